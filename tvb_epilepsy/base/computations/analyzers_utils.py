@@ -1,6 +1,15 @@
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import numpy as np
-from scipy.signal import butter, filtfilt, welch, periodogram, spectrogram
+from scipy.signal import butter, sosfiltfilt, welch, periodogram, spectrogram, convolve
 from scipy.interpolate import interp1d, griddata
+from scipy.fftpack import next_fast_len
+try:
+    # scipy >= 1.4
+    from scipy.signal import oaconvolve
+except ImportError:
+    oaconvolve = None
+from tvb_epilepsy.base.utils.log_error_utils import raise_value_error
 
 # x is assumed to be data (real numbers) arranged along the first dimension of an ndarray
 # this factory makes use of the numpy array properties
@@ -115,9 +124,9 @@ def power(x, n=None):
 
 # Frequency domain:
 
-def _butterworth_bandpass(fs, mode, lowcut, highcut, order=3):
+def _butterworth_bandpass(fs, mode, lowcut, highcut, order=3, output="ba"):
     """
-    Build a diggital Butterworth filter
+    Build a diggital Butterworth filter, as (b, a) coefficients, or, for output="sos", as second order sections
     """
     nyq = 0.5 * fs
     freqs = []
@@ -125,17 +134,196 @@ def _butterworth_bandpass(fs, mode, lowcut, highcut, order=3):
         freqs.append(lowcut / nyq)  # normalize frequency
     if highcut is not None:
         freqs.append(highcut / nyq)  # normalize frequency
+    if output == "sos":
+        return butter(order, freqs, btype=mode, output="sos")
     b, a = butter(order, freqs, btype=mode)     # btype : {'lowpass', 'highpass', 'bandpass', 'bandstop}, optional
     return b, a
 
 
-def filter_data(data, fs, lowcut=None, highcut=None, mode='bandpass', order=3, axis=0):
-    # get filter coefficients
-    b, a = _butterworth_bandpass(fs, mode, lowcut, highcut, order)
-    # filter data
-    y = filtfilt(b, a, data, axis=axis)
-    # y = lfilter(b, a, data, axis=axis)
-    return y
+# Second order sections of the Butterworth filters designed so far, keyed by (fs, (lowcut, highcut), order, mode)
+_SOS_DESIGNS = {}
+
+
+def butterworth_sos(fs, mode, lowcut, highcut, order=3):
+    """
+    The second order sections of a digital Butterworth filter, designed once per (fs, band, order, mode)
+    """
+    key = (float(fs), (lowcut, highcut), int(order), mode)
+    sos = _SOS_DESIGNS.get(key)
+    if sos is None:
+        sos = _butterworth_bandpass(fs, mode, lowcut, highcut, order, output="sos")
+        _SOS_DESIGNS[key] = sos
+    return sos
+
+
+def filter_bank(data, fs, bands, mode='bandpass', order=3, reduce_fun=None, n_threads=None, n_signals_block=None):
+    """
+    Zero phase Butterworth filtering (sosfiltfilt) of the signals of data, along its first axis,
+    for several frequency bands in a single pass over the data:
+    the signals, along the second axis, are read in blocks of n_signals_block, each one filtered for all bands,
+    by a pool of n_threads threads, which run in parallel as far as scipy releases the GIL.
+    :param data: array of time points along the first axis, e.g., the data of a (possibly out of core) Timeseries
+    :param bands: list of (lowcut, highcut) tuples, with None for the cutoff a lowpass or highpass filter lacks
+    :param mode: filter type of all bands, or list of types, one per band
+    :param reduce_fun: optional function, applied to every filtered block, which reduces its first (time) axis,
+                       e.g., in order to compute band powers, without keeping the filtered signals in memory
+    :return: list of the filtered data, or of their reductions, one per band
+    """
+    if isinstance(mode, basestring):
+        mode = [mode] * len(bands)
+    soses = [butterworth_sos(fs, band_mode, band[0], band[1], order) for band, band_mode in zip(bands, mode)]
+    if n_threads is None:
+        n_threads = cpu_count()
+    n_threads = max(1, int(n_threads))
+    n_signals = data.shape[1] if data.ndim > 1 else 1
+    if n_signals_block is None:
+        # A few blocks per thread, for balancing the load
+        n_signals_block = int(np.ceil(1.0 * n_signals / (4 * n_threads)))
+    n_signals_block = max(1, int(n_signals_block))
+
+    if reduce_fun is None:
+        # The filtered blocks are written directly to the outputs, of which the threads write disjoint parts
+        outputs = [np.empty(data.shape) for _ in soses]
+    else:
+        outputs = None
+
+    def filter_block(i_start):
+        if data.ndim > 1:
+            block = np.asarray(data[:, i_start:i_start + n_signals_block], dtype="float64")
+        else:
+            block = np.asarray(data, dtype="float64")
+        # Filtering along a contiguous time axis is a few times faster than along the strided first axis
+        block = np.ascontiguousarray(np.moveaxis(block, 0, -1))
+        reductions = []
+        for i_band, sos in enumerate(soses):
+            output = np.moveaxis(sosfiltfilt(sos, block, axis=-1), -1, 0)
+            if reduce_fun is not None:
+                reductions.append(reduce_fun(output))
+            elif data.ndim > 1:
+                outputs[i_band][:, i_start:i_start + n_signals_block] = output
+            else:
+                outputs[i_band][:] = output
+        return reductions
+
+    i_starts = range(0, n_signals, n_signals_block)
+    if n_threads == 1 or len(i_starts) == 1:
+        blocks = [filter_block(i_start) for i_start in i_starts]
+    else:
+        pool = ThreadPool(min(n_threads, len(i_starts)))
+        try:
+            blocks = pool.map(filter_block, i_starts)
+        finally:
+            pool.close()
+            pool.join()
+    if reduce_fun is None:
+        return outputs
+    # The signals' axis is the first one of the reductions of the blocks
+    return [np.concatenate([reductions[i_band] for reductions in blocks]) for i_band in range(len(soses))]
+
+
+def filter_data(data, fs, lowcut=None, highcut=None, mode='bandpass', order=3, axis=0, n_threads=None):
+    if axis != 0:
+        return np.moveaxis(filter_data(np.moveaxis(data, axis, 0), fs, lowcut, highcut, mode, order, 0, n_threads),
+                           0, axis)
+    return filter_bank(data, fs, [(lowcut, highcut)], mode, order, n_threads=n_threads)[0]
+
+
+def _convolution_kernel(kernel, ndim):
+    # A kernel along the time axis, broadcast over the rest of the dimensions
+    return np.reshape(kernel, (kernel.size,) + (1,) * (ndim - 1))
+
+
+def running_sum_convolve(data, win_len, value=1.0):
+    """
+    Convolution of mode "same" along the first axis with a boxcar kernel of win_len points equal to value,
+    computed as differences of cumulative sums, in O(n_times) regardless of win_len.
+    The signals are mean centered before the cumulative sums, which limits their rounding error.
+    """
+    data = np.asarray(data)
+    n_times = data.shape[0]
+    win_len = int(win_len)
+    # The output of the i-th time point sums the input of time points [i - n_before, i + n_after],
+    # i.e., cumsum[min(i + n_after + 1, n_times)] - cumsum[max(i - n_before, 0)]
+    n_after = (win_len - 1) // 2
+    n_before = win_len - 1 - n_after
+    mean = np.mean(data, axis=0, dtype="float64")
+    cumsum = np.zeros((n_times + 1,) + data.shape[1:])
+    np.cumsum(data - mean, axis=0, out=cumsum[1:])
+    output = np.empty(data.shape)
+    n_inside = max(0, n_times - n_after - 1)
+    output[:n_inside] = cumsum[n_after + 1:n_after + 1 + n_inside]
+    output[n_inside:] = cumsum[n_times]
+    if n_before < n_times:
+        output[n_before:] -= cumsum[:n_times - n_before]
+    time_points = np.arange(n_times)
+    n_points = np.minimum(time_points + n_after + 1, n_times) - np.maximum(time_points - n_before, 0)
+    output += _convolution_kernel(n_points, data.ndim) * mean
+    output *= value
+    return output
+
+
+def _overlap_add_convolve(data, kernel):
+    # Convolution of mode "same" along the first axis, by overlap-add of real FFTs of segments of the signals
+    n_times = data.shape[0]
+    n_kernel = kernel.size
+    c = (n_kernel - 1) // 2
+    n_fft = next_fast_len(min(n_times + n_kernel - 1, max(8 * n_kernel, 1024)))
+    segment_length = n_fft - n_kernel + 1
+    signals = np.reshape(data, (n_times, -1))
+    kernel_fft = np.fft.rfft(kernel, n_fft)[:, np.newaxis]
+    output = np.zeros(signals.shape)
+    for i_start in range(0, n_times, segment_length):
+        segment = signals[i_start:i_start + segment_length]
+        full = np.fft.irfft(np.fft.rfft(segment, n_fft, axis=0) * kernel_fft, n_fft, axis=0)
+        full = full[:segment.shape[0] + n_kernel - 1]
+        # The full convolution of the segment starts at time point i_start, i.e., at i_start - c of the output
+        i_output = max(0, i_start - c)
+        i_full = i_output - (i_start - c)
+        n_output = min(n_times - i_output, full.shape[0] - i_full)
+        if n_output > 0:
+            output[i_output:i_output + n_output] += full[i_full:i_full + n_output]
+    return np.reshape(output, data.shape)
+
+
+def fft_convolve(data, kernel):
+    """
+    Convolution of mode "same" along the first axis with an arbitrary kernel, by overlap-add FFT,
+    in O(n_times * log(n_kernel)), with scipy.signal.oaconvolve where available.
+    """
+    data = np.asarray(data)
+    kernel = np.array(kernel, dtype="float64").flatten()
+    if oaconvolve is not None:
+        return oaconvolve(data, _convolution_kernel(kernel, data.ndim), mode="same", axes=0)
+    return _overlap_add_convolve(data, kernel)
+
+
+def select_convolution_mode(kernel):
+    # Running sums for boxcar kernels, and FFT for the rest:
+    # the direct N-dimensional convolution of scipy is slower than both, already for kernels of 2 points
+    if np.all(kernel == kernel[0]):
+        return "running_sum"
+    return "fft"
+
+
+def convolve_data(data, kernel, mode="auto"):
+    """
+    Convolution of mode "same" of the signals along the first axis with a 1D kernel
+    :param mode: "direct", "running_sum" (for boxcar kernels only), "fft",
+                 or "auto" for the fastest one, according to the kernel's values
+    """
+    kernel = np.array(kernel, dtype="float64").flatten()
+    if mode == "auto":
+        mode = select_convolution_mode(kernel)
+    if mode == "direct":
+        return convolve(data, _convolution_kernel(kernel, np.ndim(data)), mode="same", method="direct")
+    elif mode == "running_sum":
+        if not np.all(kernel == kernel[0]):
+            raise_value_error("Running sum convolution needs a boxcar kernel, i.e., of equal values!")
+        return running_sum_convolve(data, kernel.size, kernel[0])
+    elif mode == "fft":
+        return fft_convolve(data, kernel)
+    else:
+        raise_value_error("Convolution mode " + str(mode) + " is none of 'auto', 'direct', 'running_sum' or 'fft'!")
 
 
 def spectral_analysis(x, fs, freq=None, method="periodogram", output="spectrum", nfft=None, window='hanning',
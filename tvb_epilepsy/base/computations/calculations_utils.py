@@ -1,7 +1,10 @@
 # coding=utf-8
 
+from scipy import sparse
 from scipy.optimize import root
+from tvb_epilepsy.base.computations.coupling_utils import difference_coupling_jacobian
 from tvb_epilepsy.base.computations.equations_utils import *
+from tvb_epilepsy.base.computations.symbolic_cache import symbol_lambda
 from tvb_epilepsy.base.constants.model_constants import *
 from tvb_epilepsy.base.utils.data_structures_utils import shape_to_size
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_import_error, raise_value_error
@@ -39,13 +42,14 @@ def calc_coupling(x1, K, w, ix=None, jx=None, shape=None, calc_mode="non_symbol"
     calc_mode = confirm_calc_mode(calc_mode)
     x1, K = assert_arrays([x1, K], shape)
     n_regions = x1.size
-    w = assert_arrays([w], (x1.size, x1.size))
+    if not sparse.issparse(w):
+        w = assert_arrays([w], (x1.size, x1.size))
     if ix is None:
         ix = range(n_regions)
     if jx is None:
         jx = range(n_regions)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_coupling(x1.size, ix, jx, shape=x1.shape)[0](x1, K, w))
+        return np.array(symbol_lambda(symbol_eqtn_coupling, x1.size, ix, jx, shape=x1.shape)(x1, K, w))
     else:
         return eqtn_coupling(x1, K, w, ix, jx)
 
@@ -55,7 +59,7 @@ def calc_x0(x1, z, K=0.0, w=0.0, zmode=np.array("lin"), z_pos=True, shape=None,
     x1, z, K = assert_arrays([x1, z, K], shape)
     w = assert_arrays([w], (z.size, z.size))
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_x0(z.size, zmode, z_pos, "K", z.shape)[0](x1, z, K, w))
+        return np.array(symbol_lambda(symbol_eqtn_x0, z.size, zmode, z_pos, "K", z.shape)(x1, z, K, w))
     else:
         if zmode == np.array("lin") and z_pos is None:
             z_pos = z > 0.0
@@ -68,12 +72,12 @@ def calc_fx1(x1=0.0, z=0.0, y1=0.0, Iext1=I_EXT1_DEF, slope=SLOPE_DEF, a=A_DEF,
     x1, z, y1, Iext1, slope, a, b, d, tau1 = assert_arrays([x1, z, y1, Iext1, slope, a, b, d, tau1], shape)
     if np.all(calc_mode == "symbol"):
         if np.all(model == "2d"):
-            return np.array(symbol_eqtn_fx1(x1.size, model, x1_neg, slope="slope", Iext1="Iext1", shape=x1.shape)[0]
-                            (x1, z, y1, Iext1, slope, a, b, d, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fx1, x1.size, model, x1_neg, slope="slope", Iext1="Iext1",
+                                          shape=x1.shape)(x1, z, y1, Iext1, slope, a, b, d, tau1))
         else:
             x2 = assert_arrays([x2], x1.shape)
-            return np.array(symbol_eqtn_fx1(x1.size, model, x1_neg, slope="slope", Iext1="Iext1", shape=x1.shape)[0]
-                            (x1, z, y1, x2, Iext1, slope, a, b, d, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fx1, x1.size, model, x1_neg, slope="slope", Iext1="Iext1",
+                                          shape=x1.shape)(x1, z, y1, x2, Iext1, slope, a, b, d, tau1))
     else:
         if x1_neg is None:
             x1_neg = x1 < 0.0
@@ -88,7 +92,7 @@ def calc_fy1(x1, yc, y1=0, d=D_DEF, tau1=TAU1_DEF, shape=None, calc_mode="non_sy
     calc_mode = confirm_calc_mode(calc_mode)
     x1, yc, y1, d, tau1 = assert_arrays([x1, yc, y1, d, tau1], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fy1(x1.size, x1.shape)[0](x1, y1, yc, d, tau1))
+        return np.array(symbol_lambda(symbol_eqtn_fy1, x1.size, x1.shape)(x1, y1, yc, d, tau1))
     else:
         return eqtn_fy1(x1, yc, y1, d, tau1)
 
@@ -99,9 +103,8 @@ def calc_fz(x1=0.0, z=0, x0=0.0, K=0.0, w=0.0, tau1=TAU1_DEF, tau0=TAU0_DEF, zmo
     x1, z, x0, K, tau1, tau0 = assert_arrays([x1, z, x0, K, tau1, tau0], shape)
     w = assert_arrays([w], (z.size, z.size))
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fz(z.size, zmode, z_pos, x0="x0_values", K="K", shape=z.shape)[0](x1, z, x0,
-                                                                                                      K, w, tau1,
-                                                                                                      tau0))
+        return np.array(symbol_lambda(symbol_eqtn_fz, z.size, zmode, z_pos, x0="x0_values", K="K",
+                                      shape=z.shape)(x1, z, x0, K, w, tau1, tau0))
     else:
         if zmode == np.array("lin") and z_pos is None:
             z_pos = z > 0.0
@@ -112,7 +115,8 @@ def calc_fx2(x2, y2=0.0, z=0.0, g=0.0, Iext2=I_EXT2_DEF, tau1=TAU1_DEF, shape=No
     calc_mode = confirm_calc_mode(calc_mode)
     x2, y2, z, g, Iext2, tau1 = assert_arrays([x2, y2, z, g, Iext2, tau1], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fx2(x2.size, Iext2="Iext2", shape=x2.shape)[0](x2, y2, z, g, Iext2, tau1))
+        return np.array(symbol_lambda(symbol_eqtn_fx2, x2.size, Iext2="Iext2", shape=x2.shape)(x2, y2, z, g, Iext2,
+                                                                                               tau1))
     else:
         return eqtn_fx2(x2, y2, z, g, Iext2, tau1)
 
@@ -128,7 +132,7 @@ def calc_fy2(x2, y2=0.0, s=S_DEF, tau1=TAU1_DEF, tau2=TAU2_DEF, x2_neg=None, sha
             logger.warning("\nx2_neg is None and failed to compare x2_neg = x2 < -0.25!" +
                            "\nSetting default x2_neg = False")
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fy2(x2.size, x2_neg=x2_neg, shape=x2.shape)[0](x2, y2, s, tau1, tau2))
+        return np.array(symbol_lambda(symbol_eqtn_fy2, x2.size, x2_neg=x2_neg, shape=x2.shape)(x2, y2, s, tau1, tau2))
     else:
         return eqtn_fy2(x2, y2, s, tau1, tau2, x2_neg)
 
@@ -137,7 +141,7 @@ def calc_fg(x1, g=0.0, gamma=GAMMA_DEF, tau1=TAU1_DEF, shape=None, calc_mode="no
     calc_mode = confirm_calc_mode(calc_mode)
     x1, g, gamma, tau1 = assert_arrays([x1, g, gamma, tau1], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fg(x1.size, x1.shape)[0](x1, g, gamma, tau1))
+        return np.array(symbol_lambda(symbol_eqtn_fg, x1.size, x1.shape)(x1, g, gamma, tau1))
     else:
         return eqtn_fg(x1, g, gamma, tau1)
 
@@ -146,7 +150,7 @@ def calc_fx0(x0_var, x0, tau1=TAU1_DEF, shape=None, calc_mode="non_symbol"):
     calc_mode = confirm_calc_mode(calc_mode)
     x0_var, x0, tau1 = assert_arrays([x0_var, x0, tau1], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fx0(x0.size, shape)[0](x0_var, x0, tau1))
+        return np.array(symbol_lambda(symbol_eqtn_fx0, x0.size, shape)(x0_var, x0, tau1))
     else:
         return eqtn_fx0(x0_var, x0, tau1)
 
@@ -158,16 +162,16 @@ def calc_fslope(slope_var, slope, z=0.0, g=0.0, tau1=TAU1_DEF, pmode=np.array("c
     if np.all(calc_mode == "symbol"):
         if pmode == "z":
             z = assert_arrays([z], slope.shape)
-            return np.array(symbol_eqtn_fslope(slope.size, pmode, shape)[0](slope_var, z, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fslope, slope.size, pmode, shape)(slope_var, z, tau1))
         elif pmode == "g":
             g = assert_arrays([g], slope.shape)
-            return np.array(symbol_eqtn_fslope(slope.size, pmode, shape)[0](slope_var, g, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fslope, slope.size, pmode, shape)(slope_var, g, tau1))
         elif pmode == "z*g":
             z = assert_arrays([z], slope.shape)
             g = assert_arrays([g], slope.shape)
-            return np.array(symbol_eqtn_fslope(slope.size, pmode, shape)[0](slope_var, z, g, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fslope, slope.size, pmode, shape)(slope_var, z, g, tau1))
         else:
-            return np.array(symbol_eqtn_fslope(slope.size, pmode, shape)[0](slope_var, slope, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fslope, slope.size, pmode, shape)(slope_var, slope, tau1))
     else:
         if pmode == "z" or pmode == "g" or pmode == "z*g":
             z, g = assert_arrays([z, g], slope.shape)
@@ -180,7 +184,7 @@ def calc_fIext1(Iext1_var, Iext1, tau1=TAU1_DEF, tau0=TAU0_DEF, shape=None, calc
     calc_mode = confirm_calc_mode(calc_mode)
     Iext1_var, Iext1, tau1, tau0 = assert_arrays([Iext1_var, Iext1, tau1, tau0], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fIext1(Iext1.size, shape)[0](Iext1_var, Iext1, tau1, tau0))
+        return np.array(symbol_lambda(symbol_eqtn_fIext1, Iext1.size, shape)(Iext1_var, Iext1, tau1, tau0))
     else:
         return eqtn_fIext1(Iext1_var, Iext1, tau1, tau0)
 
@@ -192,16 +196,16 @@ def calc_fIext2(Iext2_var, Iext2, z=0.0, g=0.0, tau1=TAU1_DEF, pmode=np.array("c
     if np.all(calc_mode == "symbol"):
         if pmode == "z":
             z = assert_arrays([z], Iext2.shape)
-            return np.array(symbol_eqtn_fIext2(Iext2.size, pmode, shape)[0](Iext2_var, z, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fIext2, Iext2.size, pmode, shape)(Iext2_var, z, tau1))
         elif pmode == "g":
             g = assert_arrays([g], Iext2.shape)
-            return np.array(symbol_eqtn_fIext2(Iext2.size, pmode, shape)[0](Iext2_var, g, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fIext2, Iext2.size, pmode, shape)(Iext2_var, g, tau1))
         elif pmode == "z*g":
             z = assert_arrays([z], Iext2.shape)
             g = assert_arrays([g], Iext2.shape)
-            return np.array(symbol_eqtn_fIext2(Iext2.size, pmode, shape)[0](Iext2_var, z, g, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fIext2, Iext2.size, pmode, shape)(Iext2_var, z, g, tau1))
         else:
-            return np.array(symbol_eqtn_fIext2(Iext2.size, pmode, shape)[0](Iext2_var, Iext2, tau1))
+            return np.array(symbol_lambda(symbol_eqtn_fIext2, Iext2.size, pmode, shape)(Iext2_var, Iext2, tau1))
     else:
         if pmode == "z" or pmode == "g" or pmode == "z*g":
             z, g = assert_arrays([z, g], Iext2.shape)
@@ -214,7 +218,7 @@ def calc_fK(K_var, K, tau1=TAU1_DEF, tau0=TAU0_DEF, shape=None, calc_mode="non_s
     calc_mode = confirm_calc_mode(calc_mode)
     K_var, K, tau1, tau0 = assert_arrays([K_var, K, tau1, tau0], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fK(K.size, shape)[0](K_var, K, tau1, tau0))
+        return np.array(symbol_lambda(symbol_eqtn_fK, K.size, shape)(K_var, K, tau1, tau0))
     else:
         return eqtn_fK(K_var, K, tau1, tau0)
 
@@ -240,7 +244,7 @@ def calc_dfun(x1, z, yc, Iext1, x0, K, w, model_vars=2,
                                slope, a, b, d, s, Iext2, gamma, tau1, tau0, tau2)
     else:
         if np.all(calc_mode == "symbol"):
-            dfun_sym = symbol_eqnt_dfun(x1.size, model_vars, zmode, x1_neg, z_pos, x2_neg, pmode, shape)[0]
+            dfun_sym = symbol_lambda(symbol_eqnt_dfun, x1.size, model_vars, zmode, x1_neg, z_pos, x2_neg, pmode, shape)
             x1, z, yc, Iext1, x0, K, slope, a, b, tau1, tau0 = \
                 assert_arrays([x1, z, yc, Iext1, x0, K, slope, a, b, tau1, tau0], shape)
             w = assert_arrays([w], (z.size, z.size))
@@ -340,7 +344,7 @@ def calc_jac(x1, z, yc, Iext1, x0, K, w, model_vars=2,
         n = model_vars * n_regions
         jac = np.zeros((n, n), dtype=z.dtype)
         ind = lambda x: x * n_regions + np.array(range(n_regions))
-        jac_lambda, jac_sym = symbol_calc_jac(n_regions, model_vars, zmode, x1_neg, z_pos, x2_neg, pmode)[:2]
+        jac_lambda = symbol_lambda(symbol_calc_jac, n_regions, model_vars, zmode, x1_neg, z_pos, x2_neg, pmode)
         y1, x2, y2, g, Iext2, s, gamma, tau2 = \
             assert_arrays([y1, x2, y2, g, Iext2, s, gamma, tau2], z.shape)
         if model_vars == 6:
@@ -393,8 +397,11 @@ def calc_jac(x1, z, yc, Iext1, x0, K, w, model_vars=2,
                 x1_neg = x1 < 0.0
             if z_pos is None:
                 z_pos = z > 0.0
-            return np.concatenate([eqtn_jac_x1_2d(x1, z, slope, a, b, d, tau1, x1_neg),
-                                   eqtn_jac_fz_2d(x1, z, tau1, tau0, zmode, z_pos, K, w)])
+            return sparse_or_dense_jacobian(
+                w, lambda: sparse.vstack([eqtn_jac_x1_2d(x1, z, slope, a, b, d, tau1, x1_neg, sparse_output=True),
+                                          eqtn_jac_fz_2d(x1, z, tau1, tau0, zmode, z_pos, K, w)]),
+                lambda: np.concatenate([eqtn_jac_x1_2d(x1, z, slope, a, b, d, tau1, x1_neg),
+                                        eqtn_jac_fz_2d(x1, z, tau1, tau0, zmode, z_pos, K, w)]))
         else:
             if model_vars == 6:
                 sx1, sy1, sz, sx2, sy2, sg = symbol_vars(n_regions, ['x1', 'y1', 'z', 'x2', 'y2', 'g'])[:6]
@@ -428,13 +435,14 @@ def calc_coupling_diff(K, w, ix=None, jx=None, calc_mode="non_symbol"):
     calc_mode = confirm_calc_mode(calc_mode)
     K = assert_arrays([K])
     n_regions = K.size
-    w = assert_arrays([w], (K.size, K.size))
+    if not sparse.issparse(w):
+        w = assert_arrays([w], (K.size, K.size))
     if ix is None:
         ix = range(n_regions)
     if jx is None:
         jx = range(n_regions)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_calc_coupling_diff(K.size, ix, jx, K="K")[0](K, w))
+        return np.array(symbol_lambda(symbol_calc_coupling_diff, K.size, ix, jx, K="K")(K, w))
     else:
         return eqtn_coupling_diff(K, w, ix, jx)
 
@@ -445,8 +453,8 @@ def calc_fx1_2d_taylor(x1, x_taylor, z=0, y1=0.0, Iext1=I_EXT1_DEF, slope=SLOPE_
     x1, x_taylor, z, y1, Iext1, slope, a, b, d, tau1 = \
         assert_arrays([x1, x_taylor, z, y1, Iext1, slope, a, b, d, tau1], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_calc_2d_taylor(x1.size, order=order, x1_neg=x1_neg, slope="slope", Iext1="Iext1",
-                                              shape=shape)[0](x1, x_taylor, z, y1, Iext1, slope, a, b, d, tau1))
+        return np.array(symbol_lambda(symbol_calc_2d_taylor, x1.size, order=order, x1_neg=x1_neg, slope="slope",
+                                      Iext1="Iext1", shape=shape)(x1, x_taylor, z, y1, Iext1, slope, a, b, d, tau1))
     else:
         if x1_neg is None:
             x1_neg = x1 < 0.0
@@ -481,11 +489,11 @@ def calc_fx1z(x1, x0, K, w, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF, tau1=TAU1_DEF,
     w = assert_arrays([w], (x1.size, x1.size))
     if np.all(calc_mode == "symbol"):
         if model == "2d":
-            return np.array(symbol_eqtn_fx1z(x1.size, model, zmode, x1.shape)[0](x1, x0, K, w, yc, Iext1, a, b,
-                                                                                 d, tau1, tau0))
+            return np.array(symbol_lambda(symbol_eqtn_fx1z, x1.size, model, zmode, x1.shape)(x1, x0, K, w, yc, Iext1,
+                                                                                             a, b, d, tau1, tau0))
         else:
-            return np.array(symbol_eqtn_fx1z(x1.size, model, zmode, x1.shape)[0](x1, x0, K, w, yc, Iext1, a, b, d, tau1,
-                                                                                 tau0))
+            return np.array(symbol_lambda(symbol_eqtn_fx1z, x1.size, model, zmode, x1.shape)(x1, x0, K, w, yc, Iext1,
+                                                                                             a, b, d, tau1, tau0))
     else:
         # TODO: for the extreme z_pos = False case where we have terms like 0.1 * z ** 7
         if np.all(model == "2d"):
@@ -504,7 +512,7 @@ def calc_fx1z_diff(x1, K, w, a=A_DEF, b=B_DEF, d=D_DEF, tau1=TAU1_DEF, tau0=TAU0
     x1, K, a, b, d, tau1, tau0 = assert_arrays([x1, K, a, b, d, tau1, tau0])
     w = assert_arrays([w], (x1.size, x1.size))
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_eqtn_fx1z_diff(x1.size, model, zmode)[0](x1, K, w, a, b, d, tau1, tau0))
+        return np.array(symbol_lambda(symbol_eqtn_fx1z_diff, x1.size, model, zmode)(x1, K, w, a, b, d, tau1, tau0))
     else:
         # TODO: for the extreme z_pos = False case where we have terms like 0.1 * z ** 7
         ix = range(x1.size)
@@ -518,8 +526,8 @@ def calc_fx1z_2d_x1neg_zpos_jac(x1, z, x0, yc, Iext1, K, w, ix0, iE, a=A_DEF, b=
         x1, z, x0, yc, Iext1, K, a, b, d, tau1, tau0 = \
             assert_arrays([x1, z, x0, yc, Iext1, K, a, b, d, tau1, tau0])
         w = assert_arrays([w], (x1.size, x1.size))
-        return np.array(symbol_calc_fx1z_2d_x1neg_zpos_jac(x1.size, ix0, iE)[0](x1, z, x0, yc, Iext1, K, w, a, b, d,
-                                                                                tau1, tau0))
+        return np.array(symbol_lambda(symbol_calc_fx1z_2d_x1neg_zpos_jac, x1.size, ix0, iE)(x1, z, x0, yc, Iext1, K,
+                                                                                            w, a, b, d, tau1, tau0))
     else:
         if x1.shape != (1, x1.size):
             x1 = np.expand_dims(x1.flatten(), 1).T
@@ -528,32 +536,24 @@ def calc_fx1z_2d_x1neg_zpos_jac(x1, z, x0, yc, Iext1, K, w, ix0, iE, a=A_DEF, b=
         # Correspondance with EpileptorDP2D
         b = b - d
         w = assert_arrays([w], (x1.size, x1.size))
-        tau = np.divide(tau1, tau0)
-        no_x0 = len(ix0)
-        no_e = len(iE)
-        i_x0 = np.ones((no_x0, 1))
-        i_e = np.ones((no_e, 1))
-        jac_e_x0e = np.diag(np.multiply(tau[:, iE], - 4.0).flatten())
-        jac_e_x1o = -np.dot(np.dot(i_e, np.multiply(tau[:, iE], K[:, iE])), w[iE][:, ix0])
-        jac_x0_x0e = np.zeros((no_x0, no_e))
-        jac_x0_x1o = (np.diag(np.multiply(tau[:, ix0],
-                                          (4 + 3 * np.multiply(a[:, ix0], np.power(x1[:, ix0], 2))
-                                           - 2 * np.multiply(b[:, ix0], x1[:, ix0]) +
-                                           np.multiply(K[:, ix0], np.sum(w[ix0], axis=1)))).flatten()) -
-                      np.multiply(np.dot(i_x0, np.multiply(tau[:, ix0], K[:, ix0])).T, w[ix0][:, ix0]))
-        jac = np.empty((x1.size, x1.size), dtype=jac_x0_x1o.dtype)
-        jac[np.ix_(iE, iE)] = jac_e_x0e
-        jac[np.ix_(iE, ix0)] = jac_e_x1o
-        jac[np.ix_(ix0, iE)] = jac_x0_x0e
-        jac[np.ix_(ix0, ix0)] = jac_x0_x1o
-        return jac
+        tau = np.divide(tau1, tau0).flatten()
+        x0_mask = np.zeros((x1.size,))
+        x0_mask[ix0] = 1.0
+        # Derivatives with respect to the x1 of the regions of fixed x0: 4 + 3 * a_i * x1_i ** 2 - 2 * b_i * x1_i
+        # minus those of the coupling, and with respect to the x0 of the regions of fixed equilibria: -4
+        diagonal = np.where(x0_mask, 4.0 + 3.0 * np.multiply(a, np.power(x1, 2)) - 2.0 * np.multiply(b, x1),
+                            -4.0).flatten()
+        dcoupl_dx1 = difference_coupling_jacobian(np.multiply(K.flatten(), tau), w)
+        return sparse_or_dense_jacobian(
+            dcoupl_dx1, lambda: sparse.diags(np.multiply(diagonal, tau)) - dcoupl_dx1.dot(sparse.diags(x0_mask)),
+            lambda: np.diag(np.multiply(diagonal, tau)) - np.multiply(dcoupl_dx1, x0_mask))
 
 
 def calc_fx1y1_6d_diff_x1(x1, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF, tau1=TAU1_DEF, shape=None, calc_mode="non_symbol"):
     calc_mode = confirm_calc_mode(calc_mode)
     x1, yc, Iext1, a, b, d, tau1 = assert_arrays([x1, yc, Iext1, a, b, d, tau1], shape)
     if np.all(calc_mode == "symbol"):
-        return np.array(symbol_calc_fx1y1_6d_diff_x1(x1.size, shape)[0](x1, yc, Iext1, a, b, d, tau1))
+        return np.array(symbol_lambda(symbol_calc_fx1y1_6d_diff_x1, x1.size, shape)(x1, yc, Iext1, a, b, d, tau1))
     else:
         # Correspondance with EpileptorDP2D
         b = b - d
@@ -568,9 +568,9 @@ def calc_x0cr_r(yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF, zmode=np.array("lin"), x1_
         = assert_arrays([yc, Iext1, a, b, d, x1_rest, x1_cr, x0def, x0cr_def], shape)
     if np.all(calc_mode == "symbol"):
         if test:
-            x0cr, r = symbol_calc_x0cr_r(Iext1.size, zmode, Iext1.shape)[0]
+            x0cr, r = symbol_lambda(symbol_calc_x0cr_r, Iext1.size, zmode, Iext1.shape)
         else:
-            x0cr, r = symbol_eqtn_x0cr_r(Iext1.size, zmode, Iext1.shape)[0]
+            x0cr, r = symbol_lambda(symbol_eqtn_x0cr_r, Iext1.size, zmode, Iext1.shape)
         # Calculate x0cr from the lambda function
         x0cr = np.array(x0cr(yc, Iext1, a, b, d, x1_rest, x1_cr, x0def, x0cr_def))
         # r is already given as independent of yc and Iext1
@@ -638,9 +638,38 @@ def calc_fz_jac_square_taylor(zeq, yc, Iext1, K, w, a=A_DEF, b=B_DEF, d=D_DEF, t
         assert_arrays([zeq, yc, Iext1, K, a, b, d, tau1, tau0, x_taylor], (1, zeq.size))
     w = assert_arrays([w], (zeq.size, zeq.size))
     if np.all(calc_mode == "symbol"):
-        return symbol_calc_fz_jac_square_taylor(zeq.size)[0](zeq, yc, Iext1, K, w, a, b, d, tau1, tau0, x_taylor)
+        return symbol_lambda(symbol_calc_fz_jac_square_taylor, zeq.size)(zeq, yc, Iext1, K, w, a, b, d, tau1, tau0,
+                                                                         x_taylor)
     else:
-        return eqtn_fz_square_taylor(zeq, yc, Iext1, K, w, tau1, tau0)
+        return sparse_or_dense_jacobian(
+            w, lambda: eqtn_fz_square_taylor_sparse(zeq.flatten(), yc.flatten(), Iext1.flatten(), K.flatten(), w,
+                                                    tau1.flatten(), tau0.flatten()),
+            lambda: eqtn_fz_square_taylor(zeq, yc, Iext1, K, w, tau1, tau0))
+
+
+def calc_fz_jac_square_taylor_sparse(zeq, yc, Iext1, K, w, tau1=TAU1_DEF, tau0=TAU0_DEF):
+    # Sparse Jacobian of a single configuration, for w a dense or scipy sparse matrix of shape (n, n)
+    zeq = np.array(zeq, dtype="float64").flatten()
+    yc, Iext1, K, tau1, tau0 = [np.array(param).flatten() * np.ones(zeq.shape) for param in [yc, Iext1, K, tau1, tau0]]
+    if w.shape != (zeq.size, zeq.size):
+        raise_value_error("w of shape " + str(w.shape) + " is not of shape (n_regions, n_regions)!")
+    return eqtn_fz_square_taylor_sparse(zeq, yc, Iext1, K, w, tau1, tau0)
+
+
+def calc_fz_jac_square_taylor_batch(zeq, yc, Iext1, K, w, tau1=TAU1_DEF, tau0=TAU0_DEF):
+    # Jacobians of S configurations at once, for zeq of shape (S, n), and w of shape (n, n) or (S, n, n)
+    zeq = np.array(zeq, dtype="float64")
+    if zeq.ndim != 2:
+        raise_value_error("zeq of shape " + str(zeq.shape) + " is not of shape (n_samples, n_regions)!")
+    yc, Iext1, K, tau1, tau0 = [np.broadcast_to(np.array(param).squeeze(), zeq.shape)
+                                for param in [yc, Iext1, K, tau1, tau0]]
+    # Batched Jacobians are dense, also for scipy.sparse weights
+    w = w.toarray() if sparse.issparse(w) else np.array(w)
+    if w.ndim not in [2, 3] or w.shape[-2:] != (zeq.shape[1], zeq.shape[1]) or \
+            (w.ndim == 3 and w.shape[0] != zeq.shape[0]):
+        raise_value_error("w of shape " + str(w.shape) + " is not of shape (n_regions, n_regions) " +
+                          "or (n_samples, n_regions, n_regions)!")
+    return eqtn_fz_square_taylor_batch(zeq, yc, Iext1, K, w, tau1, tau0)
 
 
 def calc_fpop2(x2, y2=0.0, z=0.0, g=0.0, Iext2=I_EXT2_DEF, s=S_DEF, tau1=TAU1_DEF, tau2=1.0, x2_neg=None, shape=None,
@@ -0,0 +1,147 @@
+# coding=utf-8
+"""
+Difference coupling of regions' states, and its Jacobian, for dense or scipy.sparse connectivity weights,
+and for single or batched states, as well as the sparse Jacobian of networks of models coupled by it.
+The coupling to region i from regions j, K_i * sum_j{w_ij * (x_j - x_i)}, is computed as
+K_i * ((W @ x)_i - rowsum(W)_i * x_i), i.e., without building the n x n outer difference of states.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def _select_weights(w, ix=None, jx=None):
+    # The weights to regions ix from regions jx
+    if sparse.issparse(w):
+        w = w.tocsr()
+        if ix is not None:
+            w = w[ix]
+        if jx is not None:
+            w = w.tocsc()[:, jx].tocsr()
+        return w
+    w = np.asarray(w)
+    if ix is not None:
+        w = w[ix]
+    if jx is not None:
+        w = w[:, jx]
+    return w
+
+
+def weights_are_zero(w):
+    if sparse.issparse(w):
+        return not np.any(w.data)
+    return np.all(np.asarray(w) == 0.0)
+
+
+def weights_row_sums(w):
+    return np.array(w.sum(axis=1)).flatten()
+
+
+def weights_dot(w, x):
+    # W @ x along the last axis of states x of shape (..., n)
+    x = np.asarray(x)
+    if sparse.issparse(w):
+        return w.dot(x.reshape((-1, x.shape[-1])).T).T.reshape(x.shape[:-1] + (w.shape[0],))
+    return np.dot(x, np.asarray(w).T)
+
+
+def difference_coupling(x, K, w, ix=None, jx=None):
+    """
+    Difference coupling K_i * sum_j{w_ij * (x_j - x_i)} to regions ix from regions jx (by default all regions).
+    :param x: states of shape (n,) or batched states of shape (..., n), e.g. (n_samples, n_regions)
+    :param K: scalar, or coupling scaling of shape (n,) or broadcastable to the shape of x
+    :param w: weights of shape (n, n), numpy array or scipy.sparse matrix
+    :return: coupling of shape (..., len(ix))
+    """
+    x = np.asarray(x)
+    w = _select_weights(w, ix, jx)
+    x_i = x if ix is None else x[..., ix]
+    x_j = x if jx is None else x[..., jx]
+    K = np.array(K)
+    if K.ndim > 0 and ix is not None:
+        K = K[..., ix]
+    return np.multiply(K, weights_dot(w, x_j) - np.multiply(weights_row_sums(w), x_i))
+
+
+def diagonal_positions(ix, jx, n_regions):
+    # Positions (a, b) such that ix[a] == jx[b], i.e., the self coupling terms
+    ix = np.arange(n_regions) if ix is None else np.array(ix)
+    jx = np.arange(n_regions) if jx is None else np.array(jx)
+    j_positions = -np.ones((n_regions,), dtype="i")
+    j_positions[jx] = np.arange(jx.size)
+    b = j_positions[ix]
+    a = np.where(b >= 0)[0]
+    return a, b[a]
+
+
+def difference_coupling_jacobian(K, w, ix=None, jx=None):
+    """
+    Jacobian of difference_coupling(x, K, w, ix, jx) with respect to x[jx], of shape (len(ix), len(jx)):
+    K_i * w_ij for i != j, and - K_i * sum_j_not_i{w_ij} for i == j.
+    :return: numpy array for dense weights, or scipy.sparse CSR matrix for sparse ones
+    """
+    n_regions = w.shape[0]
+    w_ij = _select_weights(w, ix, jx)
+    K = np.array(K).flatten() * np.ones((n_regions,))
+    K_i = K if ix is None else K[ix]
+    a, b = diagonal_positions(ix, jx, n_regions)
+    diagonal = - np.multiply(K_i[a], weights_row_sums(w_ij)[a])
+    if sparse.issparse(w_ij):
+        return (sparse.diags(K_i).dot(w_ij) +
+                sparse.coo_matrix((diagonal, (a, b)), shape=w_ij.shape)).tocsr()
+    jac = np.multiply(K_i[:, np.newaxis], w_ij)
+    jac[a, b] += diagonal
+    return jac
+
+
+def sparse_or_dense_jacobian(w, sparse_jacobian, dense_jacobian):
+    """
+    Jacobian of equations coupled by connectivity weights w, computed by sparse_jacobian() for scipy.sparse weights,
+    and returned as a CSR matrix, or by dense_jacobian() for dense ones.
+    Sparse weights result in a sparse Jacobian, whose non zero elements are only those of the weights and of
+    the diagonal, so that the Jacobians of large sparse connectomes are never built as dense matrices.
+    """
+    if sparse.issparse(w):
+        return sparse_jacobian().tocsr()
+    return dense_jacobian()
+
+
+def network_jacobian(model, state_variables, w, local_coupling=0.0):
+    """
+    Jacobian of the derivatives of the state variables of a network of regions of a model,
+    coupled by the difference coupling (i.e., TVB's Difference coupling with a=1) of its coupling variables.
+    The model has to provide the node-local blocks of its Jacobian, of shape (nvar, nvar, n), by its jacobian,
+    and the ones of its derivatives with respect to the coupling, of shape (nvar, len(cvar), n),
+    by its coupling_jacobian method, as the EpileptorDP, EpileptorDPrealistic and EpileptorDP2D models do.
+    :param state_variables: states of shape (nvar, n)
+    :param w: weights of shape (n, n), numpy array or scipy.sparse matrix
+    :return: scipy.sparse CSR matrix of shape (nvar * n, nvar * n), for the states ordered as
+             state_variables.flatten(), i.e., variable by variable
+    """
+    y = np.asarray(state_variables)
+    n_regions = y.shape[1]
+    coupling = difference_coupling(y[model.cvar], 1.0, w)
+    local_jac = np.array(model.jacobian(y, coupling, local_coupling))
+    coupling_jac = np.array(model.coupling_jacobian(y, coupling, local_coupling))
+    n_vars = local_jac.shape[0]
+    regions = np.arange(n_regions)
+    data = []
+    rows = []
+    cols = []
+    # Node-local blocks are diagonal matrices, present only for the non zero derivatives
+    for i_var, j_var in zip(*np.nonzero(np.any(local_jac != 0.0, axis=-1))):
+        data.append(local_jac[i_var, j_var])
+        rows.append(i_var * n_regions + regions)
+        cols.append(j_var * n_regions + regions)
+    # Coupling blocks diag(d ydot_i / d coupling_c) @ d coupling_c / d y_cvar[c]
+    w_jac = sparse.coo_matrix(difference_coupling_jacobian(1.0, w))
+    for i_var, i_cvar in zip(*np.nonzero(np.any(coupling_jac != 0.0, axis=-1))):
+        data.append(coupling_jac[i_var, i_cvar][w_jac.row] * w_jac.data)
+        rows.append(i_var * n_regions + w_jac.row)
+        cols.append(model.cvar[i_cvar] * n_regions + w_jac.col)
+    shape = (n_vars * n_regions, n_vars * n_regions)
+    if len(data) == 0:
+        return sparse.csr_matrix(shape)
+    # Duplicate entries, i.e., the diagonal of coupling and local blocks, are summed
+    return sparse.coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=shape).tocsr()
@@ -1,5 +1,8 @@
 
+from scipy import sparse
 from tvb_epilepsy.base.constants.model_constants import *
+from tvb_epilepsy.base.computations.coupling_utils import difference_coupling, difference_coupling_jacobian, \
+    diagonal_positions, weights_are_zero, sparse_or_dense_jacobian
 from tvb_epilepsy.base.utils.data_structures_utils import assert_arrays, isequal_string
 from tvb_epilepsy.base.utils.log_error_utils import raise_value_error
 
@@ -23,6 +26,10 @@ def eqtn_coupling(x1, K, w, ix, jx):
     # Only difference coupling for the moment.
     # TODO: Extend for different coupling forms
     shape = x1.shape
+    if x1.dtype != "object" and np.array(K).dtype != "object":
+        coupling = difference_coupling(np.array(x1).flatten(), np.array(K).flatten() * np.ones((x1.size,)), w, ix, jx)
+        return np.reshape(coupling, shape)
+    # Symbolic calculation:
     x1, K = assert_arrays([x1, K], (1, x1.size))
     i_n = np.ones((len(ix), 1), dtype='float32')
     j_n = np.ones((len(jx), 1), dtype='float32')
@@ -36,11 +43,10 @@ def eqtn_coupling_diff(K, w, ix, jx):
     # Only difference coupling for the moment.
     # TODO: Extend for different coupling forms
     K = np.reshape(K, (K.size,))
-    if K.dtype == "object" or w.dtype == "object":
-        dtype = "object"
-    else:
-        dtype = K.dtype
-    dcoupl_dx1 = np.empty((len(ix), len(jx)), dtype=dtype)
+    if K.dtype != "object" and w.dtype != "object":
+        return difference_coupling_jacobian(K, w, ix, jx)
+    # Symbolic calculation:
+    dcoupl_dx1 = np.empty((len(ix), len(jx)), dtype="object")
     for ii in ix:
         for ij in jx:
 
@@ -90,7 +96,7 @@ def eqtn_x0cr_r(Iext1, yc, a, b, d, x1_rest, x1_cr, x0_rest, x0_cr, zmode=np.arr
 
 def eqtn_x0(x1, z, zmode=np.array("lin"), z_pos=True, K=None, w=None, coupl=None):
     if coupl is None:
-        if np.all(K == 0.0) or np.all(w == 0.0) or (K is None) or (w is None):
+        if (K is None) or (w is None) or np.all(K == 0.0) or weights_are_zero(w):
             coupl = 0.0
         else:
             from tvb_epilepsy.base.computations.calculations_utils import calc_coupling
@@ -123,15 +129,16 @@ def eqtn_fx1_2d_taylor_lin(x1, x_taylor, z, yc, Iext1, a, b, d, tau1):
                                           + 2 * np.multiply(x_taylor, b))), tau1)
 
 
-def eqtn_jac_x1_2d(x1, z, slope, a, b, d, tau1, x1_neg=True):
+def eqtn_jac_x1_2d(x1, z, slope, a, b, d, tau1, x1_neg=True, sparse_output=False):
     # Correspondence with EpileptorDP2D
     b = b - d
-    jac_x1 = np.diag(
-        np.multiply(np.where(x1_neg, np.multiply(-3.0 * np.multiply(a, x1) + 2.0 * np.multiply(b, 1.0), x1),
-                             + else_ydot0_2d(x1, z, slope, d)), tau1).flatten())
-    jac_z = - np.diag(np.multiply(np.ones(x1.shape, dtype=x1.dtype) +
-                                  np.where(x1_neg, 0.0, 1.2 * np.multiply(z - 4.0, x1)), tau1).flatten())
-    return np.concatenate([jac_x1, jac_z], axis=1)
+    jac_x1 = np.multiply(np.where(x1_neg, np.multiply(-3.0 * np.multiply(a, x1) + 2.0 * np.multiply(b, 1.0), x1),
+                                  + else_ydot0_2d(x1, z, slope, d)), tau1).flatten()
+    jac_z = - np.multiply(np.ones(x1.shape, dtype=x1.dtype) +
+                          np.where(x1_neg, 0.0, 1.2 * np.multiply(z - 4.0, x1)), tau1).flatten()
+    if sparse_output:
+        return sparse.hstack([sparse.diags(jac_x1), sparse.diags(jac_z)]).tocsr()
+    return np.concatenate([np.diag(jac_x1), np.diag(jac_z)], axis=1)
 
 
 def eqtn_fx1z_diff(x1, K, w, ix, jx, a, b, d, tau1, tau0, zmode=np.array("lin")):  # , z_pos=True
@@ -148,14 +155,20 @@ def eqtn_fx1z_diff(x1, K, w, ix, jx, a, b, d, tau1, tau0, zmode=np.array("lin"))
     else:
         raise_value_error('zmode is neither "lin" nor "sig"')
     dfx1_3_dx1 = 3 * np.multiply(np.power(x1[ix], 2.0), a[ix]) + 2 * np.multiply(x1[ix], d[ix] - b[ix])
-    fx1z_diff = np.empty_like(dcoupl_dx, dtype=dcoupl_dx.dtype)
-    for xi in ix:
-        for xj in jx:
-            if xj == xi:
-                fx1z_diff[xi, xj] = np.multiply(dfx1_3_dx1[xi] + dfx1_1_dx1[xi] - dcoupl_dx[xi, xj], tau[xi])
-            else:
-                fx1z_diff[xi, xj] = np.multiply(- dcoupl_dx[xi, xj], tau[xi])
-    return fx1z_diff
+    # Derivatives of the - coupling term, plus those of the x1 terms at the diagonal
+    ix_positions, jx_positions = diagonal_positions(ix, jx, x1.size)
+    diagonal = np.multiply(dfx1_3_dx1[ix_positions] + dfx1_1_dx1[ix_positions], tau[ix][ix_positions])
+
+    def sparse_jacobian():
+        return - sparse.diags(tau[ix]).dot(dcoupl_dx) + \
+               sparse.coo_matrix((diagonal, (ix_positions, jx_positions)), shape=dcoupl_dx.shape)
+
+    def dense_jacobian():
+        fx1z_diff = - np.multiply(dcoupl_dx, tau[ix][:, np.newaxis])
+        fx1z_diff[ix_positions, jx_positions] += diagonal
+        return fx1z_diff
+
+    return sparse_or_dense_jacobian(dcoupl_dx, sparse_jacobian, dense_jacobian)
 
 
 def eqtn_fy1(x1, yc, y1, d, tau1):
@@ -164,7 +177,7 @@ def eqtn_fy1(x1, yc, y1, d, tau1):
 
 def eqtn_fz(x1, z, x0, tau1, tau0, zmode=np.array("lin"), z_pos=True, K=None, w=None, coupl=None):
     if coupl is None:
-        if np.all(K == 0.0) or np.all(w == 0.0) or (K is None) or (w is None):
+        if (K is None) or (w is None) or np.all(K == 0.0) or weights_are_zero(w):
             coupl = 0.0
         else:
             from tvb_epilepsy.base.computations.calculations_utils import calc_coupling
@@ -190,13 +203,21 @@ def eqtn_jac_fz_2d(x1, z, tau1, tau0, zmode=np.array("lin"), z_pos=True, K=None,
                            1 + np.power(np.exp(1), (-10.0 * (x1 + 0.5))))
     else:
         raise_value_error('zmode is neither "lin" nor "sig"')
-    # Assuming that wii = 0
-    jac_x1 += np.multiply(K, np.sum(w, 1))
-    jac_x1 = np.diag(jac_x1.flatten()) - np.multiply(np.repeat(np.reshape(K, (x1.size, 1)), x1.size, axis=1), w)
-    jac_x1 *= np.repeat(np.reshape(tau, (x1.size, 1)), x1.size, axis=1)
-    jac_z *= tau
-    jac_z = np.diag(jac_z.flatten())
-    return np.concatenate([jac_x1, jac_z], axis=1)
+
+    def sparse_jacobian():
+        tau_flat = np.array(tau * np.ones(x1.shape)).flatten()
+        return sparse.hstack([sparse.diags(np.multiply(jac_x1.flatten(), tau_flat)) -
+                              difference_coupling_jacobian(np.multiply(np.array(K).flatten(), tau_flat), w),
+                              sparse.diags(np.multiply(jac_z.flatten(), tau_flat))])
+
+    def dense_jacobian():
+        # Assuming that wii = 0
+        jac = np.diag((jac_x1 + np.multiply(K, np.sum(w, 1))).flatten()) - \
+              np.multiply(np.repeat(np.reshape(K, (x1.size, 1)), x1.size, axis=1), w)
+        jac *= np.repeat(np.reshape(tau, (x1.size, 1)), x1.size, axis=1)
+        return np.concatenate([jac, np.diag(np.multiply(jac_z, tau).flatten())], axis=1)
+
+    return sparse_or_dense_jacobian(w, sparse_jacobian, dense_jacobian)
 
 
 def eqtn_fx1z_2d_zpos_jac(x1, K, w, ix0, iE, a, b, d, tau1, tau0):
@@ -340,3 +361,31 @@ def eqtn_fz_square_taylor(zeq, yc, Iext1, K, w, tau1, tau0):
     except:
         pass
     return np.multiply(fz_jac, tau)
+
+
+def eqtn_fz_square_taylor_sparse(zeq, yc, Iext1, K, w, tau1, tau0):
+    # Sparse eqtn_fz_square_taylor:
+    # zeq, yc, Iext1, K, tau1, tau0 of shape (n,), w dense or sparse of shape (n, n), CSR Jacobian of shape (n, n)
+    tau = np.divide(tau1, tau0)
+    dfz = -np.divide(0.5, np.power(2.0 * (zeq - yc - Iext1) + 64.0 / 27.0, 0.5))
+    w = sparse.csr_matrix(w)
+    # Off diagonal elements: -K_i * wij_not_i * dfz_j_not_i
+    fz_jac = - sparse.diags(np.multiply(K, tau)).dot(w).dot(sparse.diags(dfz))
+    # Diagonal elements: -1 + dfz_i * (4 + K_i * sum_j_not_i{wij})
+    w_sum = np.array(w.sum(axis=1)).flatten()
+    fz_jac = fz_jac + sparse.diags(np.multiply(-1.0 + np.multiply(dfz, 4.0 + np.multiply(K, w_sum)), tau))
+    return fz_jac.tocsr()
+
+
+def eqtn_fz_square_taylor_batch(zeq, yc, Iext1, K, w, tau1, tau0):
+    # Stacked eqtn_fz_square_taylor for S configurations of n regions:
+    # zeq, yc, Iext1, K, tau1, tau0 of shape (S, n), w of shape (n, n) or (S, n, n), Jacobians of shape (S, n, n)
+    n_regions = zeq.shape[-1]
+    tau = np.divide(tau1, tau0)
+    dfz = -np.divide(0.5, np.power(2.0 * (zeq - yc - Iext1) + 64.0 / 27.0, 0.5))
+    # Off diagonal elements: -K_i * wij_not_i * dfz_j_not_i
+    fz_jac = - np.multiply(np.multiply(K, tau)[:, :, np.newaxis], np.multiply(w, dfz[:, np.newaxis, :]))
+    # Diagonal elements: -1 + dfz_i * (4 + K_i * sum_j_not_i{wij})
+    diag = np.arange(n_regions)
+    fz_jac[:, diag, diag] += np.multiply(-1.0 + np.multiply(dfz, 4.0 + np.multiply(K, np.sum(w, axis=-1))), tau)
+    return fz_jac
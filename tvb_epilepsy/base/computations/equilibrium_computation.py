@@ -3,6 +3,8 @@ Module to compute the resting equilibrium point of a Virtual Epileptic Patient m
 """
 
 import numpy
+from scipy import sparse
+from scipy.sparse.linalg import spsolve, gmres, LinearOperator
 from tvb_epilepsy.base.constants.config import CalculusConfig
 from tvb_epilepsy.base.utils.log_error_utils import raise_not_implemented_error
 from tvb_epilepsy.base.computations.calculations_utils import *
@@ -33,6 +35,49 @@ def def_x1lin(X1_DEF, X1_EQ_CR_DEF, n_regions):
     return (X1_EQ_CR_DEF + X1_DEF) / 2.0 * numpy.ones((1,n_regions), dtype='float32')
 
 
+def _solve_sparse(a, b):
+    # Jacobi preconditioned GMRES, which is fast for the usually diagonally dominant Jacobians of the equilibria,
+    # falling back to the sparse LU decomposition, whose fill-in grows fast with the number of regions
+    a = sparse.csc_matrix(a)
+    diagonal = a.diagonal()
+    if numpy.all(diagonal != 0.0):
+        x, info = gmres(a, b, M=LinearOperator(a.shape, lambda v: v / diagonal), tol=10 ** (-12), maxiter=100)
+        if info == 0:
+            return x
+    return spsolve(a, b)
+
+
+def newton_sparse(fun, jac, xinit, max_iter=50, tol=10 ** (-12), max_step_halvings=10):
+    """
+    Damped Newton method for the large systems of sparse connectivity weights, for which the dense Jacobians of the
+    Levenberg-Marquardt method of scipy.optimize.root do not fit in memory.
+    :param jac: function returning the Jacobian as a scipy.sparse matrix
+    :return: the solution and a flag of convergence
+    """
+    x = numpy.array(xinit, dtype="float64")
+    f = numpy.array(fun(x)).flatten()
+    f_norm = numpy.max(numpy.abs(f))
+    for _ in range(max_iter):
+        if f_norm <= tol:
+            break
+        step = _solve_sparse(jac(x), f)
+        if not numpy.all(numpy.isfinite(step)):
+            break
+        # Halve the step while the residual does not decrease:
+        step_size = 1.0
+        for _ in range(max_step_halvings + 1):
+            x_new = x - step_size * step
+            f_new = numpy.array(fun(x_new)).flatten()
+            f_norm_new = numpy.max(numpy.abs(f_new))
+            if f_norm_new < f_norm:
+                break
+            step_size /= 2.0
+        if not f_norm_new < f_norm:
+            break
+        x, f, f_norm = x_new, f_new, f_norm_new
+    return x, f_norm <= tol and numpy.all(numpy.isfinite(x))
+
+
 def calc_eq_x1(yc, Iext1, x0, K, w, a=A_DEF, b=B_DEF, d=D_DEF, zmode=numpy.array("lin"), model="6d"):
     x0, K, yc, Iext1, a, b, d = assert_arrays([x0, K, yc, Iext1, a, b, d])
     n = x0.size
@@ -58,14 +103,20 @@ def calc_eq_x1(yc, Iext1, x0, K, w, a=A_DEF, b=B_DEF, d=D_DEF, zmode=numpy.array
     fx1z = lambda x1: calc_fx1z(x1, x0, K, w, yc, Iext1, a=a, b=b, d=d, tau1=1.0, tau0=1.0, model=model, zmode=zmode,
                                 shape=(Iext1.size, ))
     jac = lambda x1: calc_fx1z_diff(x1, K, w, a, b, d, tau1=1.0, tau0=1.0, model=model, zmode=zmode)
-    sol = root(fx1z, -1.5*numpy.ones((Iext1.size, )), jac=jac, method='lm', tol=10 ** (-12), callback=None, options=None)
-    #args=(y2eq[ii], zeq[ii], g_eq[ii], Iext2[ii], s, tau1, tau2, x2_neg)  method='hybr'
-    if sol.success:
-        if numpy.any([numpy.any(numpy.isnan(sol.x)), numpy.any(numpy.isinf(sol.x))]):
-            raise_value_error("nan or inf values in solution x\n" + sol.message)
-        x1eq = sol.x
+    if sparse.issparse(w):
+        x1eq, success = newton_sparse(fx1z, jac, -1.5 * numpy.ones((Iext1.size, )))
+        if not success:
+            raise_value_error("Newton's method did not converge for the equilibria x1eq!")
     else:
-        raise_value_error(sol.message)
+        sol = root(fx1z, -1.5*numpy.ones((Iext1.size, )), jac=jac, method='lm', tol=10 ** (-12), callback=None,
+                   options=None)
+        #args=(y2eq[ii], zeq[ii], g_eq[ii], Iext2[ii], s, tau1, tau2, x2_neg)  method='hybr'
+        if sol.success:
+            if numpy.any([numpy.any(numpy.isnan(sol.x)), numpy.any(numpy.isinf(sol.x))]):
+                raise_value_error("nan or inf values in solution x\n" + sol.message)
+            x1eq = sol.x
+        else:
+            raise_value_error(sol.message)
     x1eq = numpy.reshape(x1eq, shape)
     if numpy.any(x1eq > 0.0):
         raise_value_error("At least one x1eq is > 0.0!")
@@ -216,8 +267,60 @@ def calc_eq_x2(Iext2, y2eq=None, zeq=None, geq=None, x1eq=None, s=S_DEF, x2_neg=
     return x2eq, x2_neg
 
 
+def cardano_min_real_root(Q, R):
+    # The minimum real root of the depressed cubic x^3 + 3 * Q * x - 2 * R = 0, for Q, R arrays of any shape,
+    # (see http://mathworld.wolfram.com/CubicFormula.html)
+    Q, R = numpy.broadcast_arrays(numpy.array(Q, dtype="float64"), numpy.array(R, dtype="float64"))
+    delta = Q ** 3 + R ** 2
+    one_root = delta > 0.0
+    # For delta > 0 there is a single real root: cubic_root(R + sqrt(delta)) + cubic_root(R - sqrt(delta))
+    delta_sq = numpy.sqrt(numpy.where(one_root, delta, 0.0))
+    root1 = numpy.cbrt(R + delta_sq) + numpy.cbrt(R - delta_sq)
+    # For delta <= 0 (therefore Q <= 0) all roots are real: 2 * sqrt(-Q) * cos((theta + 2 * pi * k) / 3),
+    # for cos(theta) = R / sqrt(-Q^3) and k = 0, 1, 2, the minimum of which is the one for k = 1
+    Q_sq = numpy.sqrt(numpy.where(one_root, 1.0, -Q))
+    cos_theta = numpy.clip(R / numpy.where(Q_sq > 0.0, Q_sq ** 3, 1.0), -1.0, 1.0)
+    root3 = 2.0 * Q_sq * numpy.cos((numpy.arccos(cos_theta) + 2.0 * numpy.pi) / 3.0)
+    return numpy.where(one_root, root1, root3)
+
+
+def calc_eq_x2_cardano(Iext2, y2eq=None, zeq=None, geq=None, x1eq=None, s=S_DEF, x2_neg=True):
+    """
+    Vectorized closed form computation of the x2 equilibria, as in calc_eq_x2, for arrays of any shape,
+    e.g., (n_samples, n_regions).
+    :return: x2eq and x2_neg boolean arrays of the broadcast shape of the inputs
+    """
+    if geq is None:
+        geq = calc_eq_g(x1eq)
+    zeq, geq, Iext2, s, x2_neg = numpy.broadcast_arrays(numpy.array(zeq), numpy.array(geq), numpy.array(Iext2),
+                                                        numpy.array(s), numpy.array(x2_neg, dtype="bool"))
+    # As in calc_eq_x2: 0 = x2eq ** 3 + 3 * Q * x2eq - 2 * R
+    R0 = (Iext2 + 2.0 * geq - 0.3 * zeq + 1.05) / 2
+    ss = numpy.where(x2_neg, 0.0, s)
+    if y2eq is None:
+        x2eq = cardano_min_real_root((ss - 1.0) / 3, R0 - 0.25 * ss / 2)
+    else:
+        x2eq = cardano_min_real_root(-numpy.ones(R0.shape) / 3.0, R0 + numpy.array(y2eq) / 2)
+    x2eq = x2eq.astype(zeq.dtype) if zeq.dtype.kind == "f" else x2eq
+    # Rerun the elements of inconsistent x2_neg with the opposite x2_neg, and keep those that become consistent:
+    wrong = numpy.where(x2_neg, x2eq > -0.25, x2eq < -0.25)
+    if numpy.any(wrong):
+        ss = numpy.where(x2_neg, s, 0.0)
+        x2eq_rerun = cardano_min_real_root((ss - 1.0) / 3, R0 - 0.25 * ss / 2).astype(x2eq.dtype)
+        corrected = numpy.logical_and(wrong, numpy.where(x2_neg, x2eq_rerun > -0.25, x2eq_rerun < -0.25))
+        logger.warning("\nx2eq of indices " + str(numpy.where(wrong)) + " are inconsistent with x2_neg!" +
+                       "\nThose of indices " + str(numpy.where(corrected)) +
+                       " are corrected by rerunning with the opposite x2_neg.")
+        x2eq = numpy.where(corrected, x2eq_rerun, x2eq)
+        x2_neg = numpy.where(corrected, numpy.logical_not(x2_neg), x2_neg)
+    return x2eq, numpy.array(x2_neg)
+
+
 def calc_eq_pop2(Iext2, y2eq=None, zeq=None, geq=None, x1eq=None, s=S_DEF, x2_neg=True):
-    x2eq, x2_neg = calc_eq_x2(Iext2, y2eq, zeq, geq, x1eq, s, x2_neg)
+    if CalculusConfig.SYMBOLIC_CALCULATIONS_FLAG:
+        x2eq, x2_neg = calc_eq_x2(Iext2, y2eq, zeq, geq, x1eq, s, x2_neg)
+    else:
+        x2eq, x2_neg = calc_eq_x2_cardano(Iext2, y2eq, zeq, geq, x1eq, s, x2_neg)
     y2eq = calc_eq_y2(x2eq, s, x2_neg)
     return x2eq, y2eq
 
@@ -273,6 +376,15 @@ def eq_x1_hypo_x0_optimize(ix0, iE, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B
     #x1eqinit = x0 + z / 4
     xinit[ix0] = x0 + zeq[ix0] / 4.0
     #Solve:
+    if sparse.issparse(w):
+        # Solve in double precision, for the residuals to reach the tolerance of Newton's method
+        args = (ix0, iE, x1eq.astype("float64"), zeq.astype("float64"), x0, K, w, yc, Iext1, a, b, d, slope)
+        x, success = newton_sparse(lambda x: eq_x1_hypo_x0_optimize_fun(x, *args),
+                                   lambda x: eq_x1_hypo_x0_optimize_jac(x, *args), xinit)
+        if not success:
+            raise_value_error("Newton's method did not converge for the equilibria x1eq and x0!")
+        x1eq[ix0] = x[ix0]
+        return x1eq, x[iE]
     sol = root(eq_x1_hypo_x0_optimize_fun, xinit,
                args=(ix0, iE, x1eq, zeq, x0, K, w, yc, Iext1, a, b, d, slope),
                method='lm', jac=eq_x1_hypo_x0_optimize_jac, tol=10**(-12), callback=None, options=None) #method='hybr'
@@ -290,6 +402,9 @@ def eq_x1_hypo_x0_optimize(ix0, iE, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B
 def eq_x1_hypo_x0_linTaylor(ix0, iE, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF):
     x1eq, zeq, yc, Iext1, K, a, b, d = assert_arrays([x1eq, zeq, yc, Iext1, K, a, b, d], (1, x1eq.size))
     x0 = assert_arrays([x0], (1, len(ix0)))
+    if sparse.issparse(w):
+        # The linear system is solved densely anyway
+        w = w.toarray()
     w = assert_arrays([w], (x1eq.size, x1eq.size))
     no_x0 = len(ix0)
     no_e = len(iE)
@@ -340,6 +455,152 @@ def eq_x1_hypo_x0_linTaylor(ix0, iE, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=
     return x1eq.flatten(), x[0, :no_e].flatten()
 
 
+# Batched equilibria computations for S configurations of n regions at once.
+# All parameters are broadcasted to (S, n) arrays, apart from w, which is of shape (n, n) or (S, n, n).
+# Only the linear z dynamics (zmode="lin") for x1 < 0 (x1_neg=True) and z > 0 (z_pos=True) is considered.
+
+def _assert_batch_arrays(shape, params, w):
+    params = [numpy.broadcast_to(numpy.array(param, dtype="float64"), shape) for param in params]
+    # Batched computations are dense, also for scipy.sparse weights
+    w = w.toarray() if sparse.issparse(w) else numpy.array(w, dtype="float64")
+    if w.ndim == 2:
+        w = numpy.broadcast_to(w, (shape[0],) + w.shape)
+    if w.shape != shape + (shape[1],):
+        raise_value_error("w of shape " + str(w.shape) + " is not of shape (n_regions, n_regions) " +
+                          "or (n_samples, n_regions, n_regions)!")
+    return params, w
+
+
+def eq_x1_hypo_x0_batch_fun(x, e_mask, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF):
+    # x comprises of the unknown equilibria x1 for the regions of fixed x0 (e_mask False),
+    # and the unknown x0 for the regions of fixed x1 and z equilibria (e_mask True).
+    # z equilibria are the same for all Epileptor models: zeq = yc + Iext1 - a * x1eq ** 3 + (b - d) * x1eq ** 2
+    b = b - d
+    x1eq = numpy.where(e_mask, x1eq, x)
+    zeq = numpy.where(e_mask, zeq, yc + Iext1 + numpy.multiply(x1eq, if_ydot0(x1eq, a, b)))
+    x0 = numpy.where(e_mask, x, x0)
+    coupling = numpy.multiply(K, numpy.einsum("sij,sj->si", w, x1eq) - numpy.multiply(numpy.sum(w, axis=2), x1eq))
+    return 4.0 * (x1eq - x0) - zeq - coupling
+
+
+def eq_x1_hypo_x0_batch_jac(x, e_mask, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF):
+    b = b - d
+    n_regions = x.shape[1]
+    x1eq = numpy.where(e_mask, x1eq, x)
+    # Derivatives with respect to the x1 of the regions of fixed x0:
+    # diagonal elements: 4 + 3 * a_i * x1_i ** 2 - 2 * b_i * x1_i + K_i * sum_j{wij}, off diagonal elements: -K_i * wij
+    jac = -numpy.multiply(K[:, :, numpy.newaxis], w)
+    diag = numpy.arange(n_regions)
+    jac[:, diag, diag] += 4.0 + 3.0 * numpy.multiply(a, x1eq ** 2) - 2.0 * numpy.multiply(b, x1eq) + \
+                          numpy.multiply(K, numpy.sum(w, axis=2))
+    # Derivatives with respect to the x0 of the regions of fixed equilibria: -4 on the diagonal
+    return numpy.where(e_mask[:, numpy.newaxis, :], -4.0 * numpy.eye(n_regions), jac)
+
+
+def eq_x1_hypo_x0_newton_batch(e_mask, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF, xinit=None,
+                               max_iter=50, tol=10 ** (-12), max_step_halvings=10):
+    """
+    Solve for the equilibria of S configurations concurrently, with a damped Newton method and analytic Jacobians.
+    :param e_mask: boolean (S, n) array, True for the regions of fixed x1eq and zeq equilibria, for which x0 is solved,
+                   and False for the regions of fixed (model) x0, for which the x1eq equilibria are solved
+    :param xinit: initial conditions for the unknowns, by default computed by ignoring coupling
+    :return: x1eq and x0 (S, n) arrays of the solution, and the boolean (S,) array of the converged samples
+    """
+    shape = numpy.array(x1eq).shape
+    if len(shape) != 2:
+        raise_value_error("x1eq of shape " + str(shape) + " is not of shape (n_samples, n_regions)!")
+    e_mask = numpy.broadcast_to(numpy.array(e_mask, dtype="bool"), shape)
+    (x1eq, zeq, x0, K, yc, Iext1, a, b, d), w = _assert_batch_arrays(shape, [x1eq, zeq, x0, K, yc, Iext1, a, b, d], w)
+    if xinit is None:
+        # Set initial conditions for the optimization algorithm, by ignoring coupling (=0), as in eq_x1_hypo_x0_optimize
+        x = numpy.where(e_mask, x1eq - zeq / 4.0, x0 + zeq / 4.0)
+    else:
+        x = numpy.array(numpy.broadcast_to(xinit, shape), dtype="float64")
+    params = [e_mask, x1eq, zeq, x0, K, w, yc, Iext1, a, b, d]
+    fun = eq_x1_hypo_x0_batch_fun(x, *params)
+    fun_norm = numpy.max(numpy.abs(fun), axis=1)
+    failed = numpy.zeros((shape[0],), dtype="bool")
+    for _ in range(max_iter):
+        # Only the samples that have not converged or failed yet are iterated further:
+        active = numpy.where(~numpy.logical_or(fun_norm <= tol, failed))[0]
+        if active.size == 0:
+            break
+        active_params = [param[active] for param in params]
+        jac = eq_x1_hypo_x0_batch_jac(x[active], *active_params)
+        try:
+            step = numpy.linalg.solve(jac, fun[active][:, :, numpy.newaxis])[:, :, 0]
+        except numpy.linalg.LinAlgError:
+            # Some Jacobians are singular. Solve one by one, and stop iterating the singular ones.
+            step = numpy.zeros(x[active].shape)
+            for i_active in range(active.size):
+                try:
+                    step[i_active] = numpy.linalg.solve(jac[i_active], fun[active[i_active]])
+                except numpy.linalg.LinAlgError:
+                    failed[active[i_active]] = True
+        # Halve the steps of the samples whose residual does not decrease:
+        step_size = numpy.ones((active.size, 1))
+        for _ in range(max_step_halvings + 1):
+            x_new = x[active] - step_size * step
+            fun_new = eq_x1_hypo_x0_batch_fun(x_new, *active_params)
+            fun_norm_new = numpy.max(numpy.abs(fun_new), axis=1)
+            not_decreased = ~(fun_norm_new < fun_norm[active])
+            if not numpy.any(not_decreased):
+                break
+            step_size[not_decreased] /= 2.0
+        # Samples that can not decrease their residual any more are stopped:
+        failed[active[not_decreased]] = True
+        decreased = active[~not_decreased]
+        x[decreased] = x_new[~not_decreased]
+        fun[decreased] = fun_new[~not_decreased]
+        fun_norm[decreased] = fun_norm_new[~not_decreased]
+    converged = numpy.logical_and(fun_norm <= tol, numpy.all(numpy.isfinite(x), axis=1))
+    return numpy.where(e_mask, x1eq, x), numpy.where(e_mask, x, x0), converged
+
+
+def eq_x1_hypo_x0_optimize_batch(e_mask, x1eq, zeq, x0, K, w, yc, Iext1, a=A_DEF, b=B_DEF, d=D_DEF, slope=SLOPE_DEF):
+    # Batched eq_x1_hypo_x0_optimize, for e_mask, x1eq, zeq, and (the full) x0 of shape (S, n).
+    # Samples that do not converge with eq_x1_hypo_x0_newton_batch are solved by eq_x1_hypo_x0_optimize.
+    x1eq = numpy.array(x1eq)
+    shape = x1eq.shape
+    e_mask = numpy.broadcast_to(numpy.array(e_mask, dtype="bool"), shape)
+    x1eq_sol, x0_sol, converged = eq_x1_hypo_x0_newton_batch(e_mask, x1eq, zeq, x0, K, w, yc, Iext1, a, b, d)
+    if not numpy.all(converged):
+        logger.warning("Newton's method did not converge for the equilibria of samples " +
+                       str(numpy.where(~converged)[0]) + "!\nSolving them with eq_x1_hypo_x0_optimize instead.")
+        (zeq, x0, K, yc, Iext1, a, b, d, slope), w = \
+            _assert_batch_arrays(shape, [zeq, x0, K, yc, Iext1, a, b, d, slope], w)
+        for i_sample in numpy.where(~converged)[0]:
+            ix0 = numpy.where(~e_mask[i_sample])[0]
+            iE = numpy.where(e_mask[i_sample])[0]
+            x1eq_sol[i_sample], x0_sol[i_sample, iE] = \
+                eq_x1_hypo_x0_optimize(ix0, iE, numpy.array(x1eq[i_sample]), numpy.array(zeq[i_sample]),
+                                       x0[i_sample, ix0], K[i_sample], w[i_sample], yc[i_sample], Iext1[i_sample],
+                                       a[i_sample], b[i_sample], d[i_sample], slope[i_sample])
+    return x1eq_sol.astype(x1eq.dtype), x0_sol
+
+
+def calc_eq_x1_batch(yc, Iext1, x0, K, w, a=A_DEF, b=B_DEF, d=D_DEF, zmode=numpy.array("lin"), model="6d"):
+    # Batched calc_eq_x1, for x0 of shape (S, n).
+    # Samples that do not converge with eq_x1_hypo_x0_newton_batch are solved by calc_eq_x1.
+    x0 = numpy.array(x0)
+    shape = x0.shape
+    if not (isequal_string(str(zmode), "lin")):
+        raise_not_implemented_error("Batched equilibria computation is implemented only for zmode = 'lin'!")
+    e_mask = numpy.zeros(shape, dtype="bool")
+    x1eq, _, converged = eq_x1_hypo_x0_newton_batch(e_mask, numpy.zeros(shape), numpy.zeros(shape), x0, K, w, yc,
+                                                    Iext1, a, b, d, xinit=-1.5)
+    if not numpy.all(converged):
+        logger.warning("Newton's method did not converge for the equilibria of samples " +
+                       str(numpy.where(~converged)[0]) + "!\nSolving them with calc_eq_x1 instead.")
+        (x0, K, yc, Iext1, a, b, d), w = _assert_batch_arrays(shape, [x0, K, yc, Iext1, a, b, d], w)
+        for i_sample in numpy.where(~converged)[0]:
+            x1eq[i_sample] = calc_eq_x1(yc[i_sample], Iext1[i_sample], x0[i_sample], K[i_sample], w[i_sample],
+                                        a[i_sample], b[i_sample], d[i_sample], zmode, model)
+    if numpy.any(x1eq > 0.0):
+        raise_value_error("At least one x1eq is > 0.0!")
+    return x1eq
+
+
 def assert_equilibrium_point(epileptor_model, weights, equilibrium_point):
     n_dim = equilibrium_point.shape[0]
     if epileptor_model._ui_name == "EpileptorDP2D":
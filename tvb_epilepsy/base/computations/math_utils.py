@@ -3,6 +3,7 @@ from itertools import product
 from sklearn.cluster import AgglomerativeClustering
 
 import numpy as np
+from scipy import sparse
 
 from tvb_epilepsy.base.constants.config import CalculusConfig, FiguresConfig
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
@@ -23,27 +24,63 @@ def weighted_vector_sum(weights, vectors, normalize=True):
     return np.array(vector_sum)
 
 
+def sparse_percentile(w, percentile):
+    # Percentile of all the elements of a scipy.sparse matrix, including the implicit zeros, without densifying it
+    values = np.sort(w.tocsr().data)
+    n_zeros = w.shape[0] * w.shape[1] - values.size
+    negative = values[values < 0.0]
+    positive = values[values >= 0.0]
+    # The implicit zeros occupy a block of n_zeros positions among the sorted elements, between the negative and
+    # the positive elements, and it suffices to interpolate, as np.percentile does, between its first and last one
+    zeros_positions = np.unique([negative.size, negative.size + n_zeros - 1])[:max(n_zeros, 0)]
+    positions = np.concatenate([np.arange(negative.size), zeros_positions,
+                                negative.size + n_zeros + np.arange(positive.size)])
+    values = np.concatenate([negative, np.zeros(zeros_positions.shape), positive])
+    return np.interp(percentile / 100.0 * (w.shape[0] * w.shape[1] - 1), positions, values)
+
+
 def normalize_weights(weights, percentile=CalculusConfig.WEIGHTS_NORM_PERCENT, remove_diagonal=True, ceil=1.0):
-    # Create the normalized connectivity weights:
-    if len(weights) > 0:
+    # Create the normalized connectivity weights, dense or scipy.sparse ones:
+    if sparse.issparse(weights):
+        if weights.shape[0] == 0:
+            return sparse.csr_matrix(weights.shape)
+        normalized_w = sparse.csr_matrix(weights, dtype="float64", copy=True)
+        if remove_diagonal:
+            normalized_w = (normalized_w - sparse.diags(normalized_w.diagonal())).tocsr()
+            normalized_w.eliminate_zeros()
+        norm = sparse_percentile(normalized_w, percentile)
+    elif len(weights) > 0:
         normalized_w = np.array(weights)
         if remove_diagonal:
             # Remove diagonal elements
             n_regions = normalized_w.shape[0]
             normalized_w *= 1 - np.eye(n_regions)
-        # Normalize with the 95th percentile
-        normalized_w = np.array(normalized_w / np.percentile(normalized_w, percentile))
-        if ceil:
-            if ceil is True:
-                ceil = 1.0
-            normalized_w[normalized_w > ceil] = ceil
-        return normalized_w
+        norm = np.percentile(normalized_w, percentile)
     else:
         return np.array([])
+    if norm == 0.0:
+        # Thresholded connectomes may have less than (100 - percentile)% non zero weights
+        logger.warning("The " + str(percentile) + "th percentile of the weights is 0! "
+                       "Normalizing with the " + str(percentile) + "th percentile of the non zero weights instead.")
+        if sparse.issparse(normalized_w):
+            norm = np.percentile(normalized_w.data[normalized_w.data != 0.0], percentile)
+        else:
+            norm = np.percentile(normalized_w[normalized_w != 0.0], percentile)
+    # Normalize with the 95th percentile
+    normalized_w = normalized_w / norm
+    if ceil:
+        if ceil is True:
+            ceil = 1.0
+        if sparse.issparse(normalized_w):
+            normalized_w.data[normalized_w.data > ceil] = ceil
+        else:
+            normalized_w = np.array(normalized_w)
+            normalized_w[normalized_w > ceil] = ceil
+    return normalized_w
 
 
 def compute_in_degree(weights):
-    return np.expand_dims(np.sum(weights, axis=1), 1).T
+    return np.expand_dims(np.array(weights.sum(axis=1)).flatten(), 1).T
 
 
 def compute_gain_matrix(locations1, locations2, normalize=95, ceil=1.0):
@@ -0,0 +1,157 @@
+# coding=utf-8
+"""
+Cache of the lambdified functions generated by the symbolic calculations (symbolic_utils).
+
+The symbol_* functions create sympy symbols and lambdify their expressions at every call,
+which is far too slow for calculations in loops.
+The cache keeps the lambdified functions in memory, keyed by the generating function and its arguments
+(e.g., n_regions, model_vars, zmode, x1_neg, etc.).
+If a cache folder is set (CalculusConfig.SYMBOLIC_CACHE_FOLDER, None by default),
+the generated numpy source code is also written to a python file per key,
+so that later processes load the functions from it, without any symbolic computation.
+These files are loaded by executing them, so the cache folder has to be trusted as much as the code itself,
+i.e., no one but the user should be able to write to it.
+The keys include a hash of the source code of the module of the generating function and the sympy version,
+so that the files of previous versions of the symbolic calculations are never loaded.
+"""
+
+import os
+import sys
+import hashlib
+import inspect
+import numpy
+from tvb_epilepsy.base.constants.config import CalculusConfig
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, warning
+from tvb_epilepsy.base.utils.file_utils import write_file_atomically
+
+# Increase to invalidate the source files of previous versions of this module
+SYMBOLIC_CACHE_VERSION = 1
+
+
+class SymbolicLambdaCache(object):
+    logger = initialize_logger(__name__)
+
+    def __init__(self, folder=CalculusConfig.SYMBOLIC_CACHE_FOLDER):
+        self.folder = folder
+        self._lambdas = {}
+        # Hashes of the source code of the modules of the generating functions
+        self._source_hashes = {}
+
+    @property
+    def number_of_keys(self):
+        return len(self._lambdas)
+
+    def _normalize_argument(self, arg):
+        if isinstance(arg, numpy.ndarray):
+            return ("array", arg.tolist())
+        elif isinstance(arg, (list, tuple)):
+            return tuple([self._normalize_argument(a) for a in arg])
+        elif isinstance(arg, numpy.generic):
+            return numpy.asscalar(arg)
+        return arg
+
+    def get_source_hash(self, function):
+        """
+        Hash of the source code of the module of function, and of the sympy version,
+        or None, if the source code is not available.
+        """
+        module_name = function.__module__
+        if module_name not in self._source_hashes:
+            try:
+                source = inspect.getsource(sys.modules[module_name])
+                sympy_version = getattr(sys.modules.get("sympy", None), "__version__", "")
+                self._source_hashes[module_name] = hashlib.md5(source + sympy_version).hexdigest()
+            except (IOError, KeyError, TypeError):
+                warning("Failed to get the source code of " + module_name + "!\n" +
+                        "The lambdified functions of its functions will be cached only in memory.", self.logger)
+                self._source_hashes[module_name] = None
+        return self._source_hashes[module_name]
+
+    def get_key(self, function, *args, **kwargs):
+        return (SYMBOLIC_CACHE_VERSION, function.__name__, self.get_source_hash(function),
+                self._normalize_argument(args),
+                tuple([(name, self._normalize_argument(kwargs[name])) for name in sorted(kwargs.keys())]))
+
+    def get_file_path(self, key):
+        return os.path.join(self.folder, key[1] + "_" + hashlib.md5(repr(key)).hexdigest() + ".py")
+
+    def _write_lambdas(self, key, lambdas):
+        functions_sources = []
+
+        def to_source(lambdas):
+            if isinstance(lambdas, (list, tuple)):
+                sources = [to_source(lambda_fun) for lambda_fun in lambdas]
+                return ("[" if isinstance(lambdas, list) else "(") + ", ".join(sources) + \
+                       ("]" if isinstance(lambdas, list) else ",)")
+            source = inspect.getsource(lambdas)
+            if not source.startswith("def " + lambdas.__name__ + "("):
+                raise ValueError("Unexpected source of lambdified function " + lambdas.__name__)
+            name = "_lambda_" + str(len(functions_sources))
+            functions_sources.append(source.replace("def " + lambdas.__name__ + "(", "def " + name + "(", 1))
+            return name
+
+        try:
+            structure = to_source(lambdas)
+        except (IOError, TypeError, ValueError):
+            warning("Failed to get the source code of the lambdified functions of " + str(key) + "!\n" +
+                    "They will be cached only in memory.", self.logger)
+            return
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+        def write(file_path):
+            with open(file_path, "w") as f:
+                f.write("# Generated by " + __name__ + " for:\n# " + repr(key).replace("\n", " ") + "\n" +
+                        "import numpy\nfrom numpy import *\n\n\n")
+                for source in functions_sources:
+                    f.write(source + "\n\n")
+                f.write("LAMBDAS = " + structure + "\n")
+
+        write_file_atomically(self.get_file_path(key), write)
+
+    def _read_lambdas(self, key):
+        file_path = self.get_file_path(key)
+        if not os.path.isfile(file_path):
+            return None
+        namespace = {}
+        try:
+            with open(file_path, "r") as f:
+                exec(compile(f.read(), file_path, "exec"), namespace)
+            return namespace["LAMBDAS"]
+        except Exception:
+            self.logger.exception("Failed to read cached lambdified functions from " + file_path + "!")
+            return None
+
+    def get(self, function, *args, **kwargs):
+        """
+        Get the lambdified function(s) that function(*args, **kwargs)[0] returns, from memory, disk, or by calling it.
+        """
+        key = self.get_key(function, *args, **kwargs)
+        lambdas = self._lambdas.get(key, None)
+        # Without the hash of their source code, the source files can not be validated
+        use_disk = self.folder is not None and key[2] is not None
+        if lambdas is None and use_disk:
+            lambdas = self._read_lambdas(key)
+            if lambdas is not None:
+                self.logger.debug("Loaded lambdified functions of " + function.__name__ + " from disk.")
+        if lambdas is None:
+            lambdas = function(*args, **kwargs)[0]
+            if use_disk:
+                self._write_lambdas(key, lambdas)
+        self._lambdas[key] = lambdas
+        return lambdas
+
+    def clear(self, disk=False):
+        self._lambdas = {}
+        if disk and self.folder is not None and os.path.isdir(self.folder):
+            for file_name in os.listdir(self.folder):
+                if file_name.endswith(".py"):
+                    os.remove(os.path.join(self.folder, file_name))
+
+
+symbolic_lambda_cache = SymbolicLambdaCache()
+
+
+def symbol_lambda(function, *args, **kwargs):
+    # The cached lambdified function(s) of function(*args, **kwargs)[0], i.e., of any of the symbol_* functions
+    return symbolic_lambda_cache.get(function, *args, **kwargs)
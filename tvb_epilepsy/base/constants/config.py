@@ -22,6 +22,8 @@ class GenericConfig(object):
     # Identify and choose the Simulator, or data folder type to read.
     MODE_JAVA = "java"
     MODE_TVB = "tvb"
+    # Only for the Simulator:
+    MODE_NUMPY = "numpy"
 
 
 class InputConfig(object):
@@ -65,6 +67,18 @@ class InputConfig(object):
 class OutputConfig(object):
     subfolder = None
 
+    # Storage of the datasets of the H5 files: compression filter ("gzip", "lzf" or None),
+    # its options (e.g., the level of gzip, 0-9), and whether the shuffle filter precedes compression
+    H5_COMPRESSION = None
+    H5_COMPRESSION_OPTS = None
+    H5_SHUFFLE = True
+    # Time series are stored in chunks of up to H5_CHUNK_SIGNALS signals and H5_CHUNK_BYTES bytes,
+    # or contiguously if H5_CHUNK_BYTES is None
+    H5_CHUNK_BYTES = 2 ** 19
+    H5_CHUNK_SIGNALS = 16
+    # Other datasets are compressed, if they are larger than this, in bytes
+    H5_COMPRESSION_MIN_BYTES = 2 ** 12
+
     def __init__(self, out_base=None, separate_by_run=False):
         """
         :param work_folder: Base folder where logs/figures/results should be kept
@@ -124,6 +138,9 @@ class FiguresConfig(object):
 
 class CalculusConfig(object):
     SYMBOLIC_CALCULATIONS_FLAG = False
+    # Folder where the lambdified functions of symbolic calculations are cached, or None to cache only in memory.
+    # The cached files are executed when loaded, so only set it to a folder that no one else can write to.
+    SYMBOLIC_CACHE_FOLDER = None
 
     # Normalization configuration
     WEIGHTS_NORM_PERCENT = 95
@@ -132,9 +149,17 @@ class CalculusConfig(object):
     # or "user_defined", in which case we expect a number equal to from 1 to hypothesis.n_regions
     LSA_METHOD = "1D" # other options: "2D", "auto"
     EIGENVECTORS_NUMBER_SELECTION = "auto_eigenvals"
+    # Eigenvalue decomposition for LSA: "dense" (full decomposition), "partial" (only the leading eigenvectors),
+    # or "auto", in which case "partial" is selected only for large connectomes and few eigenvectors
+    LSA_EIGEN_SOLVER = "auto"
+    LSA_PARTIAL_EIGEN_SOLVER_MIN_REGIONS = 500
+    LSA_PARTIAL_EIGEN_SOLVER_MAX_RATIO = 0.1
     WEIGHTED_EIGENVECTOR_SUM = True
     INTERACTIVE_ELBOW_POINT = False
 
+    # Number of time points of the blocks, in which the data of Timeseries are processed out of core
+    TIMESERIES_BLOCK_LENGTH = 2 ** 16
+
     MIN_SINGLE_VALUE = np.finfo("single").min
     MAX_SINGLE_VALUE = np.finfo("single").max
     MAX_INT_VALUE = np.iinfo(np.int64).max
@@ -144,6 +169,17 @@ class CalculusConfig(object):
 class SimulatorConfig(object):
     USE_TIME_DELAYS_FLAG = True
     MODE = GenericConfig.MODE_TVB
+    # Cache of simulation results, keyed by a hash of everything that determines them
+    USE_SIMULATION_CACHE = False
+    SIMULATION_CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".tvb_epilepsy", "simulation_cache")
+    # Maximum total size of the cached results in bytes, beyond which the least recently used ones are removed
+    SIMULATION_CACHE_MAX_SIZE = 2 * 1024 ** 3
+    # Tolerances of the local error of the adaptive step integrators of the numpy simulator
+    ADAPTIVE_STEP_ATOL = 1e-4
+    ADAPTIVE_STEP_RTOL = 1e-4
+    # Online seizure detection: x1 threshold of seizures, and minimum time (ms) below it for a seizure to end
+    SEIZURE_DETECTION_X1_THRESHOLD = 0.0
+    SEIZURE_DETECTION_MIN_OFFSET_INTERVAL = 100.0
 
 
 class HypothesisConfig(object):
@@ -0,0 +1,147 @@
+# coding=utf-8
+"""
+Copy-on-write parameter overlays, used to vary a few parameters of an object (e.g., per sample of a PSE)
+without deep copying the whole object.
+
+An overlay keeps a reference to a base object, which is never modified, and records only the parameters that are set
+on it, as attribute paths (e.g., "x0_values" or "model.x0"), with optional (linear) indices.
+Attributes that are not modified are read through from the base object, numpy arrays as read-only views,
+so that any attempt for an in place modification fails instead of corrupting the base object.
+Arrays modified only at some indices are copied lazily, the first time they are read.
+Methods and properties of the base object's class are evaluated on the overlay.
+"""
+
+import types
+from copy import copy, deepcopy
+import numpy
+
+
+def _get_class_attribute(klass, name):
+    for base_class in klass.__mro__:
+        if name in base_class.__dict__:
+            return base_class.__dict__[name]
+    raise AttributeError(name)
+
+
+class ParameterOverlay(object):
+
+    def __init__(self, base):
+        object.__setattr__(self, "_overlay_base", base)
+        # Attributes set on the overlay, including child overlays for nested paths
+        object.__setattr__(self, "_overlay_values", {})
+        # Lists of (indices, values) modifications of base attributes, to be applied when they are first read
+        object.__setattr__(self, "_overlay_pending", {})
+
+    @property
+    def __class__(self):
+        # So that isinstance() checks and class names refer to the class of the base object
+        return self._overlay_base.__class__
+
+    @property
+    def overlay_base(self):
+        return self._overlay_base
+
+    @property
+    def overlay_paths(self):
+        paths = []
+        for name in sorted(set(self._overlay_values.keys() + self._overlay_pending.keys())):
+            value = self._overlay_values.get(name, None)
+            if type(value) is ParameterOverlay:
+                paths += [name + "." + path for path in value.overlay_paths]
+            else:
+                paths.append(name)
+        return paths
+
+    def set_parameter(self, path, values, indices=[]):
+        if isinstance(path, basestring):
+            path = path.split(".")
+        name = path[0]
+        if len(path) > 1:
+            # Nested path: set the parameter on a child overlay of the respective attribute of the base object
+            child = self._overlay_values.get(name, None)
+            if type(child) is not ParameterOverlay:
+                child = ParameterOverlay(getattr(self, name))
+                self._overlay_values[name] = child
+            child.set_parameter(path[1:], values, indices)
+        elif len(indices) > 0:
+            value = self._overlay_values.get(name, None)
+            if isinstance(value, numpy.ndarray) and value.flags.writeable:
+                # Already materialized
+                value[indices] = values
+            else:
+                self._overlay_pending.setdefault(name, []).append((indices, values))
+        else:
+            setattr(self, name, values)
+        return self
+
+    def _materialize_attribute(self, name):
+        value = self._overlay_values.pop(name, None)
+        if value is None:
+            value = getattr(self._overlay_base, name)
+        # This is the only place where (only the modified) arrays are copied
+        value = numpy.array(value)
+        for indices, values in self._overlay_pending.pop(name):
+            value[indices] = values
+        self._overlay_values[name] = value
+        return value
+
+    def materialize(self):
+        # Generate a standalone shallow copy of the base object, with all parameters of the overlay applied
+        obj = copy(self._overlay_base)
+        for name in list(self._overlay_pending.keys()):
+            self._materialize_attribute(name)
+        for name, value in self._overlay_values.items():
+            if type(value) is ParameterOverlay:
+                value = value.materialize()
+            setattr(obj, name, value)
+        return obj
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the overlay object itself
+        if name.startswith("_overlay") or (name.startswith("__") and name.endswith("__")):
+            raise AttributeError(name)
+        if name in self._overlay_pending:
+            return self._materialize_attribute(name)
+        if name in self._overlay_values:
+            return self._overlay_values[name]
+        base = self._overlay_base
+        if name not in getattr(base, "__dict__", {}):
+            try:
+                class_attribute = _get_class_attribute(base.__class__, name)
+            except AttributeError:
+                class_attribute = None
+            if isinstance(class_attribute, property):
+                return class_attribute.fget(self)
+            elif isinstance(class_attribute, types.FunctionType):
+                return types.MethodType(class_attribute, self)
+        value = getattr(base, name)
+        if isinstance(value, numpy.ndarray) and value.ndim > 0:
+            value = value.view()
+            value.flags.writeable = False
+        return value
+
+    def __setattr__(self, name, value):
+        self._overlay_pending.pop(name, None)
+        self._overlay_values[name] = value
+
+    def __delattr__(self, name):
+        self._overlay_pending.pop(name, None)
+        self._overlay_values.pop(name, None)
+
+    def __repr__(self):
+        try:
+            return _get_class_attribute(self._overlay_base.__class__, "__repr__")(self)
+        except:
+            return "ParameterOverlay{" + repr(self._overlay_base) + "\npaths = " + str(self.overlay_paths) + "}"
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __reduce_ex__(self, protocol):
+        return self.materialize().__reduce_ex__(protocol)
+
+    def __copy__(self):
+        return self.materialize()
+
+    def __deepcopy__(self, memo):
+        return deepcopy(self.materialize(), memo)
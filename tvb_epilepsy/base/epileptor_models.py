@@ -8,7 +8,7 @@ import tvb.basic.traits.types_basic as basic
 import tvb.datatypes.arrays as arrays
 from tvb.simulator.common import get_logger
 from tvb.simulator.models import Model
-from tvb_epilepsy.base.utils.log_error_utils import raise_value_error, raise_not_implemented_error
+from tvb_epilepsy.base.utils.log_error_utils import raise_value_error
 from tvb_epilepsy.base.utils.data_structures_utils import isequal_string
 
 LOG = get_logger(__name__)
@@ -357,7 +357,67 @@ class EpileptorDP(Model):
 
     def jacobian(self, state_variables, coupling, local_coupling=0.0,
                  array=numpy.array, where=numpy.where, concat=numpy.concatenate):
-        raise_not_implemented_error("Jacobian calculation of model " + self._ui_name + " is not implemented yet!")
+        r"""
+        Computes the Jacobian of the derivatives of the state variables of the Epileptor
+        with respect to the state variables, for a fixed coupling.
+
+        Implementation note: the Jacobian is local to each node, i.e., it is returned as an array of blocks jac
+        of shape (6, 6, n) for y of shape (6, n), where jac[i, j] = d ydot[i] / d y[j] for all nodes.
+        As in dfun, the if/else branches are evaluated by masks on the same conditions.
+        The terms due to the coupling from other nodes are given by coupling_jacobian.
+        """
+
+        y = state_variables
+        jac = numpy.zeros((self._nvar, ) + y.shape)
+
+        # population 1
+        if_jac00 = -3 * self.a * y[0] ** 2 + 2 * self.b * y[0]
+        else_jac00 = self.slope - y[3] + 0.6 * (y[2] - 4.0) ** 2
+        jac[0, 0] = self.tau1 * (local_coupling + where(y[0] < 0.0, if_jac00, else_jac00))
+        jac[0, 1] = self.tau1
+        jac[0, 2] = self.tau1 * (-1.0 + where(y[0] < 0.0, 0.0, 1.2 * (y[2] - 4.0) * y[0]))
+        jac[0, 3] = self.tau1 * where(y[0] < 0.0, 0.0, -y[0])
+        jac[1, 0] = -2 * self.tau1 * self.d * y[0]
+        jac[1, 1] = -self.tau1
+
+        # energy
+        if isequal_string(str(self.zmode), 'lin'):
+            jac[2, 0] = 4 * self.tau1 / self.tau0
+            jac[2, 2] = self.tau1 * (where(y[2] < 0., -0.7 * y[2] ** 6, 0.0) - 1.0) / self.tau0
+
+        elif isequal_string(str(self.zmode), 'sig'):
+            exp_fun = numpy.exp(-10 * (y[0] + 0.5))
+            jac[2, 0] = self.tau1 * 30.0 * exp_fun / (1.0 + exp_fun) ** 2 / self.tau0
+            jac[2, 2] = -self.tau1 / self.tau0
+
+        else:
+            raise_value_error("zmode has to be either ""lin"" or ""sig"" for linear and sigmoidal fz(), " +
+                              "respectively")
+
+        # population 2
+        jac[3, 2] = -0.3 * self.tau1
+        jac[3, 3] = self.tau1 * (1.0 - 3 * y[3] ** 2)
+        jac[3, 4] = -self.tau1
+        jac[3, 5] = 2 * self.tau1
+        jac[4, 3] = self.tau1 * where(y[3] < -0.25, 0.0, self.s) / self.tau2
+        jac[4, 4] = -self.tau1 / self.tau2
+
+        # filter
+        jac[5, 0] = 0.01 * self.tau1 * self.gamma
+        jac[5, 5] = -0.01 * self.tau1
+
+        return jac
+
+    def coupling_jacobian(self, state_variables, coupling, local_coupling=0.0):
+        """
+        Computes the Jacobian of the derivatives of the state variables of the Epileptor
+        with respect to the coupling variables, of shape (6, 2, n) for y of shape (6, n).
+        """
+        jac = numpy.zeros((self._nvar, self.cvar.size) + state_variables.shape[1:])
+        jac[0, 0] = self.tau1 * self.Kvf
+        jac[2, 0] = self.tau1 * self.K / self.tau0
+        jac[3, 1] = self.tau1 * self.Kf
+        return jac
 
 
 class EpileptorDPrealistic(Model):
@@ -643,6 +703,39 @@ class EpileptorDPrealistic(Model):
 
         return slope_eq, Iext2_eq
 
+    @staticmethod
+    def fun_slope_Iext2_jac(z, g, pmode, slope, Iext2):
+        # Derivatives of slope_eq and Iext2_eq of fun_slope_Iext2 with respect to z and g
+        zeros = numpy.zeros(numpy.broadcast(z, g).shape)
+        dxp_dz = zeros
+        dxp_dg = zeros
+        if (pmode == numpy.array(['g', 'z', 'z*g'])).any():
+
+            if pmode == 'g':
+                xp = 1.0 / (1.0 + numpy.exp(1) ** (-10 * (g + 0.0)))
+                dxp_dg = 10 * xp * (1.0 - xp)
+                xp1 = 0
+                xp2 = 1
+
+            elif pmode == 'z':
+                xp = 1.0 / (1.0 + numpy.exp(1) ** (-10 * (z - 3.00)))
+                dxp_dz = 10 * xp * (1.0 - xp)
+                xp1 = 0
+                xp2 = 1
+
+            elif pmode == 'z*g':
+                dxp_dz = g + zeros
+                dxp_dg = z + zeros
+                xp1 = -0.7
+                xp2 = 0.1
+            # the derivatives of the linear interval_scaling from (xp1, xp2) to (1.0, slope) and (0.0, Iext2)
+            slope_scale = (slope - 1.0) / (xp2 - xp1)
+            Iext2_scale = (Iext2 - 0.0) / (xp2 - xp1)
+            return slope_scale * dxp_dz, slope_scale * dxp_dg, Iext2_scale * dxp_dz, Iext2_scale * dxp_dg
+
+        else:
+            return zeros, zeros, zeros, zeros
+
     def dfun(self, state_variables, coupling, local_coupling=0.0,
              array=numpy.array, where=numpy.where, concat=numpy.concatenate):
         r"""
@@ -756,7 +849,96 @@ class EpileptorDPrealistic(Model):
 
     def jacobian(self, state_variables, coupling, local_coupling=0.0,
                  array=numpy.array, where=numpy.where, concat=numpy.concatenate):
-        raise_not_implemented_error("Jacobian calculation of model " + self._ui_name + " is not implemented yet!")
+        r"""
+        Computes the Jacobian of the derivatives of the state variables of the Epileptor
+        with respect to the state variables, for a fixed coupling.
+
+        Implementation note: the Jacobian is local to each node, i.e., it is returned as an array of blocks jac
+        of shape (11, 11, n) for y of shape (11, n), where jac[i, j] = d ydot[i] / d y[j] for all nodes.
+        As in dfun, the if/else branches are evaluated by masks on the same conditions.
+        The terms due to the coupling from other nodes are given by coupling_jacobian.
+        """
+
+        y = state_variables
+        jac = numpy.zeros((self._nvar, ) + y.shape)
+
+        slope = y[7]
+        K = y[10]
+        c_pop1 = coupling[0, :]
+
+        # population 1
+        if_jac00 = -3 * self.a * y[0] ** 2 + 2 * self.b * y[0]
+        else_jac00 = slope - y[3] + 0.6 * (y[2] - 4.0) ** 2
+        jac[0, 0] = self.tau1 * (local_coupling + where(y[0] < 0.0, if_jac00, else_jac00))
+        jac[0, 1] = self.tau1
+        jac[0, 2] = self.tau1 * (-1.0 + where(y[0] < 0.0, 0.0, 1.2 * (y[2] - 4.0) * y[0]))
+        jac[0, 3] = self.tau1 * where(y[0] < 0.0, 0.0, -y[0])
+        jac[0, 7] = self.tau1 * where(y[0] < 0.0, 0.0, y[0])
+        jac[1, 0] = -2 * self.tau1 * self.d * y[0]
+        jac[1, 1] = -self.tau1
+
+        # energy
+        if isequal_string(str(self.zmode), 'lin'):
+            jac[2, 0] = 4 * self.tau1 / self.tau0
+            jac[2, 2] = self.tau1 * (where(y[2] < 0., -0.7 * y[2] ** 6, 0.0) - 1.0) / self.tau0
+            jac[2, 6] = -4 * self.tau1 / self.tau0
+
+        elif isequal_string(str(self.zmode), 'sig'):
+            exp_fun = numpy.exp(-10 * (y[0] + 0.5))
+            jac[2, 0] = self.tau1 * 30.0 * exp_fun / (1.0 + exp_fun) ** 2 / self.tau0
+            jac[2, 2] = -self.tau1 / self.tau0
+            jac[2, 6] = -self.tau1 / self.tau0
+
+        else:
+            raise_value_error("zmode has to be either ""lin"" or ""sig"" for linear and sigmoidal fz(), respectively")
+        jac[2, 10] = self.tau1 * c_pop1 / self.tau0
+
+        # population 2
+        jac[3, 2] = -0.3 * self.tau1
+        jac[3, 3] = self.tau1 * (1.0 - 3 * y[3] ** 2)
+        jac[3, 4] = -self.tau1
+        jac[3, 5] = 2 * self.tau1
+        jac[3, 9] = self.tau1
+        jac[4, 3] = self.tau1 * where(y[3] < -0.25, 0.0, self.s) / self.tau2
+        jac[4, 4] = -self.tau1 / self.tau2
+
+        # filter
+        jac[5, 0] = 0.01 * self.tau1 * self.gamma
+        jac[5, 5] = -0.01 * self.tau1
+
+        feedback = (self.pmode == numpy.array(['g', 'z', 'z*g'])).any()
+        dslope_dz, dslope_dg, dIext2_dz, dIext2_dg = \
+            self.fun_slope_Iext2_jac(y[2], y[5], self.pmode, self.slope, self.Iext2)
+        tau0_feedback = numpy.where(feedback, 1.0, self.tau0/100)
+
+        # x0_values
+        jac[6, 6] = -1000 * self.tau1 / self.tau0
+        # slope
+        jac[7, 2] = 10 * self.tau1 * dslope_dz / tau0_feedback
+        jac[7, 5] = 10 * self.tau1 * dslope_dg / tau0_feedback
+        jac[7, 7] = -10 * self.tau1 / tau0_feedback
+        # Iext1
+        jac[8, 8] = -1000 * self.tau1 / self.tau0
+        # Iext2
+        jac[9, 2] = 10 * self.tau1 * dIext2_dz / tau0_feedback
+        jac[9, 5] = 10 * self.tau1 * dIext2_dg / tau0_feedback
+        jac[9, 9] = -10 * self.tau1 / tau0_feedback
+        # K
+        jac[10, 10] = -1000 * self.tau1 / self.tau0
+
+        return jac
+
+    def coupling_jacobian(self, state_variables, coupling, local_coupling=0.0):
+        """
+        Computes the Jacobian of the derivatives of the state variables of the Epileptor
+        with respect to the coupling variables, of shape (11, 2, n) for y of shape (11, n).
+        """
+        y = state_variables
+        jac = numpy.zeros((self._nvar, self.cvar.size) + y.shape[1:])
+        jac[0, 0] = self.tau1 * self.Kvf
+        jac[2, 0] = self.tau1 * y[10] / self.tau0
+        jac[3, 1] = self.tau1 * self.Kf
+        return jac
 
 
 class EpileptorDP2D(Model):
@@ -1024,66 +1206,47 @@ class EpileptorDP2D(Model):
 
     def jacobian(self, state_variables, coupling, local_coupling=0.0,
                  array=numpy.array, where=numpy.where, concat=numpy.concatenate):
-        raise_not_implemented_error("Jacobian calculation of model " + self._ui_name + " is not implemented yet!")
-    #     r"""
-    #     Computes the Jacobian of the state variables of the Epileptor
-    #     with respect to time.
-    #
-    #     Implementation note: we expect this version of the Epileptor to be used
-    #     in a vectorized manner. Concretely, y has a shape of (2, n) where n is
-    #     the number of nodes in the network. An consequence is that
-    #     the original use of if/else is translated by calculated both the true
-    #     and false forms and mixing them using a boolean mask.
-    #
-    #     Variables of interest to be used by monitors: -y[0] + y[3]
-    #
-    #         .. math::
-    #         \dot{y_{0}} &=& yc - f_{1}(y_{0}, y_{1}) - y_{2} + I_{ext1} \\
-    #         \dot{y_{1}} &=&
-    #         \begin{cases}
-    #         (f_z(y_{0}) - y_{1}-0.1 y_{1}^{7})/tau0 & \text{if } y_{0}<5/3 \\
-    #         (f_z(y_{0}) - y_{1})/tau0           & \text{if } y_{0} \geq 5/3
-    #         \end{cases} \\
-    #
-    #     where:
-    #         .. math::
-    #             f_{1}(y_{0}, y_{3}) =
-    #             \begin{cases}
-    #             a ( y_{0} -5/3 )^{3} - b ( y_{0} -5/3 )^2 & \text{if } y_{0} <5/3\\
-    #             ( 5*( y_{0} -5/3 ) - 0.6(y_{1}-4)^2 -slope) ( y_{0} - 5/3 ) &\text{if }y_{0} \geq 5/3
-    #             \end{cases}
-    #     and:
-    #
-    #         .. math::
-    #             f_z(y_{0})  =
-    #             \begin{cases}
-    #             4 * (y_{0} - r*x0_values + x0_{cr}) & \text{linear} \\
-    #             \frac{3}{1+e^{-10*(y_{0}-7/6)}} - r*x0_values + x0_{cr} & \text{sigmoidal} \\
-    #             \end{cases}
-    #
-    #
-    #     """
-    #
-    #     y = state_variables
-    #
-    #     n_ep = state_variables.shape[1]
-    #
-    #     # population 1
-    #     jac_xx = where(y[0] < 0.0, numpy.diag(3*y[0]**2 + 4.0*y[0]), numpy.diag(5*y[0]+0.6*(y[1]-4.0)**2-self.slope))
-    #     jac_xz = where(y[0] < 0.0, numpy.diag(numpy.zeros((n_ep,), dtype=y.dtype)), numpy.diag(1.2*(y[1]-4.0)*y[0]))
-    #
-    #     # energy
-    #     # The terms resulting from coupling from other regions, have to be added later on
-    #     if_fz = - 0.1 * y[1] ** 7
-    #     else_fz = 0
-    #     jac_zz = -numpy.diag(numpy.ones((n_ep,)), dtype=y.dtype) / self.tau0
-    #     if isequal_string(str(self.zmode), 'lin'):
-    #         jac_zx = numpy.diag(4.0) / self.tau0
-    #         jac_zz -= numpy.diag(where(y[1] < 0.0, if_fz, else_fz))
-    #     elif isequal_string(str(self.zmode), 'sig'):
-    #         exp_fun = numpy.exp(-10.0 * (y[0] + 0.5))
-    #         jac_zx = numpy.diag(30.0 * exp_fun / (1.0 + exp_fun) ** 2)/ self.tau0
-    #     else:
-    #         raise_value_error('zmode has to be either ""lin"" or ""sig"" for linear and sigmoidal fz(), respectively')
-    #
-    #     return concat([numpy.hstack([jac_xx, jac_xz]),numpy.hstack([jac_zx, jac_zz])],axis=0)
+        r"""
+        Computes the Jacobian of the derivatives of the state variables of the Epileptor
+        with respect to the state variables, for a fixed coupling.
+
+        Implementation note: the Jacobian is local to each node, i.e., it is returned as an array of blocks jac
+        of shape (2, 2, n) for y of shape (2, n), where jac[i, j] = d ydot[i] / d y[j] for all nodes.
+        As in dfun, the if/else branches are evaluated by masks on the same conditions.
+        The terms due to the coupling from other nodes are given by coupling_jacobian.
+        """
+
+        y = state_variables
+        jac = numpy.zeros((self._nvar, ) + y.shape)
+
+        # population 1
+        if_jac00 = 3 * self.a * y[0] ** 2 + 2 * (self.d - self.b) * y[0]
+        else_jac00 = 2 * self.d * y[0] - 0.6 * (y[1] - 4.0) ** 2 - self.slope
+        jac[0, 0] = self.tau1 * (local_coupling - where(y[0] < 0.0, if_jac00, else_jac00))
+        jac[0, 1] = self.tau1 * (-1.0 + where(y[0] < 0.0, 0.0, 1.2 * (y[1] - 4.0) * y[0]))
+
+        # energy
+        if isequal_string(str(self.zmode), 'lin'):
+            jac[1, 0] = 4 * self.tau1 / self.tau0
+            jac[1, 1] = self.tau1 * (where(y[1] < 0.0, -0.7 * y[1] ** 6, 0.0) - 1.0) / self.tau0
+
+        elif isequal_string(str(self.zmode), 'sig'):
+            exp_fun = numpy.exp(-10 * (y[0] + 0.5))
+            jac[1, 0] = self.tau1 * 30.0 * exp_fun / (1.0 + exp_fun) ** 2 / self.tau0
+            jac[1, 1] = -self.tau1 / self.tau0
+
+        else:
+            raise_value_error('zmode has to be either ""lin"" or ""sig"" for linear and sigmoidal fz(), respectively')
+
+        return jac
+
+    def coupling_jacobian(self, state_variables, coupling, local_coupling=0.0):
+        """
+        Computes the Jacobian of the derivatives of the state variables of the Epileptor
+        with respect to the coupling variables, of shape (2, 2, n) for y of shape (2, n).
+        Only the coupling of the first coupling variable, x1, enters the equations.
+        """
+        jac = numpy.zeros((self._nvar, self.cvar.size) + state_variables.shape[1:])
+        jac[0, 0] = self.tau1 * self.Kvf
+        jac[1, 0] = self.tau1 * self.K / self.tau0
+        return jac
@@ -2,7 +2,9 @@ import numpy
 from enum import Enum
 from copy import deepcopy
 from collections import OrderedDict
-from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from tvb_epilepsy.base.constants.config import CalculusConfig
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error
 from tvb_epilepsy.base.utils.data_structures_utils import monopolar_to_bipolar
 
 
@@ -30,15 +32,51 @@ class PossibleVariables(Enum):
     SEEG = "seeg"
 
 
+class FrozenDimensionLabels(OrderedDict):
+    """
+    Immutable dimension labels, with the labels of each dimension as tuples,
+    so that they can be shared, instead of deep copied, among Timeseries views.
+    """
+
+    def __init__(self, dimension_labels=()):
+        super(FrozenDimensionLabels, self).__init__()
+        for dimension, labels in OrderedDict(dimension_labels).items():
+            if not isinstance(labels, basestring):
+                labels = tuple(labels)
+            OrderedDict.__setitem__(self, dimension, labels)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Dimension labels of Timeseries views are immutable!")
+
+    __setitem__ = __delitem__ = update = pop = popitem = clear = setdefault = _immutable
+
+
 class Timeseries(object):
+    """
+    Time series data of shape (time, space, variables, samples).
+
+    In view mode (view=True, or as_view()), selections (get_time_window, get_subspace_by_index/labels,
+    get_state_variable, decimate_time, get_sample_window) of equally spaced indices return numpy views,
+    instead of copies, of the data, and all selections share the same immutable dimension labels objects.
+    Data shared by views is read-only, for both the selected and the original Timeseries,
+    so that in place modifications have to go through writable_data, which copies the data on the first write.
+    """
     logger = initialize_logger(__name__)
 
     dimensions = TimeseriesDimensions
 
+    is_view = False
+
     # dimension_labels = {"space": [], "variables": []}
 
-    def __init__(self, data, dimension_labels, time_start, time_step, time_unit="ms"):
+    def __init__(self, data, dimension_labels, time_start, time_step, time_unit="ms", view=False):
         self.data = self.prepare_4D(data)
+        self.is_view = view
+        if view:
+            # A new array object, so that marking it read-only does not affect the flags of the given array
+            self.data = self.data.view()
+            if not isinstance(dimension_labels, FrozenDimensionLabels):
+                dimension_labels = FrozenDimensionLabels(dimension_labels)
         self.dimension_labels = dimension_labels
         self.time_start = time_start
         self.time_step = time_step
@@ -101,6 +139,67 @@ class Timeseries(object):
     def squeezed(self):
         return numpy.squeeze(self.data)
 
+    @property
+    def writable_data(self):
+        # Copy on write of data shared with Timeseries views
+        if not self.data.flags.writeable:
+            self.data = numpy.array(self.data)
+        return self.data
+
+    def as_view(self):
+        return Timeseries(self.data, self.dimension_labels, self.time_start, self.time_step, self.time_unit,
+                          view=True)
+
+    def _share_data(self):
+        # Data, of which views are taken, can only be modified after a copy, through writable_data
+        if self.is_view:
+            self.data.flags.writeable = False
+        return self.data
+
+    def _select_data(self, axis, selection):
+        key = [slice(None)] * 4
+        key[axis] = selection
+        return self._share_data()[tuple(key)]
+
+    def iter_time_blocks(self, block_length=CalculusConfig.TIMESERIES_BLOCK_LENGTH):
+        """
+        Iterate over the data in blocks of time points, which, for out of core Timeseries, are read one at a time
+        :return: generator of (index of the first time point of the block, block of data of shape
+                 (at most block_length, n_space, n_variables, n_samples))
+        """
+        for i_start in range(0, self.time_length, block_length):
+            yield i_start, numpy.asarray(self._share_data()[i_start:i_start + block_length])
+
+    def _new_timeseries(self, data, dimension_labels, time_start=None, time_step=None, copied=False):
+        if time_start is None:
+            time_start = self.time_start
+        if time_step is None:
+            time_step = self.time_step
+        if self.is_view:
+            timeseries = Timeseries(data, dimension_labels, time_start, time_step, self.time_unit, view=True)
+            if copied:
+                # The data of a copying selection are not shared, and can be modified in place
+                timeseries.data = timeseries.prepare_4D(data)
+            return timeseries
+        return Timeseries(data, dimension_labels, time_start, time_step, self.time_unit)
+
+    def _select_space_indices(self, list_of_index):
+        # In view mode, equally spaced increasing indices are selected by a slice, i.e., as a view of the data
+        indices = numpy.array(list_of_index)
+        if self.is_view and indices.ndim < 2 and indices.size > 0 and indices.dtype.kind in "iu":
+            indices = indices.flatten()
+            steps = numpy.diff(indices)
+            step = steps[0] if steps.size > 0 else 1
+            if step > 0 and numpy.all(steps == step):
+                return slice(indices[0], indices[-1] + 1, step)
+        return list_of_index
+
+    def _select_space_labels(self, selection):
+        labels = self.dimension_labels[TimeseriesDimensions.SPACE.value]
+        if isinstance(selection, slice):
+            return labels[selection]
+        return numpy.array(labels)[selection]
+
     def _get_index_for_slice_label(self, slice_label, slice_idx):
         if slice_idx == 1:
             return self._get_indices_for_labels([slice_label])[0]
@@ -188,43 +287,44 @@ class Timeseries(object):
                 else:
                     slice_list.append(current_slice)
 
-        return self.data[tuple(slice_list)]
+        return self._share_data()[tuple(slice_list)]
 
     def get_state_variable(self, sv_label):
-        sv_data = self.data[:, :, self._get_index_of_state_variable(sv_label), :]
-        return Timeseries(numpy.expand_dims(sv_data, 2),
-                          OrderedDict({TimeseriesDimensions.SPACE.value: self.dimension_labels[
-                              TimeseriesDimensions.SPACE.value]}),
-                          self.time_start, self.time_step, self.time_unit)
+        sv_index = self._get_index_of_state_variable(sv_label)
+        sv_data = self._select_data(2, slice(sv_index, sv_index + 1))
+        return self._new_timeseries(sv_data,
+                                    OrderedDict({TimeseriesDimensions.SPACE.value: self.dimension_labels[
+                                        TimeseriesDimensions.SPACE.value]}))
+
+    def _get_subspace(self, selection, subspace_labels):
+        subspace_data = self._select_data(1, selection)
+        if self.is_view:
+            subspace_dimension_labels = OrderedDict(self.dimension_labels)
+        else:
+            subspace_dimension_labels = deepcopy(self.dimension_labels)
+        subspace_dimension_labels[TimeseriesDimensions.SPACE.value] = subspace_labels
+        if subspace_data.ndim == 3:
+            subspace_data = numpy.expand_dims(subspace_data, 1)
+        return self._new_timeseries(subspace_data, subspace_dimension_labels,
+                                    copied=not isinstance(selection, slice))
 
     def get_subspace_by_labels(self, list_of_labels):
         list_of_indices_for_labels = self._get_indices_for_labels(list_of_labels)
-        subspace_data = self.data[:, list_of_indices_for_labels, :, :]
-        subspace_dimension_labels = deepcopy(self.dimension_labels)
-        subspace_dimension_labels[TimeseriesDimensions.SPACE.value] = list_of_labels
-        if subspace_data.ndim == 3:
-            subspace_data = numpy.expand_dims(subspace_data, 1)
-        return Timeseries(subspace_data, subspace_dimension_labels, self.time_start, self.time_step, self.time_unit)
+        return self._get_subspace(self._select_space_indices(list_of_indices_for_labels), list_of_labels)
 
     def get_subspace_by_index(self, list_of_index):
         self._check_space_indices(list_of_index)
-        subspace_data = self.data[:, list_of_index, :, :]
-        subspace_dimension_labels = deepcopy(self.dimension_labels)
-        subspace_dimension_labels[TimeseriesDimensions.SPACE.value] = \
-            numpy.array(self.dimension_labels[TimeseriesDimensions.SPACE.value])[list_of_index]
-        if subspace_data.ndim == 3:
-            subspace_data = numpy.expand_dims(subspace_data, 1)
-        return Timeseries(subspace_data, subspace_dimension_labels, self.time_start, self.time_step, self.time_unit)
+        selection = self._select_space_indices(list_of_index)
+        return self._get_subspace(selection, self._select_space_labels(selection))
 
     def get_time_window(self, index_start, index_end):
         if index_start < 0 or index_end > self.data.shape[0]:
             self.logger.error("The time indices are outside time series interval: [%s, %s]" % (0, self.data.shape[0]))
             raise IndexError
-        subtime_data = self.data[index_start:index_end, :, :, :]
+        subtime_data = self._select_data(0, slice(index_start, index_end))
         if subtime_data.ndim == 3:
             subtime_data = numpy.expand_dims(subtime_data, 0)
-        return Timeseries(subtime_data, self.dimension_labels,
-                          self._get_time_unit_for_index(index_start), self.time_step, self.time_unit)
+        return self._new_timeseries(subtime_data, self.dimension_labels, self._get_time_unit_for_index(index_start))
 
     def get_time_window_by_units(self, unit_start, unit_end):
         end_time = self.end_time
@@ -236,20 +336,20 @@ class Timeseries(object):
         return self.get_time_window(index_start, index_end)
 
     def decimate_time(self, time_step):
-        if time_step % self.time_step != 0:
+        index_step = int(numpy.round(time_step / self.time_step))
+        if index_step < 1 or not numpy.isclose(index_step * self.time_step, time_step):
             self.logger.error("Cannot decimate time if new time step is not a multiple of the old time step")
             raise ValueError
 
-        index_step = int(time_step / self.time_step)
-        time_data = self.data[::index_step, :, :, :]
+        time_data = self._select_data(0, slice(None, None, index_step))
 
-        return Timeseries(time_data, self.dimension_labels, self.time_start, time_step, self.time_unit)
+        return self._new_timeseries(time_data, self.dimension_labels, time_step=time_step)
 
     def get_sample_window(self, index_start, index_end):
-        subsample_data = self.data[:, :, :, index_start:index_end]
+        subsample_data = self._select_data(3, slice(index_start, index_end))
         if subsample_data.ndim == 3:
             subsample_data = numpy.expand_dims(subsample_data, 3)
-        return Timeseries(subsample_data, self.dimension_labels, self.time_start, self.time_step, self.time_unit)
+        return self._new_timeseries(subsample_data, self.dimension_labels)
 
     def get_sample_window_by_percentile(self, percentile_start, percentile_end):
         pass
@@ -275,7 +375,7 @@ class Timeseries(object):
             lfp_dim_labels = OrderedDict(
                 {TimeseriesDimensions.SPACE.value: self.dimension_labels[TimeseriesDimensions.SPACE.value],
                  TimeseriesDimensions.VARIABLES.value: [PossibleVariables.SOURCE.value]})
-            return Timeseries(lfp_data, lfp_dim_labels, self.time_start, self.time_step, self.time_unit)
+            return self._new_timeseries(lfp_data, lfp_dim_labels, copied=True)
         self.logger.error(
             "%s is not computed and cannot be computed now because state variables %s and %s are not defined!" % (
                 PossibleVariables.SOURCE.value, PossibleVariables.X1.value, PossibleVariables.X2.value))
@@ -284,5 +384,206 @@ class Timeseries(object):
     def get_bipolar(self):
         bipolar_labels, bipolar_inds = monopolar_to_bipolar(self.space_labels)
         data = self.data[:, bipolar_inds[0]] - self.data[:, bipolar_inds[1]]
-        return Timeseries(data, self.dimension_labels, self.time_start, self.time_step, self.time_unit)
+        return self._new_timeseries(data, self.dimension_labels, copied=True)
+
+
+
+class LazyH5Data(NDArrayOperatorsMixin):
+    """
+    Lazy, read-only proxy of a selection of a h5py dataset, e.g., of the data of a Timeseries H5 file,
+    with trailing singleton axes up to ndim axes.
+    Selections by select are composed without reading any data, into hyperslabs of the dataset,
+    which are read by read, by indexing, or by numpy functions and operators.
+    """
+
+    def __init__(self, dataset, ndim=None, selection=None):
+        self.dataset = dataset
+        if ndim is None:
+            ndim = dataset.ndim
+        if selection is None:
+            # Per axis, either a slice of positive step, or an array of indices
+            selection = [slice(0, n, 1) for n in dataset.shape] + [slice(0, 1, 1)] * (ndim - dataset.ndim)
+        self.selection = list(selection)
+
+    @staticmethod
+    def _length(selection):
+        if isinstance(selection, slice):
+            return len(xrange(selection.start, selection.stop, selection.step))
+        return selection.size
+
+    @staticmethod
+    def _simplify(indices):
+        # Equally spaced increasing indices are read as a hyperslab
+        steps = numpy.diff(indices)
+        if indices.size > 0 and numpy.all(steps == (steps[0] if steps.size > 0 else 1)) and \
+                (steps.size == 0 or steps[0] > 0):
+            step = int(steps[0]) if steps.size > 0 else 1
+            return slice(int(indices[0]), int(indices[-1]) + 1, step)
+        return indices
+
+    @property
+    def shape(self):
+        return tuple(self._length(selection) for selection in self.selection)
+
+    @property
+    def ndim(self):
+        return len(self.selection)
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape))
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def select(self, axis, selection):
+        """
+        :param selection: a slice, or an (array of) index(es), relative to the current selection of the axis
+        :return: a new LazyH5Data of the composed selection, without reading any data
+        """
+        current = self.selection[axis]
+        n = self._length(current)
+        if isinstance(selection, slice):
+            start, stop, step = selection.indices(n)
+            if step < 0:
+                raise_value_error("Lazy h5 data cannot be selected by slices of negative step!")
+            if isinstance(current, slice):
+                count = len(xrange(start, stop, step))
+                start = current.start + start * current.step
+                step *= current.step
+                selection = slice(start, start + (count - 1) * step + 1 if count > 0 else start, step)
+            else:
+                selection = current[start:stop:step]
+        else:
+            indices = numpy.array(selection, dtype="int64", ndmin=1).flatten()
+            indices = numpy.where(indices < 0, indices + n, indices)
+            if numpy.any(indices < 0) or numpy.any(indices >= n):
+                raise IndexError("Indices " + str(selection) + " out of range [0, " + str(n) + ")!")
+            if isinstance(current, slice):
+                indices = current.start + current.step * indices
+            else:
+                indices = current[indices]
+            selection = self._simplify(indices)
+        selections = list(self.selection)
+        selections[axis] = selection
+        return LazyH5Data(self.dataset, self.ndim, selections)
+
+    def read(self):
+        """
+        :return: the selected data as a numpy array, reading only the hyperslabs of the selection
+        """
+        shape = self.shape
+        if 0 in shape:
+            return numpy.empty(shape, dtype=self.dtype)
+        key = []
+        take = []
+        for axis, selection in enumerate(self.selection[:self.dataset.ndim]):
+            if isinstance(selection, slice):
+                key.append(selection)
+            elif len(take) == 0 and numpy.all(numpy.diff(selection) > 0):
+                # h5py reads increasing indices of a single axis
+                key.append(selection.tolist())
+                take.append(None)
+            else:
+                # ...and the rest are read as the hyperslab covering them, and then selected in memory
+                key.append(slice(int(selection.min()), int(selection.max()) + 1))
+                take.append((axis, selection - selection.min()))
+        data = self.dataset[tuple(key)]
+        for axis_take in take:
+            if axis_take is not None:
+                data = numpy.take(data, axis_take[1], axis=axis_take[0])
+        return data.reshape(shape)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim or \
+                sum([not isinstance(k, (slice, int, long, numpy.integer)) for k in key]) > 1 or Ellipsis in key:
+            # Not a hyperslab, or numpy's broadcasting of multiple index arrays
+            return self.read()[key]
+        data = self
+        squeeze_axes = []
+        for axis, k in enumerate(key):
+            data = data.select(axis, k)
+            if isinstance(k, (int, long, numpy.integer)):
+                squeeze_axes.append(axis)
+        data = data.read()
+        if len(squeeze_axes) > 0:
+            data = numpy.squeeze(data, axis=tuple(squeeze_axes))
+        return data
+
+    def __array__(self, dtype=None):
+        data = self.read()
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple([x.read() if isinstance(x, LazyH5Data) else x for x in inputs])
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def _reduce_by_blocks(self, fun, block_length):
+        return fun([fun(self.select(0, slice(i_start, i_start + block_length)).read())
+                    for i_start in range(0, self.shape[0], block_length)])
+
+    def min(self, axis=None, block_length=CalculusConfig.TIMESERIES_BLOCK_LENGTH):
+        if axis is None:
+            return self._reduce_by_blocks(numpy.min, block_length)
+        return self.read().min(axis=axis)
+
+    def max(self, axis=None, block_length=CalculusConfig.TIMESERIES_BLOCK_LENGTH):
+        if axis is None:
+            return self._reduce_by_blocks(numpy.max, block_length)
+        return self.read().max(axis=axis)
 
+
+class H5Timeseries(Timeseries):
+    """
+    Out of core Timeseries, of which the data is a LazyH5Data proxy of the dataset of a Timeseries H5 file.
+    Time windows, subspaces, state variables, decimation and sample windows are lazy selections of hyperslabs,
+    which are read only when their data is needed, e.g., by squeezed, load, or iter_time_blocks.
+    The data is read-only. The h5 file has to be closed by close, when no selection of it is needed anymore.
+    """
+
+    def __init__(self, data, dimension_labels, time_start, time_step, time_unit="ms"):
+        if not isinstance(data, LazyH5Data) or data.ndim != 4:
+            raise_value_error("The data of a H5Timeseries is expected to be a 4D LazyH5Data!")
+        self.data = data
+        self.dimension_labels = dimension_labels
+        self.time_start = time_start
+        self.time_step = time_step
+        self.time_unit = time_unit
+
+    @property
+    def squeezed(self):
+        return numpy.squeeze(self.data.read())
+
+    @property
+    def writable_data(self):
+        raise_value_error("The data of a H5Timeseries is read-only! Use load() to get an in memory Timeseries.")
+
+    def as_view(self):
+        # Selections of a H5Timeseries are already lazy, read-only views of its dataset
+        return self
+
+    def load(self):
+        return Timeseries(self.data.read(), self.dimension_labels, self.time_start, self.time_step, self.time_unit)
+
+    def close(self):
+        self.data.dataset.file.close()
+
+    def _select_data(self, axis, selection):
+        return self.data.select(axis, selection)
+
+    def _new_timeseries(self, data, dimension_labels, time_start=None, time_step=None, copied=False):
+        if isinstance(data, LazyH5Data):
+            if time_start is None:
+                time_start = self.time_start
+            if time_step is None:
+                time_step = self.time_step
+            return H5Timeseries(data, dimension_labels, time_start, time_step, self.time_unit)
+        return super(H5Timeseries, self)._new_timeseries(data, dimension_labels, time_start, time_step, copied)
@@ -1,6 +1,7 @@
 # coding=utf-8
 
 import numpy as np
+from scipy import sparse
 from tvb_epilepsy.base.utils.data_structures_utils import reg_dict, formal_repr, sort_dict, labels_to_inds
 from tvb_epilepsy.base.computations.math_utils import normalize_weights
 
@@ -15,6 +16,10 @@ class ConnectivityH5Field(object):
 
 
 class Connectivity(object):
+    """
+    The weights, normalized_weights and tract_lengths are either dense numpy arrays,
+    or, for large thresholded connectomes, scipy.sparse CSR matrices of the same sparsity structure (see to_sparse).
+    """
     file_path = None
     weights = None
     normalized_weights = None
@@ -30,7 +35,7 @@ class Connectivity(object):
                  normalized_weights=np.array([])):
         self.file_path = file_path
         self.weights = weights
-        if len(normalized_weights) == 0:
+        if not sparse.issparse(normalized_weights) and len(normalized_weights) == 0:
             normalized_weights = normalize_weights(weights, remove_diagonal=True, ceil=1.0)
         self.normalized_weights = normalized_weights
         self.tract_lengths = tract_lengths
@@ -44,6 +49,35 @@ class Connectivity(object):
     def number_of_regions(self):
         return self.centres.shape[0]
 
+    @property
+    def is_sparse(self):
+        return sparse.issparse(self.weights)
+
+    def to_sparse(self, threshold=0.0):
+        """
+        :param threshold: weights, normalized or not, of absolute value not greater than threshold are removed
+        :return: a new Connectivity with the thresholded weights, normalized weights and tract lengths as CSR matrices
+        """
+        normalized_weights = sparse.csr_matrix(self.normalized_weights)
+        mask = sparse.csr_matrix(abs(normalized_weights) > threshold).multiply(abs(sparse.csr_matrix(self.weights)) >
+                                                                             threshold)
+
+        def thresholded(x):
+            x = sparse.csr_matrix(mask.multiply(sparse.csr_matrix(x)))
+            x.eliminate_zeros()
+            return x
+
+        return Connectivity(self.file_path, thresholded(self.weights), thresholded(self.tract_lengths),
+                            self.region_labels, self.centres, self.hemispheres, self.orientations, self.areas,
+                            thresholded(normalized_weights))
+
+    def to_dense(self):
+        if not self.is_sparse:
+            return self
+        return Connectivity(self.file_path, self.weights.toarray(), self.tract_lengths.toarray(), self.region_labels,
+                            self.centres, self.hemispheres, self.orientations, self.areas,
+                            self.normalized_weights.toarray())
+
     def __repr__(self):
         d = {"f. normalized weights": reg_dict(self.normalized_weights, self.region_labels),
              "g. weights": reg_dict(self.weights, self.region_labels),
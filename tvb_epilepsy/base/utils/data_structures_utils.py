@@ -2,6 +2,7 @@
 
 import re
 import numpy as np
+from scipy import sparse
 from collections import OrderedDict
 from copy import deepcopy
 from tvb_epilepsy.base.utils.log_error_utils import raise_value_error, raise_import_error, initialize_logger
@@ -457,7 +458,13 @@ def assert_arrays(params, shape=None, transpose=False):
 
     for ip in range(len(params)):
         # Convert all accepted types to np arrays:
-        if isinstance(params[ip], np.ndarray):
+        if sparse.issparse(params[ip]):
+            # scipy.sparse matrices, e.g., connectivity weights, are kept as they are, if they are of the given shape
+            if params[ip].shape != shape:
+                raise_value_error("Sparse input of shape " + str(params[ip].shape) +
+                                  " is not of the given shape " + str(shape) + "!")
+            continue
+        elif isinstance(params[ip], np.ndarray):
             pass
         elif isinstance(params[ip], (list, tuple)):
             # assuming a list or tuple of symbols...
@@ -515,7 +522,7 @@ def assert_arrays(params, shape=None, transpose=False):
     # Now reshape or tile when necessary
     for ip in range(len(params)):
         try:
-            if params[ip].shape != shape:
+            if params[ip].shape != shape and not sparse.issparse(params[ip]):
                 if params[ip].size in [0, 1]:
                     params[ip] = np.tile(params[ip], shape)
                 else:
@@ -3,6 +3,7 @@
 import os
 from datetime import datetime
 import glob
+import numpy
 
 def ensure_unique_file(parent_folder, filename):
     final_path = os.path.join(parent_folder, filename)
@@ -58,9 +59,72 @@ def change_filename_or_overwrite_with_wildcard(path, overwrite=True):
         return path
 
 
+def write_file_atomically(path, write_function):
+    """
+    Write the file at path by write_function(temporary path), and then rename the temporary file to path,
+    so that other processes never read an incomplete file at path.
+    """
+    temp_path = path + "." + str(os.getpid()) + ".tmp"
+    try:
+        write_function(temp_path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.rename(temp_path, path)
+
+
 def write_metadata(meta_dict, h5_file, key_date, key_version, path="/"):
     root = h5_file[path].attrs
     root[key_date] = str(datetime.now())
     root[key_version] = 2
     for key, val in meta_dict.iteritems():
         root[key] = val
+
+
+def timeseries_chunks(shape, itemsize, chunk_bytes=2 ** 19, chunk_signals=16):
+    """
+    Chunk shape of a dataset of time series of shape (time, signals, ...), which balances the reading of time windows
+    of all signals with the reading of subsets of signals of long time windows:
+    up to chunk_signals signals, split evenly among the chunks, all of their trailing dimensions,
+    and as many time points as fit in chunk_bytes, but no more than the dataset has.
+    """
+    shape = tuple(shape)
+    chunks = tuple(max(1, n) for n in shape[1:])
+    if len(chunks) > 0:
+        # Signals are split evenly among the chunks, so that the last ones are not mostly empty
+        n_chunks = int(numpy.ceil(1.0 * chunks[0] / max(1, int(chunk_signals))))
+        chunks = (int(numpy.ceil(1.0 * chunks[0] / n_chunks)),) + chunks[1:]
+    sample_bytes = itemsize
+    for n in chunks:
+        sample_bytes *= n
+    n_times = max(1, int(chunk_bytes) // sample_bytes)
+    if shape[0] > 0:
+        n_times = min(n_times, shape[0])
+    return (n_times,) + chunks
+
+
+def create_h5_dataset(location, name, data, timeseries=False, chunk_bytes=2 ** 19, chunk_signals=16,
+                      compression=None, compression_opts=None, shuffle=True, compression_min_bytes=2 ** 12):
+    """
+    Create a dataset of data at the h5py location (file or group).
+    Time series datasets, i.e., of time along their first axis, are chunked by timeseries_chunks,
+    and resizable along time, so that time points can be appended to them, unless chunk_bytes is None.
+    Datasets of more than compression_min_bytes are compressed by the compression filter, if any,
+    preceded by the shuffle filter, if shuffle.
+    """
+    array = numpy.asarray(data)
+    if array.dtype.kind not in "OU":
+        # ...while h5py converts the data of (unicode) strings by itself
+        data = array
+    kwargs = {}
+    if timeseries and chunk_bytes is not None and array.ndim > 0:
+        kwargs["chunks"] = timeseries_chunks(array.shape, array.dtype.itemsize, chunk_bytes, chunk_signals)
+        kwargs["maxshape"] = (None,) + array.shape[1:]
+    if compression is not None and array.ndim > 0 and array.nbytes > compression_min_bytes and \
+            (not timeseries or chunk_bytes is not None) and array.dtype.kind not in "OSU":
+        kwargs["compression"] = compression
+        if compression_opts is not None:
+            kwargs["compression_opts"] = compression_opts
+        kwargs["shuffle"] = bool(shuffle)
+    return location.create_dataset(name, data=data, **kwargs)
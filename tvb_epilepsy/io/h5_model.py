@@ -11,7 +11,8 @@ from tvb_epilepsy.base.datatypes.dot_dicts import OrderedDictDot
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
 from tvb_epilepsy.base.utils.data_structures_utils import sort_dict, iterable_to_dict, dict_to_list_or_tuple, \
     set_list_item_by_reference_safely, get_list_or_tuple_item_safely, isequal_string
-from tvb_epilepsy.base.utils.file_utils import change_filename_or_overwrite
+from tvb_epilepsy.base.constants.config import OutputConfig
+from tvb_epilepsy.base.utils.file_utils import change_filename_or_overwrite, create_h5_dataset
 
 
 bool_inf_nan_none_empty = OrderedDict()
@@ -49,16 +50,20 @@ class H5Model(object):
         for key, value in h5_model.metadata_dict.iteritems():
             self.add_or_update_metadata_attribute(key, value)
 
-    def write_to_h5(self, path):
+    def write_to_h5(self, path, compression=OutputConfig.H5_COMPRESSION,
+                    compression_opts=OutputConfig.H5_COMPRESSION_OPTS, shuffle=OutputConfig.H5_SHUFFLE,
+                    compression_min_bytes=OutputConfig.H5_COMPRESSION_MIN_BYTES):
         """
-        Store H5Model object to a hdf5 file
+        Store H5Model object to a hdf5 file,
+        compressing the datasets larger than compression_min_bytes, if compression is "gzip" or "lzf"
         """
         final_path = change_filename_or_overwrite(path)
         # final_path = ensure_unique_file(folder_name, file_name)
         logger.info("Writing %s at: %s" % (self, final_path))
         h5_file = h5py.File(final_path, 'a', libver='latest')
         for attribute, field in self.datasets_dict.iteritems():
-            h5_file.create_dataset(attribute, data=field)
+            create_h5_dataset(h5_file, attribute, field, compression=compression, compression_opts=compression_opts,
+                              shuffle=shuffle, compression_min_bytes=compression_min_bytes)
         for meta, val in self.metadata_dict.iteritems():
             dataset_path, attribute_name = os.path.split(meta)
             if dataset_path == "":
@@ -8,7 +8,7 @@ from tvb_epilepsy.base.model.vep.connectivity import Connectivity, ConnectivityH
 from tvb_epilepsy.base.model.vep.head import Head
 from tvb_epilepsy.base.model.vep.sensors import Sensors, SensorsH5Field
 from tvb_epilepsy.base.model.vep.surface import Surface, SurfaceH5Field
-from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions, H5Timeseries, LazyH5Data
 from tvb_epilepsy.base.model.parameter import Parameter
 from tvb_epilepsy.base.simulation_settings import SimulationSettings
 from tvb_epilepsy.service.model_inversion.probabilistic_models_builders import *
@@ -233,19 +233,23 @@ class H5Reader(object):
 
         return values
 
-    def read_ts(self, path):
+    def read_ts(self, path, lazy=False):
         """
         :param path: Path towards a valid TimeSeries H5 file
+        :param lazy: if True, the data is returned as a LazyH5Data proxy of the dataset, of which the file stays open
         :return: Timeseries data and time in 2 numpy arrays
         """
         self.logger.info("Starting to read TimeSeries from: %s" % path)
         h5_file = h5py.File(path, 'r', libver='latest')
 
-        data = h5_file['/data'][()]
         total_time = int(h5_file["/"].attrs["Simulated_period"][0])
         nr_of_steps = int(h5_file["/data"].attrs["Number_of_steps"][0])
         start_time = float(h5_file["/data"].attrs["Start_time"][0])
         time = numpy.linspace(start_time, total_time, nr_of_steps)
+        if lazy:
+            self.logger.info("Successfully opened timeseries for lazy reading!")
+            return time, LazyH5Data(h5_file['/data'])
+        data = h5_file['/data'][()]
 
         self.logger.info("First Channel sv sum: " + str(numpy.sum(data[:, 0])))
         self.logger.info("Successfully read timeseries!") #: %s" % data)
@@ -253,26 +257,38 @@ class H5Reader(object):
 
         return time, data
 
-    def read_timeseries(self, path):
+    def read_timeseries(self, path, lazy=False):
         """
         :param path: Path towards a valid TimeSeries H5 file
+        :param lazy: if True, return a H5Timeseries, which reads its data only when needed, and has to be closed
         :return: Timeseries data and time in 2 numpy arrays
         """
         self.logger.info("Starting to read TimeSeries from: %s" % path)
         h5_file = h5py.File(path, 'r', libver='latest')
 
-        data = h5_file['/data'][()]
-        time = h5_file['/time'][()]
-        labels = ensure_list(h5_file['/labels'][()])
-        variables = ensure_list(h5_file['/variables'][()])
-        time_unit = h5_file.attrs["time_unit"]
-        self.logger.info("First Channel sv sum: " + str(numpy.sum(data[:, 0])))
+        if lazy:
+            dimension_labels = {TimeseriesDimensions.SPACE.value: ensure_list(h5_file['/labels'][()]),
+                                TimeseriesDimensions.VARIABLES.value: ensure_list(h5_file['/variables'][()])}
+            time_unit = h5_file.attrs["time_unit"]
+            # Only the first and last time points are read, instead of the whole time vector
+            time = h5_file['/time']
+            time_step = (time[-1] - time[0]) / (time.shape[0] - 1) if time.shape[0] > 1 else 0.0
+            self.logger.info("Successfully opened Timeseries for lazy reading!")
+            return H5Timeseries(LazyH5Data(h5_file['/data'], 4), dimension_labels, time[0], time_step, time_unit)
+        timeseries = self._read_timeseries_at_location(h5_file)
+        self.logger.info("First Channel sv sum: " + str(numpy.sum(timeseries.data[:, 0])))
         self.logger.info("Successfully read Timeseries!") #: %s" % data)
         h5_file.close()
 
-        return Timeseries(data, {TimeseriesDimensions.SPACE.value: labels,
-                                 TimeseriesDimensions.VARIABLES.value: variables},
-                          time[0], np.mean(np.diff(time)), time_unit)
+        return timeseries
+
+    def _read_timeseries_at_location(self, location):
+        # location is a h5py file or group, as written by H5Writer._write_timeseries_at_location
+        dimension_labels = {TimeseriesDimensions.SPACE.value: ensure_list(location['labels'][()]),
+                            TimeseriesDimensions.VARIABLES.value: ensure_list(location['variables'][()])}
+        data = location['data'][()]
+        time = location['time'][()]
+        return Timeseries(data, dimension_labels, time[0], np.mean(np.diff(time)), location.attrs["time_unit"])
 
     def read_hypothesis(self, path, simplify=True):
         """
@@ -395,6 +411,38 @@ class H5Reader(object):
         else:
             return dictionary
 
+    def read_pse_checkpoint(self, path):
+        """
+        :param path: Path towards a PSE checkpoint H5 file
+        :return: list of the outputs of all PSE loops (None for the not completed ones),
+                 and numpy.array of the completion status of all loops
+        """
+        self.logger.info("Starting to read a PSE checkpoint from: %s" % path)
+        h5_file = h5py.File(path, 'r', libver='latest')
+
+        completed = h5_file["completed"][()].astype("bool")
+        results = [None] * completed.size
+        results_loops = h5_file["results_loops"][()]
+        datasets = dict([(key, h5_file["results/" + key][:results_loops.size])
+                         for key in h5_file["results"].keys()])
+        for row, iloop in enumerate(results_loops):
+            results[iloop] = dict([(key, dataset[row]) for key, dataset in datasets.iteritems()])
+        # The outputs written in a group per loop
+        for name, group in h5_file.get("results_per_loop", {}).iteritems():
+            output = {}
+            for key, value in group.iteritems():
+                if isinstance(value, h5py.Group):
+                    output[key] = self._read_timeseries_at_location(value)
+                else:
+                    output[key] = value[()]
+            results[int(name)] = output
+        for iloop, output in enumerate(results):
+            if output is not None and output.keys() == ["output"]:
+                results[iloop] = output["output"]
+
+        h5_file.close()
+        return results, completed
+
     def read_simulation_settings(self, path):
         """
         :param path: Path towards a SimulationSettings H5 file
@@ -2,7 +2,9 @@ import os
 import h5py
 import numpy
 from tvb_epilepsy.base.utils.log_error_utils import warning, raise_error, raise_value_error, initialize_logger
-from tvb_epilepsy.base.utils.file_utils import change_filename_or_overwrite, write_metadata
+from tvb_epilepsy.base.constants.config import OutputConfig
+from tvb_epilepsy.base.utils.file_utils import change_filename_or_overwrite, write_metadata, create_h5_dataset, \
+    timeseries_chunks
 from tvb_epilepsy.base.model.vep.connectivity import ConnectivityH5Field
 from tvb_epilepsy.base.model.vep.sensors import SensorsH5Field
 from tvb_epilepsy.base.model.vep.surface import SurfaceH5Field
@@ -29,6 +31,30 @@ class H5Writer(object):
     H5_TYPE_ATTRIBUTE = "EPI_Type"
     H5_SUBTYPE_ATTRIBUTE = "EPI_Subtype"
 
+    def __init__(self, compression=OutputConfig.H5_COMPRESSION, compression_opts=OutputConfig.H5_COMPRESSION_OPTS,
+                 shuffle=OutputConfig.H5_SHUFFLE, chunk_bytes=OutputConfig.H5_CHUNK_BYTES,
+                 chunk_signals=OutputConfig.H5_CHUNK_SIGNALS,
+                 compression_min_bytes=OutputConfig.H5_COMPRESSION_MIN_BYTES):
+        """
+        :param compression: compression filter of the datasets, "gzip", "lzf" or None
+        :param compression_opts: options of the compression filter, e.g., the level of gzip, 0-9
+        :param shuffle: whether the shuffle filter precedes compression, which helps compressing numbers
+        :param chunk_bytes: maximum size of the chunks of the time series datasets, or None for contiguous ones
+        :param chunk_signals: maximum number of signals of the chunks of the time series datasets
+        :param compression_min_bytes: the datasets of at most this size are not compressed
+        """
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+        self.chunk_bytes = chunk_bytes
+        self.chunk_signals = chunk_signals
+        self.compression_min_bytes = compression_min_bytes
+
+    def _create_dataset(self, location, name, data, timeseries=False):
+        # Time series datasets, i.e., of time along their first axis, are chunked, resizable and appendable
+        return create_h5_dataset(location, name, data, timeseries, self.chunk_bytes, self.chunk_signals,
+                                 self.compression, self.compression_opts, self.shuffle, self.compression_min_bytes)
+
     def _determine_datasets_and_attributes(self, object, datasets_size=None):
         datasets_dict = {}
         metadata_dict = {}
@@ -65,7 +91,7 @@ class H5Writer(object):
 
     def _write_dicts_at_location(self, datasets_dict, metadata_dict, location):
         for key, value in datasets_dict.iteritems():
-            location.create_dataset(key, data=value)
+            self._create_dataset(location, key, value)
 
         for key, value in metadata_dict.iteritems():
             location.attrs.create(key, value)
@@ -245,6 +271,124 @@ class H5Writer(object):
 
         self.write_dictionary(pse_dict, path)
 
+    def open_pse_checkpoint(self, pse_service, path):
+        """
+        :param pse_service: PSEService object, whose results are checkpointed
+        :param path: H5 path of the checkpoint, which is created if it does not exist, or resumed otherwise
+        :return: h5py.File of the checkpoint, open for appending the results of the PSE loops
+        """
+        params_samples = numpy.array(pse_service.params_vals)
+        if os.path.isfile(path):
+            h5_file = h5py.File(path, 'a', libver='latest')
+            if h5_file["completed"].shape[0] != pse_service.n_loops or \
+                    not numpy.array_equal(h5_file["params_samples"][()], params_samples):
+                h5_file.close()
+                raise_value_error("PSE checkpoint " + path + " does not correspond to the parameters' samples of " +
+                                  "this PSE service!\nRemove it or choose a different checkpoint path.")
+            self.logger.info("Resuming PSE checkpoint " + path + " with " + str(numpy.sum(h5_file["completed"][()]))
+                             + " of " + str(pse_service.n_loops) + " loops completed")
+            return h5_file
+
+        h5_file = h5py.File(path, 'a', libver='latest')
+        h5_file.attrs.create(self.H5_TYPE_ATTRIBUTE, "HypothesisModel")
+        h5_file.attrs.create(self.H5_SUBTYPE_ATTRIBUTE, "PSECheckpoint")
+        h5_file.attrs.create("task", pse_service.task)
+        h5_file.create_dataset("params_names", data=numpy.array(pse_service.params_names, dtype="S"))
+        h5_file.create_dataset("params_paths", data=numpy.array(pse_service.params_paths, dtype="S"))
+        h5_file.create_dataset("params_indices",
+                               data=numpy.array([str(inds) for inds in pse_service.params_indices], dtype="S"))
+        h5_file.create_dataset("params_samples", data=params_samples)
+        # Completion bitmap and execution status of all loops
+        h5_file.create_dataset("completed", data=numpy.zeros((pse_service.n_loops,), dtype="uint8"))
+        h5_file.create_dataset("execution_status", data=numpy.zeros((pse_service.n_loops,), dtype="uint8"))
+        # Loop index of each row of the results' datasets, in order of completion
+        h5_file.create_dataset("results_loops", shape=(0,), maxshape=(None,), dtype="i", chunks=True)
+        h5_file.create_group("results")
+        h5_file.flush()
+        return h5_file
+
+    def _pse_checkpoint_value(self, value):
+        # The value to be checkpointed, i.e., a Timeseries, or a numpy.array of numbers or strings,
+        # or None, if it can not be written in H5
+        if isinstance(value, Timeseries):
+            if value.data.size > 0 and str(value.data.dtype)[0] in "biuf":
+                return value
+            return None
+        value = numpy.array(value)
+        if value.dtype.kind == "U":
+            try:
+                value = value.astype("S")
+            except UnicodeEncodeError:
+                return None
+        if value.dtype.kind not in "biufcS":
+            return None
+        return value
+
+    def write_pse_checkpoint_loop(self, h5_file, iloop, status, output):
+        """
+        :param h5_file: h5py.File of a PSE checkpoint, as returned by open_pse_checkpoint
+        :param iloop: index of the PSE loop
+        :param status: execution status of the loop. Failed loops are not marked as completed,
+                       so that they are executed again when the PSE is resumed
+        :param output: output of the loop, a dictionary of values or a single value.
+                       Numeric values of the same keys and shapes in all loops are written as rows of common datasets,
+                       whereas outputs of Timeseries, strings, or values of different keys or shapes
+                       are written in a group per loop.
+                       Outputs of other objects are not checkpointed, and their loops are executed again on resume.
+        """
+        h5_file["execution_status"][iloop] = int(status)
+        if status:
+            if not isinstance(output, dict):
+                output = {"output": output}
+            values = dict([(key, self._pse_checkpoint_value(value)) for key, value in output.iteritems()])
+            if len(values) == 0 or any([value is None for value in values.values()]):
+                self.logger.warning("The output of PSE loop " + str(iloop) + " can not be written in H5, and " +
+                                    "it is not checkpointed!: " + str(dict([(key, type(value)) for key, value
+                                                                            in output.iteritems()])))
+                h5_file.flush()
+                return
+            results = h5_file["results"]
+            keys = results.keys()
+            if (len(keys) == 0 or sorted(keys) == sorted(values.keys())) and \
+                    all([isinstance(value, numpy.ndarray) and value.dtype.kind in "biufc" and
+                         (key not in results or results[key].shape[1:] == value.shape)
+                         for key, value in values.iteritems()]):
+                self._write_pse_checkpoint_row(h5_file, iloop, values)
+            else:
+                self._write_pse_checkpoint_group(h5_file, iloop, values)
+            # The loop is marked as completed only after all of its results have been written
+            h5_file["completed"][iloop] = 1
+        h5_file.flush()
+
+    def _write_pse_checkpoint_row(self, h5_file, iloop, values):
+        results_loops = h5_file["results_loops"]
+        # Any rows beyond the last completed one are leftovers of an interrupted write, and are overwritten
+        row = results_loops.shape[0]
+        results = h5_file["results"]
+        for key, value in values.iteritems():
+            if key not in results:
+                results.create_dataset(key, shape=(0,) + value.shape, maxshape=(None,) + value.shape,
+                                       dtype=value.dtype, chunks=True)
+            dataset = results[key]
+            dataset.resize(row + 1, axis=0)
+            dataset[row] = value
+        results_loops.resize(row + 1, axis=0)
+        results_loops[row] = iloop
+
+    def _write_pse_checkpoint_group(self, h5_file, iloop, values):
+        loops = h5_file.require_group("results_per_loop")
+        name = str(iloop)
+        # Any group of the loop is a leftover of an interrupted write, and is overwritten
+        if name in loops:
+            del loops[name]
+        group = loops.create_group(name)
+        for key, value in values.iteritems():
+            if isinstance(value, Timeseries):
+                self._write_timeseries_at_location(group.create_group(key), value)
+                group[key].attrs.create(self.H5_TYPE_ATTRIBUTE, "Timeseries")
+            else:
+                group.create_dataset(key, data=value)
+
     def write_sensitivity_analysis_service(self, sensitivity_service, path):
         """
         :param sensitivity_service: SensitivityAnalysisService object to write in H5
@@ -272,7 +416,7 @@ class H5Writer(object):
         for key, value in dictionary.iteritems():
             try:
                 if isinstance(value, numpy.ndarray) and value.size > 0:
-                    h5_file.create_dataset(key, data=value)
+                    self._create_dataset(h5_file, key, value)
                 else:
                     if isinstance(value, list) and len(value) > 0:
                         h5_file.create_dataset(key, data=value)
@@ -305,7 +449,7 @@ class H5Writer(object):
             if isinstance(seeg_data, Timeseries):
                 seeg_ts = seeg_data.squeezed
             h5_file = h5py.File(path, 'a', libver='latest')
-            h5_file.create_dataset("/" + sensors_name, data=seeg_ts)
+            self._create_dataset(h5_file, "/" + sensors_name, seeg_ts, timeseries=True)
             write_metadata({KEY_MAX: seeg_ts.max(), KEY_MIN: seeg_ts.min(), KEY_STEPS: seeg_ts.shape[0],
                             KEY_CHANNELS: seeg_ts.shape[1], KEY_SV: 1, KEY_SAMPLING: sampling_period, KEY_START: 0.0},
                            h5_file, KEY_DATE, KEY_VERSION, "/" + sensors_name)
@@ -322,8 +466,8 @@ class H5Writer(object):
         if source_ts is None:
             source_ts = raw_ts.source
         h5_file = h5py.File(path, 'a', libver='latest')
-        h5_file.create_dataset("/data", data=raw_ts.squeezed)
-        h5_file.create_dataset("/lfpdata", data=source_ts.squeezed)
+        self._create_dataset(h5_file, "/data", raw_ts.squeezed, timeseries=True)
+        self._create_dataset(h5_file, "/lfpdata", source_ts.squeezed, timeseries=True)
         write_metadata({KEY_TYPE: "TimeSeries"}, h5_file, KEY_DATE, KEY_VERSION)
         write_metadata({KEY_MAX: raw_ts.squeezed.max(), KEY_MIN: raw_ts.squeezed.min(),
                         KEY_STEPS: raw_ts.squeezed.shape[0], KEY_CHANNELS: raw_ts.squeezed.shape[1],
@@ -344,7 +488,7 @@ class H5Writer(object):
         if isinstance(raw_data, dict):
             for data in raw_data:
                 if len(raw_data[data].shape) == 2 and str(raw_data[data].dtype)[0] == "f":
-                    h5_file.create_dataset("/" + data, data=raw_data[data])
+                    self._create_dataset(h5_file, "/" + data, raw_data[data], timeseries=True)
                     write_metadata({KEY_MAX: raw_data[data].max(), KEY_MIN: raw_data[data].min(),
                                     KEY_STEPS: raw_data[data].shape[0], KEY_CHANNELS: raw_data[data].shape[1],
                                     KEY_SV: 1, KEY_SAMPLING: sampling_period, KEY_START: 0.0}, h5_file, KEY_DATE,
@@ -352,8 +496,8 @@ class H5Writer(object):
                 else:
                     raise_value_error("Invalid TS data. 2D (time, nodes) numpy.ndarray of floats expected")
         elif isinstance(raw_data, numpy.ndarray):
-            if len(raw_data.shape) != 2 and str(raw_data.dtype)[0] != "f":
-                h5_file.create_dataset("/data", data=raw_data)
+            if len(raw_data.shape) == 2 and str(raw_data.dtype)[0] == "f":
+                self._create_dataset(h5_file, "/data", raw_data, timeseries=True)
                 write_metadata({KEY_MAX: raw_data.max(), KEY_MIN: raw_data.min(), KEY_STEPS: raw_data.shape[0],
                                 KEY_CHANNELS: raw_data.shape[1], KEY_SV: 1, KEY_SAMPLING: sampling_period,
                                 KEY_START: 0.0}, h5_file, KEY_DATE, KEY_VERSION, "/data")
@@ -361,26 +505,123 @@ class H5Writer(object):
                 raise_value_error("Invalid TS data. 2D (time, nodes) numpy.ndarray of floats expected")
         elif isinstance(raw_data, Timeseries):
             if len(raw_data.shape) == 4 and str(raw_data.data.dtype)[0] == "f":
-                h5_file.create_dataset("/data", data=raw_data.data)
-                h5_file.create_dataset("/time", data=raw_data.time_line)
-                h5_file.create_dataset("/labels",
-                                       data=numpy.array([numpy.string_(label) for label in raw_data.space_labels]))
-                h5_file.create_dataset("/variables",
-                                       data=numpy.array([numpy.string_(var) for var in raw_data.variables_labels]))
-                h5_file.attrs.create("time_unit", raw_data.time_unit)
-                write_metadata({KEY_MAX: raw_data.data.max(), KEY_MIN: raw_data.data.min(),
-                                KEY_STEPS: raw_data.data.shape[0],KEY_CHANNELS: raw_data.data.shape[1],
-                                KEY_SV: 1, KEY_SAMPLING: raw_data.time_step,
-                                KEY_START: raw_data.time_start}, h5_file, KEY_DATE, KEY_VERSION, "/data")
+                self._write_timeseries_at_location(h5_file, raw_data)
             else:
                 raise_value_error("Invalid TS data. 4D (time, nodes) numpy.ndarray of floats expected")
         else:
             raise_value_error("Invalid TS data. Dictionary or 2D (time, nodes) numpy.ndarray of floats expected")
         h5_file.close()
 
+    def _write_timeseries_at_location(self, location, timeseries):
+        # location is a h5py file or group
+        self._create_dataset(location, "data", timeseries.data, timeseries=True)
+        self._create_dataset(location, "time", timeseries.time_line, timeseries=True)
+        location.create_dataset("labels", data=numpy.array([numpy.string_(label)
+                                                            for label in timeseries.space_labels]))
+        location.create_dataset("variables", data=numpy.array([numpy.string_(var)
+                                                               for var in timeseries.variables_labels]))
+        location.attrs.create("time_unit", timeseries.time_unit)
+        write_metadata({KEY_MAX: timeseries.data.max(), KEY_MIN: timeseries.data.min(),
+                        KEY_STEPS: timeseries.data.shape[0], KEY_CHANNELS: timeseries.data.shape[1],
+                        KEY_SV: 1, KEY_SAMPLING: timeseries.time_step,
+                        KEY_START: timeseries.time_start}, location, KEY_DATE, KEY_VERSION, "data")
+
     def write_timeseries(self, timeseries, path):
         self.write_ts(timeseries, timeseries.time_step, path)
 
+    def append_timeseries(self, timeseries, path):
+        """
+        Append the time points of timeseries to the resizable datasets of a Timeseries H5 file,
+        as written by write_timeseries, or by open_timeseries and close_timeseries, and update its metadata.
+        The timeseries has to continue the one of the file, i.e., to start one time step after its last time point,
+        with the same time step and shape of time points.
+        """
+        if timeseries.time_length == 0:
+            raise_value_error("There are no time points to append to " + path + "!", self.logger)
+        self.logger.info("Appending a TS at:\n" + path)
+        h5_file = h5py.File(path, 'a', libver='latest')
+        try:
+            dataset = h5_file["/data"]
+            if dataset.maxshape[0] is not None:
+                raise_value_error("The data of " + path + " are not resizable, and cannot be appended!", self.logger)
+            if tuple(dataset.shape[1:]) != tuple(timeseries.shape[1:]):
+                raise_value_error("The time points of shape " + str(timeseries.shape[1:]) + " cannot be appended " +
+                                  "to the ones of shape " + str(dataset.shape[1:]) + " of " + path + "!", self.logger)
+            metadata = dataset.attrs
+            if not numpy.isclose(metadata[KEY_SAMPLING], timeseries.time_step):
+                raise_value_error("The time step " + str(timeseries.time_step) + " differs from the one, " +
+                                  str(metadata[KEY_SAMPLING]) + ", of " + path + "!", self.logger)
+            time = h5_file["/time"]
+            n_times = time.shape[0]
+            # Overlapping or gapped time points would make the time of the file non uniform
+            if n_times > 0 and not numpy.isclose(timeseries.time_start, time[n_times - 1] + metadata[KEY_SAMPLING],
+                                                 rtol=0.0, atol=1e-3 * metadata[KEY_SAMPLING]):
+                raise_value_error("The time start " + str(timeseries.time_start) + " does not follow the last " +
+                                  "time point, " + str(time[n_times - 1]) + ", of " + path + "!", self.logger)
+            data = numpy.asarray(timeseries.data)
+            self.append_timeseries_block(h5_file, data)
+            time.resize(n_times + timeseries.time_length, axis=0)
+            time[n_times:] = timeseries.time_line
+            write_metadata({KEY_MAX: max(metadata[KEY_MAX], data.max()), KEY_MIN: min(metadata[KEY_MIN], data.min()),
+                            KEY_STEPS: dataset.shape[0]}, h5_file, KEY_DATE, KEY_VERSION, "/data")
+        finally:
+            h5_file.close()
+
+    def open_timeseries(self, path, sample_shape, dtype="float32", chunk_length=1024):
+        """
+        Open a Timeseries H5 file, in order to stream its data in blocks of time points,
+        with append_timeseries_block, and then complete it with close_timeseries.
+        :param sample_shape: shape of a single time point of the data, e.g., (n_regions, n_variables, n_samples)
+        :param chunk_length: number of time points of each chunk of the data's dataset
+        :return: h5py.File of the Timeseries, open for appending data
+        """
+        path = change_filename_or_overwrite(path)
+
+        self.logger.info("Streaming a TS at:\n" + path)
+        h5_file = h5py.File(path, 'a', libver='latest')
+        write_metadata({KEY_TYPE: "TimeSeries"}, h5_file, KEY_DATE, KEY_VERSION)
+        sample_shape = tuple(sample_shape)
+        chunks = (max(1, int(chunk_length)),) + timeseries_chunks((1,) + sample_shape, 1, 0, self.chunk_signals)[1:]
+        kwargs = {}
+        if self.compression is not None:
+            kwargs = {"compression": self.compression, "compression_opts": self.compression_opts,
+                      "shuffle": self.shuffle}
+        h5_file.create_dataset("/data", shape=(0,) + sample_shape, maxshape=(None,) + sample_shape, dtype=dtype,
+                               chunks=chunks, **kwargs)
+        return h5_file
+
+    def append_timeseries_block(self, h5_file, data):
+        """
+        :param h5_file: h5py.File of a Timeseries, as returned by open_timeseries
+        :param data: block of data of shape (n_times,) + sample_shape
+        """
+        dataset = h5_file["/data"]
+        n_times = dataset.shape[0]
+        dataset.resize(n_times + data.shape[0], axis=0)
+        dataset[n_times:] = data
+
+    def close_timeseries(self, h5_file, space_labels, variables_labels, time_start, time_step, time_unit="ms"):
+        """
+        Write the time, labels and metadata of a streamed Timeseries, as write_ts does, and close its file.
+        """
+        dataset = h5_file["/data"]
+        n_times = dataset.shape[0]
+        max_value = -numpy.inf
+        min_value = numpy.inf
+        # Compute the extreme values chunk by chunk, in order not to load all the data
+        for i_time in range(0, n_times, dataset.chunks[0]):
+            block = dataset[i_time:i_time + dataset.chunks[0]]
+            max_value = max(max_value, block.max())
+            min_value = min(min_value, block.min())
+        self._create_dataset(h5_file, "/time", time_start + time_step * numpy.arange(n_times), timeseries=True)
+        h5_file.create_dataset("/labels", data=numpy.array([numpy.string_(label) for label in space_labels]))
+        h5_file.create_dataset("/variables", data=numpy.array([numpy.string_(var) for var in variables_labels]))
+        h5_file.attrs.create("time_unit", time_unit)
+        write_metadata({KEY_MAX: max_value, KEY_MIN: min_value, KEY_STEPS: n_times, KEY_CHANNELS: dataset.shape[1],
+                        KEY_SV: 1, KEY_SAMPLING: time_step, KEY_START: time_start}, h5_file, KEY_DATE, KEY_VERSION,
+                       "/data")
+        h5_file.close()
+
     def write_simulator_model(self, simulator_model, nr_regions, path):
         self.write_object_to_file(path, simulator_model, "HypothesisModel", nr_regions)
 
@@ -6,11 +6,14 @@ TODO: it might be useful to store eigenvalues and eigenvectors, as well as the p
 such as eigen_vectors_number and LSAService in a h5 file
 """
 import numpy
+from scipy import sparse
+from scipy.sparse.linalg import eigs, ArpackNoConvergence
 from tvb_epilepsy.base.constants.config import CalculusConfig
 from tvb_epilepsy.base.constants.model_constants import X1EQ_CR_DEF
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error, warning
 from tvb_epilepsy.base.utils.data_structures_utils import formal_repr
-from tvb_epilepsy.base.computations.calculations_utils import calc_fz_jac_square_taylor, calc_jac
+from tvb_epilepsy.base.computations.calculations_utils import calc_fz_jac_square_taylor, calc_jac, \
+    calc_fz_jac_square_taylor_batch, calc_fz_jac_square_taylor_sparse
 from tvb_epilepsy.base.computations.equilibrium_computation import calc_eq_z
 from tvb_epilepsy.base.computations.math_utils import weighted_vector_sum, curve_elbow_point
 from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
@@ -22,7 +25,7 @@ class LSAService(object):
     def __init__(self, lsa_method=CalculusConfig.LSA_METHOD,
                  eigen_vectors_number_selection=CalculusConfig.EIGENVECTORS_NUMBER_SELECTION,
                  eigen_vectors_number=None, weighted_eigenvector_sum=CalculusConfig.WEIGHTED_EIGENVECTOR_SUM,
-                 normalize_propagation_strength=False):
+                 normalize_propagation_strength=False, eigen_solver=CalculusConfig.LSA_EIGEN_SOLVER):
         self.eigen_vectors_number_selection = eigen_vectors_number_selection
         self.eigen_values = []
         self.eigen_vectors = []
@@ -32,6 +35,8 @@ class LSAService(object):
         # lsa_method = "1D" (default), "2D"
         # or "auto" in which case "2D" is selected only if there is an unstable fixed point...
         self.lsa_method = lsa_method
+        # eigen_solver = "dense", "partial" (only the eigenvectors to be summed, by ARPACK), or "auto"
+        self.eigen_solver = eigen_solver
 
     def __repr__(self):
         d = {"01. LSA method": self.lsa_method,
@@ -40,7 +45,8 @@ class LSAService(object):
              "04. Eigen values": self.eigen_values,
              "05. Eigenvectors": self.eigen_vectors,
              "06. Eigenvectors' number": self.eigen_vectors_number,
-             "07. Weighted eigenvector's sum flag": str(self.weighted_eigenvector_sum)
+             "07. Weighted eigenvector's sum flag": str(self.weighted_eigenvector_sum),
+             "08. Eigen solver": self.eigen_solver
              }
         return formal_repr(self, d)
 
@@ -73,42 +79,114 @@ class LSAService(object):
         else:
             self.eigen_vectors_number_selection = "user_defined"
 
-    def _compute_jacobian(self, model_configuration):
-
+    def _get_eigen_vectors_number_before_decomposition(self, e_values, x0_values, disease_indices):
+        # The number of eigenvectors to be summed, if it can be known without the eigenvalues, None otherwise
+        if self.eigen_vectors_number is not None:
+            return self.eigen_vectors_number
+        elif self.eigen_vectors_number_selection == "auto_disease":
+            return len(disease_indices)
+        elif self.eigen_vectors_number_selection == "auto_epileptogenicity":
+            return self.get_curve_elbow_point(e_values)
+        elif self.eigen_vectors_number_selection == "auto_excitability":
+            return self.get_curve_elbow_point(x0_values)
+        else:
+            return None
+
+    def _select_eigen_solver(self, disease_hypothesis, model_configuration):
+        # Returns the eigen solver to be used, and the number of eigenvectors to compute for the "partial" one
+        if self.eigen_solver == "dense":
+            return "dense", None
+        elif self.eigen_solver not in ["partial", "auto"]:
+            raise_value_error("\n" + str(self.eigen_solver) + " is not a valid option for the LSA eigen solver!")
+        n_regions = disease_hypothesis.number_of_regions
+        if self.eigen_solver == "auto" and n_regions < CalculusConfig.LSA_PARTIAL_EIGEN_SOLVER_MIN_REGIONS:
+            return "dense", None
+        eigen_vectors_number = self._get_eigen_vectors_number_before_decomposition(
+            model_configuration.e_values, model_configuration.x0_values, disease_hypothesis.regions_disease_indices)
+        n_eigen = 2 * n_regions if self.lsa_method == "2D" else n_regions
+        # All eigenvalues are needed for their automatic selection, or if all eigenvectors are summed,
+        # whereas ARPACK computes at most n_eigen - 2 eigenvectors
+        if eigen_vectors_number is None or eigen_vectors_number >= min(n_regions, n_eigen - 1):
+            if self.eigen_solver == "partial":
+                warning("A partial eigenvalue decomposition is not possible for the eigenvectors' number selection "
+                        + self.eigen_vectors_number_selection + " and eigen_vectors_number = "
+                        + str(eigen_vectors_number) + "!\nA dense one will be performed instead.", self.logger)
+            return "dense", None
+        if self.eigen_solver == "auto" and \
+                eigen_vectors_number > CalculusConfig.LSA_PARTIAL_EIGEN_SOLVER_MAX_RATIO * n_regions:
+            return "dense", None
+        return "partial", max(eigen_vectors_number, 1)
+
+    def _compute_partial_eigen_decomposition(self, model_configuration, eigen_vectors_number):
+        if self.lsa_method == "2D":
+            jacobian = self._compute_jacobian(model_configuration)
+            # The largest eigenvalues first
+            which = "LR"
+        else:
+            self._correct_supercritical_equilibria(model_configuration)
+            jacobian = calc_fz_jac_square_taylor_sparse(model_configuration.zeq, model_configuration.yc,
+                                                        model_configuration.Iext1, model_configuration.K,
+                                                        model_configuration.model_connectivity)
+            if numpy.any([numpy.any(numpy.isnan(jacobian.data)), numpy.any(numpy.isinf(jacobian.data))]):
+                raise_value_error("nan or inf values in dfz")
+            # The smallest eigenvalues first
+            which = "SR"
+        try:
+            eigen_values, eigen_vectors = eigs(jacobian, k=eigen_vectors_number, which=which)
+        except ArpackNoConvergence:
+            warning("The partial eigenvalue decomposition did not converge!\nA dense one will be performed instead.",
+                    self.logger)
+            return numpy.linalg.eig(self._compute_dense_jacobian(model_configuration))
+        return eigen_values, eigen_vectors
+
+    def _correct_supercritical_equilibria(self, model_configuration):
         # Check if any of the equilibria are in the supercritical regime (beyond the separatrix) and set it right before
         # the bifurcation.
-        zeq = model_configuration.zeq
-        if self.lsa_method == "2D":
+        temp = model_configuration.x1eq > X1EQ_CR_DEF - 10 ** (-3)
+        if temp.any():
+            correction_value = X1EQ_CR_DEF - 10 ** (-3)
+            self.logger.warning("Equilibria x1eq[" + str(numpy.where(temp)[0]) + "]  = "
+                                + str(model_configuration.x1eq[temp]) +
+                                "\nwere corrected for LSA to value: X1EQ_CR_DEF - 10 ** (-3) = "
+                                + str(correction_value) + " to be sub-critical!")
+            model_configuration.x1eq[temp] = correction_value
+            i_temp = numpy.ones(model_configuration.x1eq.shape)
+            model_configuration.zeq[temp] = calc_eq_z(model_configuration.x1eq[temp],
+                                                      model_configuration.yc * i_temp[temp],
+                                                      model_configuration.Iext1 * i_temp[temp], "2d", 0.0,
+                                                      model_configuration.slope * i_temp[temp],
+                                                      model_configuration.a * i_temp[temp],
+                                                      model_configuration.b * i_temp[temp],
+                                                      model_configuration.d * i_temp[temp])
+
+    def _compute_jacobian(self, model_configuration, lsa_method=None):
+        if lsa_method is None:
+            lsa_method = self.lsa_method
+        if lsa_method == "2D":
             fz_jacobian = calc_jac(model_configuration.x1eq, model_configuration.zeq, model_configuration.yc,
                                    model_configuration.Iext1, model_configuration.x0, model_configuration.K,
                                    model_configuration.model_connectivity, model_vars=2, zmode="lin",
                                    a=model_configuration.a, b=model_configuration.b, d=model_configuration.d,
                                    tau1= model_configuration.tau1, tau0=model_configuration.tau0)
         else:
-            temp = model_configuration.x1eq > X1EQ_CR_DEF - 10 ** (-3)
-            if temp.any():
-                correction_value = X1EQ_CR_DEF - 10 ** (-3)
-                self.logger.warning("Equilibria x1eq[" + str(numpy.where(temp)[0]) + "]  = "
-                                    + str(model_configuration.x1eq[temp]) +
-                                    "\nwere corrected for LSA to value: X1EQ_CR_DEF - 10 ** (-3) = "
-                                    + str(correction_value) + " to be sub-critical!")
-                model_configuration.x1eq[temp] = correction_value
-                i_temp = numpy.ones(model_configuration.x1eq.shape)
-                zeq[temp] = calc_eq_z(model_configuration.x1eq[temp], model_configuration.yc * i_temp[temp],
-                                      model_configuration.Iext1 * i_temp[temp], "2d", 0.0,
-                                      model_configuration.slope * i_temp[temp],
-                                      model_configuration.a * i_temp[temp], model_configuration.b * i_temp[temp],
-                                      model_configuration.d * i_temp[temp])
+            self._correct_supercritical_equilibria(model_configuration)
             fz_jacobian = calc_fz_jac_square_taylor(model_configuration.zeq, model_configuration.yc,
                                                     model_configuration.Iext1, model_configuration.K,
                                                     model_configuration.model_connectivity,
                                                     model_configuration.a, model_configuration.b, model_configuration.d)
 
-        if numpy.any([numpy.any(numpy.isnan(fz_jacobian.flatten())), numpy.any(numpy.isinf(fz_jacobian.flatten()))]):
+        values = fz_jacobian.data if sparse.issparse(fz_jacobian) else fz_jacobian.flatten()
+        if numpy.any([numpy.any(numpy.isnan(values)), numpy.any(numpy.isinf(values))]):
             raise_value_error("nan or inf values in dfz")
 
         return fz_jacobian
 
+    def _compute_dense_jacobian(self, model_configuration, lsa_method=None):
+        jacobian = self._compute_jacobian(model_configuration, lsa_method)
+        if sparse.issparse(jacobian):
+            return jacobian.toarray()
+        return jacobian
+
     def run_lsa(self, disease_hypothesis, model_configuration):
 
         if self.lsa_method == "auto":
@@ -121,10 +199,16 @@ class LSAService(object):
             warning("LSA with the '2D' method (on the 2D Epileptor model) will not produce interpretable results when"
                     " the equilibrium point of the system is not supercritical (unstable)!")
 
-        jacobian = self._compute_jacobian(model_configuration)
+        eigen_solver, eigen_vectors_number = self._select_eigen_solver(disease_hypothesis, model_configuration)
+        if eigen_solver == "partial":
+            # Compute only the eigenvectors to be summed
+            eigen_values, eigen_vectors = \
+                self._compute_partial_eigen_decomposition(model_configuration, eigen_vectors_number)
+        else:
+            jacobian = self._compute_dense_jacobian(model_configuration)
 
-        # Perform eigenvalue decomposition
-        eigen_values, eigen_vectors = numpy.linalg.eig(jacobian)
+            # Perform eigenvalue decomposition
+            eigen_values, eigen_vectors = numpy.linalg.eig(jacobian)
         eigen_values = numpy.real(eigen_values)
         eigen_vectors = numpy.real(eigen_vectors)
         sorted_indices = numpy.argsort(eigen_values, kind='mergesort')
@@ -186,6 +270,172 @@ class LSAService(object):
 
         return hypothesis_builder.build_lsa_hypothesis()
 
+    def _get_curve_elbow_points(self, values):
+        # Elbow points of all rows of a (S, n) array of values, i.e., a vectorized curve_elbow_point
+        if CalculusConfig.INTERACTIVE_ELBOW_POINT:
+            return numpy.array([self.get_curve_elbow_point(vals) for vals in values])
+        # Values in descending order:
+        values = -numpy.sort(-values, axis=1)
+        grad = numpy.gradient(numpy.gradient(numpy.gradient(numpy.cumsum(values, axis=1), axis=1), axis=1), axis=1)
+        return numpy.argmax(grad, axis=1)
+
+    def _ensure_eigen_vectors_numbers(self, eigen_values, e_values, x0_values, disease_indices):
+        # Eigenvectors' numbers of a batch of S samples, for eigen_values, e_values and x0_values of shape (S, n).
+        # Automatically selected numbers are sample specific, and therefore, they are not stored to the service.
+        n_samples = eigen_values.shape[0]
+        if self.eigen_vectors_number is not None:
+            self.eigen_vectors_number_selection = "user_defined"
+            return self.eigen_vectors_number * numpy.ones((n_samples,), dtype="i")
+        elif self.eigen_vectors_number_selection == "auto_eigenvals":
+            return self._get_curve_elbow_points(numpy.abs(eigen_values))
+        elif self.eigen_vectors_number_selection == "auto_disease":
+            return numpy.array([len(indices) for indices in disease_indices])
+        elif self.eigen_vectors_number_selection == "auto_epileptogenicity":
+            return self._get_curve_elbow_points(e_values)
+        elif self.eigen_vectors_number_selection == "auto_excitability":
+            return self._get_curve_elbow_points(x0_values)
+        else:
+            raise_value_error("\n" + self.eigen_vectors_number_selection +
+                              "is not a valid option when for automatic computation of self.eigen_vectors_number")
+
+    def _stack_model_configurations(self, model_configurations, attribute, n_regions):
+        # Stack the (n,) or scalar values of an attribute to a (S, n) array, keeping their data type
+        return numpy.array([numpy.broadcast_to(numpy.array(getattr(model_configuration, attribute)).flatten(),
+                                               (n_regions,))
+                            for model_configuration in model_configurations])
+
+    def _compute_jacobians(self, model_configurations, lsa_method):
+        if lsa_method == "2D":
+            return numpy.array([self._compute_dense_jacobian(model_configuration, lsa_method)
+                                for model_configuration in model_configurations])
+        n_regions = model_configurations[0].number_of_regions
+        for model_configuration in model_configurations:
+            self._correct_supercritical_equilibria(model_configuration)
+        zeq, yc, Iext1, K = [self._stack_model_configurations(model_configurations, attribute, n_regions)
+                             for attribute in ["zeq", "yc", "Iext1", "K"]]
+        # The connectivity is stacked only if it differs among samples
+        model_connectivity = model_configurations[0].model_connectivity
+        if not numpy.all([model_configuration.model_connectivity is model_connectivity
+                          for model_configuration in model_configurations[1:]]):
+            model_connectivity = numpy.array([model_configuration.model_connectivity.toarray()
+                                              if sparse.issparse(model_configuration.model_connectivity)
+                                              else model_configuration.model_connectivity
+                                              for model_configuration in model_configurations])
+        fz_jacobians = calc_fz_jac_square_taylor_batch(zeq, yc, Iext1, K, model_connectivity)
+        if numpy.any([numpy.any(numpy.isnan(fz_jacobians)), numpy.any(numpy.isinf(fz_jacobians))]):
+            raise_value_error("nan or inf values in dfz")
+        return fz_jacobians
+
+    def _run_lsa_batch(self, disease_hypotheses, model_configurations, lsa_method):
+        n_samples = len(model_configurations)
+        n_regions = disease_hypotheses[0].number_of_regions
+
+        if lsa_method == "2D" and numpy.any([numpy.all(model_configuration.x1eq <= X1EQ_CR_DEF)
+                                             for model_configuration in model_configurations]):
+            warning("LSA with the '2D' method (on the 2D Epileptor model) will not produce interpretable results when"
+                    " the equilibrium point of the system is not supercritical (unstable)!")
+
+        jacobians = self._compute_jacobians(model_configurations, lsa_method)
+
+        # Perform the eigenvalue decomposition of all Jacobians at once
+        eigen_values, eigen_vectors = numpy.linalg.eig(jacobians)
+        eigen_values = numpy.real(eigen_values)
+        eigen_vectors = numpy.real(eigen_vectors)
+        n_eigen = eigen_values.shape[1]
+        sorted_indices = numpy.argsort(eigen_values, axis=1, kind='mergesort')
+        if lsa_method == "2D":
+            sorted_indices = sorted_indices[:, ::-1]
+        samples_indices = numpy.arange(n_samples)[:, numpy.newaxis]
+        eigen_values = eigen_values[samples_indices, sorted_indices]
+        eigen_vectors = eigen_vectors[samples_indices[:, :, numpy.newaxis],
+                                      numpy.arange(n_eigen)[numpy.newaxis, :, numpy.newaxis],
+                                      sorted_indices[:, numpy.newaxis, :]]
+
+        eigen_vectors_numbers = self._ensure_eigen_vectors_numbers(
+            eigen_values[:, :n_regions],
+            self._stack_model_configurations(model_configurations, "e_values", n_regions),
+            self._stack_model_configurations(model_configurations, "x0_values", n_regions),
+            [disease_hypothesis.regions_disease_indices for disease_hypothesis in disease_hypotheses])
+
+        # Weights of the eigenvectors to be summed for the propagation strength index of each sample:
+        # all eigenvectors if their number equals the number of regions, or the first ones otherwise.
+        sum_all = eigen_vectors_numbers == n_regions
+        eigen_vectors_weights = numpy.logical_or(numpy.arange(n_eigen)[numpy.newaxis, :] <
+                                                 eigen_vectors_numbers[:, numpy.newaxis],
+                                                 sum_all[:, numpy.newaxis]).astype(eigen_values.dtype)
+        if self.weighted_eigenvector_sum:
+            weighted = eigen_vectors_weights * eigen_values
+            weighted /= numpy.sum(weighted, axis=1, keepdims=True)
+            eigen_vectors_weights = numpy.where(sum_all[:, numpy.newaxis], eigen_vectors_weights, weighted)
+        lsa_propagation_strengths = numpy.abs(numpy.einsum("sij,sj->si", eigen_vectors, eigen_vectors_weights))
+
+        if lsa_method == "2D":
+            lsa_propagation_strengths = numpy.log10(numpy.sqrt(lsa_propagation_strengths[:, :n_regions] ** 2 +
+                                                               lsa_propagation_strengths[:, n_regions:] ** 2))
+            lsa_propagation_strengths -= lsa_propagation_strengths.min(axis=1, keepdims=True)
+
+        if self.normalize_propagation_strength:
+            # Normalize by the maximum
+            lsa_propagation_strengths /= numpy.max(lsa_propagation_strengths, axis=1, keepdims=True)
+
+        propagation_strength_elbows = self._get_curve_elbow_points(lsa_propagation_strengths)
+
+        lsa_hypotheses = []
+        for disease_hypothesis, lsa_propagation_strength, propagation_strength_elbow in \
+                zip(disease_hypotheses, lsa_propagation_strengths, propagation_strength_elbows):
+            propagation_indices = lsa_propagation_strength.argsort()[-propagation_strength_elbow:]
+            hypothesis_builder = HypothesisBuilder(disease_hypothesis.number_of_regions). \
+                                    set_attributes_based_on_hypothesis(disease_hypothesis). \
+                                        set_name(disease_hypothesis.name + "_LSA"). \
+                                            set_lsa_propagation(propagation_indices, lsa_propagation_strength)
+            lsa_hypotheses.append(hypothesis_builder.build_lsa_hypothesis())
+
+        return lsa_hypotheses, eigen_values, eigen_vectors
+
+    def run_lsa_batch(self, disease_hypotheses, model_configurations):
+        """
+        Run LSA for a batch of model configurations at once, with a single stacked eigenvalue decomposition.
+        :param disease_hypotheses: a DiseaseHypothesis, common to all model configurations,
+                                   or a list of DiseaseHypothesis objects, one per model configuration
+        :param model_configurations: a list of S ModelConfiguration objects of the same number of regions n
+        :return: a list of S LSA hypotheses.
+                 The eigenvalues and eigenvectors are stored in arrays of shape (S, n) and (S, n, n), respectively,
+                 or in lists of arrays per sample, if the "auto" LSA method selects different methods for the samples.
+        """
+        model_configurations = list(model_configurations)
+        n_samples = len(model_configurations)
+        if not isinstance(disease_hypotheses, (list, tuple)):
+            disease_hypotheses = n_samples * [disease_hypotheses]
+        elif len(disease_hypotheses) != n_samples:
+            raise_value_error("The number of disease hypotheses (" + str(len(disease_hypotheses)) + ") does not " +
+                              "match the number of model configurations (" + str(n_samples) + ")!")
+
+        if self.lsa_method == "auto":
+            lsa_methods = ["2D" if numpy.any(model_configuration.x1eq > X1EQ_CR_DEF) else "1D"
+                           for model_configuration in model_configurations]
+        else:
+            lsa_methods = n_samples * [self.lsa_method]
+
+        lsa_hypotheses = n_samples * [None]
+        eigen_values = n_samples * [None]
+        eigen_vectors = n_samples * [None]
+        for lsa_method in numpy.unique(lsa_methods):
+            samples = [i_sample for i_sample in range(n_samples) if lsa_methods[i_sample] == lsa_method]
+            method_results = self._run_lsa_batch([disease_hypotheses[i_sample] for i_sample in samples],
+                                                 [model_configurations[i_sample] for i_sample in samples], lsa_method)
+            for i_result, i_sample in enumerate(samples):
+                lsa_hypotheses[i_sample] = method_results[0][i_result]
+                eigen_values[i_sample] = method_results[1][i_result]
+                eigen_vectors[i_sample] = method_results[2][i_result]
+
+        if len(numpy.unique(lsa_methods)) == 1:
+            eigen_values = numpy.array(eigen_values)
+            eigen_vectors = numpy.array(eigen_vectors)
+        self.eigen_values = eigen_values
+        self.eigen_vectors = eigen_vectors
+
+        return lsa_hypotheses
+
     def update_for_pse(self, values, paths, indices):
         for i, val in enumerate(paths):
             vals = val.split(".")
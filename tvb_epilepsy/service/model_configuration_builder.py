@@ -8,12 +8,15 @@ yc=YC_DEF, Iext1=I_EXT1_DEF, K=K_DEF, a=A_DEF, b=B_DEF
 For now, we assume default values, or externally set
 """
 import numpy as np
-from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, warning
+from scipy import sparse
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, warning, raise_value_error
 from tvb_epilepsy.base.utils.data_structures_utils import formal_repr, ensure_list
 from tvb_epilepsy.base.computations.calculations_utils import calc_x0cr_r, calc_coupling, calc_x0, \
     calc_x0_val_to_model_x0, calc_model_x0_to_x0_val
+from tvb_epilepsy.base.computations.equations_utils import eqtn_x0
+from tvb_epilepsy.base.computations.coupling_utils import difference_coupling
 from tvb_epilepsy.base.computations.equilibrium_computation import calc_eq_z, eq_x1_hypo_x0_linTaylor, \
-    eq_x1_hypo_x0_optimize
+    eq_x1_hypo_x0_optimize, eq_x1_hypo_x0_optimize_batch
 from tvb_epilepsy.base.constants.model_constants import *
 from tvb_epilepsy.base.model.model_configuration import ModelConfiguration
 
@@ -177,7 +180,11 @@ class ModelConfigurationBuilder(object):
 
         # Then apply connectivity disease hypothesis scaling if any:
         if len(disease_hypothesis.w_indices) > 0:
-            model_connectivity *= disease_hypothesis.connectivity_disease
+            if sparse.issparse(model_connectivity):
+                # Elementwise, since * is the matrix product of scipy.sparse matrices
+                model_connectivity = model_connectivity.multiply(disease_hypothesis.connectivity_disease).tocsr()
+            else:
+                model_connectivity *= disease_hypothesis.connectivity_disease
 
         # All nodes except for the diseased ones will get the default epileptogenicity:
         e_values = np.array(self.e_values)
@@ -205,7 +212,11 @@ class ModelConfigurationBuilder(object):
 
         # Then apply connectivity disease hypothesis scaling if any:
         if len(disease_hypothesis.w_indices) > 0:
-            model_connectivity *= disease_hypothesis.connectivity_disease
+            if sparse.issparse(model_connectivity):
+                # Elementwise, since * is the matrix product of scipy.sparse matrices
+                model_connectivity = model_connectivity.multiply(disease_hypothesis.connectivity_disease).tocsr()
+            else:
+                model_connectivity *= disease_hypothesis.connectivity_disease
 
         # We assume that all nodes have the default (healthy) excitability:
         x0_values = np.array(self.x0_values)
@@ -230,6 +241,93 @@ class ModelConfigurationBuilder(object):
 
         return self._configure_model_from_equilibrium(x1eq, zeq, model_connectivity)
 
+    def _compute_x1_equilibrium_batch(self, e_indices, x1eq, zeq, x0_values, model_connectivity, K):
+        # x1eq, zeq and x0_values of shape (S, n), K of shape (n,) or (S, n)
+        self._compute_critical_x0_scaling()
+        x0 = self._compute_model_x0(x0_values)
+        if self.x1eq_mode == "linTaylor":
+            # There is no batched linear Taylor approximation. Solve for each sample:
+            x0_indices = np.delete(np.array(range(self.number_of_regions)), e_indices)
+            K = K * np.ones(x1eq.shape)
+            return np.array([eq_x1_hypo_x0_linTaylor(x0_indices, e_indices, x1eq[i_sample], zeq[i_sample],
+                                                     x0[i_sample, x0_indices], K[i_sample], model_connectivity,
+                                                     self.yc, self.Iext1, self.a, self.b, self.d)[0]
+                             for i_sample in range(x1eq.shape[0])])
+        e_mask = np.zeros(x1eq.shape, dtype="bool")
+        e_mask[:, e_indices] = True
+        return eq_x1_hypo_x0_optimize_batch(e_mask, x1eq, zeq, x0, K, model_connectivity, self.yc, self.Iext1,
+                                            self.a, self.b, self.d, self.slope)[0]
+
+    def build_models_from_hypothesis_batch(self, disease_hypothesis, model_connectivity, x0_values=None,
+                                           e_values=None, K_unscaled=None):
+        """
+        Build the model configurations of S samples at once, as build_model_from_hypothesis would do for each sample.
+        :param disease_hypothesis: DiseaseHypothesis, which sets the regions of fixed excitability and epileptogenicity
+        :param model_connectivity: connectivity weights of shape (n, n)
+        :param x0_values: (S, n) excitabilities of all regions (those of the epileptogenicity regions are ignored).
+                          By default, the builder's x0_values and the hypothesis' ones, for all samples.
+        :param e_values: (S, n) epileptogenicities of all regions (only those of the epileptogenicity regions are used).
+                         By default, the builder's e_values and the hypothesis' ones, for all samples.
+        :param K_unscaled: (S,) or (S, n) global coupling samples. By default, the builder's K_unscaled.
+        :return: a list of S ModelConfiguration objects
+        """
+        # Always normalize K first
+        self._normalize_global_coupling()
+        K = self.K
+
+        # Then apply connectivity disease hypothesis scaling if any:
+        if len(disease_hypothesis.w_indices) > 0:
+            if sparse.issparse(model_connectivity):
+                # Elementwise, since * is the matrix product of scipy.sparse matrices
+                model_connectivity = model_connectivity.multiply(disease_hypothesis.connectivity_disease).tocsr()
+            else:
+                model_connectivity = model_connectivity * disease_hypothesis.connectivity_disease
+
+        n_samples = [np.array(samples).shape[0] for samples in [x0_values, e_values, K_unscaled] if samples is not None]
+        if len(n_samples) == 0:
+            n_samples = [1]
+        elif np.any(np.array(n_samples) != n_samples[0]):
+            raise_value_error("The samples of x0_values, e_values and K_unscaled are not of the same number!: "
+                              + str(n_samples))
+        shape = (n_samples[0], self.number_of_regions)
+
+        # Excitabilities as in build_model_from_hypothesis, by default
+        if x0_values is None:
+            x0_values = np.array(self.x0_values)
+            x0_values[disease_hypothesis.x0_indices] = disease_hypothesis.x0_values
+        x0_values = np.broadcast_to(x0_values, shape).astype(self.x0_values.dtype)
+        if e_values is None:
+            e_values = np.array(self.e_values)
+            e_values[disease_hypothesis.e_indices] = disease_hypothesis.e_values
+        e_values = np.broadcast_to(e_values, shape).astype(self.e_values.dtype)
+        if K_unscaled is not None:
+            K_unscaled = np.array(K_unscaled)
+            if K_unscaled.ndim == 1:
+                K_unscaled = K_unscaled[:, np.newaxis]
+            K = np.broadcast_to(K_unscaled, shape).astype(self.K_unscaled.dtype) / self.number_of_regions
+
+        # Compute equilibrium only from epileptogenicity:
+        x1eq, zeq = self._compute_x1_and_z_equilibrium_from_E(e_values)
+
+        # Now, solve the system of all samples in order to compute equilibrium:
+        x1eq = self._compute_x1_equilibrium_batch(disease_hypothesis.e_indices, x1eq, zeq, x0_values,
+                                                  model_connectivity, K)
+        zeq = self._compute_z_equilibrium(x1eq)
+
+        # Compute the rest of the parameters after equilibration, as in _compute_params_after_equilibration
+        self._compute_critical_x0_scaling()
+        K = K * np.ones(shape, dtype=np.array(K).dtype)
+        Ceq = difference_coupling(x1eq, K, model_connectivity)
+        x0_values = self._compute_x0_values_from_x0_model(eqtn_x0(x1eq, zeq, self.zmode, coupl=Ceq))
+        e_values = self._compute_e_values(x1eq)
+        x0 = self._compute_model_x0(x0_values)
+
+        return [ModelConfiguration(self.yc, self.Iext1, self.Iext2, K[i_sample], self.a, self.b, self.d,
+                                   self.slope, self.s, self.gamma, self.tau1, self.tau0, x1eq[i_sample], zeq[i_sample],
+                                   Ceq[i_sample], x0[i_sample], x0_values[i_sample], e_values[i_sample], self.zmode,
+                                   model_connectivity)
+                for i_sample in range(shape[0])]
+
     # TODO: This is used from PSE for varying an attribute's value. We should find a better way, not hardcoded strings.
     def set_attributes_from_pse(self, values, paths, indices):
         for i, val in enumerate(paths):
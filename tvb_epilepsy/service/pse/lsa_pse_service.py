@@ -1,9 +1,8 @@
 import numpy
-from copy import deepcopy
 from tvb_epilepsy.base.constants.config import CalculusConfig
 from tvb_epilepsy.base.constants.model_constants import *
-from tvb_epilepsy.base.utils.log_error_utils import raise_not_implemented_error
 from tvb_epilepsy.base.utils.data_structures_utils import formal_repr
+from tvb_epilepsy.base.datatypes.parameter_overlay import ParameterOverlay
 from tvb_epilepsy.service.pse.pse_service import ABCPSEService
 from tvb_epilepsy.service.lsa_service import LSAService
 
@@ -12,8 +11,9 @@ class LSAPSEService(ABCPSEService):
     task = "LSA"
     hypothesis = None
 
-    def __init__(self, hypothesis=None, params_pse=None):
-        super(LSAPSEService, self).__init__()
+    def __init__(self, hypothesis=None, params_pse=None, n_workers=None, chunksize=None,
+                 checkpoint_path=None):
+        super(LSAPSEService, self).__init__(n_workers, chunksize, checkpoint_path)
         self.hypothesis = hypothesis
         self.params_pse = params_pse
         self.prepare_params(params_pse)
@@ -28,9 +28,6 @@ class LSAPSEService(ABCPSEService):
     def __str__(self):
         return self.__repr__()
 
-    def run_pse_parallel(self):
-        raise_not_implemented_error("PSE parallel not implemented!", self.logger)
-
     def run(self, params, conn_matrix, model_config_service_input=None, lsa_service_input=None,
             yc=YC_DEF, Iext1=I_EXT1_DEF, K=K_DEF, a=A_DEF, b=B_DEF, tau1=TAU1_DEF, tau0=TAU0_DEF, x1eq_mode="optimize",
             lsa_method=CalculusConfig.LSA_METHOD, n_eigenvectors=CalculusConfig.EIGENVECTORS_NUMBER_SELECTION,
@@ -43,11 +40,11 @@ class LSAPSEService(ABCPSEService):
         # Copy a LSAService and update it
         # ...create/update lsa service:
         if isinstance(lsa_service_input, LSAService):
-            lsa_service = deepcopy(lsa_service_input)
+            lsa_service = ParameterOverlay(lsa_service_input)
         else:
             lsa_service = LSAService(lsa_method=lsa_method, eigen_vectors_number=n_eigenvectors,
                                      weighted_eigenvector_sum=weighted_eigenvector_sum)
-        lsa_service.update_for_pse(params, self.params_paths, self.params_indices)
+        self.update_object(lsa_service, params, object_type="lsa_service")
         lsa_hypothesis = lsa_service.run_lsa(hypo_copy, model_configuration)
         output = self.prepare_run_results(lsa_hypothesis, model_configuration)
         return True, output
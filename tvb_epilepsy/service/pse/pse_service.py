@@ -1,9 +1,38 @@
-from copy import deepcopy
+import os
+import sys
+import traceback
+import multiprocessing
 import numpy as np
 from abc import abstractmethod, ABCMeta
 from tvb_epilepsy.base.constants.model_constants import *
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error
+from tvb_epilepsy.base.datatypes.parameter_overlay import ParameterOverlay
 from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.io.h5_reader import H5Reader
+from tvb_epilepsy.io.h5_writer import H5Writer
+
+# State shipped once to every worker process of a parallel PSE by _init_pse_worker
+_worker_pse_service = None
+_worker_conn_matrix = None
+_worker_run_args = ()
+
+
+def _init_pse_worker(pse_service, conn_matrix, run_args):
+    global _worker_pse_service, _worker_conn_matrix, _worker_run_args
+    _worker_pse_service = pse_service
+    _worker_conn_matrix = conn_matrix
+    _worker_run_args = run_args
+
+
+def _run_pse_worker(iloop_params):
+    # Run a single PSE sample in a worker process.
+    # Any error is caught and returned, so that it is reported for this sample only.
+    iloop, params = iloop_params
+    try:
+        status, output = _worker_pse_service.run(params, _worker_conn_matrix, *_worker_run_args)
+        return iloop, status, output, None
+    except:
+        return iloop, False, None, "".join(traceback.format_exception(*sys.exc_info()))
 
 
 class ABCPSEService(object):
@@ -11,44 +40,123 @@ class ABCPSEService(object):
 
     logger = initialize_logger(__name__)
 
-    def __init__(self):
+    def __init__(self, n_workers=None, chunksize=None, checkpoint_path=None):
         self.params_vals = []
         self.params_paths = []
         self.params_indices = []
         self.params_names = []
         self.n_params_vals = []
         self.n_params = 0
+        # Number of worker processes for run_pse_parallel (None for as many as the available cores)
+        self.n_workers = n_workers
+        # Number of samples sent to a worker at once (None for an automatic choice)
+        self.chunksize = chunksize
+        # Path of a H5 file where the results of each loop are written as soon as it is completed.
+        # If it exists already, the PSE is resumed, skipping the loops completed before.
+        self.checkpoint_path = checkpoint_path
 
-    def run_pse(self, conn_matrix, grid_mode=False, *kwargs):
-        results = []
-        execution_status = []
-        loop_tenth = 1
-        for iloop in range(self.n_loops):
-            params = self.params_vals[iloop]
-            if iloop == 0 or iloop + 1 >= loop_tenth * self.n_loops / 10.0:
-                print "\nExecuting loop " + str(iloop + 1) + " of " + str(self.n_loops)
-                if iloop > 0:
-                    loop_tenth += 1
+    def _open_checkpoint(self):
+        # Return the results of any loops completed previously, the loops that remain to be executed,
+        # and the open checkpoint file, if checkpointing is enabled
+        results = [None] * self.n_loops
+        execution_status = [False] * self.n_loops
+        if self.checkpoint_path is None:
+            return results, execution_status, range(self.n_loops), None
+        completed = np.zeros((self.n_loops,), dtype="bool")
+        if os.path.isfile(self.checkpoint_path):
+            results, completed = H5Reader().read_pse_checkpoint(self.checkpoint_path)
+        # This also checks that an existing checkpoint corresponds to the parameters' samples of this PSE
+        checkpoint = H5Writer().open_pse_checkpoint(self, self.checkpoint_path)
+        return results, completed.tolist(), np.where(~completed)[0].tolist(), checkpoint
+
+    def _close_checkpoint(self, checkpoint):
+        if checkpoint is not None:
+            checkpoint.close()
+
+    def _write_checkpoint(self, checkpoint, iloop, status, output):
+        if checkpoint is not None:
+            H5Writer().write_pse_checkpoint_loop(checkpoint, iloop, status, output)
 
-            status = False
-            output = None
-            # try:
-            status, output = self.run(params, conn_matrix, *kwargs)
-            # except:
-            #     pass
-            # if not status:
-            #     self.logger.warning("\nExecution of loop " + str(iloop) + " failed!")
-            results.append(output)
-            execution_status.append(status)
+    def _prepare_results(self, results, execution_status, grid_mode=False):
         if grid_mode:
             results = np.reshape(np.array(results, dtype="O"), tuple(self.n_params_vals))
             execution_status = np.reshape(np.array(execution_status), tuple(self.n_params_vals))
         return results, execution_status
 
-    @abstractmethod
-    def run_pse_parallel(self):
-        # TODO: start each loop on a separate process, gather results and return them
-        pass
+    def run_pse(self, conn_matrix, grid_mode=False, *kwargs):
+        results, execution_status, iloops, checkpoint = self._open_checkpoint()
+        try:
+            loop_tenth = 1
+            for iloop in iloops:
+                params = self.params_vals[iloop]
+                if iloop == iloops[0] or iloop + 1 >= loop_tenth * self.n_loops / 10.0:
+                    print "\nExecuting loop " + str(iloop + 1) + " of " + str(self.n_loops)
+                    while iloop + 1 >= loop_tenth * self.n_loops / 10.0:
+                        loop_tenth += 1
+
+                status = False
+                output = None
+                # try:
+                status, output = self.run(params, conn_matrix, *kwargs)
+                # except:
+                #     pass
+                # if not status:
+                #     self.logger.warning("\nExecution of loop " + str(iloop) + " failed!")
+                results[iloop] = output
+                execution_status[iloop] = status
+                self._write_checkpoint(checkpoint, iloop, status, output)
+        finally:
+            self._close_checkpoint(checkpoint)
+        return self._prepare_results(results, execution_status, grid_mode)
+
+    def _get_n_workers(self):
+        if self.n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        else:
+            n_workers = int(self.n_workers)
+        return max(1, min(n_workers, self.n_loops))
+
+    def _get_chunksize(self, n_workers):
+        if self.chunksize is None:
+            # A few chunks per worker, so that the load remains balanced if some samples are slower
+            return max(1, int(np.ceil(self.n_loops / (4.0 * n_workers))))
+        return max(1, int(self.chunksize))
+
+    def run_pse_parallel(self, conn_matrix, grid_mode=False, *kwargs):
+        n_workers = self._get_n_workers()
+        if n_workers == 1:
+            return self.run_pse(conn_matrix, grid_mode, *kwargs)
+        chunksize = self._get_chunksize(n_workers)
+        results, execution_status, iloops, checkpoint = self._open_checkpoint()
+        print "\nExecuting " + str(len(iloops)) + " loops in parallel, with " + str(n_workers) + \
+              " processes and chunks of " + str(chunksize) + " loops"
+        # The service (with its hypothesis or simulator), the connectivity and the run arguments
+        # are pickled only once per worker, whereas only the parameters' values are sent per sample.
+        # Loops completed in the worker processes are checkpointed by this process, as their results arrive.
+        pool = multiprocessing.Pool(n_workers, _init_pse_worker, (self, conn_matrix, kwargs))
+        try:
+            n_done = self.n_loops - len(iloops)
+            loop_tenth = int(10.0 * n_done / self.n_loops) + 1
+            for iloop, status, output, error in pool.imap(_run_pse_worker,
+                                                          [(iloop, self.params_vals[iloop]) for iloop in iloops],
+                                                          chunksize):
+                if error is not None:
+                    self.logger.warning("\nExecution of loop " + str(iloop + 1) + " failed!\n" + error)
+                results[iloop] = output
+                execution_status[iloop] = status
+                self._write_checkpoint(checkpoint, iloop, status, output)
+                n_done += 1
+                if n_done >= loop_tenth * self.n_loops / 10.0:
+                    print "\nCompleted " + str(n_done) + " of " + str(self.n_loops) + " loops"
+                    loop_tenth += 1
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            self._close_checkpoint(checkpoint)
+        return self._prepare_results(results, execution_status, grid_mode)
 
     @abstractmethod
     def run(self, *kwargs):
@@ -89,17 +197,17 @@ class ABCPSEService(object):
     def update_hypo_model_config(self, hypothesis, params, conn_matrix, model_config_service_input=None,
                                 yc=YC_DEF, Iext1=I_EXT1_DEF, K=K_DEF, a=A_DEF, b=B_DEF, tau1=TAU1_DEF, tau0=TAU0_DEF,
                                 x1eq_mode="optimize",):
-        # Copy and update hypothesis
-        hypo_copy = deepcopy(hypothesis)
-        hypo_copy.update_for_pse(params, self.params_paths, self.params_indices)
+        # Overlay the hypothesis with its updated parameters, instead of copying it
+        hypo_copy = ParameterOverlay(hypothesis)
+        self.update_object(hypo_copy, params, object_type="hypothesis")
         # Create a ModelConfigService and update it
         if isinstance(model_config_service_input, ModelConfigurationBuilder):
-            model_configuration_builder = deepcopy(model_config_service_input)
+            model_configuration_builder = ParameterOverlay(model_config_service_input)
         else:
             model_configuration_builder = ModelConfigurationBuilder(hypo_copy.number_of_regions,
                                                                     yc=yc, Iext1=Iext1, K=K, a=a, b=b,
                                                                     tau1=tau1, tau0=tau0, x1eq_mode=x1eq_mode)
-        model_configuration_builder.set_attributes_from_pse(params, self.params_paths, self.params_indices)
+        self.update_object(model_configuration_builder, params, object_type="model_configuration_builder")
         # Obtain Modelconfiguration
         if hypo_copy.type == "Epileptogenicity":
             model_configuration = model_configuration_builder.build_model_from_E_hypothesis(hypo_copy,
@@ -110,8 +218,11 @@ class ABCPSEService(object):
         return hypo_copy, model_configuration
 
     def set_object_attribute_recursively(self, object, values, path, indices):
+        if type(object) is ParameterOverlay:
+            # Only record the parameter to the overlay, leaving the base object intact
+            object.set_parameter(path, values, indices)
         # If there is more than one levels...
-        if len(path) > 1:
+        elif len(path) > 1:
             # ...call the function recursively
             self.set_object_attribute_recursively(getattr(object, path[0]), values, path[1:], indices)
         else:
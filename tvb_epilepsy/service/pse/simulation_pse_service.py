@@ -1,18 +1,20 @@
 import numpy
 from copy import deepcopy
 from tvb_epilepsy.base.constants.model_constants import *
-from tvb_epilepsy.base.utils.log_error_utils import raise_not_implemented_error
+from tvb_epilepsy.base.utils.log_error_utils import raise_value_error
 from tvb_epilepsy.base.utils.data_structures_utils import formal_repr
 from tvb_epilepsy.service.pse.pse_service import ABCPSEService
 from tvb_epilepsy.base.model.disease_hypothesis import DiseaseHypothesis
+from tvb_epilepsy.service.simulator.simulator_numpy import SimulatorNumpy
 
 
 class SimulationPSEService(ABCPSEService):
     task = "SIMULATION"
     simulator = None
 
-    def __init__(self, simulator, params_pse=None):
-        super(SimulationPSEService, self).__init__()
+    def __init__(self, simulator, params_pse=None, n_workers=None, chunksize=None,
+                 checkpoint_path=None):
+        super(SimulationPSEService, self).__init__(n_workers, chunksize, checkpoint_path)
         self.simulator = simulator
         self.params_pse = params_pse
         self.prepare_params(params_pse)
@@ -28,37 +30,80 @@ class SimulationPSEService(ABCPSEService):
     def __str__(self):
         return self.__repr__()
 
-    def run_pse_parallel(self):
-        raise_not_implemented_error("PSE parallel not implemented!", self.logger)
+    def _update_simulator(self, params, conn_matrix, hypothesis_input=None, model_config_service_input=None,
+                          yc=YC_DEF, Iext1=I_EXT1_DEF, K=K_DEF, a=A_DEF, b=B_DEF, tau1=TAU1_DEF, tau0=TAU0_DEF,
+                          x1eq_mode="optimize", update_initial_conditions=True):
+        # Create new objects from the input simulator
+        # The simulator is still copied, because its TVB simulator keeps its integration state (e.g., history)
+        simulator_copy = deepcopy(self.simulator)
+        if isinstance(hypothesis_input, DiseaseHypothesis):
+            # Copy and update hypothesis
+            model_configuration = \
+                self.update_hypo_model_config(hypothesis_input, params, conn_matrix,
+                                              model_config_service_input, yc, Iext1, K, a, b,
+                                              tau1, tau0, x1eq_mode)[1]
+            # Update simulator with new ModelConfiguration
+            simulator_copy.model_configuration = model_configuration
+            # Generate new simulator_copy.model with the new ModelConfiguration
+            simulator_copy.configure_model()
+        # Update model if needed
+        # TODO: check if the name "model" is correct!
+        self.update_object(simulator_copy.model, params, object_type="model")
+        # Update other possible remaining parameters, i.e., concerning the integrator, noise etc
+        # TODO: check if the name "SimulatorTVB" is correct!
+        self.update_object(simulator_copy, params, object_type="SimulatorTVB")
+        # Now, recalculate the default initial conditions...
+        # If initial conditions were parameters, then, this flag can be set to False
+        if update_initial_conditions:
+            simulator_copy.configure_initial_conditions()
+        return simulator_copy
 
     def run(self, params, conn_matrix, hypothesis_input=None, model_config_service_input=None,
             yc=YC_DEF, Iext1=I_EXT1_DEF, K=K_DEF, a=A_DEF, b=B_DEF, tau1=TAU1_DEF, tau0=TAU0_DEF, x1eq_mode="optimize",
             update_initial_conditions=True):
-        # Create new objects from the input simulator
-        simulator_copy = deepcopy(self.simulator)
-        model_copy = deepcopy(simulator_copy.model)
         try:
-            if isinstance(hypothesis_input, DiseaseHypothesis):
-                # Copy and update hypothesis
-                model_configuration = \
-                    self.update_hypo_model_config(hypothesis_input, params, conn_matrix,
-                                                  model_config_service_input, yc, Iext1, K, a, b,
-                                                  tau1, tau0, x1eq_mode)[1]
-                # Update simulator with new ModelConfiguration
-                simulator_copy.model_configuration = model_configuration
-                # Generate new simulator_copy.model with the new ModelConfiguration
-                simulator_copy.configure_model()
-            # Update model if needed
-            # TODO: check if the name "model" is correct!
-            self.update_object(simulator_copy.model, params, object_type="model")
-            # Update other possible remaining parameters, i.e., concerning the integrator, noise etc
-            # TODO: check if the name "SimulatorTVB" is correct!
-            self.update_object(simulator_copy, params, object_type="SimulatorTVB")
-            # Now, recalculate the default initial conditions...
-            # If initial conditions were parameters, then, this flag can be set to False
-            if update_initial_conditions:
-                simulator_copy.configure_initial_conditions()
-            output, status = simulator_copy.launch()
-            return status, output
+            simulator_copy = self._update_simulator(params, conn_matrix, hypothesis_input, model_config_service_input,
+                                                    yc, Iext1, K, a, b, tau1, tau0, x1eq_mode,
+                                                    update_initial_conditions)
+            output, status = simulator_copy.launch_simulation()
+            return status, self.prepare_run_results(output)
         except:
             return False, None
+
+    def prepare_run_results(self, output):
+        return output
+
+    def run_ensemble(self, conn_matrix, hypothesis_input=None, model_config_service_input=None,
+                     yc=YC_DEF, Iext1=I_EXT1_DEF, K=K_DEF, a=A_DEF, b=B_DEF, tau1=TAU1_DEF, tau0=TAU0_DEF,
+                     x1eq_mode="optimize", update_initial_conditions=True, noise_seeds=None,
+                     report_every_n_monitor_steps=None):
+        """
+        Run all PSE samples in a single, vectorized simulation of an ensemble of models,
+        instead of one simulation per sample (as run_pse does).
+        It requires a SimulatorNumpy, and parameters of the hypothesis, the model configuration builder or the model.
+        :param noise_seeds: list of seeds of the noise streams of the samples
+                            (by default, all samples use the noise seed of the simulation settings)
+        :return: the Timeseries of the samples along its "samples" dimension, and the execution status of each sample
+        """
+        if not isinstance(self.simulator, SimulatorNumpy):
+            raise_value_error("An ensemble PSE requires a SimulatorNumpy, and not a " +
+                              self.simulator.__class__.__name__ + "!")
+        if numpy.any([path.split(".")[0] == "SimulatorTVB" for path in self.params_paths]):
+            raise_value_error("Simulator parameters can not differ among the samples of an ensemble PSE!: \n" +
+                              str(self.params_paths))
+        models = []
+        initial_conditions = []
+        for params in self.params_vals:
+            simulator_copy = self._update_simulator(params, conn_matrix, hypothesis_input, model_config_service_input,
+                                                    yc, Iext1, K, a, b, tau1, tau0, x1eq_mode,
+                                                    update_initial_conditions)
+            models.append(simulator_copy.model)
+            initial_conditions.append(simulator_copy.current_state)
+        simulator_ensemble = deepcopy(self.simulator)
+        simulator_ensemble.configure_ensemble(models, initial_conditions, noise_seeds)
+        print "\nExecuting " + str(self.n_loops) + " loops in a single ensemble simulation"
+        output, status = simulator_ensemble.launch_simulation(report_every_n_monitor_steps)
+        if output is None:
+            return None, [False] * self.n_loops
+        execution_status = numpy.all(numpy.isfinite(output.data), axis=(0, 1, 2)).tolist()
+        return self.prepare_run_results(output), execution_status
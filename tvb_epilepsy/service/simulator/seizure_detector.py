@@ -0,0 +1,127 @@
+"""
+Online detection of seizures during a simulation, from its monitor outputs, one time point at a time,
+with rules to stop the simulation as soon as the question of interest is answered.
+"""
+
+import numpy
+from tvb_epilepsy.base.constants.config import SimulatorConfig
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error
+
+
+class SeizureDetector(object):
+    """
+    Tracks the seizures of every region (and of every member of an ensemble simulation) by the x1 variable
+    of the Epileptor, and, if it is monitored, by the permittivity variable z:
+    a seizure starts when x1 crosses x1_threshold upwards.
+    It ends at the time x1 crosses x1_threshold downwards, if x1 remains below it for at least min_offset_interval,
+    so that the spikes of a seizure do not end it, and if z has dropped from its maximum during the seizure,
+    as it does after a seizure has terminated.
+    The onset and offset times of the first seizure of each region are kept, as well as the number of seizures.
+
+    Stop rules, of which a simulation is stopped as soon as one is fulfilled (for all members of an ensemble):
+    stop_if_all_seized: all the regions of interest have seized,
+    stop_if_no_seizure_by: no region of interest has seized by this time.
+    """
+    logger = initialize_logger(__name__)
+
+    def __init__(self, regions_of_interest=None, x1_threshold=SimulatorConfig.SEIZURE_DETECTION_X1_THRESHOLD,
+                 min_offset_interval=SimulatorConfig.SEIZURE_DETECTION_MIN_OFFSET_INTERVAL,
+                 stop_if_all_seized=False, stop_if_no_seizure_by=None):
+        self.regions_of_interest = regions_of_interest
+        self.x1_threshold = x1_threshold
+        self.min_offset_interval = min_offset_interval
+        self.stop_if_all_seized = stop_if_all_seized
+        self.stop_if_no_seizure_by = stop_if_no_seizure_by
+        self.ix1 = None
+        self.iz = None
+        self.time = None
+        self.onsets = None
+        self.offsets = None
+        self.number_of_seizures = None
+        self.in_seizure = None
+        self.below_threshold_since = None
+        self.z_max = None
+        self.stop_time = None
+        self.stop_reason = None
+
+    def open(self, variables_labels, sample_shape):
+        """
+        :param variables_labels: the labels of the monitored variables, among which "x1" and, optionally, "z"
+        :param sample_shape: shape of the data of a single time point, i.e., (n_regions, n_variables, n_modes)
+        """
+        variables_labels = list(variables_labels)
+        if "x1" not in variables_labels:
+            raise_value_error("Seizure detection needs the monitored variable x1, but the monitored variables are: "
+                              + str(variables_labels) + "!")
+        self.ix1 = variables_labels.index("x1")
+        self.iz = variables_labels.index("z") if "z" in variables_labels else None
+        shape = (sample_shape[0], sample_shape[2])
+        self.time = None
+        self.onsets = numpy.nan * numpy.ones(shape)
+        self.offsets = numpy.nan * numpy.ones(shape)
+        self.number_of_seizures = numpy.zeros(shape, dtype="i")
+        self.in_seizure = numpy.zeros(shape, dtype="bool")
+        # Time since when x1 is below threshold during a seizure, or inf otherwise
+        self.below_threshold_since = numpy.inf * numpy.ones(shape)
+        self.z_max = -numpy.inf * numpy.ones(shape)
+        self.stop_time = None
+        self.stop_reason = None
+
+    @property
+    def seized(self):
+        return self.number_of_seizures > 0
+
+    def _select_regions(self, values):
+        if self.regions_of_interest is None:
+            return values
+        return values[self.regions_of_interest]
+
+    def update(self, time, data):
+        """
+        :param time: time of the monitor output
+        :param data: data of the monitor output, of shape (n_regions, n_variables, n_modes)
+        :return: True if the simulation should stop, according to the stop rules
+        """
+        self.time = float(time)
+        x1 = data[:, self.ix1]
+        above = x1 > self.x1_threshold
+        # Onsets
+        onset = above & ~self.in_seizure
+        self.onsets[onset & ~self.seized] = self.time
+        self.number_of_seizures[onset] += 1
+        self.in_seizure |= onset
+        self.z_max[onset] = -numpy.inf
+        # Offsets
+        self.below_threshold_since[above] = numpy.inf
+        self.below_threshold_since[self.in_seizure & ~above & numpy.isinf(self.below_threshold_since)] = self.time
+        offset = self.in_seizure & ~above & (self.time - self.below_threshold_since >= self.min_offset_interval)
+        if self.iz is not None:
+            z = data[:, self.iz]
+            self.z_max[self.in_seizure] = numpy.maximum(self.z_max, z)[self.in_seizure]
+            offset &= z < self.z_max
+        first_offset = offset & numpy.isnan(self.offsets)
+        self.offsets[first_offset] = self.below_threshold_since[first_offset]
+        self.in_seizure &= ~offset
+        return self.check_stop_rules()
+
+    def check_stop_rules(self):
+        seized = self._select_regions(self.seized)
+        done = numpy.zeros((seized.shape[-1],), dtype="bool")
+        if self.stop_if_all_seized:
+            all_seized = numpy.all(seized, axis=0)
+            if numpy.all(done | all_seized):
+                self.stop_reason = "all regions of interest seized"
+            done |= all_seized
+        if self.stop_if_no_seizure_by is not None and self.time >= self.stop_if_no_seizure_by:
+            no_seizure = ~numpy.any(seized, axis=0)
+            if numpy.all(no_seizure):
+                self.stop_reason = "no seizure by " + str(self.stop_if_no_seizure_by)
+            done |= no_seizure
+        if numpy.all(done):
+            if self.stop_reason is None:
+                self.stop_reason = "all members of the ensemble fulfilled a stop rule"
+            self.stop_time = self.time
+            self.logger.info("Simulation stopped at time " + str(self.time) + ": " + self.stop_reason + ".")
+            return True
+        self.stop_reason = None
+        return False
@@ -0,0 +1,164 @@
+"""
+Content-addressed cache of simulation results.
+
+A simulation is keyed by a hash of everything that determines its result, as given by the get_cache_description
+of its simulator: the model class and parameters, the model configuration, the connectivity weights and delays,
+the simulation settings (including the noise seed), the integrator, noise, monitors (including their sensors and gain)
+and initial conditions. Simulations whose description includes values that can not be hashed are not cached.
+The resulting Timeseries are stored as H5 files named by their key in the cache folder,
+and the least recently used ones are removed when the total size of the folder exceeds a maximum size.
+"""
+
+import os
+import hashlib
+import numpy
+from scipy import sparse
+from tvb_epilepsy.base.constants.config import SimulatorConfig
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error, warning
+from tvb_epilepsy.base.utils.file_utils import write_file_atomically
+from tvb_epilepsy.base.model.timeseries import Timeseries
+from tvb_epilepsy.io.h5_writer import H5Writer
+from tvb_epilepsy.io.h5_reader import H5Reader
+
+# Increase to invalidate the results of previous versions
+SIMULATION_CACHE_VERSION = 1
+
+
+def _update_hash(hash, value):
+    # Feed a value of (nested) dictionaries, lists, tuples, numpy arrays, scipy.sparse matrices, strings and numbers
+    # to hash, in a stable way
+    if isinstance(value, dict):
+        hash.update("{")
+        for key in sorted(value.keys()):
+            _update_hash(hash, key)
+            _update_hash(hash, value[key])
+        hash.update("}")
+    elif isinstance(value, (list, tuple)):
+        hash.update("[")
+        for item in value:
+            _update_hash(hash, item)
+        hash.update("]")
+    elif sparse.issparse(value):
+        # scipy.sparse matrices, e.g., connectivity weights, by their canonical CSR form
+        value = sparse.csr_matrix(value, copy=True)
+        value.sum_duplicates()
+        value.sort_indices()
+        hash.update("sparse" + str(value.shape))
+        for array in [value.indptr, value.indices, value.data]:
+            _update_hash(hash, array)
+    elif isinstance(value, (numpy.ndarray, numpy.generic)):
+        value = numpy.asarray(value)
+        hash.update("array" + value.dtype.str + str(value.shape))
+        if value.dtype.kind == "O":
+            _update_hash(hash, value.tolist())
+        else:
+            hash.update(numpy.ascontiguousarray(value).tobytes())
+    elif value is None or isinstance(value, (basestring, bool, int, long, float, complex)):
+        hash.update(value.__class__.__name__ + repr(value))
+    else:
+        # Objects without a stable representation can not be told apart, and can not be hashed
+        raise_value_error("A value of " + str(value.__class__) + " can not be hashed for the simulation cache!")
+
+
+class SimulationCache(object):
+    logger = initialize_logger(__name__)
+
+    def __init__(self, folder=SimulatorConfig.SIMULATION_CACHE_FOLDER,
+                 max_size=SimulatorConfig.SIMULATION_CACHE_MAX_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_key(self, simulator):
+        """
+        :return: the hash of the cache description of simulator
+        :raise ValueError: if the description includes values that can not be hashed
+        """
+        hash = hashlib.sha1()
+        _update_hash(hash, [SIMULATION_CACHE_VERSION, simulator.get_cache_description()])
+        return hash.hexdigest()
+
+    def get_file_path(self, key):
+        return os.path.join(self.folder, key + ".h5")
+
+    def _get_cached_files(self):
+        if not os.path.isdir(self.folder):
+            return []
+        return [os.path.join(self.folder, file_name) for file_name in os.listdir(self.folder)
+                if file_name.endswith(".h5")]
+
+    @property
+    def size(self):
+        return sum([os.path.getsize(file_path) for file_path in self._get_cached_files()])
+
+    @property
+    def statistics(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "number_of_results": len(self._get_cached_files()), "size": self.size}
+
+    def get(self, key):
+        file_path = self.get_file_path(key)
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            output = H5Reader().read_timeseries(file_path)
+        except Exception:
+            self.logger.exception("Failed to read cached simulation result from " + file_path + "!")
+            return None
+        # Mark the result as recently used
+        os.utime(file_path, None)
+        return output
+
+    def put(self, key, output):
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        write_file_atomically(self.get_file_path(key), lambda path: H5Writer().write_timeseries(output, path))
+        self.evict()
+
+    def evict(self):
+        # Remove the least recently used results, until the total size of the cache fits its maximum size
+        if self.max_size is None:
+            return
+        files = sorted([(os.path.getmtime(file_path), os.path.getsize(file_path), file_path)
+                        for file_path in self._get_cached_files()])
+        size = sum([file_size for _, file_size, _ in files])
+        for _, file_size, file_path in files:
+            if size <= self.max_size:
+                break
+            os.remove(file_path)
+            size -= file_size
+            self.evictions += 1
+            self.logger.info("Removed least recently used simulation result " + file_path + " from the cache.")
+
+    def clear(self):
+        for file_path in self._get_cached_files():
+            os.remove(file_path)
+
+    def launch_simulation(self, simulator, **kwargs):
+        """
+        Return the cached result of the simulation of simulator, if any, or else launch it and cache its result.
+        Only successful simulations with a Timeseries output are cached.
+        :param kwargs: the arguments of simulator.launch_simulation
+        :return: the output and the status of the simulation
+        """
+        if kwargs.get("seizure_detector", None) is not None:
+            # The output of a simulation with a seizure detector depends on its stop rules, and the detector
+            # has to receive the output of the simulation
+            return simulator.launch_simulation(**kwargs)
+        try:
+            key = self.get_key(simulator)
+        except ValueError as error:
+            warning(str(error) + "\nThe simulation is launched without the cache.", self.logger)
+            return simulator.launch_simulation(**kwargs)
+        output = self.get(key)
+        if output is not None:
+            self.hits += 1
+            self.logger.info("Simulation result loaded from the cache: " + self.get_file_path(key))
+            return output, True
+        self.misses += 1
+        output, status = simulator.launch_simulation(**kwargs)
+        if status and isinstance(output, Timeseries):
+            self.put(key, output)
+        return output, status
@@ -0,0 +1,170 @@
+"""
+Sinks of the monitor outputs of a simulation, which receive them one time point at a time,
+and assemble the output of the simulation, without keeping lists of the time points in memory.
+"""
+
+from abc import ABCMeta, abstractmethod
+import numpy
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, warning
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.io.h5_writer import H5Writer
+from tvb_epilepsy.io.h5_reader import H5Reader
+
+
+class ABCSimulationOutputSink(object):
+    __metaclass__ = ABCMeta
+
+    logger = initialize_logger(__name__)
+
+    def __init__(self):
+        self.n_times = 0
+        self.time_start = None
+        self.time_step = None
+
+    def open(self, n_times, sample_shape, time_step):
+        """
+        :param n_times: the expected number of time points of the output
+        :param sample_shape: shape of the data of a single time point, i.e., (n_regions, n_variables, n_modes)
+        :param time_step: the sampling period of the output
+        """
+        self.n_times = 0
+        self.time_start = None
+        self.time_step = time_step
+
+    def append(self, time, data):
+        """
+        :param time: time of the monitor output
+        :param data: data of the monitor output, of shape sample_shape
+        """
+        if self.time_start is None:
+            self.time_start = float(time)
+        self._append(data)
+        self.n_times += 1
+
+    def append_block(self, time, data):
+        """
+        :param time: time of the first time point of the block
+        :param data: block of time points, of shape (n_times,) + sample_shape
+        """
+        for i_time, sample in enumerate(data):
+            self.append(time + i_time * self.time_step, sample)
+
+    @abstractmethod
+    def _append(self, data):
+        pass
+
+    @abstractmethod
+    def close(self, space_labels, variables_labels, time_unit="ms"):
+        """
+        :return: the output of the simulation
+        """
+        pass
+
+    def abort(self):
+        # Release any resources of a failed simulation
+        pass
+
+
+class ArrayOutputSink(ABCSimulationOutputSink):
+    """
+    Writes the time points to an array, of float32 by default, preallocated for the expected number of time points,
+    and returns a Timeseries of it.
+    """
+
+    def __init__(self, dtype="float32"):
+        super(ArrayOutputSink, self).__init__()
+        self.dtype = dtype
+        self.data = None
+
+    def open(self, n_times, sample_shape, time_step):
+        super(ArrayOutputSink, self).open(n_times, sample_shape, time_step)
+        self.data = numpy.empty((max(1, int(n_times)),) + tuple(sample_shape), dtype=self.dtype)
+
+    def _extend(self, n_times):
+        if n_times > self.data.shape[0]:
+            warning("More time points than the expected " + str(self.data.shape[0]) + "! Extending the output.",
+                    self.logger)
+            self.data = numpy.concatenate([self.data, numpy.empty((max(n_times, 2 * self.data.shape[0]) -
+                                                                   self.data.shape[0],) + self.data.shape[1:],
+                                                                  dtype=self.data.dtype)])
+
+    def _append(self, data):
+        self._extend(self.n_times + 1)
+        self.data[self.n_times] = data
+
+    def append_block(self, time, data):
+        if data.shape[0] == 0:
+            return
+        if self.time_start is None:
+            self.time_start = float(time)
+        self._extend(self.n_times + data.shape[0])
+        self.data[self.n_times:self.n_times + data.shape[0]] = data
+        self.n_times += data.shape[0]
+
+    def close(self, space_labels, variables_labels, time_unit="ms"):
+        return Timeseries(self.data[:self.n_times], {TimeseriesDimensions.SPACE.value: space_labels,
+                                                     TimeseriesDimensions.VARIABLES.value: variables_labels},
+                          self.time_start, self.time_step, time_unit)
+
+
+class H5OutputSink(ABCSimulationOutputSink):
+    """
+    Streams blocks of time points to a chunked dataset of a Timeseries H5 file, through H5Writer,
+    so that only a block of block_length time points is kept in memory, and returns the path of the file,
+    or, if lazy, a H5Timeseries of it.
+    """
+
+    def __init__(self, path, block_length=1024, lazy=False):
+        super(H5OutputSink, self).__init__()
+        self.path = path
+        self.lazy = lazy
+        self.block_length = block_length
+        self.block = None
+        self.n_block = 0
+        self.h5_file = None
+
+    def open(self, n_times, sample_shape, time_step):
+        super(H5OutputSink, self).open(n_times, sample_shape, time_step)
+        block_length = max(1, min(int(self.block_length), int(n_times)))
+        self.block = numpy.empty((block_length,) + tuple(sample_shape), dtype="float32")
+        self.n_block = 0
+        self.h5_file = H5Writer().open_timeseries(self.path, sample_shape, self.block.dtype, block_length)
+
+    def _write_block(self):
+        if self.n_block > 0:
+            H5Writer().append_timeseries_block(self.h5_file, self.block[:self.n_block])
+            self.n_block = 0
+
+    def _append(self, data):
+        self.block[self.n_block] = data
+        self.n_block += 1
+        if self.n_block == self.block.shape[0]:
+            self._write_block()
+
+    def append_block(self, time, data):
+        if data.shape[0] == 0:
+            return
+        if self.time_start is None:
+            self.time_start = float(time)
+        # The time points buffered so far precede the block
+        self._write_block()
+        H5Writer().append_timeseries_block(self.h5_file, numpy.asarray(data, dtype=self.block.dtype))
+        self.n_times += data.shape[0]
+
+    def close(self, space_labels, variables_labels, time_unit="ms"):
+        self._write_block()
+        # The writer may have changed the file name, in order not to overwrite an existing file
+        path = self.h5_file.filename
+        H5Writer().close_timeseries(self.h5_file, space_labels, variables_labels, self.time_start, self.time_step,
+                                    time_unit)
+        self.h5_file = None
+        self.block = None
+        if self.lazy:
+            return H5Reader().read_timeseries(path, lazy=True)
+        return self.path
+
+    def abort(self):
+        if self.h5_file is not None:
+            self.h5_file.close()
+            self.h5_file = None
+        self.block = None
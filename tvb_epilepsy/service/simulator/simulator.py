@@ -1,10 +1,24 @@
 from abc import ABCMeta, abstractmethod
 
 import numpy
+from scipy import sparse
 
+from tvb_epilepsy.base.constants.model_constants import TIME_DELAYS_FLAG
 from tvb_epilepsy.base.computations.equilibrium_computation import calc_equilibrium_point
 
 
+def describe_traited(value, max_depth=3):
+    # The class and trait values of a TVB traited object, e.g., a monitor, including its sensors, projection (gain)
+    # and region mapping, recursively up to max_depth traited objects deep, for the SimulationCache.
+    # Any other values are returned as they are.
+    trait = getattr(value, "trait", None)
+    if trait is None or not hasattr(trait, "keys") or max_depth < 1:
+        return value
+    return {"class": value.__class__.__module__ + "." + value.__class__.__name__,
+            "traits": dict([(name, describe_traited(getattr(value, name, None), max_depth - 1))
+                            for name in trait.keys()])}
+
+
 class ABCSimulator(object):
     __metaclass__ = ABCMeta
 
@@ -16,6 +30,27 @@ class ABCSimulator(object):
     # def launch_pse(self, hypothesis, head):
     #     pass
 
+    def get_model_parameters(self):
+        trait = getattr(self.model, "trait", None)
+        if trait is None:
+            return vars(self.model)
+        return dict([(param, getattr(self.model, param)) for param in trait.keys()])
+
+    def get_cache_description(self):
+        # Everything that determines the result of a simulation, to be hashed by the SimulationCache
+        model_connectivity = getattr(self.model_configuration, "model_connectivity", None)
+        if not isinstance(model_connectivity, numpy.ndarray) and not sparse.issparse(model_connectivity):
+            model_connectivity = self.connectivity.normalized_weights
+        delays = self.connectivity.tract_lengths
+        delays = TIME_DELAYS_FLAG * (delays if sparse.issparse(delays) else numpy.array(delays))
+        return {"simulator": self.__class__.__name__,
+                "model_class": self.model.__class__.__module__ + "." + self.model.__class__.__name__,
+                "model_parameters": self.get_model_parameters(),
+                "model_configuration": vars(self.model_configuration),
+                "weights": model_connectivity,
+                "delays": delays,
+                "simulation_settings": vars(self.simulation_settings)}
+
     ###
     # Prepare for tvb-epilepsy epileptor_models initial conditions
     ###
@@ -10,6 +10,7 @@ from tvb_epilepsy.base.simulation_settings import SimulationSettings
 from tvb_epilepsy.service.simulator.epileptor_model_factory import model_build_dict, model_noise_intensity_dict, VOIS, \
     AVAILABLE_DYNAMICAL_MODELS_NAMES, EPILEPTOR_MODEL_NVARS
 from tvb_epilepsy.service.simulator.simulator_java import SimulatorJava
+from tvb_epilepsy.service.simulator.simulator_numpy import SimulatorNumpy
 from tvb_epilepsy.service.simulator.simulator_tvb import SimulatorTVB
 
 
@@ -129,7 +130,7 @@ class SimulatorBuilder(object):
 
     def build_simulator_TVB_from_model_sim_settings(self, model_configuration, connectivity, model, sim_settings,
                                                     **kwargs):
-        model, monitors, sim_settings = self.set_monitor(model, sim_settings, kwargs.get("monitors", None))
+        model, monitors, sim_settings = self.set_monitor(model, sim_settings, kwargs.pop("monitors", None))
 
         noise, sim_settings = self.set_noise(sim_settings, **kwargs)
 
@@ -147,6 +148,35 @@ class SimulatorBuilder(object):
         return self.build_simulator_TVB_from_model_sim_settings(model_configuration, connectivity,
                                                                 model, sim_settings, **kwargs)
 
+    def build_simulator_numpy_from_model_sim_settings(self, model_configuration, connectivity, model, sim_settings,
+                                                      **kwargs):
+        model, monitors, sim_settings = self.set_monitor(model, sim_settings, kwargs.pop("monitors", None))
+
+        noise, sim_settings = self.set_noise(sim_settings, **kwargs)
+
+        simulator_instance = SimulatorNumpy(connectivity, model_configuration, model, sim_settings)
+        simulator_instance.config_simulation(noise, monitors, initial_conditions=None, **kwargs)
+
+        return simulator_instance, sim_settings, model
+
+    def build_simulator_numpy(self, model_configuration, connectivity, **kwargs):
+
+        model = self.generate_model_tvb(model_configuration)
+
+        sim_settings = self.build_sim_settings()
+
+        return self.build_simulator_numpy_from_model_sim_settings(model_configuration, connectivity,
+                                                                  model, sim_settings, **kwargs)
+
+    def build_simulator_from_model_sim_settings(self, model_configuration, connectivity, model, sim_settings,
+                                                **kwargs):
+        if isequal_string(self.simulator, "numpy"):
+            return self.build_simulator_numpy_from_model_sim_settings(model_configuration, connectivity, model,
+                                                                      sim_settings, **kwargs)
+        else:
+            return self.build_simulator_TVB_from_model_sim_settings(model_configuration, connectivity, model,
+                                                                    sim_settings, **kwargs)
+
     def build_simulator_java_from_model_configuration(self, model_configuration, connectivity, **kwargs):
 
         self.set_model_name("JavaEpileptor")
@@ -162,6 +192,8 @@ class SimulatorBuilder(object):
     def build_simulator(self, model_configuration, connectivity, **kwargs):
         if isequal_string(self.simulator, "java"):
             return self.build_simulator_java_from_model_configuration(model_configuration, connectivity, **kwargs)
+        elif isequal_string(self.simulator, "numpy"):
+            return self.build_simulator_numpy(model_configuration, connectivity, **kwargs)
         else:
             return self.build_simulator_TVB(model_configuration, connectivity, **kwargs)
 
@@ -171,6 +203,10 @@ def build_simulator_java(model_configuration, connectivity, **kwargs):
                                                                                   **kwargs)
 
 
+def build_simulator_numpy_default(model_configuration, connectivity, **kwargs):
+    return SimulatorBuilder("numpy").build_simulator(model_configuration, connectivity, **kwargs)
+
+
 def build_simulator_TVB_default(model_configuration, connectivity, **kwargs):
     return SimulatorBuilder().build_simulator(model_configuration, connectivity, **kwargs)
 
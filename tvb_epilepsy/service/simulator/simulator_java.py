@@ -10,7 +10,7 @@ import numpy
 import subprocess
 from copy import copy
 from tvb_epilepsy.base.constants.config import GenericConfig
-from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error
 from tvb_epilepsy.base.utils.data_structures_utils import obj_to_dict, assert_arrays
 from tvb_epilepsy.base.computations.calculations_utils import calc_x0_val_to_model_x0
 from tvb_epilepsy.io.h5_reader import H5Reader
@@ -153,7 +153,7 @@ class SimulatorJava(ABCSimulator):
         result_file.write(json_text)
         result_file.close()
 
-    def config_simulation(self):
+    def prepare_full_configuration(self, name="full-configuration"):
 
         ep_settings = Settings(integration_step=self.simulation_settings.integration_step,
                                noise_seed=self.simulation_settings.noise_seed,
@@ -180,16 +180,40 @@ class SimulatorJava(ABCSimulator):
         #                                        epileptor_params=json_model, settings=ep_settings,
         #                                        initial_states=initial_conditions.flatten(),
         #                                        initial_states_shape=numpy.array(initial_conditions.shape))
-        custom_config = FullConfiguration(connectivity_path=os.path.abspath(self.connectivity.file_path),
-                                          epileptor_params=json_model, settings=ep_settings,
-                                          initial_states=None, initial_states_shape=None)
-        self._save_serialized(custom_config, self.json_config_path)
+        return FullConfiguration(name=name, connectivity_path=os.path.abspath(self.connectivity.file_path),
+                                 epileptor_params=json_model, settings=ep_settings,
+                                 initial_states=None, initial_states_shape=None)
+
+    def config_simulation(self, json_config_path=None, name="full-configuration"):
+        """
+        :param json_config_path: path of the JSON configuration file (by default, in the folder of the head)
+        :param name: name of the configuration, which is the name of the folder of its results
+        """
+        if json_config_path is None:
+            json_config_path = self.json_config_path
+        self._save_serialized(self.prepare_full_configuration(name), json_config_path)
+
+    @staticmethod
+    def get_launch_command(json_config_paths, output_path):
+        """
+        :param json_config_paths: path, or list of a single path, of a JSON configuration file
+        :param output_path: folder, in which the results of the configuration are written
+                            to <configuration name>/ts.h5
+        :return: the arguments of the Java simulation process
+        """
+        if isinstance(json_config_paths, basestring):
+            json_config_paths = [json_config_paths]
+        if len(json_config_paths) != 1:
+            # GenericConfig.JAVA_MAIN_SIM takes a single configuration file, followed by the output folder
+            raise_value_error("The Java simulation main takes a single configuration file, not " +
+                              str(len(json_config_paths)) + "!")
+        return ["java", "-Dncsa.hdf.hdf5lib.H5.hdf5lib=" + os.path.join(GenericConfig.LIB_PATH, GenericConfig.HDF5_LIB),
+                "-Djava.library.path=" + GenericConfig.LIB_PATH, "-cp", GenericConfig.JAR_PATH,
+                GenericConfig.JAVA_MAIN_SIM] + [os.path.abspath(path) for path in json_config_paths] + \
+               [os.path.abspath(output_path)]
 
     def launch_simulation(self):
-        opts = "java -Dncsa.hdf.hdf5lib.H5.hdf5lib=" + os.path.join(GenericConfig.LIB_PATH, GenericConfig.HDF5_LIB) + \
-               " " + "-Djava.library.path=" + GenericConfig.LIB_PATH + " " + "-cp" + " " + GenericConfig.JAR_PATH + \
-               " " + GenericConfig.JAVA_MAIN_SIM + " " + os.path.abspath(self.json_config_path) + " " + \
-               os.path.abspath(self.head_path)
+        opts = " ".join(self.get_launch_command(self.json_config_path, self.head_path))
         try:
             status = subprocess.call(opts, shell=True)
             print(status)
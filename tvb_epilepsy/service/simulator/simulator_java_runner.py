@@ -0,0 +1,136 @@
+"""
+Launching of many Java simulations in a bounded pool of concurrent processes.
+Every process runs in its own temporary folder, so that the configuration and result files of concurrent
+simulations never collide, and, in batch mode, simulates several configurations, in order to amortize the
+startup of the Java virtual machine.
+Batch mode requires a Java simulation main that accepts several configuration files, which the current
+one, GenericConfig.JAVA_MAIN_SIM, does not.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+from multiprocessing import cpu_count
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error
+from tvb_epilepsy.io.h5_reader import H5Reader
+from tvb_epilepsy.service.simulator.simulator_java import SimulatorJava
+
+
+class SimulatorJavaRunner(object):
+    """
+    Runs the simulations of a list of SimulatorJava instances, with at most n_processes concurrent processes,
+    each one for batch_size simulations.
+    Batch mode, i.e., batch_size > 1, passes all the configuration files of a batch to a single Java invocation,
+    before the output folder, which requires a Java simulation main that accepts several configuration files.
+    Subclasses, whose get_command launches such a main, have to raise max_batch_size accordingly (None for no limit).
+    A process is killed, if it runs longer than timeout seconds per simulation of its batch.
+    """
+    logger = initialize_logger(__name__)
+    reader = H5Reader()
+    # The main of GenericConfig.JAVA_MAIN_SIM takes a single configuration file, followed by the output folder
+    max_batch_size = 1
+
+    def __init__(self, n_processes=None, batch_size=1, timeout=None, temp_folder=None, keep_folders=False,
+                 poll_interval=0.1):
+        if n_processes is None:
+            n_processes = cpu_count()
+        self.n_processes = max(1, int(n_processes))
+        self.batch_size = max(1, int(batch_size))
+        if self.max_batch_size is not None and self.batch_size > self.max_batch_size:
+            raise_value_error("Batch size " + str(self.batch_size) + " is not supported by the Java simulation main, "
+                              "which takes at most " + str(self.max_batch_size) + " configuration file(s)!",
+                              self.logger)
+        self.timeout = timeout
+        self.temp_folder = temp_folder
+        self.keep_folders = keep_folders
+        self.poll_interval = poll_interval
+
+    def get_command(self, json_config_paths, output_path):
+        return SimulatorJava.get_launch_command(json_config_paths, output_path)
+
+    def _prepare_batches(self, simulators, root_folder):
+        batches = []
+        for i_start in range(0, len(simulators), self.batch_size):
+            folder = tempfile.mkdtemp(prefix="batch_", dir=root_folder)
+            jobs = []
+            for i_job in range(i_start, min(i_start + self.batch_size, len(simulators))):
+                name = "simulation_" + str(i_job)
+                json_config_path = os.path.join(folder, name + ".json")
+                simulators[i_job].config_simulation(json_config_path, name)
+                jobs.append((i_job, json_config_path, os.path.join(folder, name, "ts.h5")))
+            batches.append({"folder": folder, "jobs": jobs})
+        return batches
+
+    def _start(self, batch):
+        batch["log"] = open(os.path.join(batch["folder"], "simulation.log"), "w")
+        batch["process"] = subprocess.Popen(self.get_command([job[1] for job in batch["jobs"]], batch["folder"]),
+                                            stdout=batch["log"], stderr=subprocess.STDOUT, cwd=batch["folder"])
+        batch["start"] = time.time()
+        batch["timed_out"] = False
+
+    def _check(self, batch):
+        # Return True if the process of the batch has finished, killing it if it has timed out
+        if batch["process"].poll() is not None:
+            return True
+        if self.timeout is not None and time.time() - batch["start"] > self.timeout * len(batch["jobs"]):
+            self.logger.warning("Java simulations " + str([job[0] for job in batch["jobs"]]) + " timed out after " +
+                                str(time.time() - batch["start"]) + " secs!")
+            batch["process"].kill()
+            batch["process"].wait()
+            batch["timed_out"] = True
+            return True
+        return False
+
+    def _collect(self, batch, results):
+        batch["log"].close()
+        succeeded = batch["process"].returncode == 0 and not batch["timed_out"]
+        if not succeeded and not batch["timed_out"]:
+            self.logger.warning("Java simulations " + str([job[0] for job in batch["jobs"]]) +
+                                " failed with return code " + str(batch["process"].returncode) + "!")
+        for i_job, _, result_path in batch["jobs"]:
+            ts_time, data = None, None
+            if os.path.isfile(result_path):
+                try:
+                    ts_time, data = self.reader.read_ts(result_path)
+                except Exception:
+                    self.logger.exception("Failed to read the result of Java simulation " + str(i_job) + "!")
+            # The results of a failed batch are returned, if they exist, but with a False status
+            results[i_job] = (ts_time, data, succeeded and data is not None)
+
+    def run(self, simulators):
+        """
+        :param simulators: list of SimulatorJava instances
+        :return: list of (time, data, status) tuples, as the ones of SimulatorJava.launch_simulation,
+                 in the order of the simulators
+        """
+        if self.temp_folder is not None and not os.path.isdir(self.temp_folder):
+            os.makedirs(self.temp_folder)
+        root_folder = tempfile.mkdtemp(prefix="java_simulations_", dir=self.temp_folder)
+        results = [None] * len(simulators)
+        running = []
+        try:
+            pending = self._prepare_batches(simulators, root_folder)
+            start = time.time()
+            while len(pending) > 0 or len(running) > 0:
+                while len(pending) > 0 and len(running) < self.n_processes:
+                    batch = pending.pop(0)
+                    self._start(batch)
+                    running.append(batch)
+                for batch in list(running):
+                    if self._check(batch):
+                        running.remove(batch)
+                        self._collect(batch, results)
+                if len(running) > 0:
+                    time.sleep(self.poll_interval)
+            self.logger.info(str(len(simulators)) + " Java simulations finished in " + str(time.time() - start) +
+                             " secs.")
+        finally:
+            for batch in running:
+                if batch["process"].poll() is None:
+                    batch["process"].kill()
+                batch["log"].close()
+            if not self.keep_folders:
+                shutil.rmtree(root_folder, ignore_errors=True)
+        return results
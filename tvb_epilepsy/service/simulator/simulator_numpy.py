@@ -0,0 +1,472 @@
+"""
+Mechanism for launching simulations of the Epileptor models with a native, vectorized numpy integrator,
+i.e., without the TVB Simulator or the external Java process.
+Only white, additive noise, a difference coupling without time delays and a single monitor are supported.
+Besides the fixed step Euler and Heun schemes, an exponential integrator with adaptive, error controlled steps
+treats the linear part of the dynamics of every variable exactly, including the slow permittivity variable z.
+Ensembles of models with different parameters can be integrated at once, in a single state array.
+"""
+
+import sys
+import time
+import numpy
+from copy import deepcopy
+from scipy import sparse
+from tvb_epilepsy.base.constants.config import SimulatorConfig
+from tvb_epilepsy.base.constants.model_constants import WHITE_NOISE
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error, warning
+from tvb_epilepsy.base.utils.data_structures_utils import isequal_string
+from tvb_epilepsy.base.computations.coupling_utils import weights_dot, weights_row_sums
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.service.simulator.simulator import ABCSimulator
+from tvb_epilepsy.service.simulator.epileptor_model_factory import model_build_dict
+
+
+class SimulatorNumpy(ABCSimulator):
+    """
+    This class integrates the dfun of the EpileptorDP2D, EpileptorDP and EpileptorDPrealistic models
+    with the Euler-Maruyama or the stochastic Heun scheme, using the same conventions as the TVB Simulator:
+    state of shape (nvar, n_regions, 1), Difference coupling with a=1 computed once per integration step,
+    additive noise sqrt(2 * nsig * dt) * N(0, 1), and TemporalAverage or SubSample monitors.
+    Unlike the TVB Simulator, the noise is drawn from a random stream seeded by the noise_seed of the simulation
+    settings, and not from the random_stream of the TVB noise instance, if any, of which only the intensity is used.
+
+    The Exponential integrators split the dfun into its diagonal linear part L, i.e., the diagonal of the Jacobian of
+    the model and the coupling, evaluated at the start of each step, and the remaining nonlinear part,
+    and advance the state with the exponential Euler scheme y + h * phi1(h * L) * dfun(y).
+    The exponential Heun (ETD2RK) scheme, of second order, provides the local error estimate,
+    which adapts the step h to the atol and rtol tolerances, between the integration step
+    of the simulation settings and the monitor period. Noise increments sqrt(2 * nsig * h) * N(0, 1)
+    are drawn only for the accepted steps.
+    """
+    logger = initialize_logger(__name__)
+
+    AVAILABLE_MODELS = ("EpileptorDP2D", "EpileptorDP", "EpileptorDPrealistic")
+    AVAILABLE_INTEGRATORS = ("EulerStochastic", "HeunStochastic", "EulerDeterministic", "HeunDeterministic",
+                             "ExponentialStochastic", "ExponentialDeterministic")
+    AVAILABLE_MONITORS = ("TemporalAverage", "SubSample")
+
+    def __init__(self, connectivity, model_configuration, model, simulation_settings):
+        self.model = model
+        self.simulation_settings = simulation_settings
+        self.model_configuration = model_configuration
+        self.connectivity = connectivity
+        self.integrator = "HeunStochastic"
+        self.monitor_type = "TemporalAverage"
+        self.monitor_period = simulation_settings.monitor_sampling_period
+        self.nsig = 0.0
+        self.initial_conditions = None
+        self.current_state = None
+        self.random_streams = []
+        self.weights = None
+        self.weights_row_sums = None
+        self.atol = SimulatorConfig.ADAPTIVE_STEP_ATOL
+        self.rtol = SimulatorConfig.ADAPTIVE_STEP_RTOL
+        self.integration_statistics = {}
+
+    @property
+    def number_of_regions(self):
+        return self.connectivity.number_of_regions
+
+    @property
+    def dt(self):
+        return self.simulation_settings.integration_step
+
+    def get_vois(self):
+        return [me.replace('x2 - x1', 'source') for me in self.simulation_settings.monitor_expressions]
+
+    def get_cache_description(self):
+        description = super(SimulatorNumpy, self).get_cache_description()
+        description.update({"integrator": [self.integrator, self.dt, self.atol, self.rtol],
+                            "noise": [self.nsig, [random_stream.get_state() for random_stream in self.random_streams]],
+                            "monitors": [[self.monitor_type, self.monitor_period]],
+                            "initial_conditions": self.current_state})
+        return description
+
+    def _configure_weights(self):
+        # Dense or scipy.sparse weights, for which the coupling is computed by sparse matrix products
+        model_connectivity = self.model_configuration.model_connectivity
+        if isinstance(model_connectivity, numpy.ndarray) or sparse.issparse(model_connectivity):
+            self.weights = self.model_configuration.model_connectivity
+        else:
+            self.weights = self.connectivity.normalized_weights
+        self.weights_row_sums = weights_row_sums(self.weights)
+
+    def _configure_model_parameters(self):
+        # Make sure that spatialized model parameters have the shape (n_regions, 1), as the TVB Simulator does
+        excluded_params = ("state_variable_range", "variables_of_interest", "noise", "psi_table", "nerf_table")
+        for param in self.model.trait.keys():
+            if param in excluded_params:
+                continue
+            region_parameters = getattr(self.model, param)
+            if isinstance(region_parameters, numpy.ndarray) and region_parameters.size == self.number_of_regions:
+                setattr(self.model, param, region_parameters.reshape((-1, 1)))
+
+    def _configure_noise(self, noise=None):
+        # Only the intensity of a TVB noise instance is used. Its random_stream is not,
+        # since the noise of this simulator is always drawn from a stream seeded by the noise_seed
+        # of the simulation settings (or by the noise_seeds of configure_ensemble),
+        # so that the simulation is reproducible, and identified by the SimulationCache, from its settings alone.
+        if noise is not None:
+            if noise.ntau > 0:
+                raise_value_error("Only white noise is supported by the numpy simulator, but ntau = " +
+                                  str(noise.ntau) + "!")
+            random_stream = getattr(noise, "random_stream", None)
+            if isinstance(random_stream, numpy.random.RandomState):
+                state = random_stream.get_state()
+                seeded_state = numpy.random.RandomState(self.simulation_settings.noise_seed).get_state()
+                ignored_stream = not numpy.array_equal(state[1], seeded_state[1]) or state[2] != seeded_state[2]
+            else:
+                ignored_stream = False
+            if ignored_stream:
+                warning("The random_stream of the noise is ignored by the numpy simulator, which draws the noise " +
+                        "from a stream seeded by the noise_seed " + str(self.simulation_settings.noise_seed) +
+                        " of the simulation settings!", self.logger)
+            nsig = noise.nsig
+        else:
+            if not isequal_string(self.simulation_settings.noise_type, WHITE_NOISE):
+                raise_value_error("Only white noise is supported by the numpy simulator, but noise_type = " +
+                                  str(self.simulation_settings.noise_type) + "!")
+            nsig = self.simulation_settings.noise_intensity
+        nsig = numpy.array(nsig, dtype="float64")
+        nvar = self.model._nvar
+        if nsig.size == 1:
+            nsig = nsig.reshape((1, 1, 1))
+        elif nsig.size == nvar:
+            nsig = nsig.reshape((nvar, 1, 1))
+        elif nsig.size == self.number_of_regions:
+            nsig = nsig.reshape((1, self.number_of_regions, 1))
+        elif nsig.size == nvar * self.number_of_regions:
+            nsig = nsig.reshape((nvar, self.number_of_regions, 1))
+        else:
+            raise_value_error("Noise intensity of size " + str(nsig.size) + " is not compatible with " + str(nvar) +
+                              " model variables and " + str(self.number_of_regions) + " regions!")
+        self.nsig = nsig
+        self.random_streams = [numpy.random.RandomState(seed=self.simulation_settings.noise_seed)]
+
+    def _configure_monitor(self, monitors=None):
+        if monitors is None:
+            self.monitor_type = self.simulation_settings.monitor_type
+            self.monitor_period = self.simulation_settings.monitor_sampling_period
+        else:
+            if isinstance(monitors, (list, tuple)):
+                if len(monitors) > 1:
+                    warning("Only the first of " + str(len(monitors)) + " monitors is used by the numpy simulator!",
+                            self.logger)
+                monitors = monitors[0]
+            self.monitor_type = monitors.__class__.__name__
+            self.monitor_period = monitors.period
+        if self.monitor_type not in self.AVAILABLE_MONITORS:
+            raise_value_error("Monitor " + str(self.monitor_type) + " is not one of the available monitors: \n" +
+                              str(self.AVAILABLE_MONITORS) + " !")
+
+    def config_simulation(self, noise=None, monitors=None, initial_conditions=None, **kwargs):
+        if self.model._ui_name not in self.AVAILABLE_MODELS:
+            raise_value_error("Model " + self.model._ui_name + " is not one of the models of the numpy simulator: \n" +
+                              str(self.AVAILABLE_MODELS) + " !")
+        self.integrator = kwargs.get("integrator", "HeunStochastic")
+        if self.integrator not in self.AVAILABLE_INTEGRATORS:
+            raise_value_error("Integrator " + str(self.integrator) + " is not one of the available integrators: \n" +
+                              str(self.AVAILABLE_INTEGRATORS) + " !")
+        self.atol = kwargs.get("atol", SimulatorConfig.ADAPTIVE_STEP_ATOL)
+        self.rtol = kwargs.get("rtol", SimulatorConfig.ADAPTIVE_STEP_RTOL)
+        self._configure_weights()
+        self._configure_noise(noise)
+        self._configure_monitor(monitors)
+        self._configure_model_parameters()
+        self.configure_initial_conditions(initial_conditions=initial_conditions)
+
+    def configure_model(self, **kwargs):
+        self.model = model_build_dict[self.model._ui_name](self.model_configuration, **kwargs)
+        self._configure_model_parameters()
+
+    def configure_initial_conditions(self, initial_conditions=None):
+        if isinstance(initial_conditions, numpy.ndarray):
+            self.initial_conditions = initial_conditions
+        else:
+            self.initial_conditions = self.prepare_initial_conditions(1)
+        # The current state is the last time point of the initial conditions, of shape (nvar, n_regions, 1)
+        state = numpy.array(self.initial_conditions, dtype="float64")
+        if state.ndim == 4:
+            state = state[-1]
+        self.current_state = state.reshape((self.model._nvar, self.number_of_regions, 1))
+
+    @property
+    def number_of_members(self):
+        # The number of the members of an ensemble simulation, i.e., the size of the last axis of the state
+        return self.current_state.shape[2]
+
+    def _stack_model_parameters(self, models):
+        # A single model with parameters of shape (n_regions, n_members) for the ones that differ among the models
+        excluded_params = ("state_variable_range", "variables_of_interest", "noise", "psi_table", "nerf_table")
+        ensemble_model = deepcopy(models[0])
+        for param in ensemble_model.trait.keys():
+            if param in excluded_params:
+                continue
+            values = [numpy.asarray(getattr(model, param)) for model in models]
+            if all([numpy.array_equal(values[0], value) for value in values[1:]]):
+                continue
+            if values[0].dtype.kind not in "biuf":
+                raise_value_error("Parameter " + param + " of the ensemble models is not numeric, "
+                                  "but it differs among them!")
+            shape = (self.number_of_regions, 1)
+            setattr(ensemble_model, param,
+                    numpy.concatenate([value.reshape((-1, 1)) * numpy.ones(shape) for value in values], axis=1))
+        return ensemble_model
+
+    def configure_ensemble(self, models, initial_conditions, noise_seeds=None):
+        """
+        Configure the simulator to integrate an ensemble of models, i.e., sets of model parameters, at once.
+        The members of the ensemble occupy the last axis of the state of shape (nvar, n_regions, n_members),
+        which is the modes' axis of the dfun of the models, so that their parameters are of shape (n_regions, n_members)
+        :param models: list of configured models of the same class and zmode
+        :param initial_conditions: list of states of shape (nvar, n_regions) or (nvar, n_regions, 1), one per model
+        :param noise_seeds: list of seeds of the noise streams of the members
+                            (by default, all members use the noise seed of the simulation settings)
+        """
+        n_members = len(models)
+        if len(initial_conditions) != n_members:
+            raise_value_error("The number of initial conditions (" + str(len(initial_conditions)) +
+                              ") is not equal to the number of models (" + str(n_members) + ")!")
+        if noise_seeds is None:
+            noise_seeds = [self.simulation_settings.noise_seed] * n_members
+        elif len(noise_seeds) != n_members:
+            raise_value_error("The number of noise seeds (" + str(len(noise_seeds)) +
+                              ") is not equal to the number of models (" + str(n_members) + ")!")
+        self.model = self._stack_model_parameters(models)
+        self.current_state = numpy.concatenate(
+            [numpy.reshape(state, (self.model._nvar, self.number_of_regions, 1)) for state in initial_conditions],
+            axis=2).astype("float64")
+        self.initial_conditions = self.current_state[numpy.newaxis]
+        self.random_streams = [numpy.random.RandomState(seed=seed) for seed in noise_seeds]
+
+    def compute_coupling(self, state):
+        # Difference coupling sum_j{w_ij * (x_j - x_i)} of the coupling variables, as TVB Difference(a=1),
+        # for states of shape (nvar, n_regions, n_members)
+        x = numpy.swapaxes(state[self.model.cvar], 1, 2)
+        coupling = weights_dot(self.weights, x) - self.weights_row_sums * x
+        return numpy.swapaxes(coupling, 1, 2)
+
+    def generate_noise(self, shape, dt=None):
+        # Every member of an ensemble draws from its own noise stream
+        if dt is None:
+            dt = self.dt
+        if len(self.random_streams) == 1:
+            noise = self.random_streams[0].normal(size=shape)
+        else:
+            noise = numpy.empty(shape)
+            for i_member, random_stream in enumerate(self.random_streams):
+                noise[:, :, i_member] = random_stream.normal(size=shape[:2])
+        return numpy.sqrt(2.0 * self.nsig * dt) * noise
+
+    def scheme(self, state):
+        coupling = self.compute_coupling(state)
+        dfun = self.model.dfun
+        dx = dfun(state, coupling)
+        if self.integrator.endswith("Stochastic"):
+            noise = self.generate_noise(state.shape)
+        else:
+            noise = 0.0
+        if self.integrator.startswith("Euler"):
+            return state + self.dt * dx + noise
+        # Heun predictor-corrector, with the same noise increment for both stages
+        inter = state + self.dt * dx + noise
+        return state + (dx + dfun(inter, coupling)) * (self.dt / 2.0) + noise
+
+    def compute_linear_part(self, state, coupling):
+        # The diagonal of the Jacobian of the dfun, including the self coupling term -rowsum(W)_i of each coupling
+        # variable, of the shape of the state
+        linear = numpy.rollaxis(numpy.diagonal(self.model.jacobian(state, coupling), axis1=0, axis2=1), -1).copy()
+        coupling_jac = self.model.coupling_jacobian(state, coupling)
+        for i_cvar, cvar in enumerate(self.model.cvar):
+            linear[cvar] -= coupling_jac[cvar, i_cvar] * self.weights_row_sums[:, numpy.newaxis]
+        return linear
+
+    @staticmethod
+    def _phi_functions(z):
+        # phi1(z) = (exp(z) - 1) / z and phi2(z) = (exp(z) - 1 - z) / z ** 2, with their Taylor series close to 0
+        small = numpy.abs(z) < 1e-3
+        z_safe = numpy.where(small, 1.0, z)
+        expm1 = numpy.expm1(z_safe)
+        phi1 = numpy.where(small, 1.0 + z / 2.0 + z ** 2 / 6.0, expm1 / z_safe)
+        phi2 = numpy.where(small, 0.5 + z / 6.0 + z ** 2 / 24.0, (expm1 - z_safe) / z_safe ** 2)
+        return phi1, phi2
+
+    def exponential_scheme(self, state, h):
+        """
+        A step of length h of the exponential Heun (ETD2RK) scheme, for the diagonal linear part L at state
+        :return: the new state, and the difference of the new state from the one of the exponential Euler scheme,
+                 i.e., the estimate of the local error
+        """
+        coupling = self.compute_coupling(state)
+        dfun = self.model.dfun
+        dx = dfun(state, coupling)
+        hL = h * self.compute_linear_part(state, coupling)
+        phi1, phi2 = self._phi_functions(hL)
+        euler = state + h * phi1 * dx
+        # The difference of the nonlinear parts dfun(y) - L * y at the exponential Euler and the initial state
+        dn = dfun(euler, self.compute_coupling(euler)) - dx - hL / h * (euler - state)
+        error = h * phi2 * dn
+        return euler + error, error
+
+    def _error_norm(self, state, new_state, error):
+        scale = self.atol + self.rtol * numpy.maximum(numpy.abs(state), numpy.abs(new_state))
+        return numpy.sqrt(numpy.mean((error / scale) ** 2))
+
+    def _open_seizure_detector(self, seizure_detector):
+        if seizure_detector is not None:
+            seizure_detector.open(self.model.state_variables, (self.number_of_regions, self.model._nvar,
+                                                               self.number_of_members))
+
+    def _detect_seizures(self, seizure_detector, time, state):
+        # Feed a monitored state to the seizure detector, which returns True if the simulation should stop
+        return seizure_detector is not None and seizure_detector.update(time, numpy.swapaxes(state, 0, 1))
+
+    def run_adaptive(self, report_every_n_monitor_steps=None, seizure_detector=None):
+        n_steps = int(numpy.ceil(self.simulation_settings.simulated_period / self.dt))
+        istep = int(numpy.round(self.monitor_period / self.dt))
+        if istep < 1:
+            raise_value_error("Monitor period " + str(self.monitor_period) + " is smaller than the integration step "
+                              + str(self.dt) + "!")
+        n_samples = n_steps / istep
+        monitor_period = istep * self.dt
+        if isequal_string(self.monitor_type, "TemporalAverage"):
+            time_start = monitor_period / 2.0
+        else:
+            time_start = monitor_period
+        if report_every_n_monitor_steps >= 1:
+            report_every_n_samples = int(report_every_n_monitor_steps)
+        else:
+            report_every_n_samples = n_samples + 1
+        data = numpy.empty((n_samples,) + self.current_state.shape, dtype="float64")
+        temporal_average = isequal_string(self.monitor_type, "TemporalAverage")
+        stochastic = self.integrator.endswith("Stochastic")
+        state = self.current_state
+        # The integration step of the simulation settings is the initial step
+        h = self.dt
+        h_min = 1e-6 * self.dt
+        n_accepted = 0
+        n_rejected = 0
+        self._open_seizure_detector(seizure_detector)
+        start = time.time()
+        i_sample = 0
+        while i_sample < n_samples:
+            t = 0.0
+            stock = numpy.zeros(state.shape)
+            while monitor_period - t > 1e-9 * monitor_period:
+                # The steps land on the times of the monitor samples
+                h_step = min(h, monitor_period - t)
+                new_state, error = self.exponential_scheme(state, h_step)
+                error_norm = self._error_norm(state, new_state, error)
+                if error_norm <= 1.0 or h_step <= h_min:
+                    if stochastic:
+                        new_state += self.generate_noise(state.shape, h_step)
+                    if temporal_average:
+                        # Trapezoidal rule for the time average over the monitor period
+                        stock += (state + new_state) * (h_step / 2.0)
+                    state = new_state
+                    t += h_step
+                    n_accepted += 1
+                else:
+                    n_rejected += 1
+                if not numpy.isfinite(error_norm):
+                    factor = 0.2
+                elif error_norm == 0.0:
+                    factor = 5.0
+                else:
+                    factor = min(5.0, max(0.2, 0.9 * error_norm ** -0.5))
+                h = min(max(h_step * factor, h_min), monitor_period)
+            if temporal_average:
+                data[i_sample] = stock / monitor_period
+            else:
+                data[i_sample] = state
+            i_sample += 1
+            if i_sample % report_every_n_samples == 0:
+                sys.stdout.write("\r" + "..." + str(100.0 * i_sample / n_samples) + "% done in " +
+                                 str(time.time() - start) + " secs")
+                sys.stdout.flush()
+            if self._detect_seizures(seizure_detector, time_start + (i_sample - 1) * monitor_period,
+                                     data[i_sample - 1]):
+                break
+        self.current_state = state
+        self.integration_statistics = {"accepted_steps": n_accepted, "rejected_steps": n_rejected}
+        return data[:i_sample], time_start, monitor_period
+
+    def compute_vois(self, data):
+        # Evaluate the monitor expressions on monitored states of shape (n_times, nvar, n_regions, n_members)
+        state_variables = dict(zip(self.model.state_variables, [data[:, iv] for iv in range(data.shape[1])]))
+        vois = []
+        for expression in self.simulation_settings.monitor_expressions:
+            expression = expression.replace('source', 'x2 - x1')
+            vois.append(eval(expression, {"__builtins__": None}, state_variables))
+        return numpy.array(vois)
+
+    def run(self, report_every_n_monitor_steps=None, seizure_detector=None):
+        if self.integrator.startswith("Exponential"):
+            return self.run_adaptive(report_every_n_monitor_steps, seizure_detector)
+        n_steps = int(numpy.ceil(self.simulation_settings.simulated_period / self.dt))
+        istep = int(numpy.round(self.monitor_period / self.dt))
+        if istep < 1:
+            raise_value_error("Monitor period " + str(self.monitor_period) + " is smaller than the integration step "
+                              + str(self.dt) + "!")
+        n_samples = n_steps / istep
+        time_step = istep * self.dt
+        if isequal_string(self.monitor_type, "TemporalAverage"):
+            time_start = (istep - istep / 2.0) * self.dt
+        else:
+            time_start = time_step
+        if report_every_n_monitor_steps >= 1:
+            report_every_n_steps = int(report_every_n_monitor_steps) * istep
+        else:
+            report_every_n_steps = n_steps + 1
+        data = numpy.empty((n_samples,) + self.current_state.shape, dtype="float64")
+        temporal_average = isequal_string(self.monitor_type, "TemporalAverage")
+        stock = numpy.zeros(self.current_state.shape)
+        state = self.current_state
+        self._open_seizure_detector(seizure_detector)
+        start = time.time()
+        i_sample = 0
+        for step in xrange(1, n_samples * istep + 1):
+            state = self.scheme(state)
+            if temporal_average:
+                stock += state
+            if step % istep == 0:
+                if temporal_average:
+                    data[i_sample] = stock / istep
+                    stock[:] = 0.0
+                else:
+                    data[i_sample] = state
+                i_sample += 1
+            if step % report_every_n_steps == 0:
+                sys.stdout.write("\r" + "..." + str(100.0 * step / n_steps) + "% done in " +
+                                 str(time.time() - start) + " secs")
+                sys.stdout.flush()
+            if step % istep == 0 and self._detect_seizures(seizure_detector, time_start + (i_sample - 1) * time_step,
+                                                           data[i_sample - 1]):
+                break
+        self.current_state = state
+        return data[:i_sample], time_start, time_step
+
+    def launch_simulation(self, report_every_n_monitor_steps=None, seizure_detector=None):
+        """
+        :param seizure_detector: a SeizureDetector, which receives the monitored states, and may stop the simulation
+                                 early, according to its stop rules
+        :return: the output Timeseries, and the status of the simulation
+        """
+        status = True
+        try:
+            data, time_start, time_step = self.run(report_every_n_monitor_steps, seizure_detector)
+        except Exception, error_message:
+            status = False
+            self.logger.warning("Something went wrong with this simulation...:" + "\n" + str(error_message))
+            return None, status
+        if not numpy.all(numpy.isfinite(data)):
+            status = False
+            self.logger.warning("The simulation diverged to non finite values!")
+        # Variables of interest in an array of shape (n_times, n_regions, n_vois, n_members):
+        vois_data = numpy.swapaxes(self.compute_vois(data), 0, 1)
+        vois_data = numpy.swapaxes(vois_data, 1, 2).astype('f')
+        sim_output = Timeseries(vois_data, {TimeseriesDimensions.SPACE.value: self.connectivity.region_labels,
+                                            TimeseriesDimensions.VARIABLES.value: self.get_vois()},
+                                time_start, time_step, "ms")
+        return sim_output, status
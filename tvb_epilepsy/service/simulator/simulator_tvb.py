@@ -5,13 +5,14 @@ Mechanism for launching TVB simulations.
 import sys
 import time
 import numpy
+from scipy import sparse
 from tvb.datatypes import connectivity
 from tvb.simulator import coupling, integrators, simulator
 from tvb_epilepsy.base.constants.model_constants import TIME_DELAYS_FLAG
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
-from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
-from tvb_epilepsy.service.simulator.simulator import ABCSimulator
+from tvb_epilepsy.service.simulator.simulator import ABCSimulator, describe_traited
 from tvb_epilepsy.service.simulator.epileptor_model_factory import model_build_dict
+from tvb_epilepsy.service.simulator.simulation_output_sink import ArrayOutputSink
 
 
 class SimulatorTVB(ABCSimulator):
@@ -31,8 +32,14 @@ class SimulatorTVB(ABCSimulator):
     def _vep2tvb_connectivity(vep_conn, model_connectivity=None):
         if model_connectivity is None:
             model_connectivity = vep_conn.normalized_weights
+        tract_lengths = vep_conn.tract_lengths
+        # TVB's Connectivity is dense
+        if sparse.issparse(model_connectivity):
+            model_connectivity = model_connectivity.toarray()
+        if sparse.issparse(tract_lengths):
+            tract_lengths = tract_lengths.toarray()
         return connectivity.Connectivity(use_storage=False, weights=model_connectivity,
-                                         tract_lengths=TIME_DELAYS_FLAG * vep_conn.tract_lengths,
+                                         tract_lengths=TIME_DELAYS_FLAG * tract_lengths,
                                          region_labels=vep_conn.region_labels,
                                          centres=vep_conn.centres, hemispheres=vep_conn.hemispheres,
                                          orientations=vep_conn.orientations, areas=vep_conn.areas)
@@ -61,69 +68,85 @@ class SimulatorTVB(ABCSimulator):
 
         self.configure_initial_conditions(initial_conditions=initial_conditions)
 
-    def launch_simulation(self, report_every_n_monitor_steps=None):
+    def get_cache_description(self):
+        description = super(SimulatorTVB, self).get_cache_description()
+        integrator = self.simTVB.integrator
+        noise = getattr(integrator, "noise", None)
+        description.update({"integrator": [integrator.__class__.__name__, integrator.dt],
+                            "noise": None if noise is None else [noise.__class__.__name__, noise.nsig, noise.ntau,
+                                                                 noise.random_stream.get_state()],
+                            "monitors": [describe_traited(monitor) for monitor in self.simTVB.monitors],
+                            "variables_of_interest": self.simTVB.model.variables_of_interest,
+                            "initial_conditions": self.simTVB.initial_conditions})
+        return description
+
+    def _get_number_of_monitor_samples(self):
+        n_steps = int(numpy.ceil(self.simTVB.simulation_length / self.simTVB.integrator.dt))
+        return n_steps / self.simTVB.monitors[0].istep
+
+    def launch_simulation(self, report_every_n_monitor_steps=None, output_sink=None, seizure_detector=None):
+        """
+        :param output_sink: an ABCSimulationOutputSink, which receives the output of the first monitor
+                            (by default, an ArrayOutputSink that returns a Timeseries)
+        :param seizure_detector: a SeizureDetector, which receives the output of the first monitor,
+                                 and may stop the simulation early, according to its stop rules
+        :return: the output of the output sink, and the status of the simulation
+        """
+        if output_sink is None:
+            output_sink = ArrayOutputSink()
+
+        n_times = self._get_number_of_monitor_samples()
         if report_every_n_monitor_steps >= 1:
-            time_length_avg = numpy.round(self.simulation_settings.simulated_period / self.simTVB.monitors[0].period)
-            n_report_blocks = max(report_every_n_monitor_steps * numpy.round(time_length_avg / 100), 1.0)
+            n_report_blocks = max(report_every_n_monitor_steps * numpy.round(n_times / 100.0), 1.0)
         else:
             n_report_blocks = 1
+        block_length = n_times / n_report_blocks
 
         self.simTVB._configure_history(initial_conditions=self.simTVB.initial_conditions)
 
         status = True
 
-        if n_report_blocks < 2:
-            try:
-                tavg_time, tavg_data = self.simTVB.run()[0]
-
-            except Exception, error_message:
-                status = False
-                self.logger.warning("Something went wrong with this simulation...:" + "\n" + error_message)
-                return None, None, status
-
-            return tavg_time, tavg_data, status
-
-        else:
-
-            sim_length = self.simTVB.simulation_length / self.simTVB.monitors[0].period
-            block_length = sim_length / n_report_blocks
-            curr_time_step = 0.0
-            curr_block = 1.0
-
-            # Perform the simulation
-            tavg_data, tavg_time = [], []
-
-            start = time.time()
-
-            try:
-                for tavg in self.simTVB():
-
-                    curr_time_step += 1.0
-
-                    if not tavg is None:
-                        tavg_time.append(tavg[0][0])
-                        tavg_data.append(tavg[0][1])
-
-                    if curr_time_step >= curr_block * block_length:
-                        end_block = time.time()
-                        # TODO: correct this part to print percentage of simulation at the same line by erasing previous
-                        print_this = "\r" + "..." + str(100 * curr_time_step / sim_length) + "% done in " + \
-                                     str(end_block - start) + " secs"
-                        sys.stdout.write(print_this)
-                        sys.stdout.flush()
-                        curr_block += 1.0
-            except Exception, error_message:
-                status = False
-                self.logger.warning("Something went wrong with this simulation...:" + "\n" + str(error_message))
-                return None, None, status
-
-            tavg_time = numpy.array(tavg_time).flatten().astype('f')
-            tavg_data = numpy.swapaxes(tavg_data, 1, 2).astype('f')
-            # Variables of interest in a dictionary:
-            sim_output = Timeseries(tavg_data, {TimeseriesDimensions.SPACE.value: self.connectivity.region_labels,
-                                                TimeseriesDimensions.VARIABLES.value: self.get_vois()},
-                                    tavg_time[0], numpy.diff(tavg_time).mean(), "ms")
-            return sim_output, status
+        curr_time_step = 0.0
+        curr_block = 1.0
+
+        # Perform the simulation
+        sample_shape = (self.connectivity.number_of_regions, len(self.simTVB.monitors[0].voi),
+                        self.simTVB.model.number_of_modes)
+        output_sink.open(n_times, sample_shape, self.simTVB.monitors[0].period)
+        if seizure_detector is not None:
+            seizure_detector.open(self.get_vois(), sample_shape)
+
+        start = time.time()
+
+        try:
+            for tavg in self.simTVB():
+
+                curr_time_step += 1.0
+
+                if not tavg is None:
+                    # From (variables, regions, modes) to (regions, variables, modes)
+                    data = numpy.swapaxes(tavg[0][1], 0, 1)
+                    output_sink.append(tavg[0][0], data)
+                    if seizure_detector is not None and seizure_detector.update(tavg[0][0], data):
+                        break
+
+                if n_report_blocks >= 2 and curr_time_step >= curr_block * block_length:
+                    end_block = time.time()
+                    # TODO: correct this part to print percentage of simulation at the same line by erasing previous
+                    print_this = "\r" + "..." + str(100 * curr_time_step / n_times) + "% done in " + \
+                                 str(end_block - start) + " secs"
+                    sys.stdout.write(print_this)
+                    sys.stdout.flush()
+                    curr_block += 1.0
+        except Exception, error_message:
+            status = False
+            output_sink.abort()
+            self.logger.warning("Something went wrong with this simulation...:" + "\n" + str(error_message))
+            return None, status
+
+        # Variables of interest in a dictionary:
+        sim_output = output_sink.close(self.connectivity.region_labels, self.get_vois(), "ms")
+        return sim_output, status
 
     def configure_model(self, **kwargs):
         self.model = model_build_dict[self.model._ui_name](self.model_configuration, **kwargs)
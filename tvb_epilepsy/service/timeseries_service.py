@@ -1,20 +1,23 @@
 
+from fractions import Fraction
 import numpy as np
-from scipy.signal import decimate, convolve, detrend, hilbert
+from scipy.signal import decimate, detrend, hilbert, resample_poly, firwin
 from scipy.stats import zscore
 
+from tvb_epilepsy.base.constants.config import CalculusConfig
 from tvb_epilepsy.base.utils.log_error_utils import raise_value_error, initialize_logger
 from tvb_epilepsy.base.utils.data_structures_utils import isequal_string, ensure_list
 from tvb_epilepsy.base.computations.math_utils import select_greater_values_array_inds, \
                                                       select_by_hierarchical_group_metric_clustering
-from tvb_epilepsy.base.computations.analyzers_utils import filter_data
+from tvb_epilepsy.base.computations.analyzers_utils import filter_data, filter_bank, convolve_data
 from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions, PossibleVariables
 
 
 def decimate_signals(signals, time, decim_ratio):
     if decim_ratio > 1:
         signals = decimate(signals, decim_ratio, axis=0, zero_phase=True, ftype="fir")
-        time = decimate(time, decim_ratio, zero_phase=True, ftype="fir")
+        # The zero phase filtering keeps the decimated time points aligned to every decim_ratio-th time point
+        time = time[::decim_ratio]
         dt = np.mean(np.diff(time))
         (n_times, n_signals) = signals.shape
         return signals, time, dt, n_times
@@ -32,11 +35,11 @@ def normalize_signals(signals, normalization=None):
         if isequal_string(normalization, "zscore"):
             signals = zscore(signals, axis=None) / 3.0
         elif isequal_string(normalization, "minmax"):
-            signals -= signals.min()
-            signals /= signals.max()
+            signals = signals - signals.min()
+            signals = signals / signals.max()
         elif isequal_string(normalization, "baseline-amplitude"):
-            signals -= np.percentile(np.percentile(signals, 1, axis=0), 1)
-            signals /= np.percentile(np.percentile(signals, 99, axis=0), 99)
+            signals = signals - np.percentile(np.percentile(signals, 1, axis=0), 1)
+            signals = signals / np.percentile(np.percentile(signals, 99, axis=0), 99)
         else:
             raise_value_error("Ignoring signals' normalization " + normalization +
                              ",\nwhich is not one of the currently available " +
@@ -75,14 +78,18 @@ class TimeseriesService(object):
 
     logger = initialize_logger(__name__)
 
-    def __init__(self, logger=initialize_logger(__name__)):
+    def __init__(self, logger=initialize_logger(__name__), block_length=CalculusConfig.TIMESERIES_BLOCK_LENGTH,
+                 n_threads=None):
 
         self.logger = logger
+        # Number of time points of the blocks of the operations that iterate over time
+        self.block_length = block_length
+        # Number of threads of the filter bank, by default as many as the cpus
+        self.n_threads = n_threads
 
     def decimate(self, timeseries, decim_ratio):
         if decim_ratio > 1:
-            return Timeseries(timeseries.data[0:timeseries.time_length:decim_ratio], timeseries.dimension_labels,
-                              timeseries.time_start, decim_ratio*timeseries.time_step, timeseries.time_unit)
+            return timeseries.decimate_time(decim_ratio*timeseries.time_step)
         else:
             return timeseries
 
@@ -91,47 +98,129 @@ class TimeseriesService(object):
             decim_data, decim_time, decim_dt, decim_n_times = decimate_signals(timeseries.squeezed,
                                                                                timeseries.time_line, decim_ratio)
             return Timeseries(decim_data, timeseries.dimension_labels,
-                              decim_time[0], decim_dt, timeseries.time_unit)
+                              decim_time[0], decim_dt, timeseries.time_unit, view=timeseries.is_view)
         else:
             return timeseries
 
-    def convolve(self, timeseries, win_len=None, kernel=None):
+    def decimate_by_resampling(self, timeseries, decim_ratio, max_denominator=1000, n_signals_block=None):
+        """
+        Anti-alias filter and decimate in one pass, by polyphase resampling (scipy.signal.resample_poly),
+        which filters only the time points that are kept.
+        The decimation ratio may be rational, e.g., 1024/250 for 1024 Hz -> 250 Hz,
+        and is approximated by the closest fraction of denominator up to max_denominator.
+        The signals are mean centered, so that the zero padding of the filter at their ends
+        does not pull them towards zero, and resampled in blocks of n_signals_block spatial signals,
+        by default as many as make up 16 * block_length time points, which are read separately for out of core data.
+        """
+        ratio = Fraction(decim_ratio).limit_denominator(max_denominator)
+        down, up = ratio.numerator, ratio.denominator
+        if down == up:
+            return timeseries
+        # The anti-alias filter, as resample_poly designs it, is designed once for all blocks
+        max_rate = max(up, down)
+        fir_filter = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+        n_times = int(np.ceil(1.0 * timeseries.time_length * up / down))
+        data = np.empty((n_times,) + tuple(timeseries.shape[1:]))
+        if n_signals_block is None:
+            n_signals_block = 16 * self.block_length // timeseries.time_length
+        n_signals_block = max(1, int(n_signals_block))
+        for i_start in range(0, timeseries.number_of_labels, n_signals_block):
+            block = np.asarray(timeseries.data[:, i_start:i_start + n_signals_block], dtype="float64")
+            mean = np.mean(block, axis=0)
+            data[:, i_start:i_start + n_signals_block] = \
+                resample_poly(block - mean, up, down, axis=0, window=fir_filter) + mean
+        return Timeseries(data, timeseries.dimension_labels, timeseries.time_start,
+                          1.0 * down / up * timeseries.time_step, timeseries.time_unit, view=timeseries.is_view)
+
+    def resample(self, timeseries, sampling_frequency, max_denominator=1000, n_signals_block=None):
+        """
+        Downsample to sampling_frequency, in the units of Timeseries.sampling_frequency, by decimate_by_resampling
+        """
+        return self.decimate_by_resampling(timeseries, timeseries.sampling_frequency / sampling_frequency,
+                                           max_denominator, n_signals_block)
+
+    def convolve(self, timeseries, win_len=None, kernel=None, mode="auto"):
+        """
+        Convolve along time with a boxcar kernel of win_len points (scaled by kernel, if it is a scalar),
+        or with the kernel array, by the method of mode, see convolve_data
+        """
         if kernel is None:
-            kernel = np.ones((np.int(np.round(win_len)), 1, 1, 1))
-        else:
-            kernel = kernel * np.ones((np.int(np.round(win_len)), 1, 1, 1))
-        return Timeseries(convolve(timeseries.data, kernel, mode='same'), timeseries.dimension_labels,
-                          timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+            kernel = np.ones((np.int(np.round(win_len)),))
+        elif np.size(kernel) == 1:
+            kernel = kernel * np.ones((np.int(np.round(win_len)),))
+        return Timeseries(convolve_data(timeseries.data, kernel, mode), timeseries.dimension_labels,
+                          timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                          view=timeseries.is_view)
 
     def hilbert_envelope(self, timeseries):
         return Timeseries(np.abs(hilbert(timeseries.data, axis=0)), timeseries.dimension_labels,
-                          timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+                          timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                          view=timeseries.is_view)
 
     def detrend(self, timeseries, type='linear'):
         return Timeseries(detrend(timeseries.data, axis=0, type=type), timeseries.dimension_labels,
-                          timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+                          timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                          view=timeseries.is_view)
 
     def normalize(self, timeseries, normalization=None):
         return Timeseries(normalize_signals(timeseries.data, normalization), timeseries.dimension_labels,
-                          timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+                          timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                          view=timeseries.is_view)
 
     def filter(self, timeseries, lowcut=None, highcut=None, mode='bandpass', order=3):
-        return Timeseries(filter_data(timeseries.data, timeseries.sampling_frequency, lowcut, highcut, mode, order),
-                         timeseries.dimension_labels, timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+        return Timeseries(filter_data(timeseries.data, timeseries.sampling_frequency, lowcut, highcut, mode, order,
+                                      n_threads=self.n_threads),
+                         timeseries.dimension_labels, timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                         view=timeseries.is_view)
+
+    def filter_bank(self, timeseries, bands, mode='bandpass', order=3):
+        """
+        Filter for several frequency bands, i.e., a list of (lowcut, highcut) tuples, in a single pass over the data
+        :return: a list of filtered Timeseries, one per band
+        """
+        return [Timeseries(data, timeseries.dimension_labels, timeseries.time_start, timeseries.time_step,
+                           timeseries.time_unit, view=timeseries.is_view)
+                for data in filter_bank(timeseries.data, timeseries.sampling_frequency, bands, mode, order,
+                                        n_threads=self.n_threads)]
+
+    def bandpower(self, timeseries, bands, mode='bandpass', order=3):
+        """
+        Mean power of the signals for several frequency bands, i.e., a list of (lowcut, highcut) tuples,
+        in a single pass over the data, without keeping any filtered signals in memory
+        :return: array of shape (n_bands,) + timeseries.shape[1:]
+        """
+        return np.array(filter_bank(timeseries.data, timeseries.sampling_frequency, bands, mode, order,
+                                    reduce_fun=lambda data: np.mean(data ** 2, axis=0), n_threads=self.n_threads))
 
     def log(self, timeseries):
         return Timeseries(np.log(timeseries.data), timeseries.dimension_labels,
-                          timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+                          timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                          view=timeseries.is_view)
 
     def power(self, timeseries):
-        return np.sum(self.square(timeseries).squeezed, axis=0)
+        # Summed over blocks of time points, so that out of core Timeseries are never loaded as a whole
+        power = 0.0
+        for _, block in timeseries.iter_time_blocks(self.block_length):
+            power += np.sum(block ** 2, axis=0)
+        return np.squeeze(power)
 
     def square(self, timeseries):
         return Timeseries(timeseries.data ** 2, timeseries.dimension_labels,
-                          timeseries.time_start, timeseries.time_step, timeseries.time_unit)
+                          timeseries.time_start, timeseries.time_step, timeseries.time_unit,
+                          view=timeseries.is_view)
 
     def correlation(self, timeseries):
-        return np.corrcoef(timeseries.squeezed.T)
+        # Two passes over blocks of time points, for the means, and then for the covariance of the centered signals
+        mean = 0.0
+        for _, block in timeseries.iter_time_blocks(self.block_length):
+            mean += np.sum(block.reshape((block.shape[0], -1)), axis=0, dtype="float64")
+        mean /= timeseries.time_length
+        covariance = 0.0
+        for _, block in timeseries.iter_time_blocks(self.block_length):
+            block = block.reshape((block.shape[0], -1)) - mean
+            covariance += np.dot(block.T, block)
+        std = np.sqrt(np.diag(covariance))
+        return covariance / np.outer(std, std)
 
     def select_by_metric(self, timeseries, metric, metric_th=None):
         return timeseries.get_subspace_by_index(select_greater_values_array_inds(metric, metric_th))
@@ -171,18 +260,22 @@ class TimeseriesService(object):
         return timeseries.get_subspace_by_labels(rois)
 
     def compute_seeg(self, source_timeseries, sensors, sum_mode="lin"):
+        # The gain matrix may be a numpy array or a scipy.sparse matrix, e.g., thresholded for many regions
         if sum_mode == "exp":
-            seeg_fun = lambda source, gain_matrix: np.log(np.exp(source.squeezed).dot(gain_matrix.T))
+            seeg_fun = lambda source, gain_matrix: np.log(gain_matrix.dot(np.exp(source).T).T)
         else:
-            seeg_fun = lambda source, gain_matrix: source.squeezed.dot(gain_matrix.T)
+            seeg_fun = lambda source, gain_matrix: gain_matrix.dot(source.T).T
         seeg = []
         for sensor in ensure_list(sensors):
-            seeg.append(Timeseries(seeg_fun(source_timeseries, sensor.gain_matrix),
+            # Projected by blocks of time points of the (time, regions) source
+            seeg_data = np.concatenate([seeg_fun(block.reshape((block.shape[0], -1)), sensor.gain_matrix)
+                                        for _, block in source_timeseries.iter_time_blocks(self.block_length)])
+            seeg.append(Timeseries(seeg_data,
                                    {TimeseriesDimensions.SPACE.value: sensor.labels,
                                     TimeseriesDimensions.VARIABLES.value:
                                         PossibleVariables.SEEG.value + str(sensor.labels)},
                                    source_timeseries.time_start, source_timeseries.time_step,
-                                   source_timeseries.time_unit))
+                                   source_timeseries.time_unit, view=source_timeseries.is_view))
         return seeg
 
 
@@ -0,0 +1,288 @@
+"""
+Streaming processing of Timeseries, block by block of time points, so that neither the whole signals,
+nor any intermediate of their processing, are ever materialized.
+A pipeline is composed of stages, each one corresponding to an operation of TimeseriesService
+(filter, hilbert_envelope, convolve and decimate), which carry their state from block to block,
+and writes its output incrementally to a simulation output sink.
+"""
+
+from abc import ABCMeta, abstractmethod
+import numpy
+from scipy.signal import sosfilt, sosfilt_zi, sosfiltfilt, hilbert, convolve, tf2zpk
+from tvb_epilepsy.base.constants.config import CalculusConfig
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger, raise_value_error
+from tvb_epilepsy.base.computations.analyzers_utils import _butterworth_bandpass, butterworth_sos
+from tvb_epilepsy.service.simulator.simulation_output_sink import ArrayOutputSink
+
+
+class ABCStreamStage(object):
+    __metaclass__ = ABCMeta
+
+    sample_shape = ()
+
+    def open(self, sample_shape, time_step):
+        """
+        Reset the state of the stage, for a new input
+        :param sample_shape: shape of the data of a single time point of the input
+        :param time_step: time step of the input
+        :return: the sample shape and the time step of the output
+        """
+        self.sample_shape = tuple(sample_shape)
+        return self.sample_shape, time_step
+
+    def output_length(self, n_times):
+        return n_times
+
+    def _empty(self):
+        return numpy.empty((0,) + self.sample_shape)
+
+    @abstractmethod
+    def process(self, block):
+        """
+        :param block: the next block of time points of the input, of shape (n_times,) + sample_shape
+        :return: the next time points of the output, that can be computed so far, possibly none
+        """
+        pass
+
+    def flush(self):
+        """
+        :return: the remaining time points of the output, at the end of the input
+        """
+        return self._empty()
+
+
+class FilterStage(ABCStreamStage):
+    """
+    Zero phase Butterworth filter, as TimeseriesService.filter, i.e., scipy.signal.sosfiltfilt,
+    with the same odd extensions of padlen time points at both ends of the signals.
+    The forward pass is a sosfilt, with its final conditions carried over from block to block.
+    The backward pass of each block starts from the steady state of the time point lookahead time points later,
+    so that its error decays by the filter's slowest pole down to tolerance. At the end of the input, it is exact.
+    """
+
+    def __init__(self, fs, lowcut=None, highcut=None, mode="bandpass", order=3, tolerance=10 ** (-9)):
+        self.b, self.a = _butterworth_bandpass(fs, mode, lowcut, highcut, order)
+        self.sos = butterworth_sos(fs, mode, lowcut, highcut, order)
+        # The same as the one of sosfiltfilt
+        self.padlen = 3 * max(len(self.a), len(self.b))
+        self.lookahead = int(numpy.ceil(numpy.log(tolerance) / numpy.log(numpy.max(numpy.abs(tf2zpk(self.b,
+                                                                                                  self.a)[1])))))
+        self.zi = sosfilt_zi(self.sos)
+        self._pending = []
+        self._zf = None
+        self._forward = None
+        self._last_input = None
+        self._skip = 0
+
+    def open(self, sample_shape, time_step):
+        self._pending = []
+        self._zf = None
+        self._forward = None
+        self._last_input = None
+        self._skip = self.padlen
+        return super(FilterStage, self).open(sample_shape, time_step)
+
+    def _steady_state(self, x0):
+        # Initial conditions of the step response to x0, as sosfiltfilt sets them
+        return self.zi.reshape(self.zi.shape + (1,) * (x0.ndim)) * x0
+
+    def _backward(self, forward):
+        backward = forward[::-1]
+        return sosfilt(self.sos, backward, axis=0, zi=self._steady_state(backward[0]))[0][::-1]
+
+    def _emit(self, output):
+        # The output of the odd extension at the start of the signals is discarded
+        skip = min(self._skip, output.shape[0])
+        self._skip -= skip
+        return output[skip:]
+
+    def process(self, block):
+        if self._zf is None:
+            # The odd extension needs the first padlen + 1 time points
+            self._pending.append(block)
+            x = numpy.concatenate(self._pending)
+            if x.shape[0] <= self.padlen:
+                return self._empty()
+            self._pending = []
+            self._last_input = x[-(self.padlen + 1):]
+            x = numpy.concatenate([2 * x[0] - x[self.padlen:0:-1], x])
+            self._forward, self._zf = sosfilt(self.sos, x, axis=0, zi=self._steady_state(x[0]))
+        else:
+            # The last padlen + 1 time points are kept for the odd extension at the end
+            self._last_input = numpy.concatenate([self._last_input, block])[-(self.padlen + 1):]
+            forward, self._zf = sosfilt(self.sos, block, axis=0, zi=self._zf)
+            self._forward = numpy.concatenate([self._forward, forward])
+        n_output = self._forward.shape[0] - self.lookahead
+        if n_output <= 0:
+            return self._empty()
+        output = self._backward(self._forward)[:n_output]
+        self._forward = self._forward[n_output:]
+        return self._emit(output)
+
+    def flush(self):
+        if self._zf is None:
+            # Too short signals are filtered as a whole, as TimeseriesService.filter does
+            if len(self._pending) == 0:
+                return self._empty()
+            return sosfiltfilt(self.sos, numpy.concatenate(self._pending), axis=0)
+        # The odd extension at the end of the signals
+        x = 2 * self._last_input[-1] - self._last_input[-2::-1]
+        forward = numpy.concatenate([self._forward, sosfilt(self.sos, x, axis=0, zi=self._zf)[0]])
+        return self._emit(self._backward(forward)[:-self.padlen])
+
+
+class EnvelopeStage(ABCStreamStage):
+    """
+    Envelope, as the absolute value of the analytic signal, as TimeseriesService.hilbert_envelope,
+    computed by overlap-save: the Hilbert transform of each block is computed together with margin time points
+    before and after it.
+    """
+
+    def __init__(self, margin):
+        self.margin = int(margin)
+        self._buffer = None
+        self._n_history = 0
+
+    def open(self, sample_shape, time_step):
+        self._buffer = None
+        self._n_history = 0
+        return super(EnvelopeStage, self).open(sample_shape, time_step)
+
+    def process(self, block):
+        if self._buffer is None:
+            self._buffer = block
+        else:
+            self._buffer = numpy.concatenate([self._buffer, block])
+        n_output = self._buffer.shape[0] - self._n_history - self.margin
+        if n_output <= 0:
+            return self._empty()
+        output = numpy.abs(hilbert(self._buffer, axis=0))[self._n_history:self._n_history + n_output]
+        start = max(0, self._n_history + n_output - self.margin)
+        self._n_history += n_output - start
+        self._buffer = self._buffer[start:]
+        return output
+
+    def flush(self):
+        if self._buffer is None or self._buffer.shape[0] == self._n_history:
+            return self._empty()
+        return numpy.abs(hilbert(self._buffer, axis=0))[self._n_history:]
+
+
+class ConvolveStage(ABCStreamStage):
+    """
+    Convolution with a kernel along time, as TimeseriesService.convolve, i.e., scipy.signal.convolve of mode "same",
+    computed exactly by overlap-save, with the time points preceding each block (zeros before the start)
+    and the ones following it (zeros after the end).
+    """
+
+    def __init__(self, kernel):
+        self.kernel = numpy.array(kernel).flatten()
+        self._buffer = None
+
+    def open(self, sample_shape, time_step):
+        sample_shape, time_step = super(ConvolveStage, self).open(sample_shape, time_step)
+        # The output of a time point needs the (K - 1) - (K - 1) // 2 previous ones
+        self._buffer = numpy.zeros((self.kernel.size - 1 - (self.kernel.size - 1) // 2,) + self.sample_shape)
+        return sample_shape, time_step
+
+    def _convolve(self):
+        return convolve(self._buffer, self.kernel.reshape((self.kernel.size,) + (1,) * len(self.sample_shape)),
+                        mode="valid")
+
+    def process(self, block):
+        self._buffer = numpy.concatenate([self._buffer, block])
+        n_output = self._buffer.shape[0] - (self.kernel.size - 1)
+        if n_output <= 0:
+            return self._empty()
+        output = self._convolve()
+        self._buffer = self._buffer[n_output:]
+        return output
+
+    def flush(self):
+        # ...and the (K - 1) // 2 following ones
+        self._buffer = numpy.concatenate([self._buffer,
+                                          numpy.zeros(((self.kernel.size - 1) // 2,) + self.sample_shape)])
+        if self._buffer.shape[0] < self.kernel.size:
+            return self._empty()
+        return self._convolve()
+
+
+class DecimateStage(ABCStreamStage):
+    """
+    Decimation by striding, as TimeseriesService.decimate, keeping every decim_ratio-th time point from the first one.
+    """
+
+    def __init__(self, decim_ratio):
+        self.decim_ratio = int(decim_ratio)
+        self._n_input = 0
+
+    def open(self, sample_shape, time_step):
+        self._n_input = 0
+        sample_shape, time_step = super(DecimateStage, self).open(sample_shape, time_step)
+        return sample_shape, self.decim_ratio * time_step
+
+    def output_length(self, n_times):
+        return int(numpy.ceil(1.0 * n_times / self.decim_ratio))
+
+    def process(self, block):
+        output = block[(-self._n_input) % self.decim_ratio::self.decim_ratio]
+        self._n_input += block.shape[0]
+        return output
+
+
+class TimeseriesStreamPipeline(object):
+    """
+    Feeds the stages with blocks of block_length time points of a Timeseries, e.g., of an out of core H5Timeseries,
+    and writes the output of the last stage to an output sink, as soon as it is computed.
+    """
+    logger = initialize_logger(__name__)
+
+    def __init__(self, stages, block_length=CalculusConfig.TIMESERIES_BLOCK_LENGTH):
+        if len(stages) == 0:
+            raise_value_error("A Timeseries stream pipeline needs at least one stage!")
+        self.stages = stages
+        self.block_length = block_length
+
+    def _process(self, block):
+        for stage in self.stages:
+            block = stage.process(block)
+        return block
+
+    def _flush(self):
+        block = None
+        for stage in self.stages:
+            if block is not None and block.shape[0] > 0:
+                block = numpy.concatenate([stage.process(block), stage.flush()])
+            else:
+                block = stage.flush()
+        return block
+
+    def run(self, timeseries, output_sink=None):
+        """
+        :param output_sink: an ABCSimulationOutputSink, by default an ArrayOutputSink of float64 data
+        :return: the output of the output sink, by default a Timeseries
+        """
+        if output_sink is None:
+            output_sink = ArrayOutputSink(dtype="float64")
+        sample_shape = timeseries.shape[1:]
+        time_step = timeseries.time_step
+        n_times = timeseries.time_length
+        for stage in self.stages:
+            sample_shape, time_step = stage.open(sample_shape, time_step)
+            n_times = stage.output_length(n_times)
+        output_sink.open(n_times, sample_shape, time_step)
+        n_output = 0
+        try:
+            for _, block in timeseries.iter_time_blocks(self.block_length):
+                block = self._process(block)
+                output_sink.append_block(timeseries.time_start + n_output * time_step, block)
+                n_output += block.shape[0]
+            block = self._flush()
+            output_sink.append_block(timeseries.time_start + n_output * time_step, block)
+            n_output += block.shape[0]
+        except:
+            output_sink.abort()
+            raise
+        self.logger.info("Streamed " + str(timeseries.time_length) + " time points through " +
+                         str(len(self.stages)) + " stages, to " + str(n_output) + " output time points.")
+        return output_sink.close(timeseries.space_labels, timeseries.variables_labels, timeseries.time_unit)
@@ -0,0 +1,73 @@
+# coding=utf-8
+
+import numpy
+from scipy import sparse
+from tvb_epilepsy.base.computations.coupling_utils import difference_coupling, difference_coupling_jacobian, \
+    sparse_or_dense_jacobian
+from tvb_epilepsy.base.computations.calculations_utils import calc_coupling, calc_coupling_diff
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestCouplingUtils(BaseTest):
+    n_regions = 30
+
+    def _prepare_inputs(self):
+        random_state = numpy.random.RandomState(0)
+        w = random_state.uniform(0.0, 1.0, (self.n_regions, self.n_regions)) * \
+            (random_state.uniform(0.0, 1.0, (self.n_regions, self.n_regions)) < 0.3)
+        x = random_state.uniform(-2.0, -1.0, (self.n_regions,))
+        K = random_state.uniform(0.0, 10.0, (self.n_regions,))
+        return x, K, w
+
+    def _outer_difference_coupling(self, x, K, w, ix, jx):
+        return K[ix] * numpy.sum(w[numpy.ix_(ix, jx)] * (x[jx][numpy.newaxis] - x[ix][:, numpy.newaxis]), axis=1)
+
+    def test_difference_coupling(self):
+        x, K, w = self._prepare_inputs()
+        all_regions = range(self.n_regions)
+        for ix, jx in [(all_regions, all_regions), ([1, 3, 5], [5, 10, 20, 1])]:
+            coupling = self._outer_difference_coupling(x, K, w, ix, jx)
+            assert numpy.allclose(difference_coupling(x, K, w, ix, jx), coupling)
+            assert numpy.allclose(difference_coupling(x, K, sparse.csr_matrix(w), ix, jx), coupling)
+        assert numpy.allclose(calc_coupling(x, K, w), self._outer_difference_coupling(x, K, w, all_regions,
+                                                                                      all_regions))
+
+    def test_difference_coupling_batch(self):
+        x, K, w = self._prepare_inputs()
+        x_batch = numpy.array([x, 2 * x, x - 1.0])
+        for weights in [w, sparse.csr_matrix(w)]:
+            coupling = difference_coupling(x_batch, K, weights)
+            assert coupling.shape == x_batch.shape
+            for x_sample, coupling_sample in zip(x_batch, coupling):
+                assert numpy.allclose(difference_coupling(x_sample, K, weights), coupling_sample)
+
+    def test_difference_coupling_jacobian(self):
+        x, K, w = self._prepare_inputs()
+        ix = [1, 3, 5, 10]
+        jx = [5, 10, 20, 1, 2]
+        for i_x, j_x in [(None, None), (ix, jx)]:
+            n_j = self.n_regions if j_x is None else len(j_x)
+            j_x_ = range(self.n_regions) if j_x is None else j_x
+            # Central finite differences are exact for linear functions, up to round off errors
+            eps = 10 ** (-3)
+            jac_fd = numpy.zeros((self.n_regions if i_x is None else len(i_x), n_j))
+            for j in range(n_j):
+                dx = numpy.zeros(x.shape)
+                dx[j_x_[j]] = eps
+                jac_fd[:, j] = (difference_coupling(x + dx, K, w, i_x, j_x) -
+                                difference_coupling(x - dx, K, w, i_x, j_x)) / (2 * eps)
+            assert numpy.allclose(difference_coupling_jacobian(K, w, i_x, j_x), jac_fd)
+            jac_sparse = difference_coupling_jacobian(K, sparse.csr_matrix(w), i_x, j_x)
+            assert sparse.issparse(jac_sparse)
+            assert numpy.allclose(jac_sparse.toarray(), jac_fd)
+        # Without self connections, it equals the previous element wise computation
+        numpy.fill_diagonal(w, 0.0)
+        jac = -K[:, numpy.newaxis] * numpy.diag(numpy.sum(w, axis=1)) + K[:, numpy.newaxis] * w
+        assert numpy.allclose(calc_coupling_diff(K, w), jac)
+
+    def test_sparse_or_dense_jacobian(self):
+        _, _, w = self._prepare_inputs()
+        jacobian = sparse_or_dense_jacobian(sparse.csr_matrix(w), lambda: sparse.coo_matrix(w), lambda: w)
+        assert sparse.isspmatrix_csr(jacobian)
+        assert numpy.allclose(jacobian.toarray(), w)
+        assert sparse_or_dense_jacobian(w, lambda: sparse.coo_matrix(w), lambda: w) is w
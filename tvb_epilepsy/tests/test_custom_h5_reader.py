@@ -2,6 +2,7 @@ import os
 import numpy
 from tvb_epilepsy.base.constants.config import InputConfig
 from tvb_epilepsy.base.model.model_configuration import ModelConfiguration
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions, H5Timeseries
 from tvb_epilepsy.base.model.vep.sensors import Sensors
 from tvb_epilepsy.base.simulation_settings import SimulationSettings
 from tvb_epilepsy.io.h5_reader import H5Reader
@@ -9,6 +10,7 @@ from tvb_epilepsy.io.h5_writer import H5Writer
 from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
 from tvb_epilepsy.service.lsa_service import LSAService
 from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
 from tvb_epilepsy.tests.base import BaseTest
 
 
@@ -176,3 +178,41 @@ class TestCustomH5Reader(BaseTest):
         assert dummy_sim_settings.monitor_sampling_period == sim_settings.monitor_sampling_period
         assert dummy_sim_settings.monitor_expressions == sim_settings.monitor_expressions
         assert numpy.array_equal(dummy_sim_settings.initial_conditions, sim_settings.initial_conditions)
+
+    def test_read_timeseries_lazy(self):
+        test_file = os.path.join(self.config.out.FOLDER_TEMP, "TestTimeseries.h5")
+        data = numpy.random.RandomState(0).normal(size=(1000, 5, 2, 1))
+        ts = Timeseries(data, {TimeseriesDimensions.SPACE.value: ["r0", "r1", "r2", "r3", "r4"],
+                               TimeseriesDimensions.VARIABLES.value: ["x1", "z"]}, 10.0, 0.5)
+        self.writer.write_timeseries(ts, test_file)
+
+        ts_h5 = self.reader.read_timeseries(test_file, lazy=True)
+        assert isinstance(ts_h5, H5Timeseries)
+        assert ts_h5.shape == ts.shape
+        assert numpy.allclose([ts_h5.time_start, ts_h5.time_step], [ts.time_start, ts.time_step])
+        # Selections are lazy, and read only their hyperslabs:
+        ts_selection = ts_h5.get_time_window(100, 900).get_subspace_by_index([4, 0, 2]).x1.decimate_time(1.5)
+        assert isinstance(ts_selection, H5Timeseries)
+        assert numpy.array_equal(ts_selection.squeezed, data[100:900:3, [4, 0, 2], 0, 0])
+        assert ts_h5.as_view() is ts_h5
+        assert numpy.array_equal(ts_h5.as_view().get_time_window(100, 200).squeezed, data[100:200].squeeze())
+        assert ts_selection.time_start == ts.time_start + 100 * ts.time_step
+        assert list(ts_selection.space_labels) == ["r4", "r0", "r2"]
+        assert numpy.array_equal(ts_h5[5:10, "r1", "z", 0], data[5:10, 1, 1, 0])
+        assert numpy.allclose(ts_h5.get_source().data, ts.get_source().data)
+        assert numpy.allclose(ts_h5.data.min(block_length=300), data.min())
+
+        # TimeseriesService operations iterate over blocks of time points:
+        ts_service = TimeseriesService(block_length=300)
+        ts_x1 = ts.x1
+        ts_h5_x1 = ts_h5.x1
+        assert numpy.allclose(ts_service.power(ts_h5_x1), ts_service.power(ts_x1))
+        assert numpy.allclose(ts_service.power(ts_h5_x1), numpy.sum(data[:, :, 0, 0] ** 2, axis=0))
+        assert numpy.allclose(ts_service.correlation(ts_h5_x1), numpy.corrcoef(data[:, :, 0, 0].T))
+        # The gain matrix of the dummy sensors is of 3 regions
+        assert numpy.allclose(ts_service.compute_seeg(ts_h5_x1.get_subspace_by_index([0, 1, 2]),
+                                                      [self.dummy_sensors])[0].data,
+                              ts_service.compute_seeg(ts_x1.get_subspace_by_index([0, 1, 2]),
+                                                      [self.dummy_sensors])[0].data)
+        assert numpy.allclose(ts_service.normalize(ts_h5_x1, "minmax").data, ts_service.normalize(ts_x1, "minmax").data)
+        ts_h5.close()
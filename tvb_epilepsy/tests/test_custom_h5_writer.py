@@ -1,8 +1,13 @@
 import os
+import h5py
 import numpy
+import pytest
 from tvb_epilepsy.base.constants.model_constants import X1EQ_CR_DEF
 from tvb_epilepsy.base.model.model_configuration import ModelConfiguration
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
 from tvb_epilepsy.base.simulation_settings import SimulationSettings
+from tvb_epilepsy.io.h5_model import convert_to_h5_model
+from tvb_epilepsy.io.h5_reader import H5Reader
 from tvb_epilepsy.io.h5_writer import H5Writer
 from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
 from tvb_epilepsy.service.lsa_service import LSAService
@@ -162,6 +167,70 @@ class TestCustomH5writer(BaseTest):
 
         assert os.path.exists(test_file)
 
+    def _prepare_timeseries(self, n_times, time_start=0.0, n_regions=40):
+        data = numpy.cumsum(numpy.random.RandomState(0).normal(size=(n_times, n_regions, 2, 1)), axis=0)
+        return Timeseries(data.astype("float32"),
+                          {TimeseriesDimensions.SPACE.value: numpy.array(["r" + str(i) for i in range(n_regions)]),
+                           TimeseriesDimensions.VARIABLES.value: ["x1", "z"]}, time_start, 0.5)
+
+    def test_write_timeseries_compressed(self):
+        timeseries = self._prepare_timeseries(5000)
+        for compression, compression_opts in [("gzip", 4), ("lzf", None)]:
+            test_file = os.path.join(self.config.out.FOLDER_TEMP, "TestTimeseries_" + compression + ".h5")
+            H5Writer(compression=compression, compression_opts=compression_opts, chunk_bytes=2 ** 14,
+                     chunk_signals=16).write_timeseries(timeseries, test_file)
+            with h5py.File(test_file, "r") as h5_file:
+                dataset = h5_file["/data"]
+                assert dataset.chunks == (146, 14, 2, 1)
+                assert dataset.maxshape == (None, 40, 2, 1)
+                assert dataset.compression == compression and dataset.shuffle
+            assert numpy.array_equal(H5Reader().read_timeseries(test_file).data, timeseries.data)
+        # Contiguous, uncompressed datasets, as before
+        test_file = os.path.join(self.config.out.FOLDER_TEMP, "TestTimeseries_contiguous.h5")
+        H5Writer(compression="gzip", chunk_bytes=None).write_timeseries(timeseries, test_file)
+        with h5py.File(test_file, "r") as h5_file:
+            assert h5_file["/data"].chunks is None and h5_file["/data"].compression is None
+
+    def test_append_timeseries(self):
+        timeseries = self._prepare_timeseries(1000)
+        test_file = os.path.join(self.config.out.FOLDER_TEMP, "TestTimeseries_append.h5")
+        writer = H5Writer(compression="lzf")
+        writer.write_timeseries(timeseries.get_time_window(0, 600), test_file)
+        writer.append_timeseries(timeseries.get_time_window(600, 1000), test_file)
+        appended = H5Reader().read_timeseries(test_file)
+        assert numpy.array_equal(appended.data, timeseries.data)
+        assert numpy.allclose(appended.time_line, timeseries.time_line)
+        with h5py.File(test_file, "r") as h5_file:
+            assert h5_file["/data"].attrs["Number_of_steps"] == 1000
+            assert numpy.allclose(h5_file["/data"].attrs["Max_value"], timeseries.data.max())
+        with pytest.raises(ValueError):
+            writer.append_timeseries(self._prepare_timeseries(10, n_regions=3), test_file)
+        # Overlapping, gapped, or empty time points are not appended
+        for time_window in [(990, 1000), (10, 20)]:
+            with pytest.raises(ValueError):
+                writer.append_timeseries(timeseries.get_time_window(*time_window), test_file)
+        with pytest.raises(ValueError):
+            writer.append_timeseries(self._prepare_timeseries(10, timeseries.time_line[-1] + 10 * timeseries.time_step),
+                                     test_file)
+        with pytest.raises(ValueError):
+            writer.append_timeseries(timeseries.get_time_window(0, 0), test_file)
+        assert numpy.array_equal(H5Reader().read_timeseries(test_file).data, timeseries.data)
+        writer.append_timeseries(self._prepare_timeseries(10, timeseries.time_line[-1] + timeseries.time_step),
+                                 test_file)
+        with h5py.File(test_file, "r") as h5_file:
+            assert h5_file["/time"].shape == (1010,)
+            assert numpy.allclose(numpy.diff(h5_file["/time"][()]), timeseries.time_step)
+
+    def test_write_h5_model_compressed(self):
+        test_file = os.path.join(self.config.out.FOLDER_TEMP, "TestH5ModelCompressed.h5")
+        values = numpy.zeros((100, 100))
+        convert_to_h5_model({"values": values, "small": numpy.ones((3,))}).write_to_h5(test_file,
+                                                                                        compression="gzip")
+        with h5py.File(test_file, "r") as h5_file:
+            assert h5_file["/values"].compression == "gzip"
+            assert h5_file["/small"].compression is None
+            assert numpy.array_equal(h5_file["/values"][()], values)
+
     @classmethod
     def teardown_class(cls):
         head_dir = os.path.join(cls.config.out.FOLDER_TEMP, "test_head")
@@ -0,0 +1,87 @@
+# coding=utf-8
+
+import numpy
+from scipy import sparse
+from tvb_epilepsy.base.computations.coupling_utils import difference_coupling, network_jacobian
+from tvb_epilepsy.base.epileptor_models import EpileptorDP, EpileptorDPrealistic, EpileptorDP2D
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestEpileptorModelsJacobian(BaseTest):
+    n_regions = 10
+    eps = 1e-6
+
+    def _build_models(self):
+        models = []
+        for zmode in ["lin", "sig"]:
+            model = EpileptorDP2D()
+            model.zmode = numpy.array(zmode)
+            model.K = numpy.array([2.0])
+            models.append(model)
+            model = EpileptorDP()
+            model.zmode = numpy.array(zmode)
+            model.K = numpy.array([2.0])
+            models.append(model)
+            for pmode in ["const", "g", "z", "z*g"]:
+                model = EpileptorDPrealistic()
+                model.zmode = numpy.array(zmode)
+                model.pmode = numpy.array(pmode)
+                models.append(model)
+        return models
+
+    def _prepare_state(self, model, random_state):
+        # Values on both sides of the if/else branches of dfun, away from their thresholds
+        y = random_state.uniform(0.1, 2.0, (model._nvar, self.n_regions)) * \
+            numpy.where(random_state.uniform(0.0, 1.0, (model._nvar, self.n_regions)) < 0.5, -1.0, 1.0)
+        y[0, :2] = [-0.5, 0.5]
+        if isinstance(model, EpileptorDP2D):
+            y[1, :2] = [-0.5, 3.0]
+        else:
+            y[2, :2] = [-0.5, 3.0]
+            y[3] = numpy.where(numpy.abs(y[3] + 0.25) < 0.05, y[3] + 0.1, y[3])
+            y[3, :2] = [-1.0, 0.5]
+        return y
+
+    def _finite_differences(self, fun, x):
+        # jac[i, j] = d fun(x)[i] / d x[j], for each node, by central differences
+        jac = []
+        for j in range(x.shape[0]):
+            dx = numpy.zeros(x.shape)
+            dx[j] = self.eps
+            jac.append((fun(x + dx) - fun(x - dx)) / (2 * self.eps))
+        return numpy.array(jac).transpose((1, 0, 2))
+
+    def test_jacobian(self):
+        random_state = numpy.random.RandomState(0)
+        local_coupling = 0.1
+        for model in self._build_models():
+            y = self._prepare_state(model, random_state)
+            coupling = random_state.uniform(-1.0, 1.0, (model.cvar.size, self.n_regions))
+            jac = model.jacobian(y, coupling, local_coupling)
+            assert jac.shape == (model._nvar, model._nvar, self.n_regions)
+            assert numpy.allclose(jac, self._finite_differences(lambda x: model.dfun(x, coupling, local_coupling), y),
+                                  rtol=1e-4, atol=1e-6)
+            coupling_jac = model.coupling_jacobian(y, coupling, local_coupling)
+            assert coupling_jac.shape == (model._nvar, model.cvar.size, self.n_regions)
+            assert numpy.allclose(coupling_jac,
+                                  self._finite_differences(lambda c: model.dfun(y, c, local_coupling), coupling),
+                                  rtol=1e-4, atol=1e-6)
+
+    def test_network_jacobian(self):
+        random_state = numpy.random.RandomState(1)
+        w = random_state.uniform(0.0, 1.0, (self.n_regions, self.n_regions)) * \
+            (random_state.uniform(0.0, 1.0, (self.n_regions, self.n_regions)) < 0.3)
+        for model in self._build_models()[:3]:
+            y = self._prepare_state(model, random_state)
+
+            def network_dfun(x):
+                x = x.reshape(y.shape)
+                return model.dfun(x, difference_coupling(x[model.cvar], 1.0, w)).flatten()
+
+            jac_fd = numpy.array([(network_dfun(y.flatten() + dx) - network_dfun(y.flatten() - dx)) / (2 * self.eps)
+                                  for dx in self.eps * numpy.eye(y.size)]).T
+            for weights in [w, sparse.csr_matrix(w)]:
+                jac = network_jacobian(model, y, weights)
+                assert sparse.issparse(jac)
+                assert jac.shape == (y.size, y.size)
+                assert numpy.allclose(jac.toarray(), jac_fd, rtol=1e-4, atol=1e-6)
@@ -0,0 +1,47 @@
+# coding=utf-8
+
+import numpy
+from tvb_epilepsy.base.computations.equilibrium_computation import calc_eq_x2, calc_eq_x2_cardano, \
+    cardano_min_real_root
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestEquilibriumComputation(BaseTest):
+    Iext2 = 0.45
+
+    def _prepare_equilibria(self, shape):
+        random_state = numpy.random.RandomState(0)
+        return random_state.uniform(-2.0, -1.0, shape), random_state.uniform(2.0, 5.0, shape), \
+               random_state.uniform(-0.5, 0.5, shape)
+
+    def test_cardano_min_real_root(self):
+        random_state = numpy.random.RandomState(0)
+        # Both single and three real roots' cases
+        Q = random_state.uniform(-1.0, 0.5, (10, 20))
+        R = random_state.uniform(-1.0, 1.0, (10, 20))
+        x = cardano_min_real_root(Q, R)
+        assert x.shape == Q.shape
+        for iq, ir in zip(*numpy.unravel_index(range(0, Q.size, 7), Q.shape)):
+            roots = numpy.roots([1.0, 0.0, 3 * Q[iq, ir], -2 * R[iq, ir]])
+            assert numpy.allclose(x[iq, ir], numpy.min(numpy.real(roots[numpy.abs(numpy.imag(roots)) < 10 ** (-6)])))
+
+    def test_calc_eq_x2_cardano(self):
+        x1eq, zeq, y2eq = self._prepare_equilibria((100,))
+        for x2_neg in [True, False]:
+            for y2 in [None, y2eq]:
+                x2eq, x2_neg_out = calc_eq_x2(self.Iext2, y2eq=y2, zeq=zeq, x1eq=x1eq, x2_neg=x2_neg)
+                x2eq_cardano, x2_neg_cardano = calc_eq_x2_cardano(self.Iext2, y2eq=y2, zeq=zeq, x1eq=x1eq,
+                                                                  x2_neg=x2_neg)
+                assert numpy.allclose(x2eq, x2eq_cardano)
+                # x2_neg is switched only for equilibria consistent with the switched value
+                switched = x2_neg_cardano != x2_neg
+                assert numpy.all(x2_neg_cardano[switched] == (x2eq_cardano[switched] < -0.25))
+
+    def test_calc_eq_x2_cardano_batch(self):
+        x1eq, zeq, _ = self._prepare_equilibria((5, 30))
+        x2eq, x2_neg = calc_eq_x2_cardano(self.Iext2, zeq=zeq, x1eq=x1eq, x2_neg=True)
+        assert x2eq.shape == (5, 30)
+        assert x2_neg.shape == (5, 30)
+        for i_sample in range(5):
+            assert numpy.allclose(x2eq[i_sample],
+                                  calc_eq_x2(self.Iext2, zeq=zeq[i_sample], x1eq=x1eq[i_sample], x2_neg=True)[0])
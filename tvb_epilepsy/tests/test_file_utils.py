@@ -1,5 +1,6 @@
 import os
-from tvb_epilepsy.base.utils.file_utils import change_filename_or_overwrite
+import pytest
+from tvb_epilepsy.base.utils.file_utils import change_filename_or_overwrite, write_file_atomically
 from tvb_epilepsy.io.h5_writer import H5Writer
 from tvb_epilepsy.tests.base import BaseTest
 
@@ -17,3 +18,21 @@ class TestFileUtils(BaseTest):
         change_filename_or_overwrite(test_file, True)
 
         assert not os.path.exists(test_file)
+
+    def test_write_file_atomically(self):
+        test_file = os.path.join(self.config.out.FOLDER_TEMP, "TestAtomic.h5")
+        write_file_atomically(test_file, lambda path: self.writer.write_dictionary({"a": [1, 2, 3]}, path))
+
+        assert os.path.exists(test_file)
+
+        def fail(path):
+            open(path, "w").close()
+            raise IOError("Failed to write " + path)
+
+        with pytest.raises(IOError):
+            write_file_atomically(test_file + ".failed", fail)
+
+        # Neither the file, nor the temporary one, of a failed writing exist
+        assert not any([file_name.startswith("TestAtomic.h5.") for file_name in
+                        os.listdir(self.config.out.FOLDER_TEMP)])
+        os.remove(test_file)
@@ -0,0 +1,50 @@
+# coding=utf-8
+
+import os
+import numpy
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions, H5Timeseries
+from tvb_epilepsy.io.h5_reader import H5Reader
+from tvb_epilepsy.io.h5_writer import H5Writer
+from tvb_epilepsy.top.scripts.fitting_data_scripts import prepare_signal_observable
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestFittingDataScripts(BaseTest):
+    seizure_length = 1000
+    on_off_set = [2000.0, 17000.0]
+
+    def _prepare_h5_timeseries(self, n_times=20000, n_signals=3):
+        random_state = numpy.random.RandomState(0)
+        data = numpy.cumsum(random_state.normal(size=(n_times, n_signals)), axis=0) + \
+            20.0 * random_state.normal(size=(n_times, n_signals))
+        timeseries = Timeseries(data, {TimeseriesDimensions.SPACE.value: numpy.array(["s" + str(i)
+                                                                                      for i in range(n_signals)]),
+                                       TimeseriesDimensions.VARIABLES.value: ["seeg"]}, 0.0, 1000.0 / 1024)
+        path = os.path.join(self.config.out.FOLDER_TEMP, "TestFittingDataScripts.h5")
+        if os.path.isfile(path):
+            os.remove(path)
+        H5Writer().write_timeseries(timeseries, path)
+        return timeseries, H5Reader().read_timeseries(path, lazy=True)
+
+    def test_prepare_signal_observable_h5(self):
+        timeseries, h5_timeseries = self._prepare_h5_timeseries()
+        assert isinstance(h5_timeseries, H5Timeseries)
+        try:
+            expected = prepare_signal_observable(timeseries, self.seizure_length, self.on_off_set, [2, 0])
+            # In memory, from the out of core data
+            observable = prepare_signal_observable(h5_timeseries, self.seizure_length, self.on_off_set, [2, 0])
+            assert observable.shape == expected.shape
+            assert numpy.allclose(observable.data, expected.data)
+            # Block by block, from the out of core data
+            streamed = prepare_signal_observable(h5_timeseries, self.seizure_length, self.on_off_set, [2, 0],
+                                                 block_length=4096)
+        finally:
+            h5_timeseries.close()
+        assert streamed.shape == expected.shape
+        assert numpy.allclose(streamed.time_start, expected.time_start)
+        assert numpy.allclose(streamed.time_step, expected.time_step)
+        assert list(streamed.space_labels) == ["s2", "s0"]
+        # The streamed envelope differs at the signals' ends, where the Hilbert transform of whole signals is circular
+        margin = streamed.time_length / 10
+        error = numpy.abs(streamed.data - expected.data)[margin:-margin]
+        assert numpy.max(error) <= 0.05 * numpy.max(numpy.abs(expected.data))
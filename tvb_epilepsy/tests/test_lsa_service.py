@@ -0,0 +1,104 @@
+# coding=utf-8
+
+import numpy
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.lsa_service import LSAService
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestLSAService(BaseTest):
+
+    def _prepare_model_configurations(self, x0_values, connectivity=None):
+        # The dummy connectivity has well separated eigenvalues,
+        # so that the propagation strengths are not sensitive to round-off errors
+        if connectivity is None:
+            connectivity = self.dummy_connectivity
+        hypotheses = []
+        model_configurations = []
+        for x0_value in x0_values:
+            hypothesis = HypothesisBuilder(connectivity.number_of_regions).set_x0_hypothesis([0], [x0_value]). \
+                set_e_hypothesis([2], [0.9]).build_hypothesis()
+            hypotheses.append(hypothesis)
+            model_configurations.append(ModelConfigurationBuilder(connectivity.number_of_regions).
+                                        build_model_from_hypothesis(hypothesis, connectivity.normalized_weights))
+        return hypotheses, model_configurations
+
+    def _assert_run_lsa_batch(self, x0_values, **lsa_service_kwargs):
+        hypotheses, model_configurations = self._prepare_model_configurations(x0_values)
+        lsa_hypotheses = [LSAService(**lsa_service_kwargs).run_lsa(hypothesis, model_configuration)
+                          for hypothesis, model_configuration in zip(hypotheses, model_configurations)]
+        hypotheses, model_configurations = self._prepare_model_configurations(x0_values)
+        lsa_service = LSAService(**lsa_service_kwargs)
+        lsa_hypotheses_batch = lsa_service.run_lsa_batch(hypotheses, model_configurations)
+        assert len(lsa_hypotheses_batch) == len(x0_values)
+        for lsa_hypothesis, lsa_hypothesis_batch in zip(lsa_hypotheses, lsa_hypotheses_batch):
+            assert numpy.allclose(lsa_hypothesis.lsa_propagation_strengths,
+                                  lsa_hypothesis_batch.lsa_propagation_strengths)
+            assert numpy.all(numpy.sort(lsa_hypothesis.lsa_propagation_indices) ==
+                             numpy.sort(lsa_hypothesis_batch.lsa_propagation_indices))
+        return lsa_service
+
+    def test_run_lsa_batch(self):
+        lsa_service = self._assert_run_lsa_batch([0.7, 0.8, 0.9], eigen_vectors_number=2)
+        assert lsa_service.eigen_values.shape == (3, 3)
+        assert lsa_service.eigen_vectors.shape == (3, 3, 3)
+
+    def test_run_lsa_batch_eigen_values(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        hypotheses, model_configurations = self._prepare_model_configurations([0.7, 0.9], connectivity)
+        lsa_service = LSAService(eigen_vectors_number=5)
+        lsa_service.run_lsa_batch(hypotheses, model_configurations)
+        eigen_values = lsa_service.eigen_values
+        assert eigen_values.shape == (2, connectivity.number_of_regions)
+        for i_sample in range(2):
+            lsa_service.run_lsa(hypotheses[i_sample], model_configurations[i_sample])
+            assert numpy.allclose(lsa_service.eigen_values, eigen_values[i_sample])
+
+    def test_run_lsa_batch_auto_eigen_vectors_number(self):
+        self._assert_run_lsa_batch([0.7, 0.8, 0.9], eigen_vectors_number_selection="auto_eigenvals",
+                                   weighted_eigenvector_sum=False)
+
+    def test_run_lsa_batch_2D(self):
+        self._assert_run_lsa_batch([0.99, 1.2], lsa_method="2D", eigen_vectors_number=2)
+
+    def test_run_lsa_batch_auto(self):
+        lsa_service = self._assert_run_lsa_batch([0.9, 5.0], lsa_method="auto", eigen_vectors_number=2)
+        # The second sample is supercritical, and therefore, analyzed with the "2D" method
+        assert [eigen_values.size for eigen_values in lsa_service.eigen_values] == [3, 6]
+        assert lsa_service.lsa_method == "auto"
+
+    def _assert_run_lsa_partial(self, x0_values, eigen_vectors_number, **lsa_service_kwargs):
+        connectivity = self._prepare_dummy_head().connectivity
+        hypotheses, model_configurations = self._prepare_model_configurations(x0_values, connectivity)
+        lsa_service = LSAService(eigen_vectors_number=eigen_vectors_number, eigen_solver="dense",
+                                 **lsa_service_kwargs)
+        lsa_hypothesis = lsa_service.run_lsa(hypotheses[0], model_configurations[0])
+        hypotheses, model_configurations = self._prepare_model_configurations(x0_values, connectivity)
+        lsa_service_partial = LSAService(eigen_vectors_number=eigen_vectors_number, eigen_solver="partial",
+                                         **lsa_service_kwargs)
+        lsa_hypothesis_partial = lsa_service_partial.run_lsa(hypotheses[0], model_configurations[0])
+        assert lsa_service_partial.eigen_values.shape == (eigen_vectors_number,)
+        assert numpy.allclose(lsa_service.eigen_values[:eigen_vectors_number], lsa_service_partial.eigen_values)
+        return lsa_hypothesis, lsa_hypothesis_partial
+
+    def test_run_lsa_partial_eigen_solver(self):
+        self._assert_run_lsa_partial([0.8], 5)
+        # The propagation strength of a single eigenvector does not depend on its sign
+        lsa_hypothesis, lsa_hypothesis_partial = self._assert_run_lsa_partial([0.8], 1)
+        assert numpy.allclose(lsa_hypothesis.lsa_propagation_strengths,
+                              lsa_hypothesis_partial.lsa_propagation_strengths)
+
+    def test_run_lsa_partial_eigen_solver_2D(self):
+        self._assert_run_lsa_partial([1.2], 3, lsa_method="2D")
+
+    def test_select_eigen_solver(self):
+        hypotheses, model_configurations = self._prepare_model_configurations([0.8])
+        # Small connectomes are decomposed densely in "auto" mode
+        assert LSAService(eigen_vectors_number=1, eigen_solver="auto"). \
+                   _select_eigen_solver(hypotheses[0], model_configurations[0])[0] == "dense"
+        assert LSAService(eigen_vectors_number=1, eigen_solver="partial"). \
+                   _select_eigen_solver(hypotheses[0], model_configurations[0]) == ("partial", 1)
+        # All eigenvalues are needed for their automatic selection
+        assert LSAService(eigen_vectors_number_selection="auto_eigenvals", eigen_solver="partial"). \
+                   _select_eigen_solver(hypotheses[0], model_configurations[0])[0] == "dense"
@@ -0,0 +1,83 @@
+# coding=utf-8
+
+import numpy
+from tvb_epilepsy.base.computations.equilibrium_computation import calc_eq_x1, calc_eq_x1_batch, \
+    eq_x1_hypo_x0_optimize, eq_x1_hypo_x0_optimize_batch
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestModelConfigurationBuilder(BaseTest):
+    x0_indices = [0, 5, 10]
+    e_indices = [20, 30]
+    e_hypo_values = [0.9, 0.95]
+
+    def _prepare_x0_samples(self, n_regions, n_samples):
+        x0_values = numpy.tile(ModelConfigurationBuilder(n_regions).x0_values, (n_samples, 1))
+        x0_values[:, self.x0_indices] = numpy.random.RandomState(0).uniform(0.3, 0.95, (n_samples, 3))
+        return x0_values
+
+    def _build_hypothesis(self, n_regions, x0_values):
+        return HypothesisBuilder(n_regions).set_x0_hypothesis(self.x0_indices, list(x0_values)). \
+            set_e_hypothesis(self.e_indices, self.e_hypo_values).build_hypothesis()
+
+    def test_eq_x1_hypo_x0_optimize_batch(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        n_regions = connectivity.number_of_regions
+        builder = ModelConfigurationBuilder(n_regions)
+        x0_indices = numpy.delete(numpy.arange(n_regions), self.e_indices)
+        x0 = builder._compute_model_x0(self._prepare_x0_samples(n_regions, 4))
+        x1eq, zeq = builder._compute_x1_and_z_equilibrium_from_E(builder.e_values * numpy.ones(x0.shape))
+        e_mask = numpy.zeros(x0.shape, dtype="bool")
+        e_mask[:, self.e_indices] = True
+        x1eq_batch, x0_batch = eq_x1_hypo_x0_optimize_batch(e_mask, x1eq, zeq, x0, builder.K,
+                                                            connectivity.normalized_weights, builder.yc,
+                                                            builder.Iext1, builder.a, builder.b, builder.d,
+                                                            builder.slope)
+        for i_sample in range(x0.shape[0]):
+            x1eq_loop, x0_loop = eq_x1_hypo_x0_optimize(x0_indices, self.e_indices, x1eq[i_sample], zeq[i_sample],
+                                                        x0[i_sample, x0_indices], builder.K * numpy.ones(n_regions),
+                                                        connectivity.normalized_weights, builder.yc, builder.Iext1,
+                                                        builder.a, builder.b, builder.d, builder.slope)
+            assert numpy.allclose(x1eq_batch[i_sample], x1eq_loop, atol=1e-5)
+            assert numpy.allclose(x0_batch[i_sample, self.e_indices], x0_loop, atol=1e-5)
+
+    def test_calc_eq_x1_batch(self):
+        weights = self.dummy_connectivity.normalized_weights
+        # A moderate coupling, for which the least squares solver of calc_eq_x1 converges, too
+        builder = ModelConfigurationBuilder(3, K=3.0)
+        builder._normalize_global_coupling()
+        x0 = numpy.random.RandomState(0).uniform(-3.0, -2.0, (5, 3))
+        x1eq = calc_eq_x1_batch(builder.yc, builder.Iext1, x0, builder.K, weights, builder.a, builder.b, builder.d)
+        for i_sample in range(x0.shape[0]):
+            assert numpy.allclose(x1eq[i_sample], calc_eq_x1(builder.yc, builder.Iext1, x0[i_sample], builder.K,
+                                                             weights, builder.a, builder.b, builder.d).flatten())
+
+    def test_build_models_from_hypothesis_batch(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        n_regions = connectivity.number_of_regions
+        x0_values = self._prepare_x0_samples(n_regions, 5)
+        model_configurations = ModelConfigurationBuilder(n_regions).build_models_from_hypothesis_batch(
+            self._build_hypothesis(n_regions, x0_values[0, self.x0_indices]), connectivity.normalized_weights,
+            x0_values=x0_values)
+        assert len(model_configurations) == x0_values.shape[0]
+        for i_sample, model_configuration_batch in enumerate(model_configurations):
+            model_configuration = ModelConfigurationBuilder(n_regions).build_model_from_hypothesis(
+                self._build_hypothesis(n_regions, x0_values[i_sample, self.x0_indices]),
+                connectivity.normalized_weights)
+            for attribute in ["x1eq", "zeq", "Ceq", "x0", "x0_values", "e_values", "K"]:
+                assert numpy.allclose(getattr(model_configuration, attribute),
+                                      getattr(model_configuration_batch, attribute), atol=1e-4)
+
+    def test_build_models_from_hypothesis_batch_K(self):
+        n_regions = self.dummy_connectivity.number_of_regions
+        hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([0], [0.8]).build_hypothesis()
+        K_unscaled = [5.0, 10.0]
+        model_configurations = ModelConfigurationBuilder(n_regions).build_models_from_hypothesis_batch(
+            hypothesis, self.dummy_connectivity.normalized_weights, K_unscaled=K_unscaled)
+        for K, model_configuration_batch in zip(K_unscaled, model_configurations):
+            model_configuration = ModelConfigurationBuilder(n_regions, K=K).build_model_from_hypothesis(
+                hypothesis, self.dummy_connectivity.normalized_weights)
+            assert numpy.allclose(model_configuration.x1eq, model_configuration_batch.x1eq, atol=1e-5)
+            assert numpy.allclose(model_configuration.K, model_configuration_batch.K)
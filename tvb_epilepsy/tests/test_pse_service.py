@@ -0,0 +1,204 @@
+# coding=utf-8
+
+import os
+import numpy
+from tvb_epilepsy.base.datatypes.parameter_overlay import ParameterOverlay
+from tvb_epilepsy.base.model.timeseries import Timeseries
+from tvb_epilepsy.io.h5_reader import H5Reader
+from tvb_epilepsy.io.h5_writer import H5Writer
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.lsa_service import LSAService
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.pse.lsa_pse_service import LSAPSEService
+from tvb_epilepsy.service.pse.simulation_pse_service import SimulationPSEService
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestPSEService(BaseTest):
+    n_samples = 6
+
+    def _prepare_lsa_pse(self, n_workers, checkpoint_path=None):
+        connectivity = self._prepare_dummy_head().connectivity
+        n_regions = connectivity.number_of_regions
+        hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([20], [0.9]). \
+            set_e_hypothesis([70], [0.9]).build_hypothesis()
+        model_configuration_builder = ModelConfigurationBuilder(n_regions)
+        model_configuration = model_configuration_builder.build_model_from_hypothesis(
+            hypothesis, connectivity.normalized_weights)
+        lsa_service = LSAService(eigen_vectors_number=5)
+        lsa_hypothesis = lsa_service.run_lsa(hypothesis, model_configuration)
+        params_pse = [{"path": "hypothesis.x0_values", "indices": [0],
+                       "samples": numpy.linspace(0.5, 0.9, self.n_samples)},
+                      {"path": "hypothesis.e_values", "indices": [0],
+                       "samples": numpy.linspace(0.5, 0.9, self.n_samples)}]
+        pse = LSAPSEService(hypothesis=lsa_hypothesis, params_pse=params_pse, n_workers=n_workers,
+                            checkpoint_path=checkpoint_path)
+        return pse, connectivity.normalized_weights, model_configuration_builder, lsa_service
+
+    def test_run_pse_parallel(self):
+        pse, weights, model_configuration_builder, lsa_service = self._prepare_lsa_pse(n_workers=2)
+        results, status = pse.run_pse(weights, False, model_configuration_builder, lsa_service)
+        results_parallel, status_parallel = pse.run_pse_parallel(weights, False, model_configuration_builder,
+                                                                 lsa_service)
+        assert len(results_parallel) == self.n_samples
+        assert all(status_parallel) and status_parallel == status
+        for result, result_parallel in zip(results, results_parallel):
+            assert numpy.allclose(result["lsa_propagation_strengths"],
+                                  result_parallel["lsa_propagation_strengths"])
+            assert numpy.allclose(result["x0_values"], result_parallel["x0_values"])
+
+    def test_run_pse_parallel_chunks(self):
+        pse, weights, model_configuration_builder, lsa_service = self._prepare_lsa_pse(n_workers=3)
+        pse.chunksize = 4
+        results, status = pse.run_pse_parallel(weights, False, model_configuration_builder, lsa_service)
+        assert all(status)
+        for x0_value, result in zip(pse.params_vals[:, 0], results):
+            assert numpy.allclose(result["x0_values"][20], x0_value)
+
+    def test_parameter_overlay(self):
+        n_regions = self._prepare_dummy_head().connectivity.number_of_regions
+        hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([1, 2], [0.8, 0.9]).build_hypothesis()
+        x0_values = numpy.array(hypothesis.x0_values)
+        overlay = ParameterOverlay(hypothesis)
+        overlay.set_parameter("x0_values", 0.5, [1])
+        assert isinstance(overlay, hypothesis.__class__)
+        assert numpy.allclose(overlay.x0_values, [0.8, 0.5])
+        assert numpy.allclose(overlay.regions_disease[:3], [0.0, 0.8, 0.5])
+        assert overlay.overlay_paths == ["x0_values"]
+        # The base object is left intact and can not be modified in place through the overlay
+        assert numpy.allclose(hypothesis.x0_values, x0_values)
+        try:
+            ParameterOverlay(hypothesis).x0_values[0] = 1.0
+            assert False
+        except ValueError:
+            pass
+        assert numpy.allclose(overlay.materialize().x0_values, [0.8, 0.5])
+
+    def test_run_pse_overlay(self):
+        pse, weights, model_configuration_builder, lsa_service = self._prepare_lsa_pse(n_workers=1)
+        x0_values = numpy.array(pse.hypothesis.x0_values)
+        K = numpy.array(model_configuration_builder.K)
+        results, status = pse.run_pse(weights, False, model_configuration_builder, lsa_service)
+        assert all(status)
+        assert numpy.allclose(pse.hypothesis.x0_values, x0_values)
+        assert numpy.allclose(model_configuration_builder.K, K)
+        for x0_value, result in zip(pse.params_vals[:, 0], results):
+            assert numpy.allclose(result["x0_values"][20], x0_value)
+
+    def test_run_pse_checkpoint(self):
+        checkpoint_path = os.path.join(self.config.out.FOLDER_TEMP, "test_pse_checkpoint.h5")
+        pse, weights, model_configuration_builder, lsa_service = self._prepare_lsa_pse(n_workers=1,
+                                                                                       checkpoint_path=checkpoint_path)
+        results, status = pse.run_pse(weights, False, model_configuration_builder, lsa_service)
+
+        # Interrupt a PSE after 2 loops, and then resume it
+        pse_resumed = self._prepare_lsa_pse(n_workers=1, checkpoint_path=checkpoint_path + "_resumed")[0]
+        run = pse_resumed.run
+        executed_loops = []
+
+        def interrupted_run(params, *args):
+            if len(executed_loops) == 2:
+                raise KeyboardInterrupt
+            executed_loops.append(params)
+            return run(params, *args)
+
+        pse_resumed.run = interrupted_run
+        try:
+            pse_resumed.run_pse(weights, False, model_configuration_builder, lsa_service)
+            assert False
+        except KeyboardInterrupt:
+            pass
+        assert numpy.sum(H5Reader().read_pse_checkpoint(checkpoint_path + "_resumed")[1]) == 2
+        del pse_resumed.run
+        pse_resumed.n_workers = 2
+        results_resumed, status_resumed = pse_resumed.run_pse_parallel(weights, False, model_configuration_builder,
+                                                                       lsa_service)
+        assert all(status_resumed)
+        for result, result_resumed in zip(results, results_resumed):
+            for key in result.keys():
+                assert numpy.allclose(result[key], result_resumed[key])
+
+        # Resuming a completed PSE only reads its results
+        pse_resumed.run = None
+        results_resumed = pse_resumed.run_pse(weights, False, model_configuration_builder, lsa_service)[0]
+        assert numpy.allclose(results[-1]["lsa_propagation_strengths"],
+                              results_resumed[-1]["lsa_propagation_strengths"])
+
+        # A checkpoint of different samples can not be resumed
+        pse.params_vals = pse.params_vals[::-1]
+        try:
+            pse.run_pse(weights, False, model_configuration_builder, lsa_service)
+            assert False
+        except ValueError:
+            pass
+
+    def test_pse_checkpoint_outputs(self):
+        checkpoint_path = os.path.join(self.config.out.FOLDER_TEMP, "test_pse_checkpoint_outputs.h5")
+        pse = self._prepare_lsa_pse(n_workers=1)[0]
+        writer = H5Writer()
+        checkpoint = writer.open_pse_checkpoint(pse, checkpoint_path)
+        # Outputs of different shapes, strings, and objects that can not be written in H5
+        writer.write_pse_checkpoint_loop(checkpoint, 0, True, {"x": numpy.ones((3,)), "name": "loop0"})
+        writer.write_pse_checkpoint_loop(checkpoint, 1, True, numpy.ones((3,)))
+        writer.write_pse_checkpoint_loop(checkpoint, 2, True, numpy.ones((4,)))
+        writer.write_pse_checkpoint_loop(checkpoint, 3, True, {"x": numpy.zeros((2, 2))})
+        writer.write_pse_checkpoint_loop(checkpoint, 4, True, {"x": object()})
+        writer.write_pse_checkpoint_loop(checkpoint, 5, False, None)
+        checkpoint.close()
+        results, completed = H5Reader().read_pse_checkpoint(checkpoint_path)
+        assert completed.tolist() == [True, True, True, True, False, False]
+        assert numpy.allclose(results[0]["x"], numpy.ones((3,))) and results[0]["name"] == "loop0"
+        assert numpy.allclose(results[1], numpy.ones((3,)))
+        assert numpy.allclose(results[2], numpy.ones((4,)))
+        assert numpy.allclose(results[3]["x"], numpy.zeros((2, 2)))
+        assert results[4] is None and results[5] is None
+
+    def _prepare_simulation_pse(self, n_samples, checkpoint_path=None):
+        connectivity = self._prepare_dummy_head().connectivity
+        n_regions = connectivity.number_of_regions
+        hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([20], [0.9]).build_hypothesis()
+        model_configuration_builder = ModelConfigurationBuilder(n_regions)
+        model_configuration = model_configuration_builder.build_model_from_hypothesis(
+            hypothesis, connectivity.normalized_weights)
+        simulator = SimulatorBuilder("numpy").set_model_name("EpileptorDP2D").set_simulated_period(20.0). \
+            build_simulator(model_configuration, connectivity)[0]
+        params_pse = [{"path": "hypothesis.x0_values", "indices": [0],
+                       "samples": numpy.linspace(0.5, 0.9, n_samples)},
+                      {"path": "model.tau1", "samples": numpy.linspace(0.5, 1.0, n_samples)}]
+        pse = SimulationPSEService(simulator, params_pse=params_pse, checkpoint_path=checkpoint_path)
+        return pse, connectivity, hypothesis, model_configuration_builder
+
+    def test_run_simulation_pse_checkpoint(self):
+        checkpoint_path = os.path.join(self.config.out.FOLDER_TEMP, "test_simulation_pse_checkpoint.h5")
+        pse, connectivity, hypothesis, model_configuration_builder = \
+            self._prepare_simulation_pse(2, checkpoint_path)
+        results, status = pse.run_pse(connectivity.normalized_weights, False, hypothesis,
+                                      model_configuration_builder)
+        assert all(status)
+        # Resuming the completed PSE only reads its Timeseries outputs
+        pse.run = None
+        results_resumed, status_resumed = pse.run_pse(connectivity.normalized_weights, False, hypothesis,
+                                                      model_configuration_builder)
+        assert all(status_resumed)
+        for result, result_resumed in zip(results, results_resumed):
+            assert isinstance(result_resumed, Timeseries)
+            assert result_resumed.shape == result.shape
+            assert numpy.allclose(result_resumed.data, result.data)
+            assert numpy.allclose(result_resumed.time_line, result.time_line)
+            assert list(result_resumed.space_labels) == list(result.space_labels)
+            assert list(result_resumed.variables_labels) == list(result.variables_labels)
+
+    def test_run_ensemble(self):
+        n_samples = 3
+        pse, connectivity, hypothesis, model_configuration_builder = self._prepare_simulation_pse(n_samples)
+        output, status = pse.run_ensemble(connectivity.normalized_weights, hypothesis, model_configuration_builder)
+        assert all(status) and len(status) == n_samples
+        assert output.number_of_samples == n_samples
+        # Each sample of the ensemble is identical to its own simulation
+        for i_sample, params in enumerate(pse.params_vals):
+            status, output_sample = pse.run(params, connectivity.normalized_weights, hypothesis,
+                                            model_configuration_builder)
+            assert status
+            assert numpy.allclose(output.data[:, :, :, i_sample], output_sample.data[:, :, :, 0])
+        assert not numpy.allclose(output.data[:, :, :, 0], output.data[:, :, :, -1])
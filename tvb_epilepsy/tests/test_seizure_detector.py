@@ -0,0 +1,67 @@
+# coding=utf-8
+
+import numpy
+import pytest
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.simulator.seizure_detector import SeizureDetector
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestSeizureDetector(BaseTest):
+
+    def _build_simulator(self, simulator, fs=2048.0, simulated_period=2000.0):
+        connectivity = self._prepare_dummy_head().connectivity
+        hypothesis = HypothesisBuilder(connectivity.number_of_regions).set_x0_hypothesis([0, 5], [5.0, 0.5]). \
+            build_hypothesis()
+        model_configuration = ModelConfigurationBuilder(connectivity.number_of_regions). \
+            build_model_from_hypothesis(hypothesis, connectivity.normalized_weights)
+        return SimulatorBuilder(simulator).set_model_name("EpileptorDP2D").set_fs(fs). \
+            set_simulated_period(simulated_period).build_simulator(model_configuration, connectivity)[0]
+
+    def test_update(self):
+        # Two regions, of which the first one seizes at time 10, spikes below threshold at time 20,
+        # and ends its seizure at time 50, while z starts decreasing
+        time = numpy.arange(0.0, 300.0, 10.0)
+        x1 = -1.5 * numpy.ones((time.size, 2))
+        x1[1:5, 0] = 0.5
+        x1[3, 0] = -1.0
+        z = 3.0 * numpy.ones((time.size, 2))
+        z[1:5, 0] = 3.0 + 0.1 * numpy.arange(4)
+        z[5:, 0] = 3.3 - 0.01 * numpy.arange(time.size - 5)
+        data = numpy.stack([x1, z], axis=2)[:, :, :, numpy.newaxis]
+        detector = SeizureDetector(min_offset_interval=100.0)
+        detector.open(["x1", "z"], data.shape[1:])
+        for t, sample in zip(time, data):
+            assert not detector.update(t, sample)
+        assert numpy.allclose(detector.onsets[0], 10.0)
+        assert numpy.allclose(detector.offsets[0], 50.0)
+        assert numpy.all(numpy.isnan(detector.onsets[1])) and numpy.all(numpy.isnan(detector.offsets[1]))
+        assert detector.number_of_seizures[:, 0].tolist() == [1, 0]
+        assert not numpy.any(detector.in_seizure)
+
+    def test_missing_x1(self):
+        with pytest.raises(ValueError):
+            SeizureDetector().open(["z", "x2"], (2, 2, 1))
+
+    def test_stop_if_all_seized(self):
+        simulator = self._build_simulator("numpy")
+        detector = SeizureDetector(regions_of_interest=[0], stop_if_all_seized=True)
+        ts, status = simulator.launch_simulation(seizure_detector=detector)
+        assert status
+        assert detector.stop_time is not None
+        assert numpy.allclose(detector.stop_time, detector.onsets[0, 0])
+        assert ts.time_length < int(numpy.round(2000.0 / ts.time_step))
+        assert numpy.allclose(ts.time_start + (ts.time_length - 1) * ts.time_step, detector.stop_time)
+        assert ts.data[-1, 0, 0, 0] > detector.x1_threshold
+
+    def test_stop_if_no_seizure_by(self):
+        for simulator_type in ["numpy", "tvb"]:
+            simulator = self._build_simulator(simulator_type, fs=4096.0)
+            detector = SeizureDetector(regions_of_interest=[1, 2], stop_if_no_seizure_by=50.0)
+            ts, status = simulator.launch_simulation(seizure_detector=detector)
+            assert status
+            assert detector.stop_reason.startswith("no seizure")
+            assert 50.0 <= detector.stop_time < 50.0 + ts.time_step
+            assert numpy.allclose(ts.time_start + (ts.time_length - 1) * ts.time_step, detector.stop_time)
@@ -2,7 +2,9 @@
 
 import os
 import numpy as np
+from tvb_epilepsy.base.model.timeseries import H5Timeseries
 from tvb_epilepsy.io.h5_reader import H5Reader
+from tvb_epilepsy.service.simulator.simulation_output_sink import ArrayOutputSink, H5OutputSink
 from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
 from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
 from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
@@ -38,6 +40,46 @@ class TestSimulationRun(BaseTest):
         ts, status = simulator.launch_simulation(100)
         assert status
 
+    def _build_dummy_tvb_simulator(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        hypothesis = HypothesisBuilder(connectivity.number_of_regions).set_x0_hypothesis([0, 5], [0.95, 0.9]). \
+            build_hypothesis()
+        model_configuration = ModelConfigurationBuilder(connectivity.number_of_regions).build_model_from_hypothesis(
+            hypothesis, connectivity.normalized_weights)
+        simulator_builder = SimulatorBuilder().set_model_name(self.epileptor_model).set_fs(4096.0). \
+            set_simulated_period(self.time_length)
+        return simulator_builder.build_simulator(model_configuration, connectivity)[0]
+
+    def test_tvb_simulation_output_sinks(self):
+        ts, status = self._build_dummy_tvb_simulator().launch_simulation(self.report_every_n_monitor_steps)
+        assert status
+        assert ts.data.dtype == np.float32
+        assert np.all(np.isfinite(ts.data))
+        assert ts.shape == (30, 76, 2, 1)
+        assert np.allclose(ts.time_step, 1000.0 / 1024)
+
+        ts_array, status = self._build_dummy_tvb_simulator().launch_simulation(output_sink=ArrayOutputSink())
+        assert status
+        assert np.array_equal(ts.data, ts_array.data)
+
+        path = os.path.join(self.config.out.FOLDER_TEMP, "test_simulation_output_sink.h5")
+        ts_path, status = self._build_dummy_tvb_simulator().launch_simulation(
+            output_sink=H5OutputSink(path, block_length=7))
+        assert status and ts_path == path
+        ts_h5 = H5Reader().read_timeseries(path)
+        assert np.array_equal(ts.data, ts_h5.data)
+        assert np.allclose(ts.time_start, ts_h5.time_start)
+        assert np.allclose(ts.time_step, ts_h5.time_step)
+        assert list(ts_h5.space_labels) == list(ts.space_labels)
+        assert list(ts_h5.variables_labels) == list(ts.variables_labels)
+
+        path = os.path.join(self.config.out.FOLDER_TEMP, "test_simulation_output_sink_lazy.h5")
+        ts_lazy, status = self._build_dummy_tvb_simulator().launch_simulation(
+            output_sink=H5OutputSink(path, block_length=7, lazy=True))
+        assert status and isinstance(ts_lazy, H5Timeseries)
+        assert np.array_equal(ts.data, ts_lazy.get_time_window(0, ts.time_length).load().data)
+        ts_lazy.close()
+
     # This can be ran only locally for the moment
 
     # def test_custom_simulation(self):
@@ -0,0 +1,104 @@
+# coding=utf-8
+
+import os
+import time
+import numpy
+import pytest
+from tvb.datatypes.projections import ProjectionSurfaceSEEG
+from tvb.datatypes.sensors import SensorsInternal
+from tvb.simulator.monitors import iEEG
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.simulator.simulation_cache import SimulationCache
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestSimulationCache(BaseTest):
+
+    def _build_simulator(self, x0_value=0.9, simulator="numpy"):
+        connectivity = self._prepare_dummy_head().connectivity
+        hypothesis = HypothesisBuilder(connectivity.number_of_regions).set_x0_hypothesis([0], [x0_value]). \
+            build_hypothesis()
+        model_configuration = ModelConfigurationBuilder(connectivity.number_of_regions).build_model_from_hypothesis(
+            hypothesis, connectivity.normalized_weights)
+        return SimulatorBuilder(simulator).set_model_name("EpileptorDP2D").set_simulated_period(20.0). \
+            build_simulator(model_configuration, connectivity)[0]
+
+    def test_launch_simulation(self):
+        cache = SimulationCache(self.config.out.FOLDER_TEMP)
+        simulator = self._build_simulator()
+        key = cache.get_key(simulator)
+        output, status = cache.launch_simulation(simulator)
+        assert status
+        assert cache.misses == 1 and cache.hits == 0
+        assert os.path.isfile(cache.get_file_path(key))
+        # An identical simulation is loaded from the cache
+        output_cached, status = cache.launch_simulation(self._build_simulator())
+        assert status
+        assert cache.misses == 1 and cache.hits == 1
+        assert numpy.array_equal(output.data, output_cached.data)
+        assert numpy.allclose(output.time_start, output_cached.time_start)
+        assert numpy.allclose(output.time_step, output_cached.time_step)
+        assert list(output_cached.variables_labels) == list(output.variables_labels)
+        os.remove(cache.get_file_path(key))
+
+    def test_get_key(self):
+        cache = SimulationCache(self.config.out.FOLDER_TEMP)
+        key = cache.get_key(self._build_simulator())
+        assert cache.get_key(self._build_simulator()) == key
+        assert cache.get_key(self._build_simulator(x0_value=0.8)) != key
+        simulator = self._build_simulator()
+        simulator.model.tau1 = 0.5
+        assert cache.get_key(simulator) != key
+        simulator = self._build_simulator()
+        simulator.simulation_settings.noise_seed += 1
+        assert cache.get_key(simulator) != key
+        simulator = self._build_simulator()
+        simulator.simulation_settings.simulated_period += 1.0
+        assert cache.get_key(simulator) != key
+
+    def test_unhashable_description(self):
+        cache = SimulationCache(self.config.out.FOLDER_TEMP)
+        simulator = self._build_simulator()
+        simulator.simulation_settings.unhashable = object()
+        with pytest.raises(ValueError):
+            cache.get_key(simulator)
+        # The simulation is launched, but not cached
+        output, status = cache.launch_simulation(simulator)
+        assert status and output is not None
+        assert cache.misses == 0 and cache.hits == 0
+
+    def test_get_key_monitors(self):
+        cache = SimulationCache(self.config.out.FOLDER_TEMP)
+        simulator = self._build_simulator(simulator="tvb")
+        n_sensors = 3
+        n_regions = simulator.connectivity.number_of_regions
+        keys = []
+        for labels, gain in [(["A1", "A2", "A3"], numpy.ones((n_sensors, n_regions))),
+                             (["B1", "B2", "B3"], numpy.ones((n_sensors, n_regions))),
+                             (["A1", "A2", "A3"], 2 * numpy.ones((n_sensors, n_regions)))]:
+            sensors = SensorsInternal(labels=numpy.array(labels), locations=numpy.zeros((n_sensors, 3)))
+            simulator.simTVB.monitors = [iEEG(period=simulator.simTVB.monitors[0].period, sensors=sensors,
+                                              projection=ProjectionSurfaceSEEG(sensors=sensors,
+                                                                               projection_data=gain))]
+            keys.append(cache.get_key(simulator))
+        assert len(set(keys)) == 3
+
+    def test_evict(self):
+        simulator = self._build_simulator()
+        output = simulator.launch_simulation()[0]
+        cache = SimulationCache(self.config.out.FOLDER_TEMP, max_size=None)
+        for key in ["a", "b"]:
+            cache.put(key, output)
+        file_size = os.path.getsize(cache.get_file_path("a"))
+        # Use "a" later than "b", so that "b" is the least recently used one
+        time.sleep(0.01)
+        assert cache.get("a") is not None
+        cache.max_size = 2.5 * file_size
+        cache.put("c", output)
+        assert cache.evictions == 1
+        assert not os.path.isfile(cache.get_file_path("b"))
+        for key in ["a", "c"]:
+            assert os.path.isfile(cache.get_file_path(key))
+            os.remove(cache.get_file_path(key))
@@ -0,0 +1,106 @@
+# coding=utf-8
+
+import os
+import sys
+import time
+import numpy
+import pytest
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.simulator.simulator_java import SimulatorJava
+from tvb_epilepsy.service.simulator.simulator_java_runner import SimulatorJavaRunner
+from tvb_epilepsy.tests.base import BaseTest
+
+# A stand-in of the Java simulation main, which writes the results of each configuration file
+# to <output folder>/<configuration name>/ts.h5, in the layout of the Java simulator
+SIMULATION_SCRIPT = """
+import os
+import sys
+import json
+import time
+import h5py
+import numpy
+time.sleep(float(os.environ.get("SIMULATION_SLEEP", 0.0)))
+for json_config_path in sys.argv[1:-1]:
+    config = json.load(open(json_config_path))
+    folder = os.path.join(sys.argv[-1], config["configurationName"])
+    os.makedirs(folder)
+    h5_file = h5py.File(os.path.join(folder, "ts.h5"), "w")
+    h5_file.create_dataset("data", data=numpy.ones((10, 6)))
+    h5_file["/"].attrs["Simulated_period"] = [config["settings"]["simulated_period"]]
+    h5_file["/data"].attrs["Number_of_steps"] = [10]
+    h5_file["/data"].attrs["Start_time"] = [0.0]
+    h5_file.close()
+"""
+
+
+class ScriptSimulatorJavaRunner(SimulatorJavaRunner):
+    # The script simulates any number of configuration files
+    max_batch_size = None
+
+    def __init__(self, script_path, **kwargs):
+        super(ScriptSimulatorJavaRunner, self).__init__(**kwargs)
+        self.script_path = script_path
+        self.n_commands = 0
+
+    def get_command(self, json_config_paths, output_path):
+        self.n_commands += 1
+        return [sys.executable, self.script_path] + json_config_paths + [output_path]
+
+
+class TestSimulatorJavaRunner(BaseTest):
+
+    def _build_simulators(self, simulated_periods):
+        connectivity = self._prepare_dummy_head().connectivity
+        hypothesis = HypothesisBuilder(connectivity.number_of_regions).set_x0_hypothesis([0], [0.9]). \
+            build_hypothesis()
+        model_configuration = ModelConfigurationBuilder(connectivity.number_of_regions). \
+            build_model_from_hypothesis(hypothesis, connectivity.normalized_weights)
+        return [SimulatorBuilder("java").set_simulated_period(simulated_period).
+                build_simulator(model_configuration, connectivity)[0] for simulated_period in simulated_periods]
+
+    def _write_script(self):
+        if not os.path.isdir(self.config.out.FOLDER_TEMP):
+            os.makedirs(self.config.out.FOLDER_TEMP)
+        script_path = os.path.join(self.config.out.FOLDER_TEMP, "java_simulation.py")
+        with open(script_path, "w") as script_file:
+            script_file.write(SIMULATION_SCRIPT)
+        return script_path
+
+    def test_run(self):
+        simulated_periods = [100.0, 200.0, 300.0, 400.0, 500.0]
+        simulators = self._build_simulators(simulated_periods)
+        for batch_size, n_commands in [(1, 5), (2, 3)]:
+            runner = ScriptSimulatorJavaRunner(self._write_script(), n_processes=2, batch_size=batch_size,
+                                               temp_folder=self.config.out.FOLDER_TEMP)
+            results = runner.run(simulators)
+            assert runner.n_commands == n_commands
+            for (ts_time, data, status), simulated_period in zip(results, simulated_periods):
+                assert status
+                assert data.shape == (10, 6)
+                assert numpy.allclose(ts_time[-1], simulated_period)
+        # The temporary folders are removed
+        assert not any([folder.startswith("java_simulations_") for folder in os.listdir(self.config.out.FOLDER_TEMP)])
+
+    def test_batch_size(self):
+        # The Java simulation main takes a single configuration file
+        with pytest.raises(ValueError):
+            SimulatorJavaRunner(batch_size=2)
+        with pytest.raises(ValueError):
+            SimulatorJava.get_launch_command(["a.json", "b.json"], self.config.out.FOLDER_TEMP)
+        assert SimulatorJavaRunner(batch_size=1).get_command(["a.json"], self.config.out.FOLDER_TEMP)[-2] == \
+               os.path.abspath("a.json")
+
+    def test_timeout(self):
+        simulators = self._build_simulators([100.0, 200.0])
+        runner = ScriptSimulatorJavaRunner(self._write_script(), n_processes=2, timeout=0.5,
+                                           temp_folder=self.config.out.FOLDER_TEMP)
+        os.environ["SIMULATION_SLEEP"] = "30"
+        try:
+            start = time.time()
+            results = runner.run(simulators)
+        finally:
+            del os.environ["SIMULATION_SLEEP"]
+        assert time.time() - start < 10.0
+        assert [status for _, _, status in results] == [False, False]
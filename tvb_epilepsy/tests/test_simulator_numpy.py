@@ -0,0 +1,119 @@
+# coding=utf-8
+
+import numpy
+import pytest
+from tvb.simulator.monitors import SubSample
+from tvb.simulator.noise import Additive
+from tvb_epilepsy.base.constants.model_constants import NOISE_SEED
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.epileptor_model_factory import model_noise_intensity_dict
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.simulator.simulator_numpy import SimulatorNumpy
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestSimulatorNumpy(BaseTest):
+    simulated_period = 50.0
+    fs = 16384.0
+
+    def _prepare_model_configuration(self, connectivity):
+        hypothesis = HypothesisBuilder(connectivity.number_of_regions).set_x0_hypothesis([0, 5], [0.95, 0.9]). \
+            build_hypothesis()
+        return ModelConfigurationBuilder(connectivity.number_of_regions).build_model_from_hypothesis(
+            hypothesis, connectivity.normalized_weights)
+
+    def _build_simulator(self, simulator, model_name, connectivity, noise_scale=1.0, **kwargs):
+        model_configuration = self._prepare_model_configuration(connectivity)
+        builder = SimulatorBuilder(simulator).set_model_name(model_name).set_fs(self.fs). \
+            set_simulated_period(self.simulated_period)
+        model = builder.generate_model_tvb(model_configuration)
+        sim_settings = builder.build_sim_settings()
+        sim_settings.noise_intensity = noise_scale * numpy.array(sim_settings.noise_intensity)
+        return builder.build_simulator_from_model_sim_settings(model_configuration, connectivity, model,
+                                                               sim_settings, **kwargs)[0]
+
+    def test_simulation(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        for model_name in ["EpileptorDP2D", "EpileptorDP", "EpileptorDPrealistic"]:
+            simulator = self._build_simulator("numpy", model_name, connectivity)
+            assert isinstance(simulator, SimulatorNumpy)
+            ts, status = simulator.launch_simulation()
+            assert status
+            istep = int(numpy.round(simulator.monitor_period / simulator.dt))
+            n_times = int(numpy.ceil(self.simulated_period * self.fs / 1000.0)) / istep
+            assert ts.shape == (n_times, connectivity.number_of_regions,
+                                len(simulator.simulation_settings.monitor_expressions), 1)
+            assert ts.dimension_labels[ts.dimensions.VARIABLES.value] == simulator.get_vois()
+            assert numpy.allclose(ts.time_step, 1000.0 / self.fs * istep)
+            assert numpy.all(numpy.isfinite(ts.data))
+
+    def test_simulation_matches_tvb(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        for model_name in ["EpileptorDP2D", "EpileptorDP"]:
+            ts = {}
+            for simulator in ["tvb", "numpy"]:
+                ts[simulator] = self._build_simulator(simulator, model_name, connectivity, noise_scale=0.0). \
+                    launch_simulation(10)[0]
+            assert ts["tvb"].shape == ts["numpy"].shape
+            assert numpy.allclose(ts["tvb"].time_start, ts["numpy"].time_start)
+            assert numpy.allclose(ts["tvb"].data, ts["numpy"].data, atol=1e-4)
+
+    def test_stochastic_simulation(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        data = {}
+        for integrator in ["EulerStochastic", "HeunStochastic"]:
+            runs = [self._build_simulator("numpy", "EpileptorDP2D", connectivity, noise_scale=100.0,
+                                          integrator=integrator).launch_simulation()[0].data for _ in range(2)]
+            # The noise is reproducible, given the noise seed of the simulation settings
+            assert numpy.array_equal(runs[0], runs[1])
+            data[integrator] = runs[0]
+        deterministic = self._build_simulator("numpy", "EpileptorDP2D", connectivity, noise_scale=0.0,
+                                              integrator="HeunDeterministic").launch_simulation()[0].data
+        assert not numpy.allclose(data["HeunStochastic"], deterministic, rtol=0.0, atol=1e-6)
+        assert numpy.allclose(data["EulerStochastic"], data["HeunStochastic"], atol=0.1)
+        # Only the intensity of a noise instance is used, and not its random stream
+        noise = Additive(nsig=100.0 * numpy.array(model_noise_intensity_dict["EpileptorDP2D"]),
+                         random_stream=numpy.random.RandomState(seed=NOISE_SEED + 1))
+        simulator = self._build_simulator("numpy", "EpileptorDP2D", connectivity)
+        simulator.config_simulation(noise, integrator="HeunStochastic")
+        noise_run = simulator.launch_simulation()[0].data
+        assert numpy.array_equal(noise_run, data["HeunStochastic"])
+
+    def test_subsample_monitor(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        monitor = SubSample()
+        monitor.period = 1000.0 / self.fs * 2
+        simulator = self._build_simulator("numpy", "EpileptorDP2D", connectivity, monitors=[monitor])
+        assert simulator.monitor_type == "SubSample"
+        ts, status = simulator.launch_simulation()
+        assert status
+        assert ts.time_length == int(numpy.ceil(self.simulated_period * self.fs / 1000.0)) / 2
+        assert numpy.allclose(ts.time_start, monitor.period)
+
+    def test_exponential_integrator(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        heun = self._build_simulator("numpy", "EpileptorDP2D", connectivity, noise_scale=0.0,
+                                     integrator="HeunDeterministic").launch_simulation()[0]
+        simulator = self._build_simulator("numpy", "EpileptorDP2D", connectivity, noise_scale=0.0,
+                                          integrator="ExponentialDeterministic", atol=1e-6, rtol=1e-6)
+        ts, status = simulator.launch_simulation()
+        assert status
+        assert ts.shape == heun.shape
+        assert numpy.allclose(ts.time_start, heun.time_start)
+        assert numpy.allclose(ts.time_step, heun.time_step)
+        assert numpy.allclose(ts.data, heun.data, atol=1e-3)
+        # Close to the equilibrium, the adaptive steps are much larger than the integration step
+        assert simulator.integration_statistics["accepted_steps"] < \
+            int(numpy.ceil(self.simulated_period * self.fs / 1000.0)) / 10
+        runs = [self._build_simulator("numpy", "EpileptorDP2D", connectivity, noise_scale=100.0,
+                                      integrator="ExponentialStochastic").launch_simulation()[0].data
+                for _ in range(2)]
+        assert numpy.array_equal(runs[0], runs[1])
+        assert numpy.all(numpy.isfinite(runs[0]))
+        assert not numpy.allclose(runs[0], ts.data, rtol=0.0, atol=1e-6)
+
+    def test_unavailable_integrator(self):
+        connectivity = self._prepare_dummy_head().connectivity
+        with pytest.raises(ValueError):
+            self._build_simulator("numpy", "EpileptorDP2D", connectivity, integrator="Dop853Stochastic")
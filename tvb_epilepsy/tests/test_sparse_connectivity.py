@@ -0,0 +1,98 @@
+# coding=utf-8
+
+import numpy
+from scipy import sparse
+from tvb_epilepsy.base.computations.math_utils import normalize_weights, sparse_percentile
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.base.model.vep.sensors import Sensors
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.lsa_service import LSAService
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.simulation_cache import SimulationCache
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestSparseConnectivity(BaseTest):
+
+    def _prepare_connectivities(self, threshold=0.1):
+        dense = self._prepare_dummy_head().connectivity
+        sparse_connectivity = dense.to_sparse(threshold)
+        return sparse_connectivity.to_dense(), sparse_connectivity
+
+    def _build_model_configurations(self, weights):
+        n_regions = weights[0].shape[0]
+        hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([0, 5], [1.5, 0.8]). \
+            set_e_hypothesis([10], [0.5]).build_hypothesis()
+        return [ModelConfigurationBuilder(n_regions).build_model_from_hypothesis(hypothesis, w) for w in weights], \
+            hypothesis
+
+    def test_to_sparse(self):
+        dense, sparse_connectivity = self._prepare_connectivities()
+        assert sparse_connectivity.is_sparse and not dense.is_sparse
+        assert sparse.isspmatrix_csr(sparse_connectivity.normalized_weights)
+        assert sparse_connectivity.normalized_weights.nnz < 0.5 * dense.number_of_regions ** 2
+        assert numpy.all(dense.normalized_weights[dense.normalized_weights != 0.0] > 0.1)
+        assert numpy.array_equal(sparse_connectivity.weights.indices, sparse_connectivity.tract_lengths.indices)
+
+    def test_normalize_weights(self):
+        weights = self._prepare_dummy_head().connectivity.weights
+        weights = numpy.where(weights > numpy.percentile(weights, 50.0), weights, 0.0)
+        for percentile in [0.0, 50.0, 95.0, 100.0]:
+            assert numpy.allclose(sparse_percentile(sparse.csr_matrix(weights), percentile),
+                                  numpy.percentile(weights, percentile))
+        assert numpy.allclose(normalize_weights(sparse.csr_matrix(weights)).toarray(), normalize_weights(weights))
+
+    def test_model_configuration(self):
+        dense, sparse_connectivity = self._prepare_connectivities()
+        model_configurations = self._build_model_configurations([dense.normalized_weights,
+                                                                 sparse_connectivity.normalized_weights])[0]
+        assert sparse.issparse(model_configurations[1].model_connectivity)
+        for attribute in ["x1eq", "zeq", "Ceq", "x0", "x0_values", "e_values"]:
+            assert numpy.allclose(getattr(model_configurations[0], attribute),
+                                  getattr(model_configurations[1], attribute), rtol=1e-4, atol=1e-5)
+
+    def test_lsa(self):
+        dense, sparse_connectivity = self._prepare_connectivities()
+        model_configurations, hypothesis = self._build_model_configurations([dense.normalized_weights,
+                                                                             sparse_connectivity.normalized_weights])
+        for lsa_method in ["1D", "2D"]:
+            jacobians = [LSAService(lsa_method=lsa_method)._compute_jacobian(model_configuration)
+                         for model_configuration in model_configurations]
+            assert sparse.isspmatrix_csr(jacobians[1])
+            assert numpy.allclose(jacobians[0], jacobians[1].toarray(), atol=1e-5)
+        lsa_hypotheses = [LSAService(lsa_method="1D", eigen_solver="dense", eigen_vectors_number=3).
+                          run_lsa(hypothesis, model_configuration) for model_configuration in model_configurations]
+        assert numpy.allclose(lsa_hypotheses[0].lsa_propagation_strengths,
+                              lsa_hypotheses[1].lsa_propagation_strengths, atol=1e-4)
+
+    def test_simulation(self):
+        connectivities = self._prepare_connectivities()
+        model_configurations = self._build_model_configurations([connectivity.normalized_weights
+                                                                 for connectivity in connectivities])[0]
+        ts = []
+        keys = []
+        for connectivity, model_configuration in zip(connectivities, model_configurations):
+            simulator = SimulatorBuilder("numpy").set_model_name("EpileptorDP2D").set_simulated_period(50.0). \
+                build_simulator(model_configuration, connectivity)[0]
+            ts.append(simulator.launch_simulation()[0])
+            keys.append(SimulationCache().get_key(simulator))
+        assert numpy.allclose(ts[0].data, ts[1].data, atol=1e-4)
+        # The sparse weights are hashed by their values
+        assert keys[0] != keys[1]
+        model_configurations[1].model_connectivity = 2.0 * model_configurations[1].model_connectivity
+        assert SimulationCache().get_key(simulator) != keys[1]
+
+    def test_compute_seeg(self):
+        n_regions = 4
+        source = Timeseries(numpy.random.RandomState(0).normal(size=(10, n_regions)),
+                            {TimeseriesDimensions.SPACE.value: numpy.array(["r" + str(i) for i in range(n_regions)]),
+                             TimeseriesDimensions.VARIABLES.value: ["source"]}, 0.0, 1.0)
+        gain_matrix = numpy.array([[1.0, 0.0, 0.0, 0.5], [0.0, 0.0, 2.0, 0.0]])
+        seeg = []
+        for gain in [gain_matrix, sparse.csr_matrix(gain_matrix)]:
+            sensors = Sensors(numpy.array(["sens1", "sens2"]), numpy.zeros((2, 3)), gain_matrix=gain)
+            seeg.append(TimeseriesService().compute_seeg(source, [sensors])[0])
+        assert seeg[1].shape == seeg[0].shape
+        assert numpy.allclose(seeg[0].data, seeg[1].data)
@@ -0,0 +1,63 @@
+# coding=utf-8
+
+import os
+import numpy
+from tvb_epilepsy.base.computations.symbolic_cache import SymbolicLambdaCache
+from tvb_epilepsy.base.computations.symbolic_utils import symbol_eqnt_dfun, symbol_eqtn_fx1, symbol_eqtn_x0cr_r
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestSymbolicCache(BaseTest):
+
+    def _prepare_cache(self):
+        cache = SymbolicLambdaCache(self.config.out.FOLDER_TEMP)
+        cache.clear(disk=True)
+        return cache
+
+    def test_memory_cache(self):
+        cache = SymbolicLambdaCache(None)
+        fx1 = cache.get(symbol_eqtn_fx1, 3, "2d", True, slope="slope", Iext1="Iext1", shape=(3,))
+        assert cache.get(symbol_eqtn_fx1, 3, "2d", True, slope="slope", Iext1="Iext1", shape=(3,)) is fx1
+        assert cache.get(symbol_eqtn_fx1, 3, "2d", False, slope="slope", Iext1="Iext1", shape=(3,)) is not fx1
+        assert cache.number_of_keys == 2
+
+    def test_disk_cache(self):
+        cache = self._prepare_cache()
+        args = (2, 6, numpy.array("lin"))
+        dfun = cache.get(symbol_eqnt_dfun, *args)
+        file_path = cache.get_file_path(cache.get_key(symbol_eqnt_dfun, *args))
+        assert os.path.isfile(file_path)
+        # A new cache, as in a new process, loads the function from its source file
+        dfun_loaded = SymbolicLambdaCache(cache.folder).get(symbol_eqnt_dfun, *args)
+        assert dfun_loaded.__code__.co_filename == file_path
+        x = [numpy.array([-1.5, -1.2]), numpy.array([-10.0, -8.0]), numpy.array([3.0, 3.5]),
+             numpy.array([-1.0, -0.8]), numpy.array([0.0, 0.0]), numpy.array([0.1, 0.2])]
+        params = [numpy.array([1.0, 1.0]), numpy.array([3.1, 3.1]), numpy.array([0.45, 0.45]),
+                  numpy.array([-2.5, -2.2]), numpy.array([1.0, 1.0]), numpy.array([[0.0, 1.0], [1.0, 0.0]])] + \
+                 [value * numpy.ones((2,)) for value in [0.0, 1.0, 3.0, 5.0, 6.0, 0.1, 1.0, 2857.0, 10.0]]
+        assert numpy.allclose(numpy.array(dfun(*(x + params))), numpy.array(dfun_loaded(*(x + params))))
+
+    def test_disk_cache_tuple(self):
+        cache = self._prepare_cache()
+        x0cr, r = cache.get(symbol_eqtn_x0cr_r, 2)
+        x0cr_loaded, r_loaded = SymbolicLambdaCache(cache.folder).get(symbol_eqtn_x0cr_r, 2)
+        args = [value * numpy.ones((2,)) for value in [1.0, 3.1, 1.0, 3.0, 5.0, -5.0 / 3, -4.0 / 3, 0.0, 1.0]]
+        assert numpy.allclose(x0cr(*args), x0cr_loaded(*args))
+        assert numpy.allclose(r(*args), r_loaded(*args))
+
+    def test_disk_cache_source_change(self):
+        cache = self._prepare_cache()
+        cache.get(symbol_eqtn_x0cr_r, 2)
+        file_path = cache.get_file_path(cache.get_key(symbol_eqtn_x0cr_r, 2))
+        assert os.path.isfile(file_path)
+        # An edit of symbolic_utils changes the keys, so that the previous source files are not loaded
+        edited_cache = SymbolicLambdaCache(cache.folder)
+        edited_cache._source_hashes[symbol_eqtn_x0cr_r.__module__] = "edited"
+        assert edited_cache.get_file_path(edited_cache.get_key(symbol_eqtn_x0cr_r, 2)) != file_path
+        x0cr, r = edited_cache.get(symbol_eqtn_x0cr_r, 2)
+        assert x0cr.__code__.co_filename != file_path
+        # Without source code, functions are cached only in memory
+        memory_cache = SymbolicLambdaCache(cache.folder)
+        memory_cache._source_hashes[symbol_eqtn_x0cr_r.__module__] = None
+        x0cr, r = memory_cache.get(symbol_eqtn_x0cr_r, 2)
+        assert x0cr.__code__.co_filename != file_path
@@ -190,3 +190,42 @@ class TestTimeseries(object):
                            time_start=self.time_start, time_step=self.time_step, time_unit=self.time_unit)
         assert ts_4D.data.shape == (3, 4, 3, 4)
         assert ts_4D.x1.data.shape == (3, 4, 1, 4)
+
+    def test_timeseries_view(self):
+        data = numpy.array(self.data_4D, dtype="float64")
+        ts = Timeseries(data, dimension_labels={TimeseriesDimensions.SPACE.value: ["r1", "r2", "r3", "r4"],
+                                                TimeseriesDimensions.VARIABLES.value: [
+                                                    PossibleVariables.X1.value, PossibleVariables.X2.value, "sv3"]},
+                        time_start=self.time_start, time_step=self.time_step, time_unit=self.time_unit).as_view()
+        assert ts.is_view
+        assert numpy.shares_memory(ts.data, data)
+        with pytest.raises(TypeError):
+            ts.dimension_labels[TimeseriesDimensions.SPACE.value] = ["r0"]
+
+        # Equally spaced selections are views, sharing their dimension labels:
+        for ts_view in [ts.get_time_window(1, 3), ts.get_subspace_by_index([1, 3]), ts.get_subspace_by_labels(["r2"]),
+                        ts.x1, ts.decimate_time(2 * self.time_step), ts.get_sample_window(1, 3)]:
+            assert ts_view.is_view
+            assert numpy.shares_memory(ts_view.data, data)
+            assert not ts_view.data.flags.writeable
+        assert ts.get_time_window(1, 3).dimension_labels is ts.dimension_labels
+        assert ts.get_subspace_by_index([1, 3]).space_labels == ("r2", "r4")
+        assert numpy.array_equal(ts.get_subspace_by_index([1, 3]).data, self.data_4D[:, [1, 3]])
+        assert numpy.array_equal(ts.get_time_window(1, 3).get_subspace_by_labels(["r2", "r3"]).data,
+                                 self.data_4D[1:3, 1:3])
+
+        # ...other selections are copies, which can be modified in place:
+        ts_copy = ts.get_subspace_by_index([0, 1, 3])
+        assert ts_copy.space_labels == ("r1", "r2", "r4")
+        assert not numpy.shares_memory(ts_copy.data, data)
+        ts_copy.data[0] = 0.0
+
+        # Copy on write:
+        ts_window = ts.get_time_window(0, 2)
+        with pytest.raises(ValueError):
+            ts.data[0] = 0.0
+        ts_window.writable_data[0] = -1.0
+        ts.writable_data[1] = -2.0
+        assert numpy.all(ts_window.data[0] == -1.0) and numpy.all(ts.data[1] == -2.0)
+        assert numpy.array_equal(ts_window.data[1], self.data_4D[1]) and numpy.array_equal(ts.data[0], self.data_4D[0])
+        assert numpy.array_equal(data, self.data_4D)
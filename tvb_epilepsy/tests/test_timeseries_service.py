@@ -0,0 +1,107 @@
+# coding=utf-8
+
+import numpy
+import pytest
+from scipy.signal import convolve, filtfilt
+from tvb_epilepsy.base.computations.analyzers_utils import select_convolution_mode, butterworth_sos, \
+    _butterworth_bandpass
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
+
+
+class TestTimeseriesService(object):
+    ts_service = TimeseriesService()
+
+    def _prepare_timeseries(self, n_times=2000, n_signals=3, dtype="float32"):
+        data = numpy.abs(numpy.random.RandomState(0).normal(size=(n_times, n_signals))).astype(dtype)
+        return Timeseries(data, {TimeseriesDimensions.SPACE.value: numpy.array(["s" + str(i)
+                                                                                for i in range(n_signals)]),
+                                 TimeseriesDimensions.VARIABLES.value: ["seeg"]}, 0.0, 1.0)
+
+    def test_convolve(self):
+        timeseries = self._prepare_timeseries()
+        for win_len in [1, 2, 7, 100, 1999, 3000]:
+            for kernel in [None, 0.5, numpy.hanning(win_len)]:
+                if kernel is None:
+                    reference_kernel = numpy.ones((win_len,))
+                else:
+                    reference_kernel = kernel * numpy.ones((win_len,))
+                reference = convolve(timeseries.data, reference_kernel.reshape((win_len, 1, 1, 1)), mode="same",
+                                     method="direct")
+                for mode in ["auto", "direct", "running_sum", "fft"]:
+                    if mode == "running_sum" and numpy.size(kernel) > 1 and win_len > 1:
+                        continue
+                    convolved = self.ts_service.convolve(timeseries, win_len, kernel, mode)
+                    assert convolved.shape == timeseries.shape
+                    assert numpy.allclose(convolved.data, reference, rtol=1e-10, atol=1e-10)
+
+    def test_convolution_mode(self):
+        assert select_convolution_mode(numpy.ones((1000,))) == "running_sum"
+        assert select_convolution_mode(numpy.hanning(1000)) == "fft"
+        timeseries = self._prepare_timeseries()
+        with pytest.raises(ValueError):
+            self.ts_service.convolve(timeseries, 10, numpy.hanning(10), "running_sum")
+        with pytest.raises(ValueError):
+            self.ts_service.convolve(timeseries, 10, mode="overlap")
+
+    def _prepare_sinusoids(self, fs, frequencies, n_times=10240, n_signals=3):
+        time = numpy.arange(n_times) / fs
+        phases = numpy.arange(n_signals)
+        data = numpy.sum([numpy.sin(2 * numpy.pi * f * time[:, numpy.newaxis] + phases) for f in frequencies], axis=0)
+        return Timeseries(data, {TimeseriesDimensions.SPACE.value: numpy.array(["s" + str(i)
+                                                                                for i in range(n_signals)]),
+                                 TimeseriesDimensions.VARIABLES.value: ["seeg"]}, 0.0, 1000.0 / fs)
+
+    def test_decimate_by_resampling(self):
+        # 10 Hz and 50 Hz are kept, while 300 Hz is above the Nyquist frequency of 125 Hz
+        timeseries = self._prepare_sinusoids(1024.0, [10.0, 50.0, 300.0])
+        resampled = self.ts_service.resample(timeseries, 250.0)
+        assert resampled.shape == (2500, 3, 1, 1)
+        assert numpy.allclose(resampled.sampling_frequency, 250.0)
+        assert numpy.allclose(resampled.time_start, timeseries.time_start)
+        expected = self._prepare_sinusoids(250.0, [10.0, 50.0], n_times=2500)
+        assert numpy.max(numpy.abs(resampled.data - expected.data)[100:-100]) < 0.01
+        # Blocks of spatial signals are resampled independently
+        assert numpy.allclose(self.ts_service.decimate_by_resampling(timeseries, 1024.0 / 250, n_signals_block=1).data,
+                              resampled.data)
+        decimated = self.ts_service.decimate_by_resampling(timeseries, 4)
+        assert decimated.shape == (2560, 3, 1, 1)
+        assert numpy.allclose(decimated.time_step, 4 * timeseries.time_step)
+        assert self.ts_service.decimate_by_resampling(timeseries, 1) is timeseries
+
+    def test_decimate_by_filtering(self):
+        timeseries = self._prepare_sinusoids(1024.0, [10.0, 50.0, 300.0])
+        decimated = self.ts_service.decimate_by_filtering(timeseries, 4)
+        assert numpy.allclose(decimated.time_start, timeseries.time_start)
+        assert numpy.allclose(decimated.time_step, 4 * timeseries.time_step)
+        expected = self._prepare_sinusoids(256.0, [10.0, 50.0], n_times=2560)
+        assert numpy.max(numpy.abs(decimated.data - expected.data)[100:-100]) < 0.01
+
+    def test_filter_bank(self):
+        # filtfilt pads float32 signals in float32, i.e., with errors of ~1e-8
+        timeseries = self._prepare_timeseries(n_signals=7, dtype="float64")
+        bands = [(1.0, 4.0), (4.0, 8.0), (None, 30.0), (100.0, None)]
+        modes = ["bandpass", "bandpass", "lowpass", "highpass"]
+        assert butterworth_sos(1000.0, "bandpass", 1.0, 4.0, 3) is butterworth_sos(1000, "bandpass", 1.0, 4.0, 3)
+        # The filtering with the (b, a) coefficients of the same order 3 Butterworth filters, as before.
+        # The (b, a) coefficients of the narrow bands of low frequencies lose precision, i.e., their poles, close to 1,
+        # move by ~1e-5, whereas the second order sections keep them, so that only the other bands agree to 1e-10.
+        expected = []
+        tolerances = []
+        for band, mode, tolerance in zip(bands, modes, [1e-3, 1e-5, 1e-10, 1e-10]):
+            b, a = _butterworth_bandpass(timeseries.sampling_frequency, mode, band[0], band[1], 3)
+            expected.append(filtfilt(b, a, timeseries.data, axis=0))
+            tolerances.append(tolerance * numpy.max(numpy.abs(expected[-1])))
+        for band, mode, band_expected, tolerance in zip(bands, modes, expected, tolerances):
+            filtered = self.ts_service.filter(timeseries, band[0], band[1], mode)
+            assert numpy.allclose(filtered.data, band_expected, rtol=0.0, atol=tolerance)
+        for n_threads in [1, 3]:
+            ts_service = TimeseriesService(n_threads=n_threads)
+            for bank_filtered, band_expected, tolerance in zip(ts_service.filter_bank(timeseries, bands, modes),
+                                                               expected, tolerances):
+                assert bank_filtered.shape == timeseries.shape
+                assert numpy.allclose(bank_filtered.data, band_expected, rtol=0.0, atol=tolerance)
+            bandpower = ts_service.bandpower(timeseries, bands, modes)
+            assert bandpower.shape == (len(bands),) + timeseries.shape[1:]
+            assert numpy.allclose(bandpower, [numpy.mean(band_expected ** 2, axis=0) for band_expected in expected],
+                                  rtol=1e-2)
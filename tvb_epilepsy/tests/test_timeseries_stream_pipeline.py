@@ -0,0 +1,66 @@
+# coding=utf-8
+
+import os
+import numpy
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.service.simulator.simulation_output_sink import H5OutputSink
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
+from tvb_epilepsy.service.timeseries_stream_pipeline import TimeseriesStreamPipeline, FilterStage, EnvelopeStage, \
+    ConvolveStage, DecimateStage
+from tvb_epilepsy.tests.base import BaseTest
+
+
+class TestTimeseriesStreamPipeline(BaseTest):
+    ts_service = TimeseriesService()
+
+    def _prepare_timeseries(self, n_times=20000, n_signals=3):
+        random_state = numpy.random.RandomState(0)
+        data = numpy.cumsum(random_state.normal(size=(n_times, n_signals)), axis=0) + \
+            20.0 * random_state.normal(size=(n_times, n_signals))
+        return Timeseries(data, {TimeseriesDimensions.SPACE.value: numpy.array(["s" + str(i)
+                                                                                for i in range(n_signals)]),
+                                 TimeseriesDimensions.VARIABLES.value: ["seeg"]}, 0.0, 1000.0 / 1024)
+
+    def _assert_close(self, streamed, timeseries, margin=0, rtol=1e-6):
+        assert streamed.shape == timeseries.shape
+        assert numpy.allclose(streamed.time_start, timeseries.time_start)
+        assert numpy.allclose(streamed.time_step, timeseries.time_step)
+        error = numpy.abs(streamed.data - timeseries.data)[margin:streamed.time_length - margin]
+        assert numpy.max(error) <= rtol * numpy.max(numpy.abs(timeseries.data))
+
+    def test_filter(self):
+        timeseries = self._prepare_timeseries()
+        filtered = self.ts_service.filter(timeseries, 10.0, 256.0, "bandpass", order=3)
+        for block_length in [100, 1000, 30000]:
+            stage = FilterStage(timeseries.sampling_frequency, 10.0, 256.0, "bandpass", order=3)
+            self._assert_close(TimeseriesStreamPipeline([stage], block_length).run(timeseries), filtered)
+
+    def test_envelope(self):
+        timeseries = self.ts_service.filter(self._prepare_timeseries(), 10.0, 256.0, "bandpass", order=3)
+        # The Hilbert transform of the whole signals is circular, i.e., it differs at their ends
+        self._assert_close(TimeseriesStreamPipeline([EnvelopeStage(1024)], 1000).run(timeseries),
+                           self.ts_service.hilbert_envelope(timeseries), margin=1000, rtol=1e-2)
+
+    def test_convolve_and_decimate(self):
+        timeseries = self._prepare_timeseries(n_times=5000)
+        for win_len in [1, 100, 301]:
+            self._assert_close(TimeseriesStreamPipeline([ConvolveStage(numpy.ones((win_len,)))], 700).run(timeseries),
+                               self.ts_service.convolve(timeseries, win_len))
+        for decim_ratio in [1, 7, 1000]:
+            streamed = TimeseriesStreamPipeline([DecimateStage(decim_ratio)], 300).run(timeseries)
+            assert numpy.array_equal(streamed.data, self.ts_service.decimate(timeseries, decim_ratio).data)
+
+    def test_pipeline(self):
+        timeseries = self._prepare_timeseries()
+        stages = [FilterStage(timeseries.sampling_frequency, 10.0, 256.0), EnvelopeStage(1024),
+                  ConvolveStage(numpy.ones((200,))), DecimateStage(10)]
+        expected = self.ts_service.filter(timeseries, 10.0, 256.0)
+        expected = self.ts_service.convolve(self.ts_service.hilbert_envelope(expected), 200)
+        expected = self.ts_service.decimate(expected, 10)
+        streamed = TimeseriesStreamPipeline(stages, 4096).run(timeseries)
+        self._assert_close(streamed, expected, margin=200, rtol=1e-2)
+        path = os.path.join(self.config.out.FOLDER_TEMP, "stream_pipeline.h5")
+        streamed_h5 = TimeseriesStreamPipeline(stages, 4096).run(timeseries, H5OutputSink(path, lazy=True))
+        assert streamed_h5.shape == streamed.shape
+        assert numpy.allclose(streamed_h5.data[:], streamed.data, rtol=1e-5)
+        streamed_h5.close()
@@ -0,0 +1,40 @@
+# coding=utf-8
+"""
+Benchmark of the computation of the x2 equilibria, with the per region loop of calc_eq_x2
+versus the vectorized closed form solution of calc_eq_x2_cardano, for increasing numbers of regions.
+"""
+
+import logging
+import timeit
+import numpy as np
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.computations.equilibrium_computation import calc_eq_x2, calc_eq_x2_cardano
+
+
+def main_cardano_benchmark(config=Config(), n_regions=(76, 1000, 10000), n_repeats=3, Iext2=0.45):
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    # Do not time the warnings about x2_neg being corrected
+    equilibrium_logger = logging.getLogger("tvb_epilepsy.base.computations.equilibrium_computation")
+    equilibrium_logger_level = equilibrium_logger.level
+    equilibrium_logger.setLevel(logging.ERROR)
+    random_state = np.random.RandomState(0)
+    results = {}
+    try:
+        for n in n_regions:
+            x1eq = random_state.uniform(-2.0, -1.0, (n,))
+            zeq = random_state.uniform(2.0, 5.0, (n,))
+            for name, solver in [("loop", calc_eq_x2), ("cardano", calc_eq_x2_cardano)]:
+                results[(name, n)] = min(timeit.repeat(lambda: solver(Iext2, zeq=zeq, x1eq=x1eq, x2_neg=True),
+                                                       number=1, repeat=n_repeats))
+                logger.info("x2 equilibria of " + str(n) + " regions with " + name + ": " +
+                            str(1000 * results[(name, n)]) + " ms")
+            logger.info("Speedup of the vectorized solver for " + str(n) + " regions: " +
+                        str(results[("loop", n)] / results[("cardano", n)]))
+    finally:
+        equilibrium_logger.setLevel(equilibrium_logger_level)
+    return results
+
+
+if __name__ == "__main__":
+    main_cardano_benchmark()
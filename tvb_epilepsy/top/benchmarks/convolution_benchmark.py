@@ -0,0 +1,69 @@
+# coding=utf-8
+"""
+Runtime benchmark of the modes of TimeseriesService.convolve, i.e., direct, running sum (boxcar kernels only)
+and FFT convolution, and of the automatic selection among them, for the smoothing of the envelopes of
+1 kHz, hour long SEEG signals, with windows of 10 points up to 1/10 of their duration,
+as prepare_signal_observable does.
+"""
+
+import time
+import numpy as np
+from scipy.signal import hann
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
+
+
+def _generate_seeg(n_times, n_sensors, fs):
+    # Positive, envelope like signals
+    data = np.abs(np.random.RandomState(0).normal(size=(n_times, n_sensors))).astype("float32")
+    return Timeseries(data, {TimeseriesDimensions.SPACE.value: np.array(["sensor" + str(i_sensor)
+                                                                         for i_sensor in range(n_sensors)]),
+                             TimeseriesDimensions.VARIABLES.value: ["seeg"]}, 0.0, 1000.0 / fs)
+
+
+def _time(function, n_repeats):
+    durations = []
+    for _ in range(n_repeats):
+        tic = time.time()
+        function()
+        durations.append(time.time() - tic)
+    return min(durations)
+
+
+def main_convolution_benchmark(config=Config(), fs=1000.0, duration=3600.0, n_sensors=10,
+                               win_lens=(10, 32, 100, 1000, 10000, 360000), n_repeats=1,
+                               max_direct_operations=10 ** 9):
+    """
+    :param duration: duration of the signals in secs
+    :param max_direct_operations: the direct convolutions of more than n_times * win_len multiplications per sensor
+                                  are skipped, as they would take hours
+    """
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    ts_service = TimeseriesService()
+    seeg = _generate_seeg(int(fs * duration), n_sensors, fs)
+    results = {}
+    for win_len in win_lens:
+        for kernel_name, kernel in [("boxcar", None), ("hann", hann(win_len))]:
+            for mode in ["direct", "running_sum", "fft", "auto"]:
+                if (mode == "running_sum" and kernel_name != "boxcar") or \
+                        (mode == "direct" and seeg.time_length * win_len > max_direct_operations):
+                    continue
+                results[(kernel_name, win_len, mode)] = \
+                    _time(lambda: ts_service.convolve(seeg, win_len, kernel, mode), n_repeats)
+                logger.info("Convolution of " + str(n_sensors) + " signals of " + str(seeg.time_length) +
+                            " points, with a " + kernel_name + " window of " + str(win_len) + " points, " + mode +
+                            ": " + str(results[(kernel_name, win_len, mode)]) + " secs")
+            if (kernel_name, win_len, "direct") in results:
+                reference = ts_service.convolve(seeg, win_len, kernel, "direct").data
+                for mode in ["running_sum", "fft"]:
+                    if (kernel_name, win_len, mode) in results:
+                        error = np.max(np.abs(ts_service.convolve(seeg, win_len, kernel, mode).data - reference))
+                        logger.info("Maximum absolute difference of " + mode + " from direct convolution: " +
+                                    str(error / np.max(np.abs(reference))) + " relative")
+    return results
+
+
+if __name__ == "__main__":
+    main_convolution_benchmark()
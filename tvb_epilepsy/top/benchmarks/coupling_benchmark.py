@@ -0,0 +1,78 @@
+# coding=utf-8
+"""
+Runtime and memory benchmark of the difference coupling, with the previous dense outer difference of states,
+versus the O(n) engine of coupling_utils, for dense and sparse weights, up to 20000 regions.
+Each computation runs in a child process, in order to measure the increase of its peak resident memory.
+"""
+
+import resource
+import time
+from multiprocessing import Process, Queue
+import numpy as np
+from scipy import sparse
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.computations.coupling_utils import difference_coupling, difference_coupling_jacobian
+
+
+def outer_difference_coupling(x, K, w):
+    # The previous implementation of eqtn_coupling
+    n = x.size
+    i_n = np.ones((n, 1), dtype='float32')
+    return np.multiply(K, np.sum(np.multiply(w, np.dot(i_n, x[np.newaxis]) - np.dot(i_n, x[np.newaxis]).T), axis=1))
+
+
+def _generate_weights(n_regions, density, dense):
+    w = sparse.random(n_regions, n_regions, density=density, format="csr", random_state=0)
+    w.setdiag(0.0)
+    w.eliminate_zeros()
+    if dense:
+        return w.toarray()
+    return w
+
+
+def _run_child(queue, function, n_regions, density, dense, n_repeats):
+    w = _generate_weights(n_regions, density, dense)
+    x = np.random.RandomState(0).uniform(-2.0, -1.0, (n_regions,))
+    K = np.ones((n_regions,))
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    durations = []
+    for _ in range(n_repeats):
+        tic = time.time()
+        function(x, K, w)
+        durations.append(time.time() - tic)
+    # ru_maxrss is in kilobytes in linux
+    queue.put((min(durations), (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory) / 1024.0))
+
+
+def _run(function, n_regions, density, dense, n_repeats):
+    queue = Queue()
+    process = Process(target=_run_child, args=(queue, function, n_regions, density, dense, n_repeats))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main_coupling_benchmark(config=Config(), n_regions=(76, 1000, 5000, 20000), density=0.01, n_repeats=3,
+                            max_dense_regions=5000):
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    methods = [("outer difference", outer_difference_coupling, True),
+               ("dense", difference_coupling, True),
+               ("sparse", difference_coupling, False),
+               ("dense jacobian", lambda x, K, w: difference_coupling_jacobian(K, w), True),
+               ("sparse jacobian", lambda x, K, w: difference_coupling_jacobian(K, w), False)]
+    results = {}
+    for n in n_regions:
+        for name, function, dense in methods:
+            # Dense weights of 20000 regions take 3.2 GB by themselves
+            if dense and n > max_dense_regions:
+                continue
+            results[(name, n)] = _run(function, n, density, dense, n_repeats)
+            logger.info("Coupling of " + str(n) + " regions, " + name + ": " + str(1000 * results[(name, n)][0]) +
+                        " ms, peak memory increase: " + str(results[(name, n)][1]) + " MB")
+    return results
+
+
+if __name__ == "__main__":
+    main_coupling_benchmark()
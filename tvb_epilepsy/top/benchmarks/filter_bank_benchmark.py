@@ -0,0 +1,61 @@
+# coding=utf-8
+"""
+Runtime benchmark of the Butterworth filtering of many SEEG channels for several frequency bands:
+the previous filter_data (filter design and filtfilt over the whole array, per band),
+versus the filter bank of analyzers_utils (cached second order sections, sosfiltfilt over blocks of channels,
+all bands per block, in a pool of threads), for the filtered signals and for band powers.
+"""
+
+import time
+import numpy as np
+from scipy.signal import filtfilt
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.computations.analyzers_utils import _butterworth_bandpass, filter_bank
+
+
+def previous_filter_data(data, fs, lowcut=None, highcut=None, mode='bandpass', order=3, axis=0):
+    # The previous implementation of filter_data
+    b, a = _butterworth_bandpass(fs, mode, lowcut, highcut, order)
+    return filtfilt(b, a, data, axis=axis)
+
+
+def _time(function, n_repeats):
+    durations = []
+    for _ in range(n_repeats):
+        tic = time.time()
+        function()
+        durations.append(time.time() - tic)
+    return min(durations)
+
+
+def main_filter_bank_benchmark(config=Config(), fs=1024.0, duration=300.0, n_channels=100,
+                               bands=((1.0, 4.0), (4.0, 8.0), (8.0, 13.0), (13.0, 30.0), (30.0, 80.0),
+                                      (80.0, 250.0)),
+                               n_threads=(1, 2, 4, 8), n_repeats=1):
+    """
+    :param duration: duration of the signals in secs
+    """
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    data = np.random.RandomState(0).normal(size=(int(fs * duration), n_channels)).astype("float32")
+    bands = list(bands)
+    power = lambda x: np.mean(x ** 2, axis=0)
+    methods = [("previous filter_data per band",
+                lambda: [previous_filter_data(data, fs, band[0], band[1]) for band in bands]),
+               ("previous filter_data per band, band powers",
+                lambda: [power(previous_filter_data(data, fs, band[0], band[1])) for band in bands])]
+    for n in n_threads:
+        methods += [("filter bank of " + str(n) + " threads",
+                     lambda n=n: filter_bank(data, fs, bands, n_threads=n)),
+                    ("filter bank of " + str(n) + " threads, band powers",
+                     lambda n=n: filter_bank(data, fs, bands, reduce_fun=power, n_threads=n))]
+    results = {}
+    for name, function in methods:
+        results[name] = _time(function, n_repeats)
+        logger.info("Filtering of " + str(n_channels) + " channels of " + str(duration) + " secs at " + str(fs) +
+                    " Hz, for " + str(len(bands)) + " bands, by " + name + ": " + str(results[name]) + " secs")
+    return results
+
+
+if __name__ == "__main__":
+    main_filter_bank_benchmark()
@@ -0,0 +1,91 @@
+# coding=utf-8
+"""
+File size and write/read throughput of the storage options of H5Writer, for simulated Timeseries of 10^6 time points:
+contiguous datasets (as before), chunked uncompressed ones, and gzip or lzf compressed ones, with or without shuffle.
+Reading is measured for the whole Timeseries, for random time windows of all regions,
+and for the whole time of random subsets of regions.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import h5py
+import numpy as np
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.io.h5_reader import H5Reader
+from tvb_epilepsy.io.h5_writer import H5Writer
+
+
+def _simulate_timeseries(n_times, n_regions, time_step, random_state):
+    # Seizure-like oscillations of x1, on slowly varying z, with integration noise, as float32 simulator outputs
+    time = time_step * np.arange(n_times)[:, np.newaxis]
+    frequencies = random_state.uniform(0.5, 5.0, (n_regions,)) / 1000.0
+    phases = random_state.uniform(0.0, 2 * np.pi, (n_regions,))
+    x1 = -1.0 + 0.8 * np.sin(2 * np.pi * frequencies * time + phases) ** 3 + \
+        0.01 * random_state.normal(size=(n_times, n_regions))
+    z = 3.5 + 0.2 * np.sin(2 * np.pi * frequencies / 50.0 * time + phases)
+    return Timeseries(np.stack([x1, z], axis=2)[:, :, :, np.newaxis].astype("float32"),
+                      {TimeseriesDimensions.SPACE.value: np.array(["region" + str(i) for i in range(n_regions)]),
+                       TimeseriesDimensions.VARIABLES.value: ["x1", "z"]}, 0.0, time_step)
+
+
+def _time(function):
+    tic = time.time()
+    function()
+    return time.time() - tic
+
+
+def _read_windows(path, starts, window_length):
+    with h5py.File(path, "r") as h5_file:
+        for i_start in starts:
+            h5_file["/data"][i_start:i_start + window_length]
+
+
+def _read_regions(path, regions):
+    with h5py.File(path, "r") as h5_file:
+        for i_region in regions:
+            h5_file["/data"][:, i_region]
+
+
+def main_h5_storage_benchmark(config=Config(), n_times=10 ** 6, n_regions=20, time_step=0.1, n_windows=20,
+                              window_length=10 ** 4, n_subsets=5):
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    random_state = np.random.RandomState(0)
+    timeseries = _simulate_timeseries(n_times, n_regions, time_step, random_state)
+    window_starts = random_state.randint(0, n_times - window_length, (n_windows,))
+    regions = random_state.randint(0, n_regions, (n_subsets,))
+    storages = [("contiguous", dict(chunk_bytes=None)),
+                ("chunked", dict()),
+                ("gzip 1, shuffle", dict(compression="gzip", compression_opts=1, shuffle=True)),
+                ("gzip 4, shuffle", dict(compression="gzip", compression_opts=4, shuffle=True)),
+                ("gzip 4", dict(compression="gzip", compression_opts=4, shuffle=False)),
+                ("lzf, shuffle", dict(compression="lzf", shuffle=True)),
+                ("lzf", dict(compression="lzf", shuffle=False))]
+    folder = tempfile.mkdtemp(prefix="h5_storage_", dir=config.out.FOLDER_TEMP
+                              if os.path.isdir(config.out.FOLDER_TEMP) else None)
+    data_size = timeseries.data.nbytes / 1024.0 ** 2
+    results = {}
+    try:
+        for name, kwargs in storages:
+            path = os.path.join(folder, name.replace(", ", "_").replace(" ", "") + ".h5")
+            write_duration = _time(lambda: H5Writer(**kwargs).write_timeseries(timeseries, path))
+            size = os.path.getsize(path) / 1024.0 ** 2
+            read_duration = _time(lambda: H5Reader().read_timeseries(path))
+            windows_duration = _time(lambda: _read_windows(path, window_starts, window_length))
+            regions_duration = _time(lambda: _read_regions(path, regions))
+            results[name] = (size, write_duration, read_duration, windows_duration, regions_duration)
+            logger.info("Timeseries of " + str(n_times) + " time points, " + str(data_size) + " MB, " + name +
+                        ": file of " + str(size) + " MB, writing at " + str(data_size / write_duration) +
+                        " MB/sec, reading at " + str(data_size / read_duration) + " MB/sec, " +
+                        str(1000 * windows_duration / n_windows) + " ms per window of " + str(window_length) +
+                        " time points, " + str(1000 * regions_duration / n_subsets) + " ms per region")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    main_h5_storage_benchmark()
@@ -0,0 +1,80 @@
+# coding=utf-8
+"""
+Benchmark of the wall time and accuracy of the adaptive step exponential integrator of the numpy simulator,
+versus the fixed step Heun scheme, on the default head.
+Accuracy is the maximum absolute difference of the SubSample monitored variables of deterministic simulations
+from a reference Heun simulation with a much smaller integration step, starting from perturbed equilibria,
+so that the Heun simulations and the exponential ones of equal accuracy can be compared.
+The stochastic versions of the integrators are timed as well, since their noise realizations differ.
+"""
+
+import time
+import numpy as np
+from tvb.simulator.monitors import SubSample
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.io.h5_reader import H5Reader as Reader
+
+
+def _run_simulation(model_configuration, connectivity, model_name, integrator, fs, simulated_period, sampling_fs,
+                    stochastic, **kwargs):
+    builder = SimulatorBuilder("numpy").set_model_name(model_name).set_fs(fs).set_simulated_period(simulated_period)
+    model = builder.generate_model_tvb(model_configuration)
+    sim_settings = builder.build_sim_settings()
+    if not stochastic:
+        sim_settings.noise_intensity = 0.0 * np.array(sim_settings.noise_intensity)
+    monitor = SubSample()
+    monitor.period = 1000.0 / sampling_fs
+    simulator = builder.build_simulator_from_model_sim_settings(model_configuration, connectivity, model,
+                                                                sim_settings, monitors=[monitor],
+                                                                integrator=integrator, **kwargs)[0]
+    # Perturb the equilibrium, so that the regions leave it also without noise
+    perturbation = 0.2 * np.random.RandomState(0).normal(size=simulator.current_state.shape)
+    simulator.configure_initial_conditions(simulator.current_state + perturbation)
+    tic = time.time()
+    ts = simulator.launch_simulation()[0]
+    return ts.data, time.time() - tic, simulator.integration_statistics
+
+
+def main_integrator_benchmark(config=Config(), model_name="EpileptorDP2D", simulated_period=1000.0, fs=2048.0,
+                              sampling_fs=256.0, reference_fs_factor=32, heun_fs_factors=(1, 2, 4, 8),
+                              tolerances=(1e-3, 1e-4, 1e-5)):
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    head = Reader().read_head(config.input.HEAD)
+    connectivity = head.connectivity
+    n_regions = connectivity.number_of_regions
+    hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([0, 5], [1.5, 1.2]).build_hypothesis()
+    model_configuration = ModelConfigurationBuilder(n_regions).build_model_from_hypothesis(
+        hypothesis, connectivity.normalized_weights)
+
+    def run(integrator, integrator_fs, stochastic=False, **kwargs):
+        return _run_simulation(model_configuration, connectivity, model_name, integrator, integrator_fs,
+                               simulated_period, sampling_fs, stochastic, **kwargs)
+
+    reference = run("HeunDeterministic", reference_fs_factor * fs)[0]
+    results = {}
+    for fs_factor in heun_fs_factors:
+        data, duration, _ = run("HeunDeterministic", fs_factor * fs)
+        results[("HeunDeterministic", fs_factor * fs)] = (duration, np.max(np.abs(data - reference)))
+        results[("HeunStochastic", fs_factor * fs)] = (run("HeunStochastic", fs_factor * fs, True)[1], None)
+    for tolerance in tolerances:
+        data, duration, statistics = run("ExponentialDeterministic", fs, atol=tolerance, rtol=tolerance)
+        results[("ExponentialDeterministic", tolerance)] = (duration, np.max(np.abs(data - reference)))
+        logger.info("Exponential integrator steps for tolerance " + str(tolerance) + ": " + str(statistics))
+        results[("ExponentialStochastic", tolerance)] = \
+            (run("ExponentialStochastic", fs, True, atol=tolerance, rtol=tolerance)[1], None)
+    for (integrator, parameter), (duration, error) in sorted(results.items()):
+        if integrator.startswith("Heun"):
+            parameter = "fs = " + str(parameter)
+        else:
+            parameter = "atol = rtol = " + str(parameter)
+        logger.info(integrator + ", " + parameter + ": " + str(duration) + " secs" +
+                    ("" if error is None else ", maximum absolute error: " + str(error)))
+    return results
+
+
+if __name__ == "__main__":
+    main_integrator_benchmark()
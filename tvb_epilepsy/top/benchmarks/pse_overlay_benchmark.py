@@ -0,0 +1,69 @@
+# coding=utf-8
+"""
+Benchmark of the per sample overhead of preparing the PSE objects (hypothesis, model configuration builder
+and LSA service), with deep copies versus with copy-on-write parameter overlays, on the default head.
+"""
+
+import timeit
+from copy import deepcopy
+import numpy as np
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.datatypes.parameter_overlay import ParameterOverlay
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.lsa_service import LSAService
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.pse.lsa_pse_service import LSAPSEService
+from tvb_epilepsy.io.h5_reader import H5Reader as Reader
+
+
+def main_pse_overlay_benchmark(config=Config(), n_samples=100, n_repeats=3):
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    head = Reader().read_head(config.input.HEAD)
+    connectivity = head.connectivity.normalized_weights
+    n_regions = head.connectivity.number_of_regions
+    all_regions_indices = np.arange(n_regions)
+
+    hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([20], [0.9]).set_e_hypothesis([70], [0.9]). \
+        build_hypothesis()
+    model_configuration_builder = ModelConfigurationBuilder(n_regions)
+    model_configuration = model_configuration_builder.build_model_from_hypothesis(hypothesis, connectivity)
+    lsa_service = LSAService(eigen_vectors_number=5)
+    lsa_hypothesis = lsa_service.run_lsa(hypothesis, model_configuration)
+
+    params_pse = [{"path": "hypothesis.x0_values", "indices": [0], "samples": np.linspace(0.5, 0.9, n_samples)},
+                  {"path": "model_configuration_builder.K_unscaled", "indices": all_regions_indices.tolist(),
+                   "samples": np.linspace(1.0, 20.0, n_samples)}]
+    pse = LSAPSEService(hypothesis=lsa_hypothesis, params_pse=params_pse)
+
+    def prepare_deepcopy():
+        for params in pse.params_vals:
+            hypo_copy = deepcopy(lsa_hypothesis)
+            hypo_copy.update_for_pse(params, pse.params_paths, pse.params_indices)
+            builder_copy = deepcopy(model_configuration_builder)
+            builder_copy.set_attributes_from_pse(params, pse.params_paths, pse.params_indices)
+            lsa_copy = deepcopy(lsa_service)
+            lsa_copy.update_for_pse(params, pse.params_paths, pse.params_indices)
+
+    def prepare_overlay():
+        for params in pse.params_vals:
+            hypo_overlay = ParameterOverlay(lsa_hypothesis)
+            pse.update_object(hypo_overlay, params, object_type="hypothesis")
+            builder_overlay = ParameterOverlay(model_configuration_builder)
+            pse.update_object(builder_overlay, params, object_type="model_configuration_builder")
+            lsa_overlay = ParameterOverlay(lsa_service)
+            pse.update_object(lsa_overlay, params, object_type="lsa_service")
+            # Reading the modified parameters materializes them, as a PSE run would do
+            hypo_overlay.x0_values
+            builder_overlay.K_unscaled
+
+    results = {}
+    for name, prepare in [("deepcopy", prepare_deepcopy), ("overlay", prepare_overlay)]:
+        results[name] = 1e6 * min(timeit.repeat(prepare, number=1, repeat=n_repeats)) / n_samples
+        logger.info("Per sample overhead with " + name + ": " + str(results[name]) + " us")
+    logger.info("Speedup of overlays over deep copies: " + str(results["deepcopy"] / results["overlay"]))
+    return results
+
+
+if __name__ == "__main__":
+    main_pse_overlay_benchmark()
@@ -0,0 +1,90 @@
+# coding=utf-8
+"""
+Accuracy and throughput benchmark of the decimation methods of TimeseriesService:
+decimate (striding), decimate_by_filtering (FIR filtering at the full rate, then striding)
+and decimate_by_resampling (polyphase resampling), for integer ratios, and, only for resampling, rational ones,
+e.g., 1024 Hz -> 250 Hz.
+Accuracy is measured on signals of sinusoids below the target Nyquist frequency, plus sinusoids above it,
+as the relative root mean square error from the former at the decimated times, away from the signals' ends.
+Throughput is measured on hour long SEEG-like signals.
+"""
+
+import time
+import numpy as np
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.model.timeseries import Timeseries, TimeseriesDimensions
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
+
+
+def _sinusoids(time, frequencies, phases):
+    # time in secs
+    return np.sum([np.sin(2 * np.pi * f * time[:, np.newaxis] + phases) for f in frequencies], axis=0)
+
+
+def _timeseries(data, fs):
+    return Timeseries(data, {TimeseriesDimensions.SPACE.value: np.array(["sensor" + str(i_sensor)
+                                                                         for i_sensor in range(data.shape[1])]),
+                             TimeseriesDimensions.VARIABLES.value: ["seeg"]}, 0.0, 1000.0 / fs)
+
+
+def _methods(ts_service, fs, target_fs):
+    decim_ratio = fs / target_fs
+    methods = [("resampling", lambda ts: ts_service.decimate_by_resampling(ts, decim_ratio))]
+    if np.isclose(decim_ratio, np.round(decim_ratio)):
+        decim_ratio = int(np.round(decim_ratio))
+        methods = [("striding", lambda ts: ts_service.decimate(ts, decim_ratio)),
+                   ("filtering", lambda ts: ts_service.decimate_by_filtering(ts, decim_ratio))] + methods
+    return methods
+
+
+def _accuracy(ts_service, fs, target_fs, duration, n_sensors, edge=0.1):
+    random_state = np.random.RandomState(0)
+    phases = random_state.uniform(0.0, 2 * np.pi, (n_sensors,))
+    nyquist = target_fs / 2.0
+    in_band = [0.05 * nyquist, 0.2 * nyquist, 0.6 * nyquist]
+    out_of_band = [1.3 * nyquist, 2.7 * nyquist]
+    seeg = _timeseries(_sinusoids(np.arange(int(fs * duration)) / fs, in_band + out_of_band, phases), fs)
+    errors = {}
+    for name, method in _methods(ts_service, fs, target_fs):
+        decimated = method(seeg)
+        data = decimated.squeezed.reshape((decimated.time_length, n_sensors))
+        expected = _sinusoids(np.arange(decimated.time_length) * decimated.time_step / 1000.0, in_band, phases)
+        n_edge = int(edge * decimated.time_length)
+        errors[name] = np.sqrt(np.mean((data - expected)[n_edge:-n_edge] ** 2) / np.mean(expected ** 2))
+    return errors
+
+
+def _throughput(ts_service, fs, target_fs, duration, n_sensors):
+    seeg = _timeseries(np.random.RandomState(0).normal(size=(int(fs * duration), n_sensors)).astype("float32"), fs)
+    durations = {}
+    for name, method in _methods(ts_service, fs, target_fs):
+        tic = time.time()
+        method(seeg)
+        durations[name] = time.time() - tic
+    return durations
+
+
+def main_resampling_benchmark(config=Config(), rates=((1024.0, 256.0), (1024.0, 128.0), (1000.0, 250.0),
+                                                      (1024.0, 250.0), (2048.0, 500.0)),
+                              accuracy_duration=60.0, throughput_duration=3600.0, n_sensors=10):
+    """
+    :param rates: pairs of original and target sampling frequencies in Hz
+    :param accuracy_duration, throughput_duration: durations of the signals in secs
+    """
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    ts_service = TimeseriesService()
+    results = {}
+    for fs, target_fs in rates:
+        errors = _accuracy(ts_service, fs, target_fs, accuracy_duration, n_sensors)
+        durations = _throughput(ts_service, fs, target_fs, throughput_duration, n_sensors)
+        for name in errors.keys():
+            results[(fs, target_fs, name)] = (errors[name], durations[name])
+            logger.info("Decimation of " + str(n_sensors) + " signals from " + str(fs) + " Hz to " + str(target_fs) +
+                        " Hz, by " + name + ": relative rms error " + str(errors[name]) + ", " +
+                        str(durations[name]) + " secs for " + str(throughput_duration) + " secs of signals")
+    return results
+
+
+if __name__ == "__main__":
+    main_resampling_benchmark()
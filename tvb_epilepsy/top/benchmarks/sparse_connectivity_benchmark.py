@@ -0,0 +1,131 @@
+# coding=utf-8
+"""
+Runtime and memory benchmark of the model pipeline for dense versus sparse (CSR) connectivity weights,
+on synthetic thresholded connectomes of increasing numbers of regions, up to 20000:
+weights normalization, model configuration (equilibria), LSA, numpy simulation and SEEG projection.
+Each configuration runs in a child process, in order to measure the increase of its peak resident memory.
+"""
+
+import resource
+import time
+from multiprocessing import Process, Queue
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+from tvb_epilepsy.base.constants.config import Config
+from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
+from tvb_epilepsy.base.model.vep.connectivity import Connectivity
+from tvb_epilepsy.base.model.vep.sensors import Sensors
+from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
+from tvb_epilepsy.service.lsa_service import LSAService
+from tvb_epilepsy.service.model_configuration_builder import ModelConfigurationBuilder
+from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.timeseries_service import TimeseriesService
+
+
+def _generate_connectome(n_regions, n_connections, random_state):
+    # Regions uniformly distributed in a sphere of 50 mm radius, each one connected to its n_connections nearest ones,
+    # with weights decaying exponentially with their distance, i.e., the tract length
+    centres = random_state.normal(size=(n_regions, 3))
+    centres *= 50.0 * random_state.uniform(size=(n_regions, 1)) ** (1.0 / 3) / \
+        np.sqrt(np.sum(centres ** 2, axis=1, keepdims=True))
+    n_connections = min(n_connections, n_regions - 1)
+    distances, neighbours = cKDTree(centres).query(centres, n_connections + 1)
+    # The nearest neighbour of every region is the region itself
+    rows = np.repeat(np.arange(n_regions), n_connections)
+    distances = distances[:, 1:].flatten()
+    neighbours = neighbours[:, 1:].flatten()
+    weights = np.exp(-distances / 10.0) * random_state.lognormal(size=distances.shape)
+    weights = sparse.csr_matrix((weights, (rows, neighbours)), shape=(n_regions, n_regions))
+    tract_lengths = sparse.csr_matrix((distances, (rows, neighbours)), shape=(n_regions, n_regions))
+    # Symmetric, as the connectomes of diffusion imaging are
+    return centres, (weights + weights.T) / 2.0, tract_lengths.maximum(tract_lengths.T)
+
+
+def _generate_gain_matrix(centres, n_sensors, threshold, random_state):
+    # Inverse square distance gains of sensors inside the same sphere, thresholded relatively to their maximum
+    sensors_locations = random_state.uniform(-25.0, 25.0, (n_sensors, 3))
+    gain_matrix = 1.0 / np.sum((sensors_locations[:, np.newaxis] - centres[np.newaxis]) ** 2, axis=2)
+    gain_matrix[gain_matrix < threshold * gain_matrix.max(axis=1, keepdims=True)] = 0.0
+    return sensors_locations, sparse.csr_matrix(gain_matrix)
+
+
+def _nbytes(x):
+    if sparse.issparse(x):
+        x = sparse.csr_matrix(x)
+        return x.data.nbytes + x.indices.nbytes + x.indptr.nbytes
+    return np.asarray(x).nbytes
+
+
+def _run_pipeline(n_regions, dense, n_connections, simulated_period, n_sensors, gain_threshold):
+    random_state = np.random.RandomState(0)
+    centres, weights, tract_lengths = _generate_connectome(n_regions, n_connections, random_state)
+    sensors_locations, gain_matrix = _generate_gain_matrix(centres, n_sensors, gain_threshold, random_state)
+    if dense:
+        weights, tract_lengths, gain_matrix = weights.toarray(), tract_lengths.toarray(), gain_matrix.toarray()
+    labels = np.array(["region" + str(i_region) for i_region in range(n_regions)])
+    durations = {}
+    tic = time.time()
+    connectivity = Connectivity("", weights, tract_lengths, labels, centres)
+    durations["normalization"] = time.time() - tic
+    tic = time.time()
+    hypothesis = HypothesisBuilder(n_regions).set_x0_hypothesis([0, 5], [1.5, 0.8]). \
+        set_e_hypothesis([10], [0.5]).build_hypothesis()
+    model_configuration = ModelConfigurationBuilder(n_regions). \
+        build_model_from_hypothesis(hypothesis, connectivity.normalized_weights)
+    durations["model configuration"] = time.time() - tic
+    tic = time.time()
+    LSAService(eigen_solver="partial", eigen_vectors_number=5).run_lsa(hypothesis, model_configuration)
+    durations["lsa"] = time.time() - tic
+    tic = time.time()
+    simulator = SimulatorBuilder("numpy").set_model_name("EpileptorDP2D").set_simulated_period(simulated_period). \
+        build_simulator(model_configuration, connectivity)[0]
+    source = simulator.launch_simulation()[0].get_source()
+    durations["simulation"] = time.time() - tic
+    tic = time.time()
+    sensors = Sensors(np.array(["sensor" + str(i_sensor) for i_sensor in range(n_sensors)]), sensors_locations,
+                      gain_matrix=gain_matrix)
+    TimeseriesService().compute_seeg(source, [sensors])
+    durations["seeg"] = time.time() - tic
+    return durations, _nbytes(connectivity.normalized_weights) / 1024.0 ** 2
+
+
+def _run_child(queue, *args):
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    durations, weights_memory = _run_pipeline(*args)
+    # ru_maxrss is in kilobytes in linux
+    queue.put((durations, weights_memory, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory) / 1024.0))
+
+
+def _run(*args):
+    queue = Queue()
+    process = Process(target=_run_child, args=(queue,) + args)
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main_sparse_connectivity_benchmark(config=Config(), n_regions=(1000, 5000, 10000, 20000), n_connections=50,
+                                       simulated_period=100.0, n_sensors=100, gain_threshold=0.01,
+                                       max_dense_regions=2000):
+    logger = initialize_logger(__name__, config.out.FOLDER_LOGS)
+    results = {}
+    for n in n_regions:
+        for name, dense in [("dense", True), ("sparse", False)]:
+            # The dense Levenberg-Marquardt equilibria computation scales as n_regions ** 3,
+            # and dense weights of 20000 regions take 3.2 GB by themselves
+            if dense and n > max_dense_regions:
+                continue
+            results[(name, n)] = _run(n, dense, n_connections, simulated_period, n_sensors, gain_threshold)
+            durations, weights_memory, memory = results[(name, n)]
+            logger.info("Pipeline of " + str(n) + " regions, " + name + " weights of " + str(weights_memory) +
+                        " MB: " + ", ".join([stage + " " + str(durations[stage]) + " secs"
+                                             for stage in ["normalization", "model configuration", "lsa",
+                                                           "simulation", "seeg"]]) +
+                        ", peak memory increase: " + str(memory) + " MB")
+    return results
+
+
+if __name__ == "__main__":
+    main_sparse_connectivity_benchmark()
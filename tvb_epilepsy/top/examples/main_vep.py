@@ -12,6 +12,7 @@ from tvb_epilepsy.io.h5_writer import H5Writer
 from tvb_epilepsy.plot.plotter import Plotter
 from tvb_epilepsy.service.hypothesis_builder import HypothesisBuilder
 from tvb_epilepsy.service.simulator.simulator_builder import SimulatorBuilder
+from tvb_epilepsy.service.simulator.simulation_cache import SimulationCache
 from tvb_epilepsy.top.scripts.pse_scripts import pse_from_lsa_hypothesis
 from tvb_epilepsy.top.scripts.sensitivity_analysis_sripts import sensitivity_analysis_pse_from_lsa_hypothesis
 from tvb_epilepsy.top.scripts.simulation_scripts import compute_seeg_and_write_ts_to_h5
@@ -208,7 +209,7 @@ def main_vep(config=Config(), ep_name=EP_NAME, K_unscaled=K_DEF, ep_indices=[],
                     model = sim_builder.generate_model_tvb(model_configuration)
 
                 sim, sim_settings, model = \
-                    sim_builder.build_simulator_TVB_from_model_sim_settings(model_configuration,head.connectivity,
+                    sim_builder.build_simulator_from_model_sim_settings(model_configuration, head.connectivity,
                                                                             model, sim_settings, integrator=integrator)
 
                 # Integrator and initial conditions initialization.
@@ -216,7 +217,10 @@ def main_vep(config=Config(), ep_name=EP_NAME, K_unscaled=K_DEF, ep_indices=[],
                 writer.write_simulator_model(sim.model, sim.connectivity.number_of_regions,
                                              os.path.join(config.out.FOLDER_RES, lsa_hypothesis.name + "_sim_model.h5"))
                 logger.info("\n\nSimulating...")
-                sim_output, status = sim.launch_simulation(report_every_n_monitor_steps=100)
+                if config.simulator.USE_SIMULATION_CACHE:
+                    sim_output, status = SimulationCache().launch_simulation(sim, report_every_n_monitor_steps=100)
+                else:
+                    sim_output, status = sim.launch_simulation(report_every_n_monitor_steps=100)
 
                 sim_path = os.path.join(config.out.FOLDER_RES, lsa_hypothesis.name + "_sim_settings.h5")
                 writer.write_simulation_settings(sim.simulation_settings, sim_path)
@@ -1,19 +1,56 @@
 import numpy as np
 from tvb_epilepsy.base.constants.model_inversion_constants import *
 from tvb_epilepsy.base.utils.log_error_utils import initialize_logger
-from tvb_epilepsy.io.edf import read_edf_to_Timeseries
 from tvb_epilepsy.service.timeseries_service import TimeseriesService
+from tvb_epilepsy.service.timeseries_stream_pipeline import TimeseriesStreamPipeline, FilterStage, EnvelopeStage, \
+    ConvolveStage, DecimateStage
 
 
 logger = initialize_logger(__name__)
 
 
+def _stream_signal_observable(data, seizure_length, duration, temp_duration, filter_flag, low_freq, high_freq,
+                              envelope_flag, smooth_flag, win_len_ratio, block_length, output_sink):
+    # Filtering, envelope, smoothing and decimation, block by block of time points,
+    # none of which changes the number of time points, but decimation
+    stages = []
+    if filter_flag:
+        logger.info("Filtering signals...")
+        stages.append(FilterStage(data.sampling_frequency, low_freq, np.minimum(high_freq, 512.0), "bandpass",
+                                  order=3))
+    if envelope_flag:
+        # The Hilbert transform of every block is computed with a margin of 1 sec before and after it
+        stages.append(EnvelopeStage(np.ceil(data.sampling_frequency)))
+    if smooth_flag:
+        win_len = int(np.round(1.0*data.time_length/win_len_ratio))
+        logger.info("Convolving signals with a square window of " + str(win_len) + " points...")
+        stages.append(ConvolveStage(np.ones((win_len, ))))
+    decim_ratio = np.maximum(1, int(np.round((1.0*data.time_length/seizure_length) * (duration/temp_duration))))
+    if decim_ratio > 1:
+        logger.info("Decimating signals " + str(decim_ratio) + " times...")
+        stages.append(DecimateStage(decim_ratio))
+    if len(stages) == 0:
+        return data
+    return TimeseriesStreamPipeline(stages, block_length).run(data, output_sink)
+
+
 def prepare_signal_observable(data, seizure_length=SEIZURE_LENGTH, on_off_set=[], rois=[],
                               filter_flag=True, low_freq=LOW_FREQ, high_freq=HIGH_FREQ,
                               envelope_flag=True, smooth_flag=True, win_len_ratio=WIN_LEN_RATIO,
-                              plotter=None, title_prefix=""):
+                              plotter=None, title_prefix="", block_length=None, output_sink=None):
+    """
+    If block_length is not None, the signals are filtered, enveloped, smoothed and decimated
+    by a TimeseriesStreamPipeline, block by block of block_length time points, e.g., of an out of core H5Timeseries,
+    so that only the decimated signals are ever held in memory, or written to output_sink,
+    which has to return a Timeseries, e.g., a lazy H5OutputSink,
+    at the cost of the plots of the intermediate steps.
+    """
     ts_service = TimeseriesService()
 
+    # Selections of rois and time windows are views of the data, instead of copies
+    # (those of a H5Timeseries are lazy views of its dataset already, and as_view returns it as it is):
+    data = data.as_view()
+
     # Select rois if any:
     n_rois = len(rois)
     if n_rois > 0:
@@ -32,6 +69,12 @@ def prepare_signal_observable(data, seizure_length=SEIZURE_LENGTH, on_off_set=[]
                    np.minimum(data.time_line[-1], on_off_set[1] + 2 * duration/win_len_ratio)]
     data = data.get_time_window_by_units(temp_on_off[0], temp_on_off[1])
 
+    if block_length is not None:
+        data = _stream_signal_observable(data, seizure_length, duration, temp_on_off[1] - temp_on_off[0],
+                                         filter_flag, low_freq, high_freq, envelope_flag, smooth_flag, win_len_ratio,
+                                         block_length, output_sink)
+        return _normalize_signal_observable(data, on_off_set, ts_service, plotter, title_prefix)
+
     # Now filter, if needed, before decimation introduces any artifacts
     if filter_flag:
         high_freq = np.minimum(high_freq, 512.0)
@@ -82,6 +125,10 @@ def prepare_signal_observable(data, seizure_length=SEIZURE_LENGTH, on_off_set=[]
                                     figure_name=title_prefix + str_decim_ratio + 'xDecimatedTimeSeries',
                                     labels=data.space_labels)
 
+    return _normalize_signal_observable(data, on_off_set, ts_service, plotter, title_prefix)
+
+
+def _normalize_signal_observable(data, on_off_set, ts_service, plotter=None, title_prefix=""):
     # Cut to the desired interval
     data = data.get_time_window_by_units(on_off_set[0], on_off_set[1])
 
@@ -100,7 +147,7 @@ def prepare_signal_observable(data, seizure_length=SEIZURE_LENGTH, on_off_set=[]
 
 def prepare_seeg_observable(data, seizure_length=SEIZURE_LENGTH, on_off_set=[], rois=[], filter_flag=True, low_freq=LOW_FREQ, high_freq=HIGH_FREQ,
                             bipolar=BIPOLAR,  envelope_flag=True, smooth_flag=True, win_len_ratio=WIN_LEN_RATIO,
-                            plotter=None, title_prefix=""):
+                            plotter=None, title_prefix="", block_length=None, output_sink=None):
 
     if bipolar:
         logger.info("Computing bipolar signals...")
@@ -112,7 +159,8 @@ def prepare_seeg_observable(data, seizure_length=SEIZURE_LENGTH, on_off_set=[],
 
     return prepare_signal_observable(data, seizure_length, on_off_set, rois, filter_flag=filter_flag, low_freq=low_freq,
                                      high_freq=high_freq,  envelope_flag=envelope_flag, smooth_flag=smooth_flag,
-                                     win_len_ratio=win_len_ratio, plotter=plotter, title_prefix=title_prefix)
+                                     win_len_ratio=win_len_ratio, plotter=plotter, title_prefix=title_prefix,
+                                     block_length=block_length, output_sink=output_sink)
 
 
 # win_len_ratio=WIN_LEN_RATIO,
@@ -121,6 +169,8 @@ def prepare_seeg_observable_from_mne_file(seeg_path, sensors, rois_selection, se
                                           filter_flag=True, low_freq=LOW_FREQ, high_freq=HIGH_FREQ,
                                           bipolar=BIPOLAR,  envelope_flag=True, smooth_flag=True,
                                           win_len_ratio=WIN_LEN_RATIO, plotter=None, title_prefix=""):
+    # The edf reader requires mne, which is needed only for edf files
+    from tvb_epilepsy.io.edf import read_edf_to_Timeseries
     logger.info("Reading empirical dataset from edf file...")
     data = read_edf_to_Timeseries(seeg_path, sensors, rois_selection,
                                   label_strip_fun=label_strip_fun, time_units=time_units)
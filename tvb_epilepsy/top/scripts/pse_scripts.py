@@ -107,8 +107,10 @@ def pse_from_lsa_hypothesis(n_samples, lsa_hypothesis, model_connectivity, model
                                     "indices": [inds[ii]], "name": name})
 
     # Now run pse service to generate output samples:
-    pse = LSAPSEService(hypothesis=lsa_hypothesis, params_pse=pse_params_list)
-    pse_results, execution_status = pse.run_pse(model_connectivity, False, model_configuration_builder, lsa_service)
+    pse = LSAPSEService(hypothesis=lsa_hypothesis, params_pse=pse_params_list, n_workers=kwargs.get("n_workers", 1),
+                        checkpoint_path=kwargs.get("checkpoint_path", None))
+    pse_results, execution_status = pse.run_pse_parallel(model_connectivity, False, model_configuration_builder,
+                                                         lsa_service)
     logger.info(pse.__repr__())
     pse_results = list_of_dicts_to_dicts_of_ndarrays(pse_results)
     for key in pse_results.keys():
@@ -99,8 +99,10 @@ def sensitivity_analysis_pse_from_lsa_hypothesis(n_samples, lsa_hypothesis, conn
             pse_params_list.append({"path": "model_configuration_builder." + name, "samples": samples[ii],
                                     "indices": [inds[ii]], "name": name})
     # Now run pse service to generate output samples:
-    pse = LSAPSEService(hypothesis=lsa_hypothesis, params_pse=pse_params_list)
-    pse_results, execution_status = pse.run_pse(connectivity_matrix, False, model_configuration_builder, lsa_service)
+    pse = LSAPSEService(hypothesis=lsa_hypothesis, params_pse=pse_params_list, n_workers=kwargs.get("n_workers", 1),
+                        checkpoint_path=kwargs.get("checkpoint_path", None))
+    pse_results, execution_status = pse.run_pse_parallel(connectivity_matrix, False, model_configuration_builder,
+                                                         lsa_service)
     pse_results = list_of_dicts_to_dicts_of_ndarrays(pse_results)
     # Now prepare inputs and outputs and run the sensitivity analysis:
     # NOTE!: Without the jittered healthy regions which we don' want to include into the sensitivity analysis!